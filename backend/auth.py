@@ -3,10 +3,19 @@ Authorization and Permission Management
 """
 from functools import wraps
 from fastapi import HTTPException, Depends, Header
-from sqlalchemy.orm import Session
-from typing import List, Optional
-from database import SessionLocal
-from models import Seller, Role, Permission
+from sqlalchemy.orm import Session, make_transient_to_detached
+from typing import Any, Dict, FrozenSet, List, Optional, Tuple
+import os
+import hmac
+import json
+import time
+import base64
+import hashlib
+import secrets
+import threading
+from sqlalchemy.exc import SQLAlchemyError
+from database import get_db, SessionLocal, BASE_DIR
+from models import Seller, Permission, RevokedToken, role_permission
 
 
 # Predefined permission codes
@@ -66,28 +75,328 @@ PERMISSIONS = {
 }
 
 
-def get_db():
-    """Database dependency"""
+# Role permissions and seller status are cached in-process. RoleService and
+# SellerService invalidate them on changes; the TTL bounds how long other
+# processes (bot, other workers) can see stale entries.
+PERMISSION_CACHE_TTL = float(os.getenv("PERMISSION_CACHE_TTL", "60"))
+
+# role_id -> (expires_at, permission codes)
+_role_permissions: Dict[int, Tuple[float, FrozenSet[str]]] = {}
+# seller_id -> (expires_at, is_active, role_id)
+_seller_status: Dict[int, Tuple[float, bool, Optional[int]]] = {}
+_cache_lock = threading.Lock()
+
+
+def get_role_permission_codes(db: Session, role_id: int) -> FrozenSet[str]:
+    """Permission codes of a role (one query on a cache miss, none on a hit)"""
+    now = time.monotonic()
+    cached = _role_permissions.get(role_id)
+    if cached and cached[0] > now:
+        return cached[1]
+    
+    rows = db.query(Permission.code).join(
+        role_permission, role_permission.c.permission_id == Permission.id
+    ).filter(role_permission.c.role_id == role_id).all()
+    codes = frozenset(code for (code,) in rows)
+    with _cache_lock:
+        _role_permissions[role_id] = (now + PERMISSION_CACHE_TTL, codes)
+    return codes
+
+
+def get_seller_status(db: Session, seller_id: int) -> Optional[Tuple[bool, Optional[int]]]:
+    """(is_active, role_id) of a seller, None if the seller does not exist"""
+    now = time.monotonic()
+    cached = _seller_status.get(seller_id)
+    if cached and cached[0] > now:
+        return cached[1], cached[2]
+    
+    row = db.query(Seller.is_active, Seller.role_id).filter(Seller.id == seller_id).first()
+    if row is None:
+        return None
+    with _cache_lock:
+        _seller_status[seller_id] = (now + PERMISSION_CACHE_TTL, row.is_active, row.role_id)
+    return row.is_active, row.role_id
+
+
+def invalidate_role_permissions(role_id: Optional[int] = None):
+    """Drop cached permissions of a role (all roles if role_id is None)"""
+    with _cache_lock:
+        if role_id is None:
+            _role_permissions.clear()
+        else:
+            _role_permissions.pop(role_id, None)
+
+
+def invalidate_seller(seller_id: Optional[int] = None):
+    """Drop cached status of a seller (all sellers if seller_id is None)"""
+    with _cache_lock:
+        if seller_id is None:
+            _seller_status.clear()
+        else:
+            _seller_status.pop(seller_id, None)
+
+
+def _seller_reference(db: Session, seller_id: int, is_active: bool, role_id: Optional[int]) -> Seller:
+    """
+    Seller attached to the session without a query: id, is_active and role_id
+    come from the cache, other attributes are loaded on first access.
+    """
+    seller = db.identity_map.get(db.identity_key(Seller, seller_id))
+    if seller is not None:
+        return seller
+    seller = Seller(id=seller_id, is_active=is_active, role_id=role_id)
+    make_transient_to_detached(seller)
+    db.add(seller)
+    return seller
+
+
+# ==================== ACCESS TOKENS ====================
+# Token: base64url(JSON payload) + "." + base64url(HMAC-SHA256 of the payload part).
+# Verified without a query per request; revocations are stored in revoked_tokens
+# and reloaded into memory every PERMISSION_CACHE_TTL seconds.
+
+# Without ACCESS_TOKEN_SECRET a key is generated once and kept next to the database,
+# so all workers and restarts share it
+ACCESS_TOKEN_SECRET_FILE = os.getenv("ACCESS_TOKEN_SECRET_FILE", str(BASE_DIR / ".access_token_secret"))
+
+
+def _load_or_create_secret(path: str) -> str:
+    """Secret from the key file, created atomically by the first process"""
+    try:
+        with open(path) as f:
+            secret = f.read().strip()
+        if secret:
+            return secret
+    except FileNotFoundError:
+        pass
+    
+    secret = secrets.token_hex(32)
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    with open(temp_path, "w") as f:
+        f.write(secret)
+    os.chmod(temp_path, 0o600)
+    try:
+        # link fails if another worker created the file first - then its key is used
+        os.link(temp_path, path)
+    except FileExistsError:
+        with open(path) as f:
+            secret = f.read().strip()
+    finally:
+        os.remove(temp_path)
+    return secret
+
+
+ACCESS_TOKEN_SECRET = os.getenv("ACCESS_TOKEN_SECRET", "")
+if not ACCESS_TOKEN_SECRET:
+    try:
+        ACCESS_TOKEN_SECRET = _load_or_create_secret(ACCESS_TOKEN_SECRET_FILE)
+    except OSError as e:
+        # Tokens stop working after a restart and are not shared between processes
+        print(f"[Auth] ACCESS_TOKEN_SECRET o'rnatilmagan va kalit fayli yozilmadi ({e}) - vaqtinchalik kalit ishlatiladi")
+        ACCESS_TOKEN_SECRET = secrets.token_hex(32)
+_TOKEN_KEY = ACCESS_TOKEN_SECRET.encode("utf-8")
+
+SELLER_TOKEN_TTL = float(os.getenv("SELLER_TOKEN_TTL_HOURS", "24")) * 3600
+CUSTOMER_TOKEN_TTL = float(os.getenv("CUSTOMER_TOKEN_TTL_HOURS", "720")) * 3600
+# Old clients that only send X-Seller-ID / X-Customer-ID (set to 0 to require tokens)
+ALLOW_ID_HEADERS = os.getenv("AUTH_ALLOW_ID_HEADERS", "1") == "1"
+
+# jti -> expiry of tokens revoked by logout
+_revoked_tokens: Dict[str, float] = {}
+# (kind, id) -> tokens issued before this time are rejected
+_revoked_subjects: Dict[Tuple[str, int], float] = {}
+# time.monotonic() of the last reload from revoked_tokens
+_revocations_loaded_at: Optional[float] = None
+
+
+def _b64encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode("ascii")
+
+
+def _b64decode(text: str) -> bytes:
+    return base64.urlsafe_b64decode(text + "=" * (-len(text) % 4))
+
+
+def _sign(body: str) -> str:
+    return _b64encode(hmac.new(_TOKEN_KEY, body.encode("ascii"), hashlib.sha256).digest())
+
+
+def permissions_version(codes: FrozenSet[str]) -> str:
+    """Short hash of a role's permission codes; changes whenever the role's permissions change"""
+    return hashlib.sha1(",".join(sorted(codes)).encode("utf-8")).hexdigest()[:12]
+
+
+def create_access_token(kind: str, subject_id: int, role_id: Optional[int] = None,
+                        perm_version: Optional[str] = None) -> str:
+    """Signed, expiring token for a seller ('seller') or customer ('customer')"""
+    now = time.time()
+    payload = {
+        "typ": kind,
+        "sub": subject_id,
+        "iat": round(now, 3),
+        "exp": int(now + (SELLER_TOKEN_TTL if kind == "seller" else CUSTOMER_TOKEN_TTL)),
+        "jti": secrets.token_urlsafe(12),
+    }
+    if kind == "seller":
+        payload["role"] = role_id
+        payload["pv"] = perm_version
+    body = _b64encode(json.dumps(payload, separators=(",", ":")).encode("utf-8"))
+    return f"{body}.{_sign(body)}"
+
+
+def bearer_token(authorization: Optional[str]) -> Optional[str]:
+    """Signed token from an Authorization header; None for missing or old random tokens"""
+    if not authorization:
+        return None
+    token = authorization[7:] if authorization[:7].lower() == "bearer " else authorization
+    token = token.strip()
+    # Old tokens from secrets.token_urlsafe() contain no "."
+    return token if token.count(".") == 1 else None
+
+
+def token_kind(token: str) -> Optional[str]:
+    """'seller' or 'customer' from an unverified token (to pick the right check)"""
+    try:
+        return json.loads(_b64decode(token.partition(".")[0])).get("typ")
+    except (ValueError, AttributeError):
+        return None
+
+
+def token_signature_valid(token: str) -> bool:
+    """Whether the token was signed with this server's key"""
+    body, _, signature = token.partition(".")
+    return hmac.compare_digest(signature, _sign(body))
+
+
+def _refresh_revocations(db: Optional[Session] = None):
+    """Reload revocations written by other processes (at most once per PERMISSION_CACHE_TTL)"""
+    global _revocations_loaded_at
+    now = time.monotonic()
+    if _revocations_loaded_at is not None and now - _revocations_loaded_at < PERMISSION_CACHE_TTL:
+        return
+    
+    own_session = db is None
+    if own_session:
+        db = SessionLocal()
+    try:
+        rows = db.query(
+            RevokedToken.jti, RevokedToken.kind, RevokedToken.subject_id,
+            RevokedToken.issued_before, RevokedToken.expires_at
+        ).filter(RevokedToken.expires_at >= time.time()).all()
+    except SQLAlchemyError as e:
+        print(f"[Auth] Bekor qilingan tokenlar o'qilmadi: {e}")
+        rows = None
+    finally:
+        if own_session:
+            db.close()
+    
+    with _cache_lock:
+        _revocations_loaded_at = now
+        for row in rows or []:
+            if row.jti:
+                _revoked_tokens[row.jti] = row.expires_at
+            elif row.issued_before is not None:
+                key = (row.kind, row.subject_id)
+                _revoked_subjects[key] = max(_revoked_subjects.get(key, 0), row.issued_before)
+
+
+def _store_revocation(**fields):
+    """Persist a revocation so other processes and restarts see it"""
     db = SessionLocal()
     try:
-        yield db
+        db.query(RevokedToken).filter(RevokedToken.expires_at < time.time()).delete(synchronize_session=False)
+        db.add(RevokedToken(**fields))
+        db.commit()
+    except SQLAlchemyError as e:
+        db.rollback()
+        print(f"[Auth] Token bekor qilinishi saqlanmadi: {e}")
     finally:
         db.close()
 
 
+def verify_access_token(token: str, kind: str, db: Optional[Session] = None) -> Dict[str, Any]:
+    """Check signature, type, expiry and revocation; return the payload or raise 401"""
+    body = token.partition(".")[0]
+    if not token_signature_valid(token):
+        raise HTTPException(status_code=401, detail="Token yaroqsiz")
+    try:
+        payload = json.loads(_b64decode(body))
+    except ValueError:
+        raise HTTPException(status_code=401, detail="Token yaroqsiz")
+    
+    if payload.get("typ") != kind:
+        raise HTTPException(status_code=401, detail="Token yaroqsiz")
+    if payload["exp"] < time.time():
+        raise HTTPException(status_code=401, detail="Token muddati tugagan")
+    _refresh_revocations(db)
+    if payload["jti"] in _revoked_tokens or payload["iat"] < _revoked_subjects.get((kind, payload["sub"]), 0):
+        raise HTTPException(status_code=401, detail="Token bekor qilingan")
+    return payload
+
+
+def revoke_token(token: str):
+    """Revoke a single token (logout); tokens not signed by this server are ignored"""
+    if not token_signature_valid(token):
+        return
+    try:
+        payload = json.loads(_b64decode(token.partition(".")[0]))
+    except ValueError:
+        return
+    if not (isinstance(payload, dict) and isinstance(payload.get("jti"), str)
+            and isinstance(payload.get("exp"), (int, float))):
+        return
+    now = time.time()
+    if payload["exp"] < now:
+        return  # Already unusable
+    with _cache_lock:
+        for jti, expires in list(_revoked_tokens.items()):
+            if expires < now:
+                del _revoked_tokens[jti]
+        already_revoked = payload["jti"] in _revoked_tokens
+        _revoked_tokens[payload["jti"]] = payload["exp"]
+    if not already_revoked:
+        _store_revocation(jti=payload["jti"], kind=payload.get("typ"), subject_id=payload.get("sub"), expires_at=payload["exp"])
+
+
+def revoke_subject(kind: str, subject_id: int):
+    """Revoke all tokens issued so far to a seller or customer"""
+    now = time.time()
+    with _cache_lock:
+        _revoked_subjects[(kind, subject_id)] = now
+    # Older tokens have expired by then, the record is no longer needed
+    ttl = SELLER_TOKEN_TTL if kind == "seller" else CUSTOMER_TOKEN_TTL
+    _store_revocation(kind=kind, subject_id=subject_id, issued_before=now, expires_at=now + ttl)
+
+
 def get_seller_from_header(
     x_seller_id: Optional[int] = Header(None, alias="X-Seller-ID"),
+    authorization: Optional[str] = Header(None),
     db: Session = Depends(get_db)
 ) -> Optional[Seller]:
-    """Get seller from X-Seller-ID header"""
-    if not x_seller_id:
+    """Get seller from a signed Bearer token, or from the X-Seller-ID header (old clients)"""
+    token = bearer_token(authorization)
+    header_fallback = bool(x_seller_id) and ALLOW_ID_HEADERS
+    # A token signed with another key (e.g. before the secret was configured) falls
+    # back to X-Seller-ID when old clients are allowed; expired/revoked tokens do not
+    if token and token_kind(token) == "seller" and (token_signature_valid(token) or not header_fallback):
+        payload = verify_access_token(token, "seller", db)
+        # Deactivated or deleted sellers lose access before their token expires
+        status = get_seller_status(db, payload["sub"])
+        if not status or not status[0]:
+            raise HTTPException(status_code=403, detail="Seller not found or inactive")
+        is_active, role_id = status
+        if role_id and payload.get("pv") != permissions_version(get_role_permission_codes(db, role_id)):
+            raise HTTPException(status_code=401, detail="Ruxsatlar o'zgargan, qaytadan kiring")
+        return _seller_reference(db, payload["sub"], is_active, role_id)
+    
+    if not x_seller_id or not ALLOW_ID_HEADERS:
         return None
     
-    seller = db.query(Seller).filter(Seller.id == x_seller_id).first()
-    if not seller or not seller.is_active:
+    status = get_seller_status(db, x_seller_id)
+    if not status or not status[0]:
         raise HTTPException(status_code=403, detail="Seller not found or inactive")
     
-    return seller
+    return _seller_reference(db, x_seller_id, *status)
 
 
 def check_permission(permission_code: str):
@@ -116,32 +425,16 @@ def check_permission(permission_code: str):
 
 def has_permission(db: Session, seller: Seller, permission_code: str) -> bool:
     """Check if seller has specific permission"""
-    if not seller.role:
-        return False
-    
-    # Get all permissions for seller's role
-    role = db.query(Role).filter(Role.id == seller.role_id).first()
-    if not role:
-        return False
-    
-    # Check if role has the permission
-    permission = db.query(Permission).filter(Permission.code == permission_code).first()
-    if not permission:
+    if not seller.role_id:
         return False
-    
-    return permission in role.permissions
+    return permission_code in get_role_permission_codes(db, seller.role_id)
 
 
 def get_seller_permissions(db: Session, seller: Seller) -> List[str]:
     """Get all permission codes for a seller"""
-    if not seller.role:
-        return []
-    
-    role = db.query(Role).filter(Role.id == seller.role_id).first()
-    if not role:
+    if not seller.role_id:
         return []
-    
-    return [perm.code for perm in role.permissions]
+    return sorted(get_role_permission_codes(db, seller.role_id))
 
 
 def require_permission(permission_code: str):
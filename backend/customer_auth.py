@@ -6,12 +6,33 @@ from sqlalchemy.orm import Session
 from database import SessionLocal
 from models import Customer
 from typing import Optional
+from auth import ALLOW_ID_HEADERS, bearer_token, token_kind, token_signature_valid, verify_access_token
+
+
+def get_customer_id_from_token(authorization: Optional[str], db: Optional[Session] = None) -> Optional[int]:
+    """Customer ID from a signed Bearer token (no per-request query), None when no token is sent"""
+    token = bearer_token(authorization)
+    if not token or token_kind(token) != "customer":
+        return None
+    return verify_access_token(token, "customer", db)["sub"]
 
 def get_customer_from_header(
-    x_customer_id: Optional[str] = None
+    x_customer_id: Optional[str] = None,
+    db: Optional[Session] = None,
+    authorization: Optional[str] = None
 ) -> int:
-    """Get customer ID from header string"""
-    if not x_customer_id:
+    """
+    Get customer ID from a signed token, or from the X-Customer-ID header string
+    for old clients (uses the request session when given)
+    """
+    token = bearer_token(authorization)
+    # Tokens signed with another key fall back to X-Customer-ID for old clients
+    if not (token and x_customer_id and ALLOW_ID_HEADERS and not token_signature_valid(token)):
+        customer_id = get_customer_id_from_token(authorization, db)
+        if customer_id is not None:
+            return customer_id
+    
+    if not x_customer_id or not ALLOW_ID_HEADERS:
         raise HTTPException(status_code=401, detail="Customer ID required")
     
     try:
@@ -20,11 +41,14 @@ def get_customer_from_header(
         raise HTTPException(status_code=400, detail="Invalid customer ID")
     
     # Verify customer exists
-    db = SessionLocal()
+    own_session = db is None
+    if own_session:
+        db = SessionLocal()
     try:
-        customer = db.query(Customer).filter(Customer.id == customer_id).first()
+        customer = db.query(Customer.id).filter(Customer.id == customer_id).first()
         if not customer:
             raise HTTPException(status_code=404, detail="Customer not found")
         return customer_id
     finally:
-        db.close()
+        if own_session:
+            db.close()
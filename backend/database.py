@@ -27,6 +27,20 @@ SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
 
+def get_db():
+    """
+    Request-scoped session dependency, shared by routes and auth dependencies.
+    FastAPI caches dependency results per request, so every Depends(get_db) in
+    one request gets the same session. The session checks out a connection
+    only on its first query, so requests that never touch the DB use none.
+    """
+    db = SessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
 def init_db():
     """Initialize database - create all tables and initial data"""
     # Import here to avoid circular imports
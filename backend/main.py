@@ -9,8 +9,9 @@ sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'services'))
 from fastapi import FastAPI, Depends, HTTPException, WebSocket, WebSocketDisconnect, UploadFile, File, Form, Header, Request, Query, Body
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import HTMLResponse, FileResponse, JSONResponse
+from fastapi.responses import HTMLResponse, FileResponse, JSONResponse, Response
 from fastapi.exceptions import RequestValidationError
+from starlette.background import BackgroundTask
 from pydantic import ValidationError
 from sqlalchemy.orm import Session
 from typing import List, Optional
@@ -20,10 +21,10 @@ import json
 import os
 from utils import get_uzbekistan_now, to_uzbekistan_time
 
-from database import SessionLocal, engine, init_db
+from database import SessionLocal, engine, init_db, get_db
 from models import Base, Product, ProductImage, ProductReview, Seller, Sale, SaleItem, Order, Customer, Banner, HelpRequest, Favorite, PriceAlert, CustomerProductTag, OtpCode, CustomerDeviceToken, Conversation, ChatMessage, SearchHistory, Referal, LoyaltyPoint, LoyaltyTransaction, ProductVariant, Category, Role
 from schemas import (
-    ProductCreate, ProductUpdate, ProductResponse,
+    ProductCreate, ProductUpdate, ProductResponse, ProductSuggestResponse,
     ProductImageResponse, ProductImageCreate,
     ProductReviewResponse, ProductReviewCreate, ProductReviewUpdate,
     CustomerCreate, CustomerUpdate, CustomerResponse, CustomerStatsResponse,
@@ -32,7 +33,7 @@ from schemas import (
     OrderCreate, OrderResponse, OrderItemCreate,
     LocationUpdate, RoleCreate, RoleUpdate, RoleResponse, PermissionResponse,
     DebtHistoryResponse, LoginRequest, LoginResponse,
-    SendOtpRequest, VerifyOtpRequest, SocialLoginRequest, ScanCodeRequest,
+    SendOtpRequest, VerifyOtpRequest, SocialLoginRequest, ScanCodeRequest, ScanCodeBatchRequest,
     DeviceTokenRequest, SendNotificationRequest,
     ChatMessageCreate, ChatMessageResponse, ConversationResponse,
     ConversationListResponse, ChatMessageListResponse,
@@ -57,9 +58,19 @@ from services.settings_service import SettingsService
 from services.audit_service import AuditService
 from services.debt_service import DebtService
 from services.auth_service import AuthService
-from websocket_manager import ConnectionManager
-from auth import PERMISSIONS, require_permission, get_seller_from_header
-from customer_auth import get_customer_from_header
+from services.receipt_cache_service import ReceiptCacheService
+from services.receipt_batch_service import ReceiptBatchService, ReceiptBatchTooLarge, BATCH_FORMATS
+from services.escpos_service import EscPosService, PAPER_WIDTHS
+from services.job_service import JobService
+from services.product_search_service import ProductSearchService
+from services.product_suggest_service import ProductSuggestService
+from services.product_code_service import ProductCodeService
+from services.resource_version_service import ResourceVersionService
+from services.image_service import ImageService, ImmutableStaticFiles, VARIANTS_DIR
+from websocket_manager import ConnectionManager, ADMIN_TOPIC
+from json_response import FastJSONResponse
+from auth import PERMISSIONS, require_permission, get_seller_from_header, bearer_token, revoke_token, revoke_subject
+from customer_auth import get_customer_from_header, get_customer_id_from_token
 
 # Create database tables
 Base.metadata.create_all(bind=engine)
@@ -226,12 +237,67 @@ try:
             print(f"Warning: Error migrating products table (category_id): {e}")
             import traceback
             traceback.print_exc()
+        
+        # Migrate conversations table to add last message pointer and unread counters
+        try:
+            try:
+                conversations_columns = [col['name'] for col in inspector.get_columns('conversations')]
+            except Exception:
+                conversations_columns = []
+            added_conversation_columns = False
+            if 'last_message_id' not in conversations_columns:
+                conn.execute(text("ALTER TABLE conversations ADD COLUMN last_message_id INTEGER"))
+                added_conversation_columns = True
+            if 'customer_unread_count' not in conversations_columns:
+                conn.execute(text("ALTER TABLE conversations ADD COLUMN customer_unread_count INTEGER NOT NULL DEFAULT 0"))
+                added_conversation_columns = True
+            if 'admin_unread_count' not in conversations_columns:
+                conn.execute(text("ALTER TABLE conversations ADD COLUMN admin_unread_count INTEGER NOT NULL DEFAULT 0"))
+                added_conversation_columns = True
+            if added_conversation_columns:
+                # One-time backfill from existing messages
+                conn.execute(text("""
+                    UPDATE conversations SET
+                        last_message_id = (
+                            SELECT id FROM chat_messages
+                            WHERE chat_messages.conversation_id = conversations.id
+                            ORDER BY created_at DESC, id DESC LIMIT 1
+                        ),
+                        customer_unread_count = (
+                            SELECT COUNT(*) FROM chat_messages
+                            WHERE chat_messages.conversation_id = conversations.id
+                              AND sender_type = 'admin' AND is_read = 0
+                        ),
+                        admin_unread_count = (
+                            SELECT COUNT(*) FROM chat_messages
+                            WHERE chat_messages.conversation_id = conversations.id
+                              AND sender_type = 'customer' AND is_read = 0
+                        )
+                """))
+                print("✓ Added last_message_id and unread counters to conversations table")
+            conn.execute(text(
+                "CREATE INDEX IF NOT EXISTS ix_chat_messages_conversation_id_id "
+                "ON chat_messages(conversation_id, id)"
+            ))
+        except Exception as e:
+            print(f"Warning: Error migrating conversations table: {e}")
+
+        # Product lists read the last sale date per product from sale_items
+        try:
+            conn.execute(text("CREATE INDEX IF NOT EXISTS ix_sale_items_product_id ON sale_items(product_id)"))
+        except Exception as e:
+            print(f"Warning: Could not create index on sale_items.product_id: {e}")
 except Exception as e:
     print(f"Warning: Could not migrate database: {e}")
     import traceback
     traceback.print_exc()
     # Continue anyway - the code will handle missing columns gracefully
 
+# Build the product search index (FTS5 + sync triggers) if it doesn't exist yet
+ProductSearchService.ensure_index(engine)
+# Version counters for catalog ETags (bumped by triggers on every write)
+ResourceVersionService.ensure_triggers(engine)
+
 app = FastAPI(title="Inventory & Sales Management API", version="1.0.0")
 
 # Exception handlers to ensure all errors return JSON
@@ -335,24 +401,22 @@ app.add_middleware(
 # WebSocket manager
 manager = ConnectionManager()
 
-# Dependency to get DB session
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
-
 # ==================== CATEGORIES ====================
 
 @app.get("/api/categories", response_model=List[CategoryResponse])
 def get_categories(
+    request: Request,
+    response: Response,
     db: Session = Depends(get_db),
     skip: int = Query(0, ge=0),
     limit: int = Query(100, ge=1, le=1000)
 ):
     """Get all categories"""
+    # O'zgarmagan bo'lsa mijozdagi nusxa ishlatiladi (304)
+    cache_headers = ResourceVersionService.cache_headers(db, "categories")
+    if ResourceVersionService.is_not_modified(request, cache_headers):
+        return Response(status_code=304, headers=cache_headers)
+    response.headers.update(cache_headers)
     categories = db.query(Category).order_by(Category.display_order, Category.name).offset(skip).limit(limit).all()
     return categories
 
@@ -503,6 +567,9 @@ def update_category(
         existing = db.query(Category).filter(Category.name == category.name, Category.id != category_id).first()
         if existing:
             raise HTTPException(status_code=400, detail="Bu nomdagi kategoriya allaqachon mavjud")
+        if db_category.name != category.name:
+            # Category names are shown and matched in autocomplete
+            ProductSuggestService.invalidate()
         db_category.name = category.name
     
     if category.description is not None:
@@ -579,8 +646,6 @@ async def upload_product_image_temporary(
     except Exception as e:
         print(f"[UPLOAD IMAGE] Error checking permission: {e}")
         # Continue anyway - permission will be checked on product creation
-    import os
-    import uuid
     from pathlib import Path
     
     # Validate file type
@@ -596,27 +661,18 @@ async def upload_product_image_temporary(
             ext = ".gif"
         elif file.content_type == "image/webp":
             ext = ".webp"
-        file.filename = f"upload_{uuid.uuid4()}{ext}"
+        file.filename = f"upload{ext}"
     
     file_ext = Path(file.filename).suffix.lower()
     if file_ext not in allowed_extensions:
         raise HTTPException(status_code=400, detail="Faqat rasm fayllari qabul qilinadi (jpg, png, gif, webp)")
     
     try:
-        # Generate unique filename
-        unique_filename = f"{uuid.uuid4()}{file_ext}"
-        uploads_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), "uploads", "products")
-        os.makedirs(uploads_dir, exist_ok=True)
-        file_path = os.path.join(uploads_dir, unique_filename)
-
-        # Save file
-        with open(file_path, "wb") as buffer:
-            content = await file.read()
-            buffer.write(content)
+        # Saved by content hash; thumbnails are rendered in the background
+        saved = ImageService.save_upload(await file.read(), "products", file_ext)
 
         # Return image URL (without updating product - will be saved when product is created)
-        image_url = f"/uploads/products/{unique_filename}"
-        return {"url": image_url, "filename": unique_filename, "success": True}
+        return {**saved, "success": True}
     except Exception as e:
         import traceback
         error_details = traceback.format_exc()
@@ -633,8 +689,6 @@ async def upload_product_image(
     seller: Seller = Depends(require_permission("products.update"))
 ):
     """Upload product image file and update existing product"""
-    import os
-    import uuid
     from pathlib import Path
     
     # Verify product exists
@@ -655,31 +709,22 @@ async def upload_product_image(
             ext = ".gif"
         elif file.content_type == "image/webp":
             ext = ".webp"
-        file.filename = f"upload_{uuid.uuid4()}{ext}"
+        file.filename = f"upload{ext}"
     
     file_ext = Path(file.filename).suffix.lower()
     if file_ext not in allowed_extensions:
         raise HTTPException(status_code=400, detail="Faqat rasm fayllari qabul qilinadi (jpg, png, gif, webp)")
     
     try:
-        # Generate unique filename
-        unique_filename = f"{uuid.uuid4()}{file_ext}"
-        uploads_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), "uploads", "products")
-        os.makedirs(uploads_dir, exist_ok=True)
-        file_path = os.path.join(uploads_dir, unique_filename)
-        
-        # Save file
-        with open(file_path, "wb") as buffer:
-            content = await file.read()
-            buffer.write(content)
+        # Saved by content hash; thumbnails are rendered in the background
+        saved = ImageService.save_upload(await file.read(), "products", file_ext)
         
         # Update product image_url
-        image_url = f"/uploads/products/{unique_filename}"
-        product.image_url = image_url
+        product.image_url = saved["url"]
         db.commit()
         db.refresh(product)
         
-        return {"url": image_url, "filename": unique_filename, "success": True}
+        return {**saved, "success": True}
     except Exception as e:
         db.rollback()
         import traceback
@@ -941,6 +986,7 @@ async def create_product(
 
 @app.get("/api/products", response_model=List[ProductResponse])
 def get_products(
+    request: Request,
     skip: int = 0, 
     limit: int = Query(100, le=1000, ge=1),
     search: Optional[str] = None,
@@ -958,61 +1004,16 @@ def get_products(
     seller: Optional[Seller] = Depends(get_seller_from_header)
 ):
     """Get all products with optional search, filtering, and sorting"""
+    # O'zgarmagan bo'lsa mijozdagi nusxa ishlatiladi (304)
+    cache_headers = ResourceVersionService.cache_headers(db, "products")
+    if ResourceVersionService.is_not_modified(request, cache_headers):
+        return Response(status_code=304, headers=cache_headers)
     products = ProductService.get_products(db, skip=skip, limit=limit, search=search, 
                                       low_stock_only=low_stock_only, min_stock=min_stock,
                                       brand=brand, category=category, supplier=supplier, location=location,
-                                      sort_by=sort_by, sort_order=sort_order)
-    # Convert to response with computed properties
-    result = []
-    for p in products:
-        try:
-            # Safely get computed properties
-            last_sold = None
-            days_since = None
-            is_slow = False
-            try:
-                last_sold = p.last_sold_date
-                days_since = p.days_since_last_sale
-                is_slow = p.is_slow_moving
-            except Exception as e:
-                # If computed properties fail, use defaults
-                print(f"Warning: Error computing properties for product {p.id}: {e}")
-            
-            product_dict = {
-                "id": p.id,
-                "name": p.name,
-                "item_number": p.item_number,
-                "barcode": p.barcode,
-                "category": p.category,
-                "brand": p.brand,
-                "supplier": p.supplier,
-                "received_date": p.received_date,
-                "image_url": p.image_url,
-                "location": p.location,
-                "pieces_per_package": p.pieces_per_package,
-                "cost_price": max(0.0, p.cost_price or 0.0),  # Ensure cost_price is >= 0
-                "wholesale_price": max(0.0, p.wholesale_price or 0.0),
-                "retail_price": max(0.0, p.retail_price or 0.0),
-                "regular_price": max(0.0, p.regular_price or 0.0),
-                "product_url": f"/product/{p.id}",  # Customer app uchun URL
-                "packages_in_stock": max(0, p.packages_in_stock or 0),
-                "pieces_in_stock": max(0, p.pieces_in_stock or 0),
-                "total_pieces": p.total_pieces,
-                "total_value": p.total_value,
-                "total_value_cost": p.total_value_cost,
-                "total_value_wholesale": p.total_value_wholesale,
-                "last_sold_date": last_sold,
-                "days_since_last_sale": days_since,
-                "is_slow_moving": is_slow,
-                "created_at": p.created_at if p.created_at is not None else datetime.now(),
-                "updated_at": p.updated_at if p.updated_at is not None else datetime.now()
-            }
-            result.append(ProductResponse.model_validate(product_dict))
-        except Exception as e:
-            print(f"Error processing product {p.id}: {e}")
-            # Continue with next product instead of failing completely
-            continue
-    return result
+                                      sort_by=sort_by, sort_order=sort_order, as_rows=True)
+    # Column rows -> response dicts (computed properties included), encoded once
+    return FastJSONResponse(ProductService.products_to_response_dicts(db, products), headers=cache_headers)
 
 
 @app.get("/api/products/count")
@@ -1043,6 +1044,16 @@ def get_products_count(
 
 
 # Export endpoint must come BEFORE /api/products/{product_id} to avoid route conflict
+@app.get("/api/products/suggest", response_model=ProductSuggestResponse)
+def suggest_products(
+    q: str = "",
+    limit: int = Query(10, ge=1, le=50),
+    db: Session = Depends(get_db)
+):
+    """Search box autocomplete from the in-memory index (typo tolerant, popular products first)"""
+    return ProductSuggestResponse(query=q, suggestions=ProductSuggestService.suggest(db, q, limit))
+
+
 @app.get("/api/products/export")
 def export_products(
     db: Session = Depends(get_db),
@@ -1056,10 +1067,12 @@ def export_products(
         if not os.path.exists(file_path):
             raise HTTPException(status_code=500, detail="Export fayli yaratilmadi")
         filename = os.path.basename(file_path)
+        # Fayl bo'laklab yuboriladi va yuborilgandan keyin o'chiriladi
         return FileResponse(
             file_path, 
             media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-            filename=filename
+            filename=filename,
+            background=BackgroundTask(os.remove, file_path)
         )
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Export xatosi: {str(e)}")
@@ -1068,54 +1081,8 @@ def export_products(
 @app.get("/api/products/low-stock", response_model=List[ProductResponse])
 def get_low_stock_products(min_stock: int = 10, db: Session = Depends(get_db)):
     """Get products with low stock"""
-    products = ProductService.get_products(db, skip=0, limit=1000, low_stock_only=True, min_stock=min_stock)
-    # Convert to response with computed properties
-    result = []
-    for p in products:
-        try:
-            last_sold = None
-            days_since = None
-            is_slow = False
-            try:
-                last_sold = p.last_sold_date
-                days_since = p.days_since_last_sale
-                is_slow = p.is_slow_moving
-            except Exception as e:
-                print(f"Warning: Error computing properties for product {p.id}: {e}")
-            
-            product_dict = {
-                "id": p.id,
-                "name": p.name,
-                "item_number": p.item_number,
-                "barcode": p.barcode,
-                "category": p.category,
-                "brand": p.brand,
-                "supplier": p.supplier,
-                "received_date": p.received_date,
-                "image_url": p.image_url,
-                "location": p.location,
-                "pieces_per_package": p.pieces_per_package,
-                "cost_price": p.cost_price,
-                "wholesale_price": p.wholesale_price,
-                "retail_price": p.retail_price,
-                "regular_price": p.regular_price,
-                "packages_in_stock": p.packages_in_stock if p.packages_in_stock is not None else 0,
-                "pieces_in_stock": p.pieces_in_stock if p.pieces_in_stock is not None else 0,
-                "total_pieces": p.total_pieces,
-                "total_value": p.total_value,
-                "total_value_cost": p.total_value_cost,
-                "total_value_wholesale": p.total_value_wholesale,
-                "last_sold_date": last_sold,
-                "days_since_last_sale": days_since,
-                "is_slow_moving": is_slow,
-                "created_at": p.created_at if p.created_at is not None else datetime.now(),
-                "updated_at": p.updated_at if p.updated_at is not None else datetime.now()
-            }
-            result.append(ProductResponse.model_validate(product_dict))
-        except Exception as e:
-            print(f"Error processing product {p.id}: {e}")
-            continue
-    return result
+    products = ProductService.get_products(db, skip=0, limit=1000, low_stock_only=True, min_stock=min_stock, as_rows=True)
+    return FastJSONResponse(ProductService.products_to_response_dicts(db, products))
 
 
 @app.post("/api/products/bulk-delete")
@@ -1136,9 +1103,13 @@ def bulk_delete_products(
 
 
 @app.get("/api/products/{product_id}", response_model=ProductResponse)
-def get_product(product_id: int, db: Session = Depends(get_db)):
+def get_product(product_id: int, request: Request, response: Response, db: Session = Depends(get_db)):
     """Get a specific product"""
     from sqlalchemy.orm import joinedload
+    cache_headers = ResourceVersionService.cache_headers(db, "products")
+    if ResourceVersionService.is_not_modified(request, cache_headers):
+        return Response(status_code=304, headers=cache_headers)
+    response.headers.update(cache_headers)
     product = db.query(Product).options(joinedload(Product.sale_items)).filter(Product.id == product_id).first()
     if not product:
         raise HTTPException(status_code=404, detail="Product not found")
@@ -1268,74 +1239,64 @@ def scan_product_code(request: ScanCodeRequest, db: Session = Depends(get_db)):
     Scan QR code or barcode to find product.
     Supports:
     - Barcode: Direct barcode match
+    - Item number: Mahsulot kodi
     - QR Code: PRODUCT_{id}_{name} format or product ID
     - Deep link: product/{id} format
+    Codes are resolved from an in-memory index (see ProductCodeService).
     """
-    from models import Product
     code = request.code.strip()
     
     if not code:
         raise HTTPException(status_code=400, detail="Kod bo'sh bo'lishi mumkin emas")
     
-    # Try to find by barcode first
-    product = db.query(Product).filter(Product.barcode == code).first()
-    if product:
-        return {
-            "success": True,
-            "product": ProductService.product_to_response(product),
-            "match_type": "barcode"
-        }
-    
-    # Try to parse QR code format: PRODUCT_{id}_{name}
-    if code.startswith("PRODUCT_"):
-        try:
-            parts = code.split("_", 2)
-            if len(parts) >= 2:
-                product_id = int(parts[1])
-                product = ProductService.get_product(db, product_id)
-                if product:
-                    return {
-                        "success": True,
-                        "product": ProductService.product_to_response(product),
-                        "match_type": "qr_code"
-                    }
-        except (ValueError, IndexError):
-            pass
-    
-    # Try to parse deep link format: product/{id} or /product/{id}
-    import re
-    product_match = re.search(r'product[/_](\d+)', code, re.IGNORECASE)
-    if product_match:
-        try:
-            product_id = int(product_match.group(1))
-            product = ProductService.get_product(db, product_id)
-            if product:
-                return {
-                    "success": True,
-                    "product": ProductService.product_to_response(product),
-                    "match_type": "deep_link"
-                }
-        except ValueError:
-            pass
+    match = ProductCodeService.find_product(db, code)
+    if not match:
+        raise HTTPException(
+            status_code=404,
+            detail=f"Ushbu kod bo'yicha mahsulot topilmadi: {code}"
+        )
     
-    # Try direct product ID
-    try:
-        product_id = int(code)
-        product = ProductService.get_product(db, product_id)
-        if product:
-            return {
+    product, match_type = match
+    return {
+        "success": True,
+        "product": ProductService.product_to_response(product, include_sales_stats=False),
+        "match_type": match_type
+    }
+
+
+@app.post("/api/products/scan/batch")
+def scan_product_codes(request: ScanCodeBatchRequest, db: Session = Depends(get_db)):
+    """
+    Resolve a whole basket of scanned codes in one call.
+    Results keep the order of the request; unknown codes are listed in not_found.
+    """
+    codes = [code.strip() for code in request.codes]
+    found = ProductCodeService.find_products(db, codes)
+    
+    results = []
+    for code in codes:
+        if code in found:
+            product, match_type = found[code]
+            results.append({
+                "code": code,
                 "success": True,
-                "product": ProductService.product_to_response(product),
-                "match_type": "product_id"
-            }
-    except ValueError:
-        pass
+                "product": ProductService.product_to_response(product, include_sales_stats=False),
+                "match_type": match_type
+            })
+        else:
+            results.append({"code": code, "success": False, "product": None, "match_type": None})
     
-    # Not found
-    raise HTTPException(
-        status_code=404,
-        detail=f"Ushbu kod bo'yicha mahsulot topilmadi: {code}"
-    )
+    return {
+        "results": results,
+        "found": sum(1 for result in results if result["success"]),
+        "not_found": [result["code"] for result in results if not result["success"]]
+    }
+
+
+@app.get("/api/products/scan/stats")
+def get_scan_stats(seller: Seller = Depends(require_permission("products.view"))):
+    """Scan code index hit/miss statistics"""
+    return ProductCodeService.get_stats()
 
 
 # ==================== PRODUCT IMAGES ====================
@@ -1350,8 +1311,6 @@ async def add_product_image(
     seller: Seller = Depends(require_permission("products.update"))
 ):
     """Add an additional image to a product"""
-    import os
-    import uuid
     from pathlib import Path
     from models import ProductImage
     
@@ -1371,23 +1330,15 @@ async def add_product_image(
             ext = ".gif"
         elif file.content_type == "image/webp":
             ext = ".webp"
-        file.filename = f"upload_{uuid.uuid4()}{ext}"
+        file.filename = f"upload{ext}"
     
     file_ext = Path(file.filename).suffix.lower()
     if file_ext not in allowed_extensions:
         raise HTTPException(status_code=400, detail="Faqat rasm fayllari qabul qilinadi")
     
     try:
-        # Generate unique filename
-        unique_filename = f"{uuid.uuid4()}{file_ext}"
-        uploads_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), "uploads", "products")
-        os.makedirs(uploads_dir, exist_ok=True)
-        file_path = os.path.join(uploads_dir, unique_filename)
-        
-        # Save file
-        with open(file_path, "wb") as buffer:
-            content = await file.read()
-            buffer.write(content)
+        # Saved by content hash; thumbnails are rendered in the background
+        saved = ImageService.save_upload(await file.read(), "products", file_ext)
         
         # If this is marked as primary, unset other primary images
         if is_primary:
@@ -1397,10 +1348,9 @@ async def add_product_image(
             ).update({"is_primary": False})
         
         # Create ProductImage record
-        image_url = f"/uploads/products/{unique_filename}"
         product_image = ProductImage(
             product_id=product_id,
-            image_url=image_url,
+            image_url=saved["url"],
             display_order=display_order,
             is_primary=is_primary
         )
@@ -1415,6 +1365,7 @@ async def add_product_image(
             "image_url": product_image.image_url,
             "display_order": product_image.display_order,
             "is_primary": product_image.is_primary,
+            "variants": saved["variants"],
             "created_at": product_image.created_at
         }
     except Exception as e:
@@ -1448,6 +1399,7 @@ def get_product_images(
             "image_url": img.image_url,
             "display_order": img.display_order,
             "is_primary": img.is_primary,
+            "variants": ImageService.variant_urls(img.image_url),
             "created_at": img.created_at
         }
         for img in images
@@ -1499,6 +1451,7 @@ def add_product_image_from_url(
             "image_url": product_image.image_url,
             "display_order": product_image.display_order,
             "is_primary": product_image.is_primary,
+            "variants": ImageService.variant_urls(product_image.image_url),
             "created_at": product_image.created_at
         }
     except Exception as e:
@@ -1518,7 +1471,6 @@ def delete_product_image(
     seller: Seller = Depends(require_permission("products.update"))
 ):
     """Delete a product image"""
-    import os
     from models import ProductImage
     
     product = db.query(Product).filter(Product.id == product_id).first()
@@ -1534,19 +1486,15 @@ def delete_product_image(
         raise HTTPException(status_code=404, detail="Rasm topilmadi")
     
     try:
-        # Delete physical file
-        if product_image.image_url:
-            file_path = os.path.join(
-                os.path.dirname(os.path.dirname(__file__)),
-                product_image.image_url.lstrip('/')
-            )
-            if os.path.exists(file_path):
-                os.remove(file_path)
+        image_url = product_image.image_url
         
         # Delete database record
         db.delete(product_image)
         db.commit()
         
+        # Delete physical file (content-hashed files may be shared with other records)
+        ImageService.delete_if_unused(db, image_url)
+        
         return {"success": True, "message": "Rasm o'chirildi"}
     except Exception as e:
         db.rollback()
@@ -1601,6 +1549,7 @@ def update_product_image(
             "image_url": product_image.image_url,
             "display_order": product_image.display_order,
             "is_primary": product_image.is_primary,
+            "variants": ImageService.variant_urls(product_image.image_url),
             "created_at": product_image.created_at
         }
     except Exception as e:
@@ -2216,7 +2165,62 @@ def export_sales(
     return FileResponse(
         file_path, 
         media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-        filename=filename
+        filename=filename,
+        background=BackgroundTask(os.remove, file_path)
+    )
+
+
+@app.get("/api/sales/receipts/batch")
+async def get_batch_receipts(
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    seller_id: Optional[int] = None,
+    status: Optional[str] = None,
+    format: str = "pdf",
+    batch_id: Optional[str] = Query(None, max_length=64, pattern=r"^[A-Za-z0-9_-]+$"),
+    db: Session = Depends(get_db),
+    seller: Seller = Depends(require_permission("sales.receipt"))
+):
+    """
+    Render receipts of all matching sales into one PDF or a ZIP archive.
+    Progress is published as receipt_batch_progress events with batch_id; clients
+    pass their own batch_id to recognize the events of their request.
+    """
+    import uuid
+    from starlette.concurrency import run_in_threadpool
+    
+    if format not in BATCH_FORMATS:
+        raise HTTPException(status_code=400, detail=f"format must be one of: {', '.join(BATCH_FORMATS)}")
+    
+    try:
+        sales, settings = await run_in_threadpool(
+            ReceiptBatchService.load_sales, db, start_date, end_date, seller_id, status
+        )
+    except ReceiptBatchTooLarge as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if not sales:
+        raise HTTPException(status_code=404, detail="Sotuvlar topilmadi")
+    
+    batch_id = batch_id or uuid.uuid4().hex
+    
+    async def report_progress(done: int, total: int):
+        # Admin panel progressni WebSocket orqali ko'radi (mijozlarga yuborilmaydi)
+        await manager.publish(ADMIN_TOPIC, {
+            "type": "receipt_batch_progress",
+            "data": {"batch_id": batch_id, "done": done, "total": total}
+        })
+    
+    content = await ReceiptBatchService.render(sales, settings, format, progress=report_progress)
+    
+    media_type = "application/zip" if format == "zip" else "application/pdf"
+    filename = f"receipts_{get_uzbekistan_now().strftime('%Y%m%d_%H%M%S')}.{format}"
+    return Response(
+        content=content,
+        media_type=media_type,
+        headers={
+            "Content-Disposition": f'attachment; filename="{filename}"',
+            "X-Batch-ID": batch_id
+        }
     )
 
 
@@ -2330,6 +2334,7 @@ def delete_sale(sale_id: int, db: Session = Depends(get_db)):
         # Delete sale
         db.delete(sale)
         db.commit()
+        ReceiptCacheService.invalidate_sale(sale_id)
         
         return {"message": "Sale cancelled successfully", "sale_id": sale_id}
     except Exception as e:
@@ -2340,8 +2345,12 @@ def delete_sale(sale_id: int, db: Session = Depends(get_db)):
 # ==================== SETTINGS ====================
 
 @app.get("/api/settings", response_model=SettingsResponse)
-def get_settings(db: Session = Depends(get_db)):
+def get_settings(request: Request, response: Response, db: Session = Depends(get_db)):
     """Get application settings"""
+    cache_headers = ResourceVersionService.cache_headers(db, "settings")
+    if ResourceVersionService.is_not_modified(request, cache_headers):
+        return Response(status_code=304, headers=cache_headers)
+    response.headers.update(cache_headers)
     try:
         settings = SettingsService.get_settings(db)
         if not settings:
@@ -2398,8 +2407,6 @@ async def upload_seller_image(
     seller: Seller = Depends(require_permission("admin.sellers"))
 ):
     """Upload seller profile image"""
-    import os
-    import uuid
     from pathlib import Path
     
     # Verify seller exists
@@ -2419,29 +2426,20 @@ async def upload_seller_image(
             ext = ".gif"
         elif file.content_type == "image/webp":
             ext = ".webp"
-        file.filename = f"seller_{seller_id}_{uuid.uuid4()}{ext}"
+        file.filename = f"seller_{seller_id}{ext}"
     
     file_ext = Path(file.filename).suffix.lower()
     if file_ext not in allowed_extensions:
         raise HTTPException(status_code=400, detail="Faqat rasm fayllari qabul qilinadi (jpg, png, gif, webp)")
     
-    # Generate unique filename
-    unique_filename = f"seller_{seller_id}_{uuid.uuid4()}{file_ext}"
-    uploads_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), "uploads", "sellers")
-    os.makedirs(uploads_dir, exist_ok=True)
-    file_path = os.path.join(uploads_dir, unique_filename)
-    
-    # Save file
-    with open(file_path, "wb") as buffer:
-        content = await file.read()
-        buffer.write(content)
+    # Saved by content hash; thumbnails are rendered in the background
+    saved = ImageService.save_upload(await file.read(), "sellers", file_ext)
     
     # Update seller image_url
-    image_url = f"/uploads/sellers/{unique_filename}"
-    seller.image_url = image_url
+    seller.image_url = saved["url"]
     db.commit()
     
-    return {"url": image_url, "filename": unique_filename}
+    return saved
 
 
 @app.post("/api/settings/upload-logo")
@@ -2450,8 +2448,6 @@ async def upload_logo(
     seller: Seller = Depends(require_permission("admin.settings"))
 ):
     """Upload logo image file (Admin only)"""
-    import os
-    import uuid
     from pathlib import Path
     
     # Validate file type
@@ -2468,42 +2464,69 @@ async def upload_logo(
             ext = ".webp"
         elif file.content_type == "image/svg+xml":
             ext = ".svg"
-        file.filename = f"logo_{uuid.uuid4()}{ext}"
+        file.filename = f"logo{ext}"
     
     file_ext = Path(file.filename).suffix.lower()
     if file_ext not in allowed_extensions:
         raise HTTPException(status_code=400, detail="Faqat rasm fayllari qabul qilinadi (jpg, png, gif, webp, svg)")
     
-    # Generate unique filename
-    unique_filename = f"logo_{uuid.uuid4()}{file_ext}"
-    uploads_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), "uploads", "settings")
-    os.makedirs(uploads_dir, exist_ok=True)
-    file_path = os.path.join(uploads_dir, unique_filename)
-    
-    # Save file
-    with open(file_path, "wb") as buffer:
-        content = await file.read()
-        buffer.write(content)
-    
-    # Return URL
-    logo_url = f"/uploads/settings/{unique_filename}"
-    return {"url": logo_url, "filename": unique_filename}
+    # Saved by content hash (svg is kept as is, other formats get thumbnails)
+    return ImageService.save_upload(await file.read(), "settings", file_ext)
 
 
 @app.get("/api/sales/{sale_id}/receipt")
 def get_sale_receipt(
     sale_id: int,
     db: Session = Depends(get_db),
-    seller: Optional[Seller] = Depends(get_seller_from_header)
+    seller: Optional[Seller] = Depends(get_seller_from_header),
+    if_none_match: Optional[str] = Header(None, alias="If-None-Match"),
+    receipt_format: str = Query("pdf", alias="format"),
+    paper: int = 80
 ):
-    """Generate PDF receipt for a sale"""
+    """
+    Generate receipt for a sale.
+    format=pdf (A4, cached by sale and settings version), escpos (raw thermal
+    printer bytes) or text; paper=58 or 80 (mm) for escpos/text.
+    """
     # Receipt uchun autentifikatsiya shart emas (admin panel va sotuvchilar uchun)
+    if receipt_format not in ("pdf", "escpos", "text"):
+        raise HTTPException(status_code=400, detail="format must be one of: pdf, escpos, text")
+    if receipt_format != "pdf" and paper not in PAPER_WIDTHS:
+        raise HTTPException(status_code=400, detail="paper must be 58 or 80")
+    
     sale = SaleService.get_sale(db, sale_id)
     if not sale:
         raise HTTPException(status_code=404, detail="Sale not found")
     
-    pdf_path = PDFService.generate_receipt(db, sale_id)
-    return FileResponse(pdf_path, media_type="application/pdf", filename=f"receipt_{sale_id}.pdf")
+    if receipt_format != "pdf":
+        # Termal printer uchun - PDF render qilinmaydi
+        settings = SettingsService.get_settings(db)
+        if receipt_format == "text":
+            return Response(
+                content=EscPosService.render_text(sale, settings, paper),
+                media_type="text/plain; charset=utf-8"
+            )
+        return Response(
+            content=EscPosService.render_escpos(sale, settings, paper),
+            media_type="application/octet-stream",
+            headers={"Content-Disposition": f'attachment; filename="receipt_{sale_id}.bin"'}
+        )
+    
+    # Chek o'zgarmagan bo'lsa mijozdagi nusxa ishlatiladi
+    etag = ReceiptCacheService.get_etag(db, sale)
+    cache_headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if if_none_match and etag in [tag.strip() for tag in if_none_match.split(",")]:
+        return Response(status_code=304, headers=cache_headers)
+    
+    content, etag = ReceiptCacheService.get_receipt(db, sale)
+    return Response(
+        content=content,
+        media_type="application/pdf",
+        headers={
+            **cache_headers,
+            "Content-Disposition": f'attachment; filename="receipt_{sale_id}.pdf"'
+        }
+    )
 
 
 @app.get("/api/customers/{customer_id}/sales-history", response_model=List[SaleResponse])
@@ -2676,7 +2699,7 @@ def verify_otp(request: VerifyOtpRequest, db: Session = Depends(get_db)):
     db.commit()
 
     # Generate token for login (similar to social-login)
-    token = AuthService.generate_token()
+    token = AuthService.issue_customer_token(customer.id)
 
     # Return token and user data for login
     user_payload = {
@@ -2830,7 +2853,7 @@ def social_login(request: SocialLoginRequest, db: Session = Depends(get_db)):
             raise HTTPException(status_code=400, detail="Mijoz yaratishda xatolik")
 
     # Generate token (reuse AuthService)
-    token = AuthService.generate_token()
+    token = AuthService.issue_customer_token(customer.id)
 
     # Log for debugging
     print("======================================")
@@ -3052,6 +3075,36 @@ def update_help_request(
 
 # ==================== CHAT/SUPPORT ====================
 
+def mark_conversation_read(db: Session, conversation, reader_type: str, up_to_id: Optional[int] = None) -> int:
+    """
+    Mark the other side's messages as read (only up to up_to_id if given) in one UPDATE
+    and lower the reader's unread counter. Returns the number of messages marked.
+    """
+    from models import Conversation, ChatMessage
+    from sqlalchemy import case
+    
+    sender_type = "admin" if reader_type == "customer" else "customer"
+    query = db.query(ChatMessage).filter(
+        ChatMessage.conversation_id == conversation.id,
+        ChatMessage.sender_type == sender_type,
+        ChatMessage.is_read == False
+    )
+    if up_to_id is not None:
+        query = query.filter(ChatMessage.id <= up_to_id)
+    marked = query.update({
+        "is_read": True,
+        "read_at": get_uzbekistan_now()
+    })
+    
+    counter_name = "customer_unread_count" if reader_type == "customer" else "admin_unread_count"
+    if up_to_id is None or (conversation.last_message_id is not None and up_to_id >= conversation.last_message_id):
+        setattr(conversation, counter_name, 0)
+    elif marked:
+        counter = getattr(Conversation, counter_name)
+        setattr(conversation, counter_name, case((counter > marked, counter - marked), else_=0))
+    return marked
+
+
 @app.get("/api/conversations", response_model=ConversationListResponse)
 def get_conversations(
     skip: int = 0,
@@ -3062,7 +3115,8 @@ def get_conversations(
     seller: Optional[Seller] = Depends(get_seller_from_header)
 ):
     """Get conversations list (for customer or admin)"""
-    from models import Conversation, ChatMessage
+    from models import Conversation
+    from sqlalchemy.orm import joinedload
     
     query = db.query(Conversation)
     
@@ -3085,28 +3139,19 @@ def get_conversations(
     query = query.order_by(Conversation.last_message_at.desc().nullslast(), Conversation.created_at.desc())
     
     total = query.count()
-    conversations = query.offset(skip).limit(limit).all()
+    # Names and the last message come in the same query; unread counts are stored on the conversation
+    conversations = query.options(
+        joinedload(Conversation.customer),
+        joinedload(Conversation.seller),
+        joinedload(Conversation.last_message)
+    ).offset(skip).limit(limit).all()
     
     # Build response with unread count and last message
     conversation_responses = []
     for conv in conversations:
-        # Get unread count
-        unread_query = db.query(ChatMessage).filter(
-            ChatMessage.conversation_id == conv.id,
-            ChatMessage.is_read == False
-        )
-        if customer_id:
-            unread_query = unread_query.filter(ChatMessage.sender_type == "admin")
-        elif seller:
-            unread_query = unread_query.filter(ChatMessage.sender_type == "customer")
-        
-        unread_count = unread_query.count()
-        
-        # Get last message
-        last_message = db.query(ChatMessage).filter(
-            ChatMessage.conversation_id == conv.id
-        ).order_by(ChatMessage.created_at.desc()).first()
+        unread_count = conv.customer_unread_count if customer_id else conv.admin_unread_count
         
+        last_message = conv.last_message
         last_message_response = None
         if last_message:
             last_message_response = ChatMessageResponse(
@@ -3153,53 +3198,54 @@ def get_conversations(
 @app.get("/api/conversations/{conversation_id}/messages", response_model=ChatMessageListResponse)
 def get_conversation_messages(
     conversation_id: int,
-    skip: int = 0,
+    before_id: Optional[int] = None,
+    after_id: Optional[int] = None,
     limit: int = 100,
     db: Session = Depends(get_db),
     customer_id: Optional[int] = Header(None, alias="X-Customer-ID"),
     seller: Optional[Seller] = Depends(get_seller_from_header)
 ):
-    """Get messages in a conversation"""
+    """
+    Get messages in a conversation (always in ascending order).
+    Without cursors the newest `limit` messages are returned; before_id pages back
+    into history and after_id fetches messages newer than the client already has.
+    """
     from models import Conversation, ChatMessage
+    from sqlalchemy.orm import joinedload
     
     # Verify conversation exists and user has access
-    conversation = db.query(Conversation).filter(Conversation.id == conversation_id).first()
+    conversation = db.query(Conversation).options(
+        joinedload(Conversation.customer),
+        joinedload(Conversation.seller)
+    ).filter(Conversation.id == conversation_id).first()
     if not conversation:
         raise HTTPException(status_code=404, detail="Conversation not found")
     
     if customer_id and conversation.customer_id != customer_id:
         raise HTTPException(status_code=403, detail="Access denied")
     
-    # Get messages
-    messages_query = db.query(ChatMessage).filter(
-        ChatMessage.conversation_id == conversation_id
-    ).order_by(ChatMessage.created_at.asc())
-    
-    total = messages_query.count()
-    messages = messages_query.offset(skip).limit(limit).all()
+    limit = max(1, min(limit, 500))
+    
+    # Keyset pagination on (conversation_id, id); one extra row tells whether more exist
+    messages_query = db.query(ChatMessage).filter(ChatMessage.conversation_id == conversation_id)
+    if before_id is not None:
+        messages_query = messages_query.filter(ChatMessage.id < before_id)
+    if after_id is not None:
+        messages_query = messages_query.filter(ChatMessage.id > after_id)
+        messages = messages_query.order_by(ChatMessage.id.asc()).limit(limit + 1).all()
+        has_more = len(messages) > limit
+        messages = messages[:limit]
+    else:
+        messages = messages_query.order_by(ChatMessage.id.desc()).limit(limit + 1).all()
+        has_more = len(messages) > limit
+        messages = messages[:limit][::-1]
     
-    # Mark messages as read
-    if customer_id:
-        # Mark admin messages as read
-        db.query(ChatMessage).filter(
-            ChatMessage.conversation_id == conversation_id,
-            ChatMessage.sender_type == "admin",
-            ChatMessage.is_read == False
-        ).update({
-            "is_read": True,
-            "read_at": get_uzbekistan_now()
-        })
-    elif seller:
-        # Mark customer messages as read
-        db.query(ChatMessage).filter(
-            ChatMessage.conversation_id == conversation_id,
-            ChatMessage.sender_type == "customer",
-            ChatMessage.is_read == False
-        ).update({
-            "is_read": True,
-            "read_at": get_uzbekistan_now()
-        })
-    db.commit()
+    # Mark the other side's messages as read up to the newest one returned
+    if messages:
+        if customer_id:
+            mark_conversation_read(db, conversation, "customer", messages[-1].id)
+        elif seller:
+            mark_conversation_read(db, conversation, "admin", messages[-1].id)
     
     # Build response
     message_responses = [
@@ -3216,6 +3262,7 @@ def get_conversation_messages(
         )
         for msg in messages
     ]
+    db.flush()
     
     # Get conversation details
     customer_name = conversation.customer.name if conversation.customer else None
@@ -3231,22 +3278,50 @@ def get_conversation_messages(
         status=conversation.status,
         is_customer_archived=conversation.is_customer_archived,
         is_admin_archived=conversation.is_admin_archived,
-        unread_count=0,  # Already marked as read
+        unread_count=conversation.customer_unread_count if customer_id else conversation.admin_unread_count,
         last_message=None,
         created_at=conversation.created_at,
         updated_at=conversation.updated_at,
         last_message_at=conversation.last_message_at
     )
+    db.commit()
     
     return ChatMessageListResponse(
         messages=message_responses,
         conversation=conversation_response,
-        total=total,
-        skip=skip,
-        limit=limit
+        limit=limit,
+        has_more=has_more
     )
 
 
+@app.put("/api/conversations/{conversation_id}/read")
+def mark_conversation_messages_read(
+    conversation_id: int,
+    up_to_id: Optional[int] = Body(None, embed=True),
+    db: Session = Depends(get_db),
+    customer_id: Optional[int] = Header(None, alias="X-Customer-ID"),
+    seller: Optional[Seller] = Depends(get_seller_from_header)
+):
+    """Mark messages read up to up_to_id (e.g. after messages arrived over /ws)"""
+    from models import Conversation
+    
+    conversation = db.query(Conversation).filter(Conversation.id == conversation_id).first()
+    if not conversation:
+        raise HTTPException(status_code=404, detail="Conversation not found")
+    
+    if customer_id:
+        if conversation.customer_id != customer_id:
+            raise HTTPException(status_code=403, detail="Access denied")
+        marked = mark_conversation_read(db, conversation, "customer", up_to_id)
+    elif seller:
+        marked = mark_conversation_read(db, conversation, "admin", up_to_id)
+    else:
+        raise HTTPException(status_code=401, detail="Authentication required")
+    
+    db.commit()
+    return {"success": True, "marked": marked}
+
+
 @app.post("/api/conversations/{conversation_id}/messages", response_model=ChatMessageResponse)
 async def send_message(
     conversation_id: int,
@@ -3299,42 +3374,37 @@ async def send_message(
     conversation.status = "open"  # Reopen if closed
     
     db.add(chat_message)
+    db.flush()
+    conversation.last_message_id = chat_message.id
+    # Counter is incremented in SQL so concurrent senders don't overwrite each other
+    if sender_type == "customer":
+        conversation.admin_unread_count = Conversation.admin_unread_count + 1
+    else:
+        conversation.customer_unread_count = Conversation.customer_unread_count + 1
     db.commit()
     db.refresh(chat_message)
     
-    # Send WebSocket notification
+    # Push the message to the other participant's topic (clients no longer need to poll)
     try:
-        if customer_id:
-            # Notify admin
-            await manager.broadcast({
-                "type": "new_chat_message",
-                "data": {
-                    "conversation_id": conversation_id,
-                    "customer_id": customer_id,
-                    "message": {
-                        "id": chat_message.id,
-                        "sender_type": sender_type,
-                        "sender_name": sender_name,
-                        "message": message_data.message,
-                        "created_at": chat_message.created_at.isoformat()
-                    }
-                }
-            })
-        elif seller:
-            # Notify customer
-            await manager.send_to_customer(conversation.customer_id, {
-                "type": "new_chat_message",
-                "data": {
-                    "conversation_id": conversation_id,
-                    "message": {
-                        "id": chat_message.id,
-                        "sender_type": sender_type,
-                        "sender_name": sender_name,
-                        "message": message_data.message,
-                        "created_at": chat_message.created_at.isoformat()
-                    }
+        event = {
+            "type": "new_chat_message",
+            "data": {
+                "conversation_id": conversation_id,
+                "customer_id": conversation.customer_id,
+                "message": {
+                    "id": chat_message.id,
+                    "sender_type": sender_type,
+                    "sender_id": sender_id,
+                    "sender_name": sender_name,
+                    "message": message_data.message,
+                    "created_at": chat_message.created_at.isoformat()
                 }
-            })
+            }
+        }
+        if customer_id:
+            await manager.publish(ADMIN_TOPIC, event)
+        else:
+            await manager.send_to_customer(conversation.customer_id, event)
     except Exception as e:
         print(f"Error sending WebSocket notification: {e}")
     
@@ -3391,12 +3461,15 @@ async def create_conversation(
     conversation.last_message_at = get_uzbekistan_now()
     
     db.add(chat_message)
+    db.flush()
+    conversation.last_message_id = chat_message.id
+    conversation.admin_unread_count = 1
     db.commit()
     db.refresh(chat_message)
     
     # Notify admin via WebSocket
     try:
-        await manager.broadcast({
+        await manager.publish(ADMIN_TOPIC, {
             "type": "new_conversation",
             "data": {
                 "conversation_id": conversation.id,
@@ -3512,6 +3585,8 @@ def reset_password(
     customer.password_hash = AuthService.hash_password(new_password)
     db.commit()
     db.refresh(customer)
+    # Eski parol bilan olingan tokenlar bekor qilinadi
+    revoke_subject("customer", customer.id)
     
     return {
         "success": True,
@@ -3520,14 +3595,27 @@ def reset_password(
     }
 
 
+@app.post("/api/auth/logout")
+def logout(authorization: Optional[str] = Header(None)):
+    """Revoke the signed access token sent in the Authorization header"""
+    token = bearer_token(authorization)
+    if token:
+        revoke_token(token)
+    return {"success": True}
+
+
 @app.get("/api/auth/me")
 def get_current_user(
     seller: Optional[Seller] = Depends(get_seller_from_header),
     x_customer_id: Optional[str] = Header(None, alias="X-Customer-ID"),
+    authorization: Optional[str] = Header(None),
     db: Session = Depends(get_db)
 ):
     """Get current logged-in user info (seller or customer)"""
-    # Try customer first if X-Customer-ID header is present
+    # Customer token (or X-Customer-ID from old clients) is tried first
+    token_customer_id = None if seller else get_customer_id_from_token(authorization)
+    if token_customer_id is not None:
+        x_customer_id = str(token_customer_id)
     if x_customer_id:
         try:
             customer_id_int = int(x_customer_id)
@@ -5078,14 +5166,29 @@ async def delete_price_alert(
 # ==================== EXCEL IMPORT/EXPORT ====================
 
 @app.post("/api/products/import")
-async def import_products(file: UploadFile = File(...), db: Session = Depends(get_db)):
-    """Import products from Excel file"""
+async def import_products(
+    file: UploadFile = File(...),
+    mode: str = "insert",  # insert yoki upsert
+    import_id: Optional[str] = Query(None, max_length=64, pattern=r"^[A-Za-z0-9_-]+$"),
+    db: Session = Depends(get_db)
+):
+    """
+    Import products from Excel file (mode=upsert updates prices and stock of existing products).
+    Progress goes to panel /ws connections as product_import_progress with import_id;
+    clients pass their own import_id to follow it. Long imports: POST /api/jobs/imports/products.
+    """
     import os
+    import asyncio
     import tempfile
+    import uuid
+    from starlette.concurrency import run_in_threadpool
+    from services.excel_service import IMPORT_MODES
     
     # Validate file type
     if not file.filename.endswith(('.xlsx', '.xls')):
         raise HTTPException(status_code=400, detail="Faqat Excel fayllari qabul qilinadi (.xlsx, .xls)")
+    if mode not in IMPORT_MODES:
+        raise HTTPException(status_code=400, detail=f"mode must be one of: {', '.join(IMPORT_MODES)}")
     
     # Save uploaded file temporarily
     temp_dir = tempfile.gettempdir()
@@ -5095,9 +5198,19 @@ async def import_products(file: UploadFile = File(...), db: Session = Depends(ge
         content = await file.read()
         buffer.write(content)
     
+    import_id = import_id or uuid.uuid4().hex
+    loop = asyncio.get_running_loop()
+    
+    def report_progress(done: int, total: Optional[int]):
+        # Import thread'idan admin panelga WebSocket orqali progress yuboriladi (mijozlarga emas)
+        asyncio.run_coroutine_threadsafe(manager.publish(ADMIN_TOPIC, {
+            "type": "product_import_progress",
+            "data": {"import_id": import_id, "done": done, "total": total}
+        }), loop)
+    
     try:
-        # Import products
-        result = ExcelService.import_products(db, temp_file_path)
+        # Import products (event loop bloklanmasligi uchun alohida thread'da)
+        result = await run_in_threadpool(ExcelService.import_products, db, temp_file_path, mode, report_progress)
         
         # Clean up temp file
         os.remove(temp_file_path)
@@ -5108,11 +5221,15 @@ async def import_products(file: UploadFile = File(...), db: Session = Depends(ge
             if len(result['errors']) > 10:
                 error_message += f"\n... va yana {len(result['errors']) - 10} ta xato"
         
+        updated_message = f" {result['updated']} ta mahsulot yangilandi." if result.get("updated") else ""
         return {
             "success": True,
-            "message": f"{result['imported']} ta mahsulot muvaffaqiyatli import qilindi.{error_message}",
+            "message": f"{result['imported']} ta mahsulot muvaffaqiyatli import qilindi.{updated_message}{error_message}",
             "imported": result['imported'],
-            "errors_count": len(result.get("errors", []))
+            "updated": result['updated'],
+            "errors": result.get("errors", []),
+            "errors_count": len(result.get("errors", [])),
+            "import_id": import_id
         }
     except Exception as e:
         # Clean up temp file on error
@@ -5121,6 +5238,198 @@ async def import_products(file: UploadFile = File(...), db: Session = Depends(ge
         raise HTTPException(status_code=400, detail=f"Import xatosi: {str(e)}")
 
 
+# ==================== CSV/NDJSON EXCHANGE ====================
+
+EXCHANGE_EXPORT_PERMISSIONS = {
+    "products": "products.export",
+    "customers": "customers.view",
+    "sales": "sales.export",
+    "debt_history": "customers.view",
+}
+EXCHANGE_IMPORT_PERMISSIONS = {
+    "products": "products.import",
+    "customers": "customers.create",
+}
+
+
+@app.get("/api/exchange/{dataset}")
+def export_dataset(
+    dataset: str,
+    format: str = "csv",  # csv yoki ndjson
+    db: Session = Depends(get_db),
+    seller: Seller = Depends(get_seller_from_header)
+):
+    """Stream products, customers, sales (with items) or debt history as CSV or NDJSON"""
+    from fastapi.responses import StreamingResponse
+    from auth import has_permission
+    from services.data_exchange_service import DataExchangeService, EXCHANGE_FORMATS, MEDIA_TYPES
+
+    if not seller:
+        raise HTTPException(status_code=401, detail="Authentication required")
+    if dataset not in EXCHANGE_EXPORT_PERMISSIONS:
+        raise HTTPException(status_code=404, detail=f"Unknown dataset: {dataset}")
+    if format not in EXCHANGE_FORMATS:
+        raise HTTPException(status_code=400, detail=f"format must be one of: {', '.join(EXCHANGE_FORMATS)}")
+    if not has_permission(db, seller, EXCHANGE_EXPORT_PERMISSIONS[dataset]):
+        raise HTTPException(status_code=403, detail=f"Permission denied: {EXCHANGE_EXPORT_PERMISSIONS[dataset]}")
+
+    def content():
+        # Javob tanasi so'rov sessiyasi yopilgandan keyin yuboriladi - alohida sessiya kerak
+        stream_db = SessionLocal()
+        try:
+            yield from DataExchangeService.export(stream_db, dataset, format)
+        finally:
+            stream_db.close()
+
+    filename = f"{dataset}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{format}"
+    return StreamingResponse(
+        content(),
+        media_type=MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+
+@app.post("/api/exchange/{dataset}/import")
+async def import_dataset(
+    dataset: str,
+    file: UploadFile = File(...),
+    format: str = "csv",  # csv yoki ndjson
+    mode: str = "insert",  # insert yoki upsert
+    import_id: Optional[str] = Query(None, max_length=64, pattern=r"^[A-Za-z0-9_-]+$"),
+    db: Session = Depends(get_db),
+    seller: Seller = Depends(get_seller_from_header)
+):
+    """
+    Import products or customers from a CSV/NDJSON file, read line by line.
+    Progress goes to panel /ws connections with import_id (client-supplied or generated).
+    """
+    import asyncio
+    import uuid
+    from starlette.concurrency import run_in_threadpool
+    from auth import has_permission
+    from services.excel_service import IMPORT_MODES
+    from services.data_exchange_service import DataExchangeService, EXCHANGE_FORMATS
+
+    if not seller:
+        raise HTTPException(status_code=401, detail="Authentication required")
+    if dataset not in EXCHANGE_IMPORT_PERMISSIONS:
+        raise HTTPException(status_code=404, detail=f"Dataset cannot be imported: {dataset}")
+    if format not in EXCHANGE_FORMATS:
+        raise HTTPException(status_code=400, detail=f"format must be one of: {', '.join(EXCHANGE_FORMATS)}")
+    if mode not in IMPORT_MODES:
+        raise HTTPException(status_code=400, detail=f"mode must be one of: {', '.join(IMPORT_MODES)}")
+    if not has_permission(db, seller, EXCHANGE_IMPORT_PERMISSIONS[dataset]):
+        raise HTTPException(status_code=403, detail=f"Permission denied: {EXCHANGE_IMPORT_PERMISSIONS[dataset]}")
+
+    import_id = import_id or uuid.uuid4().hex
+    loop = asyncio.get_running_loop()
+
+    def report_progress(done: int, total: Optional[int]):
+        asyncio.run_coroutine_threadsafe(manager.publish(ADMIN_TOPIC, {
+            "type": f"{dataset.rstrip('s')}_import_progress",
+            "data": {"import_id": import_id, "done": done, "total": total}
+        }), loop)
+
+    try:
+        # Yuklangan fayl vaqtinchalik faylda turadi va qatorma-qator o'qiladi
+        result = await run_in_threadpool(
+            DataExchangeService.import_stream, db, dataset, file.file, format, mode, report_progress
+        )
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Import xatosi: {str(e)}")
+
+    return {
+        "success": True,
+        "imported": result["imported"],
+        "updated": result["updated"],
+        "errors": result["errors"],
+        "errors_count": len(result["errors"]),
+        "import_id": import_id
+    }
+
+
+# ==================== BACKGROUND JOBS ====================
+
+JOB_EXPORT_TYPES = {
+    "products": "products_export",
+    "sales": "sales_export",
+    "statistics": "statistics_export",
+}
+
+
+def get_owned_job(job_id: str, seller: Optional[Seller]) -> dict:
+    """Job of the current seller or 404"""
+    if not seller:
+        raise HTTPException(status_code=401, detail="Authentication required")
+    job = JobService.get_job(job_id)
+    if not job or job["owner_id"] != seller.id:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+
+@app.post("/api/jobs/exports/{kind}", status_code=202)
+def submit_export_job(
+    kind: str,
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    format: str = "excel",  # faqat statistics uchun: excel yoki pdf
+    seller: Seller = Depends(get_seller_from_header)
+):
+    """Queue a products/sales/statistics export; progress is sent to panel /ws connections as job_update"""
+    if not seller:
+        raise HTTPException(status_code=401, detail="Authentication required")
+    if kind not in JOB_EXPORT_TYPES:
+        raise HTTPException(status_code=404, detail=f"Unknown export: {kind}")
+    params = {"start_date": start_date, "end_date": end_date, "format": format.lower()}
+    return JobService.submit(JOB_EXPORT_TYPES[kind], params, owner_id=seller.id)
+
+
+@app.post("/api/jobs/imports/products", status_code=202)
+async def submit_product_import_job(
+    file: UploadFile = File(...),
+    mode: str = "insert",  # insert yoki upsert
+    seller: Seller = Depends(get_seller_from_header)
+):
+    """Queue an Excel product import; the upload is saved and imported by a worker"""
+    import shutil
+    import tempfile
+    from starlette.concurrency import run_in_threadpool
+    from services.excel_service import IMPORT_MODES
+
+    if not seller:
+        raise HTTPException(status_code=401, detail="Authentication required")
+    if not file.filename.endswith(('.xlsx', '.xls')):
+        raise HTTPException(status_code=400, detail="Faqat Excel fayllari qabul qilinadi (.xlsx, .xls)")
+    if mode not in IMPORT_MODES:
+        raise HTTPException(status_code=400, detail=f"mode must be one of: {', '.join(IMPORT_MODES)}")
+
+    # Yuklangan fayl bo'laklab vaqtinchalik faylga ko'chiriladi (job tugagach o'chiriladi)
+    fd, temp_file_path = tempfile.mkstemp(prefix="import_", suffix=os.path.splitext(file.filename)[1])
+    with os.fdopen(fd, "wb") as buffer:
+        await run_in_threadpool(shutil.copyfileobj, file.file, buffer)
+
+    return JobService.submit("products_import", {"file_path": temp_file_path, "mode": mode}, owner_id=seller.id)
+
+
+@app.get("/api/jobs/{job_id}")
+def get_job_status(job_id: str, seller: Seller = Depends(get_seller_from_header)):
+    """Job status, progress and result"""
+    return JobService.to_response(get_owned_job(job_id, seller))
+
+
+@app.get("/api/jobs/{job_id}/download")
+def download_job_file(job_id: str, seller: Seller = Depends(get_seller_from_header)):
+    """Download a finished job's file (Range requests are supported for resuming)"""
+    job = get_owned_job(job_id, seller)
+    if job["status"] != "done":
+        raise HTTPException(status_code=409, detail=f"Job is {job['status']}")
+    if not job["file_path"]:
+        raise HTTPException(status_code=404, detail="Job has no file")
+    if not os.path.exists(job["file_path"]):
+        raise HTTPException(status_code=410, detail="Fayl muddati tugagan va o'chirilgan")
+    return FileResponse(job["file_path"], media_type=job["media_type"], filename=job["filename"])
+
+
 @app.get("/api/statistics/export")
 def export_statistics(
     start_date: Optional[str] = None,
@@ -5151,7 +5460,8 @@ def export_statistics(
             return FileResponse(
                 file_path, 
                 media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-                filename=filename
+                filename=filename,
+                background=BackgroundTask(os.remove, file_path)
             )
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Export xatosi: {str(e)}")
@@ -5321,14 +5631,20 @@ async def serve_seller_static(file_path: str):
 # Mount uploads directory
 uploads_base_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), "uploads")
 os.makedirs(os.path.join(uploads_base_dir, "products"), exist_ok=True)
+# Resized variants (content-hashed, never change) - mounted before /uploads to take precedence
+os.makedirs(VARIANTS_DIR, exist_ok=True)
+app.mount("/uploads/variants", ImmutableStaticFiles(directory=VARIANTS_DIR), name="image-variants")
 app.mount("/uploads", StaticFiles(directory=uploads_base_dir), name="uploads")
 
 
 # ==================== BANNERS API ====================
 
 @app.get("/api/banners", response_model=List[BannerResponse])
-def get_banners(is_active: Optional[bool] = None, db: Session = Depends(get_db)):
+def get_banners(request: Request, response: Response, is_active: Optional[bool] = None, db: Session = Depends(get_db)):
     """Get all banners (optionally filtered by is_active)"""
+    cache_headers = ResourceVersionService.cache_headers(db, "banners")
+    if ResourceVersionService.is_not_modified(request, cache_headers):
+        return Response(status_code=304, headers=cache_headers)
     try:
         query = db.query(Banner)
         if is_active is not None:
@@ -5342,6 +5658,7 @@ def get_banners(is_active: Optional[bool] = None, db: Session = Depends(get_db))
                 "id": banner.id,
                 "title": banner.title,
                 "image_url": banner.image_url,
+                "image_variants": ImageService.variant_urls(banner.image_url),
                 "link_url": banner.link_url,
                 "is_active": banner.is_active,
                 "display_order": banner.display_order,
@@ -5350,6 +5667,8 @@ def get_banners(is_active: Optional[bool] = None, db: Session = Depends(get_db))
                 "updated_at": banner.updated_at
             }
             result.append(BannerResponse.model_validate(banner_dict))
+        # Xatolikdagi bo'sh ro'yxat keshlanmasin - sarlavhalar faqat muvaffaqiyatli javobda
+        response.headers.update(cache_headers)
         return result
     except Exception as e:
         print(f"Error loading banners: {e}")
@@ -5427,7 +5746,6 @@ async def upload_banner_image(
     seller: Seller = Depends(require_permission("admin.settings"))
 ):
     """Upload banner image (admin only)"""
-    import uuid
     from pathlib import Path
     
     # Verify banner exists
@@ -5441,23 +5759,14 @@ async def upload_banner_image(
     if file_ext not in allowed_extensions:
         raise HTTPException(status_code=400, detail="Faqat rasm fayllari qabul qilinadi (jpg, png, gif, webp)")
     
-    # Generate unique filename
-    unique_filename = f"banner_{banner_id}_{uuid.uuid4()}{file_ext}"
-    uploads_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), "uploads", "banners")
-    os.makedirs(uploads_dir, exist_ok=True)
-    file_path = os.path.join(uploads_dir, unique_filename)
-    
-    # Save file
-    with open(file_path, "wb") as buffer:
-        content = await file.read()
-        buffer.write(content)
+    # Saved by content hash; thumbnails are rendered in the background
+    saved = ImageService.save_upload(await file.read(), "banners", file_ext)
     
     # Update banner image_url
-    image_url = f"/uploads/banners/{unique_filename}"
-    banner.image_url = image_url
+    banner.image_url = saved["url"]
     db.commit()
     
-    return {"url": image_url, "filename": unique_filename}
+    return saved
 
 
 # ==================== INITIALIZE ====================
@@ -5467,9 +5776,10 @@ async def upload_banner_image(
 @app.get("/api/referals/my-code", response_model=dict)
 def get_my_referal_code(
     x_customer_id: Optional[str] = Header(None, alias="X-Customer-ID"),
+    authorization: Optional[str] = Header(None),
     db: Session = Depends(get_db)
 ):
-    customer_id = get_customer_from_header(x_customer_id)
+    customer_id = get_customer_from_header(x_customer_id, db, authorization)
     """Get customer's referal code"""
     from models import Referal, Customer
     import secrets
@@ -5513,9 +5823,10 @@ def get_my_referal_code(
 def invite_friend(
     referal_data: ReferalCreate,
     x_customer_id: Optional[str] = Header(None, alias="X-Customer-ID"),
+    authorization: Optional[str] = Header(None),
     db: Session = Depends(get_db)
 ):
-    customer_id = get_customer_from_header(x_customer_id)
+    customer_id = get_customer_from_header(x_customer_id, db, authorization)
     """Invite a friend using referal code"""
     from models import Referal, Customer
     
@@ -5561,9 +5872,10 @@ def invite_friend(
 @app.get("/api/referals", response_model=ReferalListResponse)
 def get_referals(
     x_customer_id: Optional[str] = Header(None, alias="X-Customer-ID"),
+    authorization: Optional[str] = Header(None),
     db: Session = Depends(get_db)
 ):
-    customer_id = get_customer_from_header(x_customer_id)
+    customer_id = get_customer_from_header(x_customer_id, db, authorization)
     """Get all referals (sent and received)"""
     from models import Referal
     
@@ -5591,9 +5903,10 @@ def get_referals(
 @app.get("/api/loyalty/points", response_model=LoyaltyPointResponse)
 def get_loyalty_points(
     x_customer_id: Optional[str] = Header(None, alias="X-Customer-ID"),
+    authorization: Optional[str] = Header(None),
     db: Session = Depends(get_db)
 ):
-    customer_id = get_customer_from_header(x_customer_id)
+    customer_id = get_customer_from_header(x_customer_id, db, authorization)
     """Get customer's loyalty points"""
     from models import LoyaltyPoint, Customer
     
@@ -5624,9 +5937,10 @@ def get_loyalty_transactions(
     skip: int = 0,
     limit: int = 50,
     x_customer_id: Optional[str] = Header(None, alias="X-Customer-ID"),
+    authorization: Optional[str] = Header(None),
     db: Session = Depends(get_db)
 ):
-    customer_id = get_customer_from_header(x_customer_id)
+    customer_id = get_customer_from_header(x_customer_id, db, authorization)
     """Get loyalty transaction history"""
     from models import LoyaltyPoint, LoyaltyTransaction
     
@@ -5645,9 +5959,10 @@ def get_loyalty_transactions(
 def spend_loyalty_points(
     points: int = Body(..., gt=0),
     x_customer_id: Optional[str] = Header(None, alias="X-Customer-ID"),
+    authorization: Optional[str] = Header(None),
     db: Session = Depends(get_db)
 ):
-    customer_id = get_customer_from_header(x_customer_id)
+    customer_id = get_customer_from_header(x_customer_id, db, authorization)
     """Spend loyalty points"""
     from models import LoyaltyPoint, LoyaltyTransaction
     
@@ -5791,9 +6106,10 @@ def delete_product_variant(
 def initiate_payment(
     payment_data: PaymentInitiateRequest,
     x_customer_id: Optional[str] = Header(None, alias="X-Customer-ID"),
+    authorization: Optional[str] = Header(None),
     db: Session = Depends(get_db)
 ):
-    customer_id = get_customer_from_header(x_customer_id)
+    customer_id = get_customer_from_header(x_customer_id, db, authorization)
     """Initiate online payment"""
     from models import Order
     import uuid
@@ -5823,9 +6139,10 @@ def initiate_payment(
 def verify_payment(
     verify_data: PaymentVerifyRequest,
     x_customer_id: Optional[str] = Header(None, alias="X-Customer-ID"),
+    authorization: Optional[str] = Header(None),
     db: Session = Depends(get_db)
 ):
-    customer_id = get_customer_from_header(x_customer_id)
+    customer_id = get_customer_from_header(x_customer_id, db, authorization)
     """Verify payment status"""
     from models import Order
     
@@ -5846,6 +6163,29 @@ async def startup_event():
     """Initialize database on startup"""
     init_db()
 
+    import asyncio
+    loop = asyncio.get_running_loop()
+
+    def broadcast_job(job: dict):
+        # Job worker thread'idan holat/progress faqat admin/sotuvchi panellariga yuboriladi
+        asyncio.run_coroutine_threadsafe(manager.publish(ADMIN_TOPIC, {"type": "job_update", "data": job}), loop)
+
+    JobService.add_listener(broadcast_job)
+    # Eski export fayllari muntazam o'chiriladi
+    app.state.job_cleanup_task = asyncio.create_task(JobService.cleanup_loop())
+    # Autocomplete indeksi fonda quriladi, mashhurlik muntazam yangilanadi
+    app.state.suggest_refresh_task = asyncio.create_task(ProductSuggestService.refresh_loop())
+    # Skaner kodlari indeksi (barcode, mahsulot kodi, QR) xotirada quriladi
+    app.state.code_index_task = asyncio.create_task(ProductCodeService.build_on_startup())
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Stop background worker pools"""
+    ReceiptBatchService.shutdown_executor(wait=False)
+    JobService.shutdown_executor(wait=False)
+    ImageService.shutdown_executor(wait=False)
+
 
 if __name__ == "__main__":
     # Use 0.0.0.0 to bind to all interfaces, but access via localhost or 127.0.0.1 in browser
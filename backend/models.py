@@ -1,7 +1,7 @@
 """
 SQLAlchemy Database Models
 """
-from sqlalchemy import Column, Integer, String, Float, Boolean, DateTime, ForeignKey, Enum, Text, Table
+from sqlalchemy import Column, Integer, String, Float, Boolean, DateTime, ForeignKey, Enum, Text, Table, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 import enum
@@ -384,7 +384,7 @@ class SaleItem(Base):
     
     id = Column(Integer, primary_key=True, index=True)
     sale_id = Column(Integer, ForeignKey("sales.id"), nullable=False)
-    product_id = Column(Integer, ForeignKey("products.id"), nullable=False)
+    product_id = Column(Integer, ForeignKey("products.id"), nullable=False, index=True)
     
     # Requested and actual sold quantities
     requested_quantity = Column(Integer, nullable=False)  # Jami so'ralgan dona soni
@@ -770,9 +770,19 @@ class Conversation(Base):
     updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
     last_message_at = Column(DateTime(timezone=True), nullable=True, index=True)
     
+    # Denormalized inbox fields, maintained when messages are sent and read
+    last_message_id = Column(Integer, nullable=True)  # No FK: chat_messages already references conversations
+    customer_unread_count = Column(Integer, nullable=False, default=0)  # Admin messages the customer has not read
+    admin_unread_count = Column(Integer, nullable=False, default=0)  # Customer messages admins have not read
+    
     # Relationships
     customer = relationship("Customer")
     seller = relationship("Seller")
+    last_message = relationship(
+        "ChatMessage",
+        primaryjoin="foreign(Conversation.last_message_id) == ChatMessage.id",
+        viewonly=True
+    )
     messages = relationship("ChatMessage", back_populates="conversation", cascade="all, delete-orphan", order_by="ChatMessage.created_at")
 
 
@@ -794,6 +804,11 @@ class ChatMessage(Base):
     
     # Relationships
     conversation = relationship("Conversation", back_populates="messages")
+    
+    # Keyset pagination of a thread (before_id/after_id) and "read up to id" updates
+    __table_args__ = (
+        Index("ix_chat_messages_conversation_id_id", "conversation_id", "id"),
+    )
 
 
 class Referal(Base):
@@ -880,3 +895,27 @@ class ProductVariant(Base):
     # Relationships
     product = relationship("Product", back_populates="variants")
 
+
+
+class ResourceVersion(Base):
+    """Version counter per cached resource (products, categories, ...), bumped by DB triggers on every write"""
+    __tablename__ = "resource_versions"
+    
+    name = Column(String(50), primary_key=True)
+    version = Column(Integer, nullable=False, default=1)
+    updated_at = Column(DateTime, nullable=True)  # Oxirgi o'zgarish (UTC)
+
+
+class RevokedToken(Base):
+    """
+    Revoked access tokens, shared by all processes: a single token (jti, logout)
+    or every token of a subject issued before issued_before (password change, deactivation)
+    """
+    __tablename__ = "revoked_tokens"
+    
+    id = Column(Integer, primary_key=True)
+    jti = Column(String(32), nullable=True, unique=True)
+    kind = Column(String(20), nullable=True)  # seller / customer
+    subject_id = Column(Integer, nullable=True)
+    issued_before = Column(Float, nullable=True)  # Unix vaqt
+    expires_at = Column(Float, nullable=False, index=True)  # Shundan keyin yozuv kerak emas (Unix vaqt)
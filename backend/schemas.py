@@ -69,12 +69,17 @@ class ProductUpdate(BaseModel):
     pieces_in_stock: Optional[int] = Field(None, ge=0)
 
 
+# Resized image variants: {"thumb"|"list"|"detail": {"webp": url, "jpeg": url}}
+ImageVariants = Dict[str, Dict[str, str]]
+
+
 class ProductImageResponse(BaseModel):
     id: int
     product_id: int
     image_url: str
     display_order: int
     is_primary: bool
+    variants: Optional[ImageVariants] = None  # Tayyor bo'lmasa None - image_url ishlatiladi
     created_at: Optional[datetime] = None
 
 
@@ -120,6 +125,7 @@ class ProductResponse(ProductBase):
     days_since_last_sale: Optional[int] = None  # Oxirgi sotilganidan beri kunlar
     is_slow_moving: Optional[bool] = None  # Uzoq vaqt sotilmagan (30+ kun)
     product_url: Optional[str] = None  # Mahsulot URL'i (customer app uchun)
+    image_variants: Optional[ImageVariants] = None  # Kichraytirilgan rasmlar (thumb, list, detail)
     created_at: Optional[datetime] = None
     updated_at: Optional[datetime] = None
     
@@ -127,6 +133,22 @@ class ProductResponse(ProductBase):
         from_attributes = True
 
 
+class ProductSuggestion(BaseModel):
+    """Autocomplete entry for the product search box"""
+    id: int
+    name: str
+    brand: Optional[str] = None
+    category: Optional[str] = None
+    image_url: Optional[str] = None
+    score: float
+
+
+class ProductSuggestResponse(BaseModel):
+    """Autocomplete results, best first"""
+    query: str
+    suggestions: List[ProductSuggestion]
+
+
 # ==================== CATEGORY SCHEMAS ====================
 
 class CategoryBase(BaseModel):
@@ -296,6 +318,11 @@ class ScanCodeRequest(BaseModel):
     code: str = Field(..., min_length=1, max_length=200, description="Scanned QR code or barcode value")
 
 
+class ScanCodeBatchRequest(BaseModel):
+    """Request to resolve a whole basket of scanned codes at once"""
+    codes: List[str] = Field(..., min_length=1, max_length=500, description="Scanned QR code or barcode values")
+
+
 class DeviceTokenRequest(BaseModel):
     """Request to register/update device token for push notifications"""
     token: str = Field(..., min_length=1, max_length=500, description="Expo push token")
@@ -366,12 +393,11 @@ class ConversationListResponse(BaseModel):
 
 
 class ChatMessageListResponse(BaseModel):
-    """List of messages in a conversation"""
+    """Page of messages in a conversation (keyset pagination by message id)"""
     messages: List[ChatMessageResponse]
     conversation: ConversationResponse
-    total: int
-    skip: int
     limit: int
+    has_more: bool = False  # More messages exist in the requested direction
 
 
 # ==================== SEARCH HISTORY SCHEMAS ====================
@@ -777,6 +803,7 @@ class BannerUpdate(BaseModel):
 class BannerResponse(BannerBase):
     """Banner response schema"""
     id: int
+    image_variants: Optional[ImageVariants] = None
     created_at: datetime
     updated_at: datetime
     
@@ -0,0 +1,45 @@
+"""
+Search text normalization (Uzbek Latin/Cyrillic, apostrophe variants)
+"""
+import re
+from typing import Optional
+
+# o' / oʻ / o` / o’ ... - yozilishidan qat'i nazar bir xil qidiriladi
+APOSTROPHES = "'`´ʹʻʼʽ‘’‛′"
+
+# O'zbek (va rus) kirill harflari -> lotin
+CYRILLIC_TO_LATIN = {
+    "а": "a", "б": "b", "в": "v", "г": "g", "д": "d", "е": "e", "ё": "yo",
+    "ж": "j", "з": "z", "и": "i", "й": "y", "к": "k", "л": "l", "м": "m",
+    "н": "n", "о": "o", "п": "p", "р": "r", "с": "s", "т": "t", "у": "u",
+    "ф": "f", "х": "x", "ц": "ts", "ч": "ch", "ш": "sh", "щ": "sh", "ъ": "",
+    "ы": "i", "ь": "", "э": "e", "ю": "yu", "я": "ya",
+    "ў": "o", "қ": "q", "ғ": "g", "ҳ": "h",
+}
+
+_TRANSLATION = str.maketrans({
+    **CYRILLIC_TO_LATIN,
+    **{char: "" for char in APOSTROPHES},
+})
+_WHITESPACE = re.compile(r"\s+")
+
+# Marker before word starts, so 1-2 letter input still forms a trigram ("^^u", "^un")
+WORD_START_MARK = "^^"
+
+
+def normalize_search_text(value: Optional[str]) -> str:
+    """
+    Lowercase, transliterate Cyrillic to Latin and drop apostrophes, so that
+    "O'zbekiston", "Oʻzbekiston" and "Ўзбекистон" all become "ozbekiston".
+    The same function is applied to indexed columns and to search queries.
+    """
+    if not value:
+        return ""
+    text = str(value).lower().translate(_TRANSLATION)
+    return _WHITESPACE.sub(" ", text).strip()
+
+
+def word_start_keys(value: Optional[str]) -> str:
+    """Marked first two letters of every word: "Shakar qum" -> "^^sh ^^qu" """
+    return " ".join(WORD_START_MARK + word[:2] for word in normalize_search_text(value).split())
+
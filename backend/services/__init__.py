@@ -15,6 +15,13 @@ from .audit_service import AuditService
 from .debt_service import DebtService
 from .auth_service import AuthService
 from .notification_service import NotificationService
+from .analytics_service import AnalyticsService
+from .receipt_cache_service import ReceiptCacheService
+from .receipt_batch_service import ReceiptBatchService
+from .escpos_service import EscPosService
+from .data_exchange_service import DataExchangeService
+from .job_service import JobService
+from .product_search_service import ProductSearchService
 
 __all__ = [
     "ProductService",
@@ -31,4 +38,11 @@ __all__ = [
     "DebtService",
     "AuthService",
     "NotificationService",
+    "AnalyticsService",
+    "ReceiptCacheService",
+    "ReceiptBatchService",
+    "EscPosService",
+    "DataExchangeService",
+    "JobService",
+    "ProductSearchService",
 ]
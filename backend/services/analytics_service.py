@@ -0,0 +1,319 @@
+"""
+Analytics Service - Sales totals grouped by period (day/week/month/year)
+"""
+from sqlalchemy.orm import Session
+from sqlalchemy import func, case
+from typing import List, Optional, Dict, Any
+from datetime import datetime, timedelta, timezone
+from models import Sale, SaleItem, Product, Customer
+try:
+    from ..utils import UZBEKISTAN_TZ, get_uzbekistan_now, to_uzbekistan_time
+except ImportError:
+    import sys
+    from pathlib import Path
+    sys.path.insert(0, str(Path(__file__).parent.parent))
+    from utils import UZBEKISTAN_TZ, get_uzbekistan_now, to_uzbekistan_time
+
+
+PERIODS = ("day", "week", "month", "year")
+
+# created_at UTC da saqlanadi; SQLite modifikatori orqali O'zbekiston vaqtiga o'tkazamiz
+_UZ_OFFSET_MODIFIER = f"{int(UZBEKISTAN_TZ.utcoffset(None).total_seconds()):+d} seconds"
+
+
+class AnalyticsService:
+    """Service for period-bucketed sales analytics"""
+
+    @staticmethod
+    def approved_sales_filter():
+        """Only admin-approved sales or sales that never required approval"""
+        return (Sale.admin_approved == True) | (Sale.requires_admin_approval == False)
+
+    @staticmethod
+    def period_start(dt: datetime, period: str) -> datetime:
+        """Truncate a datetime to the start of its period in Uzbekistan time"""
+        if period not in PERIODS:
+            raise ValueError(f"Unknown period: {period}")
+        dt = to_uzbekistan_time(dt)
+        start = dt.replace(hour=0, minute=0, second=0, microsecond=0)
+        if period == "week":
+            start -= timedelta(days=start.weekday())
+        elif period == "month":
+            start = start.replace(day=1)
+        elif period == "year":
+            start = start.replace(month=1, day=1)
+        return start
+
+    @staticmethod
+    def shift_period(start: datetime, period: str, count: int) -> datetime:
+        """Move a period start forward (or backward) by `count` periods"""
+        if period == "day":
+            return start + timedelta(days=count)
+        if period == "week":
+            return start + timedelta(weeks=count)
+        if period == "month":
+            month_index = start.year * 12 + (start.month - 1) + count
+            return start.replace(year=month_index // 12, month=month_index % 12 + 1, day=1)
+        if period == "year":
+            return start.replace(year=start.year + count)
+        raise ValueError(f"Unknown period: {period}")
+
+    @staticmethod
+    def _to_db_time(dt: datetime) -> datetime:
+        """Convert an aware datetime to the naive UTC form stored in the database"""
+        if dt.tzinfo is None:
+            dt = dt.replace(tzinfo=UZBEKISTAN_TZ)
+        return dt.astimezone(timezone.utc).replace(tzinfo=None)
+
+    @staticmethod
+    def _bucket_expression(period: str):
+        """SQL expression returning the local (UTC+5) period start as 'YYYY-MM-DD'"""
+        if period == "day":
+            return func.date(Sale.created_at, _UZ_OFFSET_MODIFIER)
+        if period == "week":
+            # Dushanbadan boshlanadigan hafta
+            return func.date(Sale.created_at, _UZ_OFFSET_MODIFIER, "weekday 0", "-6 days")
+        if period == "month":
+            return func.strftime("%Y-%m-01", Sale.created_at, _UZ_OFFSET_MODIFIER)
+        if period == "year":
+            return func.strftime("%Y-01-01", Sale.created_at, _UZ_OFFSET_MODIFIER)
+        raise ValueError(f"Unknown period: {period}")
+
+    @staticmethod
+    def _profit_subquery(
+        db: Session,
+        start: Optional[datetime],
+        end: Optional[datetime],
+        seller_id: Optional[int],
+        approved_only: bool
+    ):
+        """
+        Per-sale profit, using the same cost rules as SaleService.get_statistics.
+        Only items of sales in the requested range are aggregated.
+        """
+        sale_price_per_piece = case(
+            (SaleItem.piece_price > 0, SaleItem.piece_price),
+            (SaleItem.requested_quantity > 0, SaleItem.subtotal / SaleItem.requested_quantity),
+            else_=0.0
+        )
+        cost_per_piece = func.coalesce(Product.cost_price, 0.0)
+        item_cost = case(
+            (
+                (cost_per_piece > 0) & (cost_per_piece <= sale_price_per_piece * 2),
+                cost_per_piece * SaleItem.requested_quantity
+            ),
+            else_=0.0
+        )
+        query = db.query(
+            SaleItem.sale_id.label("sale_id"),
+            func.sum(SaleItem.subtotal - item_cost).label("profit")
+        ).join(Sale, Sale.id == SaleItem.sale_id).join(Product, Product.id == SaleItem.product_id)
+        query = AnalyticsService._filter_sales(query, start, end, seller_id, approved_only)
+        return query.group_by(SaleItem.sale_id).subquery()
+
+    @staticmethod
+    def _totals_query(
+        db: Session,
+        columns: list,
+        start: Optional[datetime],
+        end: Optional[datetime],
+        seller_id: Optional[int],
+        with_profit: bool,
+        approved_only: bool = True
+    ):
+        """Build the base aggregate query over approved (or all) sales in [start, end)"""
+        aggregates = [
+            func.count(Sale.id).label("count"),
+            func.coalesce(func.sum(Sale.total_amount), 0.0).label("amount"),
+        ]
+        profit = None
+        if with_profit:
+            profit = AnalyticsService._profit_subquery(db, start, end, seller_id, approved_only)
+            aggregates.append(func.coalesce(func.sum(profit.c.profit), 0.0).label("profit"))
+
+        query = db.query(*columns, *aggregates)
+        if profit is not None:
+            query = query.outerjoin(profit, profit.c.sale_id == Sale.id)
+        return AnalyticsService._filter_sales(query, start, end, seller_id, approved_only)
+
+    @staticmethod
+    def _filter_sales(
+        query,
+        start: Optional[datetime],
+        end: Optional[datetime],
+        seller_id: Optional[int] = None,
+        approved_only: bool = True
+    ):
+        """Restrict a query joined with Sale to [start, end), a seller and approved sales"""
+        if approved_only:
+            query = query.filter(AnalyticsService.approved_sales_filter())
+        if start is not None:
+            query = query.filter(Sale.created_at >= AnalyticsService._to_db_time(start))
+        if end is not None:
+            query = query.filter(Sale.created_at < AnalyticsService._to_db_time(end))
+        if seller_id:
+            query = query.filter(Sale.seller_id == seller_id)
+        return query
+
+    @staticmethod
+    def get_period_totals(
+        db: Session,
+        period: str,
+        start: datetime,
+        end: Optional[datetime] = None,
+        seller_id: Optional[int] = None,
+        with_profit: bool = False
+    ) -> List[Dict[str, Any]]:
+        """
+        Sales count/amount for every period bucket in [start, end) with one grouped query.
+        Buckets without sales are included with zero totals, oldest first.
+        """
+        start = AnalyticsService.period_start(start, period)
+        end = end or get_uzbekistan_now()
+
+        bucket = AnalyticsService._bucket_expression(period).label("bucket")
+        query = AnalyticsService._totals_query(db, [bucket], start, end, seller_id, with_profit)
+        rows = {row.bucket: row for row in query.group_by(bucket).all()}
+
+        result = []
+        bucket_start = start
+        while bucket_start < end:
+            bucket_end = AnalyticsService.shift_period(bucket_start, period, 1)
+            row = rows.get(bucket_start.strftime("%Y-%m-%d"))
+            totals = {
+                "start": bucket_start,
+                "end": bucket_end,
+                "count": row.count if row else 0,
+                "amount": float(row.amount) if row else 0.0,
+            }
+            if with_profit:
+                totals["profit"] = float(row.profit) if row else 0.0
+            result.append(totals)
+            bucket_start = bucket_end
+        return result
+
+    @staticmethod
+    def get_last_periods(
+        db: Session,
+        period: str,
+        count: int,
+        now: Optional[datetime] = None,
+        seller_id: Optional[int] = None,
+        with_profit: bool = False
+    ) -> List[Dict[str, Any]]:
+        """Totals for the last `count` periods, including the current (partial) one"""
+        now = now or get_uzbekistan_now()
+        current = AnalyticsService.period_start(now, period)
+        start = AnalyticsService.shift_period(current, period, -(count - 1))
+        end = AnalyticsService.shift_period(current, period, 1)
+        return AnalyticsService.get_period_totals(db, period, start, end, seller_id, with_profit)
+
+    @staticmethod
+    def get_range_totals(
+        db: Session,
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None,
+        seller_id: Optional[int] = None,
+        with_profit: bool = False,
+        approved_only: bool = True
+    ) -> Dict[str, Any]:
+        """Single aggregate (count, amount, average, profit) over [start, end)"""
+        row = AnalyticsService._totals_query(db, [], start, end, seller_id, with_profit, approved_only).one()
+        totals = {
+            "count": row.count or 0,
+            "amount": float(row.amount or 0),
+        }
+        totals["average"] = totals["amount"] / totals["count"] if totals["count"] else 0.0
+        if with_profit:
+            totals["profit"] = float(row.profit or 0)
+        return totals
+
+    @staticmethod
+    def get_seller_totals(
+        db: Session,
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None
+    ) -> Dict[int, Dict[str, Any]]:
+        """Totals per seller over [start, end) in one grouped query"""
+        query = AnalyticsService._totals_query(db, [Sale.seller_id], start, end, None, False)
+        return {
+            row.seller_id: {"count": row.count, "amount": float(row.amount)}
+            for row in query.group_by(Sale.seller_id).all()
+        }
+
+    @staticmethod
+    def get_payment_method_totals(
+        db: Session,
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None,
+        seller_id: Optional[int] = None,
+        approved_only: bool = True
+    ) -> Dict[str, Dict[str, Any]]:
+        """
+        Totals per payment method ('cash', 'card', ...) over [start, end) in one grouped query.
+        "paid" is the sum of payment_amount (money actually received).
+        """
+        paid = func.coalesce(func.sum(Sale.payment_amount), 0.0).label("paid")
+        query = AnalyticsService._totals_query(db, [Sale.payment_method, paid], start, end, seller_id, False, approved_only)
+        totals: Dict[str, Dict[str, Any]] = {}
+        for row in query.group_by(Sale.payment_method).all():
+            # To'lov turi ko'rsatilmagan eski sotuvlar naqd hisoblanadi
+            method = row.payment_method.value if row.payment_method else "cash"
+            method_totals = totals.setdefault(method, {"count": 0, "amount": 0.0, "paid": 0.0})
+            method_totals["count"] += row.count
+            method_totals["amount"] += float(row.amount)
+            method_totals["paid"] += float(row.paid)
+        return totals
+
+    @staticmethod
+    def get_top_products(
+        db: Session,
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None,
+        limit: Optional[int] = 10,
+        approved_only: bool = True
+    ) -> List[Dict[str, Any]]:
+        """Best selling products by quantity over [start, end); limit=None returns all"""
+        quantity = func.sum(SaleItem.requested_quantity).label("quantity")
+        query = db.query(
+            SaleItem.product_id, Product.name, Product.item_number,
+            quantity,
+            func.coalesce(func.sum(SaleItem.subtotal), 0.0).label("amount")
+        ).select_from(SaleItem).join(Sale, Sale.id == SaleItem.sale_id).outerjoin(Product, Product.id == SaleItem.product_id)
+        query = AnalyticsService._filter_sales(query, start, end, None, approved_only)
+        rows = query.group_by(SaleItem.product_id).order_by(quantity.desc(), SaleItem.product_id).limit(limit).all()
+        return [
+            {
+                "product_id": row.product_id,
+                "name": row.name or "O'chirilgan mahsulot",
+                "item_number": row.item_number or "",
+                "quantity": row.quantity,
+                "amount": float(row.amount),
+            }
+            for row in rows
+        ]
+
+    @staticmethod
+    def get_top_customers(
+        db: Session,
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None,
+        limit: Optional[int] = 10,
+        approved_only: bool = True
+    ) -> List[Dict[str, Any]]:
+        """Customers with the largest purchase amount over [start, end); limit=None returns all"""
+        amount = func.coalesce(func.sum(Sale.total_amount), 0.0).label("amount")
+        query = db.query(
+            Sale.customer_id, Customer.name, func.count(Sale.id).label("count"), amount
+        ).outerjoin(Customer, Customer.id == Sale.customer_id).filter(Sale.customer_id.isnot(None))
+        query = AnalyticsService._filter_sales(query, start, end, None, approved_only)
+        rows = query.group_by(Sale.customer_id).order_by(amount.desc(), Sale.customer_id).limit(limit).all()
+        return [
+            {
+                "customer_id": row.customer_id,
+                "name": row.name or "O'chirilgan mijoz",
+                "count": row.count,
+                "amount": float(row.amount),
+            }
+            for row in rows
+        ]
@@ -8,7 +8,7 @@ from datetime import datetime, timedelta
 from typing import Optional, Dict, Any
 from sqlalchemy.orm import Session
 from models import Seller, Customer
-from auth import get_seller_permissions
+from auth import get_seller_permissions, get_role_permission_codes, permissions_version, create_access_token, revoke_subject
 
 
 class AuthService:
@@ -29,6 +29,17 @@ class AuthService:
         """Generate a simple token (can be upgraded to JWT)"""
         return secrets.token_urlsafe(32)
     
+    @staticmethod
+    def issue_seller_token(db: Session, seller: Seller) -> str:
+        """Signed token carrying seller ID, role ID and the role's permissions version"""
+        codes = get_role_permission_codes(db, seller.role_id) if seller.role_id else frozenset()
+        return create_access_token("seller", seller.id, seller.role_id, permissions_version(codes))
+    
+    @staticmethod
+    def issue_customer_token(customer_id: int) -> str:
+        """Signed token carrying the customer ID"""
+        return create_access_token("customer", customer_id)
+    
     @staticmethod
     def authenticate_seller(db: Session, username: str, password: str) -> Optional[Seller]:
         """Authenticate seller by username/email and password"""
@@ -65,8 +76,8 @@ class AuthService:
                 "message": "Noto'g'ri login yoki parol"
             }
         
-        # Generate token (simple token, can be stored in database for session management)
-        token = AuthService.generate_token()
+        # Signed token, verified on every request without a DB lookup
+        token = AuthService.issue_seller_token(db, seller)
         
         # Get seller permissions
         permissions = get_seller_permissions(db, seller)
@@ -111,7 +122,7 @@ class AuthService:
             }
         
         # Generate token
-        token = AuthService.generate_token()
+        token = AuthService.issue_customer_token(customer.id)
         
         return {
             "success": True,
@@ -139,5 +150,6 @@ class AuthService:
         
         seller.password_hash = AuthService.hash_password(password)
         db.commit()
+        revoke_subject("seller", seller_id)
         return True
 
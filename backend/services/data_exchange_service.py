@@ -0,0 +1,380 @@
+"""
+Data Exchange Service - streaming CSV/NDJSON export and import
+"""
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+from typing import BinaryIO, Callable, Dict, Iterable, Iterator, Optional
+from itertools import groupby
+from datetime import date, datetime
+import os
+import io
+import csv
+import enum
+import json
+from models import Product, Customer, CustomerType, Sale, SaleItem, DebtHistory
+try:
+    from .excel_service import ExcelService, IMPORT_MODES, IMPORT_BATCH_SIZE, IMPORT_PROGRESS_EVERY
+except ImportError:
+    from excel_service import ExcelService, IMPORT_MODES, IMPORT_BATCH_SIZE, IMPORT_PROGRESS_EVERY
+
+
+EXCHANGE_FORMATS = ("csv", "ndjson")
+EXCHANGE_DATASETS = ("products", "customers", "sales", "debt_history")
+# Datasets that can be imported (through the same bulk path as the Excel import)
+EXCHANGE_IMPORT_DATASETS = ("products", "customers")
+MEDIA_TYPES = {
+    "csv": "text/csv; charset=utf-8",
+    "ndjson": "application/x-ndjson",
+}
+
+# Rows fetched per round trip from the server-side cursor
+EXCHANGE_CHUNK_SIZE = int(os.getenv("EXCHANGE_CHUNK_SIZE", "2000"))
+# Encoded output is sent to the client in pieces of about this size
+EXCHANGE_BUFFER_BYTES = 64 * 1024
+
+# Columns that are never exported
+EXCLUDED_COLUMNS = {
+    "customers": ("password_hash",),
+}
+
+# Product fields accepted on import (id, timestamps and category_id are ignored)
+PRODUCT_TEXT_FIELDS = ('name', 'item_number', 'barcode', 'brand', 'category', 'supplier', 'location', 'image_url')
+PRODUCT_NUMBER_FIELDS = {
+    'pieces_per_package': int,
+    'cost_price': float,
+    'wholesale_price': float,
+    'retail_price': float,
+    'regular_price': float,
+    'packages_in_stock': int,
+    'pieces_in_stock': int,
+}
+
+# Customer fields accepted on import (debt balance and password are never imported)
+CUSTOMER_TEXT_FIELDS = ('name', 'phone', 'address', 'notes', 'username')
+# Fields changed on existing customers in upsert mode
+CUSTOMER_UPDATE_FIELDS = ('name', 'address', 'customer_type', 'notes', 'debt_limit')
+
+
+def _json_default(value):
+    """json.dumps fallback for datetimes and enums"""
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, enum.Enum):
+        return value.value
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def _csv_value(value):
+    """CSV cell text: ISO datetimes, enum values, empty string for NULL"""
+    if value is None:
+        return ''
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, enum.Enum):
+        return value.value
+    return value
+
+
+class DataExchangeService:
+    """Service for streaming datasets as CSV/NDJSON and importing them in bulk"""
+
+    @staticmethod
+    def _columns(model, dataset: str) -> list:
+        excluded = EXCLUDED_COLUMNS.get(dataset, ())
+        return [column for column in model.__table__.columns if column.name not in excluded]
+
+    @staticmethod
+    def _stream(db: Session, statement):
+        """Execute on a server-side cursor, fetching EXCHANGE_CHUNK_SIZE rows at a time"""
+        result = db.execute(statement.execution_options(stream_results=True, yield_per=EXCHANGE_CHUNK_SIZE))
+        for partition in result.partitions():
+            yield from partition
+
+    @staticmethod
+    def _flat_rows(db: Session, dataset: str):
+        """(header, row iterator) for a dataset; sales have one row per sale item"""
+        if dataset == "sales":
+            sale_columns = DataExchangeService._columns(Sale, dataset)
+            item_columns = [column for column in SaleItem.__table__.columns if column.name != "sale_id"]
+            header = [column.name for column in sale_columns] + [f"item_{column.name}" for column in item_columns]
+            statement = (
+                select(*sale_columns, *item_columns)
+                .outerjoin(SaleItem, SaleItem.sale_id == Sale.id)
+                .order_by(Sale.id, SaleItem.id)
+            )
+            return header, DataExchangeService._stream(db, statement)
+
+        model = {"products": Product, "customers": Customer, "debt_history": DebtHistory}[dataset]
+        columns = DataExchangeService._columns(model, dataset)
+        statement = select(*columns).order_by(model.id)
+        return [column.name for column in columns], DataExchangeService._stream(db, statement)
+
+    @staticmethod
+    def _documents(db: Session, dataset: str) -> Iterator[dict]:
+        """One JSON object per record; a sale carries its items as a nested list"""
+        header, rows = DataExchangeService._flat_rows(db, dataset)
+        if dataset != "sales":
+            for row in rows:
+                yield dict(zip(header, row))
+            return
+
+        sale_width = len(DataExchangeService._columns(Sale, dataset))
+        item_header = [name[len("item_"):] for name in header[sale_width:]]
+        # Rows are ordered by sale ID, so the items of a sale are adjacent
+        for _, sale_rows in groupby(rows, key=lambda row: row[0]):
+            sale = None
+            items = []
+            for row in sale_rows:
+                if sale is None:
+                    sale = dict(zip(header[:sale_width], row[:sale_width]))
+                item = row[sale_width:]
+                if item[0] is not None:
+                    items.append(dict(zip(item_header, item)))
+            sale["items"] = items
+            yield sale
+
+    @staticmethod
+    def export(db: Session, dataset: str, fmt: str = "csv") -> Iterator[bytes]:
+        """
+        Stream a dataset as UTF-8 CSV (with BOM, for Excel) or NDJSON.
+        Yields encoded pieces of about EXCHANGE_BUFFER_BYTES, so memory use
+        does not depend on the number of rows.
+        """
+        if dataset not in EXCHANGE_DATASETS:
+            raise ValueError(f"Unknown dataset: {dataset}")
+        if fmt not in EXCHANGE_FORMATS:
+            raise ValueError(f"Unknown format: {fmt}")
+
+        buffer = io.StringIO()
+        if fmt == "csv":
+            header, rows = DataExchangeService._flat_rows(db, dataset)
+            writer = csv.writer(buffer)
+            buffer.write("\ufeff")
+            writer.writerow(header)
+            for row in rows:
+                writer.writerow([_csv_value(value) for value in row])
+                if buffer.tell() >= EXCHANGE_BUFFER_BYTES:
+                    yield buffer.getvalue().encode("utf-8")
+                    buffer.seek(0)
+                    buffer.truncate()
+        else:
+            for document in DataExchangeService._documents(db, dataset):
+                buffer.write(json.dumps(document, ensure_ascii=False, default=_json_default))
+                buffer.write("\n")
+                if buffer.tell() >= EXCHANGE_BUFFER_BYTES:
+                    yield buffer.getvalue().encode("utf-8")
+                    buffer.seek(0)
+                    buffer.truncate()
+
+        if buffer.tell():
+            yield buffer.getvalue().encode("utf-8")
+
+    @staticmethod
+    def read_records(stream: BinaryIO, fmt: str) -> Iterator[tuple]:
+        """
+        Read an uploaded CSV/NDJSON file line by line.
+        Yields (row number, raw dict or ValueError).
+        """
+        if fmt not in EXCHANGE_FORMATS:
+            raise ValueError(f"Unknown format: {fmt}")
+
+        text = io.TextIOWrapper(stream, encoding="utf-8-sig", newline="")
+        try:
+            if fmt == "csv":
+                for row_num, row in enumerate(csv.DictReader(text), start=2):
+                    yield row_num, row
+                return
+
+            for row_num, line in enumerate(text, start=1):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    document = json.loads(line)
+                except ValueError:
+                    yield row_num, ValueError("JSON formati noto'g'ri")
+                    continue
+                if not isinstance(document, dict):
+                    yield row_num, ValueError("Har bir qator JSON obyekt bo'lishi kerak")
+                    continue
+                yield row_num, document
+        finally:
+            # The upload stream is owned by the caller
+            text.detach()
+
+    @staticmethod
+    def _parse_record(raw: dict, text_fields: Iterable[str], number_fields: Dict[str, type]) -> dict:
+        """Known fields of a raw record; empty values are left out so column defaults apply"""
+        data = {}
+        for field in text_fields:
+            value = ExcelService._clean_text(raw.get(field))
+            if value is not None:
+                data[field] = value
+        for field, cast in number_fields.items():
+            value = raw.get(field)
+            if value is None or value == '':
+                continue
+            data[field] = ExcelService._parse_number(value, cast, field, None)
+        return data
+
+    @staticmethod
+    def _parse_product(raw: dict) -> dict:
+        data = DataExchangeService._parse_record(raw, PRODUCT_TEXT_FIELDS, PRODUCT_NUMBER_FIELDS)
+        if data.get('pieces_per_package') == 0:
+            data['pieces_per_package'] = 1
+        return data
+
+    @staticmethod
+    def _parse_customer(raw: dict) -> dict:
+        data = DataExchangeService._parse_record(raw, CUSTOMER_TEXT_FIELDS, {'debt_limit': float})
+        customer_type = ExcelService._clean_text(raw.get('customer_type'))
+        if customer_type is not None:
+            try:
+                data['customer_type'] = CustomerType(customer_type.lower())
+            except ValueError:
+                raise ValueError(f"Noma'lum mijoz turi: {customer_type}")
+        return data
+
+    @staticmethod
+    def _parsed(records: Iterable[tuple], parse: Callable[[dict], dict]) -> Iterator[tuple]:
+        for row_num, raw in records:
+            if isinstance(raw, Exception):
+                yield row_num, raw
+                continue
+            try:
+                yield row_num, parse(raw)
+            except ValueError as e:
+                yield row_num, e
+
+    @staticmethod
+    def _build_customer_index(db: Session) -> Dict[str, Dict[str, int]]:
+        """phone/username -> customer ID lookup built with a single query"""
+        index = {"phone": {}, "username": {}}
+        rows = db.query(Customer.id, Customer.phone, Customer.username).yield_per(EXCHANGE_CHUNK_SIZE)
+        for row in rows:
+            for field in ("phone", "username"):
+                value = getattr(row, field)
+                if value:
+                    index[field].setdefault(value, row.id)
+        return index
+
+    @staticmethod
+    def bulk_import_customers(
+        db: Session,
+        records: Iterable,
+        mode: str = "insert",
+        progress: Optional[Callable[[int, Optional[int]], None]] = None
+    ) -> dict:
+        """
+        Bulk customer import, the customer counterpart of ExcelService.bulk_import_products.
+        Customers are matched by phone, then username. mode='insert' skips
+        existing customers; mode='upsert' updates their name, address, type,
+        notes and debt limit.
+        """
+        if mode not in IMPORT_MODES:
+            raise ValueError(f"Unknown import mode: {mode}")
+
+        index = DataExchangeService._build_customer_index(db)
+        pending = []
+        updates = {}
+        errors = []
+        imported = 0
+        updated = set()
+
+        def flush_inserts():
+            db.bulk_insert_mappings(Customer, pending, return_defaults=True)
+            for data in pending:
+                for field in ("phone", "username"):
+                    if data.get(field) and index[field].get(data[field]) is data:
+                        index[field][data[field]] = data["id"]
+            pending.clear()
+
+        def flush_updates():
+            db.bulk_update_mappings(Customer, list(updates.values()))
+            updates.clear()
+
+        try:
+            rows_done = 0
+            for row_num, data in records:
+                rows_done += 1
+                if progress is not None and rows_done % IMPORT_PROGRESS_EVERY == 0:
+                    progress(rows_done, None)
+
+                if isinstance(data, Exception):
+                    errors.append(f"Qator {row_num}: {str(data)}")
+                    continue
+
+                name = data.get("name")
+                if not name:
+                    continue
+
+                existing = next(
+                    (index[field][data[field]] for field in ("phone", "username")
+                     if data.get(field) and data[field] in index[field]),
+                    None
+                )
+
+                if existing is not None and mode == "insert":
+                    errors.append(f"Qator {row_num}: '{name}' allaqachon mavjud (ID: {existing if isinstance(existing, int) else 'fayl ichida'})")
+                    continue
+
+                if existing is not None:
+                    changes = {field: data[field] for field in CUSTOMER_UPDATE_FIELDS if field in data}
+                    if isinstance(existing, int):
+                        updates[existing] = dict(updates.get(existing, {}), **changes, id=existing)
+                        updated.add(existing)
+                        if len(updates) >= IMPORT_BATCH_SIZE:
+                            flush_updates()
+                    else:
+                        # Same customer appears twice in the file - last row wins
+                        existing.update(changes)
+                    continue
+
+                data.setdefault("customer_type", CustomerType.RETAIL)
+                data.setdefault("debt_balance", 0.0)
+                pending.append(data)
+                imported += 1
+                for field in ("phone", "username"):
+                    if data.get(field):
+                        index[field].setdefault(data[field], data)
+                if len(pending) >= IMPORT_BATCH_SIZE:
+                    flush_inserts()
+
+            if pending:
+                flush_inserts()
+            if updates:
+                flush_updates()
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+
+        if progress is not None:
+            progress(rows_done, rows_done)
+        return {
+            "imported": imported,
+            "updated": len(updated),
+            "errors": errors
+        }
+
+    @staticmethod
+    def import_stream(
+        db: Session,
+        dataset: str,
+        stream: BinaryIO,
+        fmt: str = "csv",
+        mode: str = "insert",
+        progress: Optional[Callable[[int, Optional[int]], None]] = None
+    ) -> dict:
+        """Import products or customers from a CSV/NDJSON stream without loading it into memory"""
+        if dataset not in EXCHANGE_IMPORT_DATASETS:
+            raise ValueError(f"Dataset cannot be imported: {dataset}")
+        if mode not in IMPORT_MODES:
+            raise ValueError(f"Unknown import mode: {mode}")
+
+        records = DataExchangeService.read_records(stream, fmt)
+        if dataset == "products":
+            parsed = DataExchangeService._parsed(records, DataExchangeService._parse_product)
+            return ExcelService.bulk_import_products(db, parsed, mode, progress)
+        parsed = DataExchangeService._parsed(records, DataExchangeService._parse_customer)
+        return DataExchangeService.bulk_import_customers(db, parsed, mode, progress)
@@ -0,0 +1,176 @@
+"""
+ESC/POS Service - plain-text and raw ESC/POS receipts for 58/80mm thermal printers
+"""
+from sqlalchemy.orm import Session
+from typing import List, Optional, Tuple
+import os
+import textwrap
+from utils import format_datetime_uz
+try:
+    from .pdf_service import PDFService
+    from .sale_service import SaleService
+    from .settings_service import SettingsService
+except ImportError:
+    from pdf_service import PDFService
+    from sale_service import SaleService
+    from settings_service import SettingsService
+
+
+# Characters per line in the printer's default font (Font A)
+PAPER_WIDTHS = {58: 32, 80: 48}
+
+# Printer code page: PC866 (Cyrillic) also covers plain Latin Uzbek text
+ESCPOS_CODEPAGE = "cp866"
+ESCPOS_CODEPAGE_NUMBER = 17
+
+# QR code payload: receipt URL when a public address is configured, otherwise the sale number
+RECEIPT_PUBLIC_URL = os.getenv("RECEIPT_PUBLIC_URL", "").rstrip("/")
+
+ESC = b"\x1b"
+GS = b"\x1d"
+
+INIT = ESC + b"@"
+ALIGN_LEFT = ESC + b"a\x00"
+ALIGN_CENTER = ESC + b"a\x01"
+BOLD_ON = ESC + b"E\x01"
+BOLD_OFF = ESC + b"E\x00"
+SIZE_NORMAL = GS + b"!\x00"
+SIZE_DOUBLE = GS + b"!\x11"
+CUT = GS + b"V\x42\x03"  # feed 3 lines and partial cut
+
+
+class EscPosService:
+    """Service for rendering receipts as text lines or ESC/POS printer bytes"""
+
+    @staticmethod
+    def _columns(left: str, right: str, width: int) -> str:
+        """Left and right aligned text on one line"""
+        space = width - len(left) - len(right)
+        if space < 1:
+            left = left[:max(width - len(right) - 1, 0)]
+            space = width - len(left) - len(right)
+        return left + " " * space + right
+
+    @staticmethod
+    def qr_payload(sale) -> str:
+        """Text encoded in the receipt QR code"""
+        if RECEIPT_PUBLIC_URL:
+            return f"{RECEIPT_PUBLIC_URL}/api/sales/{sale.id}/receipt"
+        return f"CHEK-{sale.id}"
+
+    @staticmethod
+    def receipt_lines(sale, settings, paper_width: int = 80) -> List[Tuple[str, Optional[str]]]:
+        """
+        Receipt as (text, style) lines, style is None, 'bold', 'title' or 'center'.
+        Uses the same sale data and wording as the PDF receipt.
+        """
+        width = PAPER_WIDTHS.get(paper_width)
+        if width is None:
+            raise ValueError(f"Unsupported paper width: {paper_width}")
+
+        lines = []
+        separator = ("-" * width, None)
+
+        store_name = settings.store_name.upper() if settings and settings.store_name else "SOTUV CHEKI"
+        lines.append((store_name, "title"))
+        if settings and settings.store_address:
+            for part in textwrap.wrap(settings.store_address, width):
+                lines.append((part, "center"))
+        if settings and settings.store_phone:
+            lines.append((f"Tel: {settings.store_phone}", "center"))
+        lines.append(separator)
+
+        lines.append((f"Chek № {sale.id}", "bold"))
+        payment_method = PDFService.PAYMENT_METHOD_NAMES.get(sale.payment_method.value, sale.payment_method.value)
+        customer_name = (sale.customer.name if sale.customer else "O'chirilgan mijoz") or "Noma'lum"
+        seller_name = (sale.seller.name if sale.seller else None) or "Noma'lum"
+        lines.append((EscPosService._columns("Sana:", format_datetime_uz(sale.created_at, '%d.%m.%Y, %H:%M'), width), None))
+        lines.append((EscPosService._columns("Mijoz:", customer_name, width), None))
+        lines.append((EscPosService._columns("Sotuvchi:", seller_name, width), None))
+        lines.append((EscPosService._columns("To'lov usuli:", payment_method, width), None))
+        lines.append(separator)
+
+        for number, item in enumerate(sale.items, 1):
+            product_name = item.product.name if item.product else "O'chirilgan mahsulot"
+            if item.product and item.product.item_number:
+                product_name = f"{product_name} [{item.product.item_number}]"
+            for part in textwrap.wrap(f"{number}. {product_name}", width):
+                lines.append((part, None))
+
+            unit_price = item.piece_price if item.piece_price > 0 else (
+                item.subtotal / item.requested_quantity if item.requested_quantity > 0 else 0
+            )
+            quantity = f"  {item.requested_quantity} x {unit_price:,.0f}"
+            lines.append((EscPosService._columns(quantity, f"{item.subtotal:,.0f}", width), None))
+        lines.append(separator)
+
+        payment_amount = sale.payment_amount or sale.total_amount
+        excess = payment_amount - sale.total_amount
+        lines.append((EscPosService._columns("JAMI:", f"{sale.total_amount:,.0f} so'm", width), "bold"))
+        lines.append((EscPosService._columns("TO'LANGAN:", f"{payment_amount:,.0f} so'm", width), None))
+        if excess > 0:
+            label = "QAYTIM (qarzga):" if (sale.excess_action or 'return') == 'debt' else "QAYTIM:"
+            lines.append((EscPosService._columns(label, f"{excess:,.0f} so'm", width), None))
+        elif excess < 0:
+            lines.append((EscPosService._columns("QARZ:", f"{abs(excess):,.0f} so'm", width), "bold"))
+
+        customer_debt = getattr(sale.customer, 'debt_balance', None) if sale.customer else None
+        if customer_debt and customer_debt > 0:
+            lines.append((EscPosService._columns("MIJOZ QARZI:", f"{customer_debt:,.0f} so'm", width), None))
+        lines.append(separator)
+
+        footer_text = settings.receipt_footer_text if settings and settings.receipt_footer_text else "Xaridingiz uchun rahmat!"
+        for part in textwrap.wrap(footer_text, width):
+            lines.append((part, "center"))
+        return lines
+
+    @staticmethod
+    def render_text(sale, settings, paper_width: int = 80) -> str:
+        """Plain-text receipt (for preview or printers without ESC/POS)"""
+        width = PAPER_WIDTHS.get(paper_width, 48)
+        rendered = []
+        for text, style in EscPosService.receipt_lines(sale, settings, paper_width):
+            rendered.append(text.center(width).rstrip() if style in ("title", "center") else text)
+        return "\n".join(rendered) + "\n"
+
+    @staticmethod
+    def _qr_commands(data: str, module_size: int = 6) -> bytes:
+        """GS ( k commands: QR model 2, module size, error correction M, store and print"""
+        payload = data.encode("utf-8")
+        length = len(payload) + 3
+        return b"".join([
+            GS + b"(k\x04\x00\x31\x41\x32\x00",
+            GS + b"(k\x03\x00\x31\x43" + bytes([module_size]),
+            GS + b"(k\x03\x00\x31\x45\x31",
+            GS + b"(k" + bytes([length % 256, length // 256]) + b"\x31\x50\x30" + payload,
+            GS + b"(k\x03\x00\x31\x51\x30",
+        ])
+
+    @staticmethod
+    def render_escpos(sale, settings, paper_width: int = 80) -> bytes:
+        """Raw ESC/POS bytes ready to be sent to a thermal printer"""
+        out = [INIT, ESC + b"t" + bytes([ESCPOS_CODEPAGE_NUMBER])]
+        for text, style in EscPosService.receipt_lines(sale, settings, paper_width):
+            encoded = text.encode(ESCPOS_CODEPAGE, errors="replace") + b"\n"
+            if style == "title":
+                out += [ALIGN_CENTER, BOLD_ON, SIZE_DOUBLE, encoded, SIZE_NORMAL, BOLD_OFF, ALIGN_LEFT]
+            elif style == "center":
+                out += [ALIGN_CENTER, encoded, ALIGN_LEFT]
+            elif style == "bold":
+                out += [BOLD_ON, encoded, BOLD_OFF]
+            else:
+                out.append(encoded)
+
+        out += [b"\n", ALIGN_CENTER, EscPosService._qr_commands(EscPosService.qr_payload(sale)), ALIGN_LEFT, CUT]
+        return b"".join(out)
+
+    @staticmethod
+    def generate_receipt(db: Session, sale_id: int, fmt: str = "escpos", paper_width: int = 80) -> bytes:
+        """Load a sale and render it as ESC/POS bytes or UTF-8 text"""
+        sale = SaleService.get_sale(db, sale_id)
+        if not sale:
+            raise ValueError(f"Sale {sale_id} not found")
+        settings = SettingsService.get_settings(db)
+        if fmt == "text":
+            return EscPosService.render_text(sale, settings, paper_width).encode("utf-8")
+        return EscPosService.render_escpos(sale, settings, paper_width)
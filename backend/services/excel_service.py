@@ -4,14 +4,79 @@ Excel Service for import/export
 from sqlalchemy.orm import Session
 from openpyxl import Workbook, load_workbook
 from openpyxl.styles import Font, Alignment, PatternFill
-from typing import Optional
+from openpyxl.cell import Cell, WriteOnlyCell
+from openpyxl.utils import get_column_letter
+from typing import Callable, Dict, Iterable, Optional
+from itertools import islice
 import os
 from datetime import datetime
-from models import Product, Sale
+from models import Product, Sale, Seller, Customer
 try:
     from .sale_service import SaleService
+    from .analytics_service import AnalyticsService
+    from .debt_service import DebtService
+    from .product_suggest_service import ProductSuggestService
+    from .product_code_service import ProductCodeService
 except ImportError:
     from sale_service import SaleService
+    from analytics_service import AnalyticsService
+    from debt_service import DebtService
+    from product_suggest_service import ProductSuggestService
+    from product_code_service import ProductCodeService
+
+
+# Rows fetched from the database per round trip during exports
+EXPORT_CHUNK_SIZE = 1000
+# Rows inspected to size columns (write-only sheets cannot be re-read)
+EXPORT_WIDTH_SAMPLE = 200
+
+IMPORT_MODES = ("insert", "upsert")
+# Rows per bulk INSERT/UPDATE statement batch
+IMPORT_BATCH_SIZE = 1000
+# Progress callback interval (rows)
+IMPORT_PROGRESS_EVERY = 500
+# Export column titles -> Product fields, used when importing an exported file
+IMPORT_COLUMNS = {
+    'Nomi': 'name',
+    'Mahsulot kodi (Item Number)': 'item_number',
+    'Barcode': 'barcode',
+    'Brend': 'brand',
+    'Yetkazib beruvchi': 'supplier',
+    'Joylashuv': 'location',
+    '1 qop = dona': 'pieces_per_package',
+    'Kelgan narx (dona)': 'cost_price',
+    'Ulgurji narx (dona)': 'wholesale_price',
+    'Dona narx (dona)': 'retail_price',
+    'Oddiy narx (dona)': 'regular_price',
+    'Ombordagi qop': 'packages_in_stock',
+    'Ombordagi dona': 'pieces_in_stock',
+    'Rasm URL': 'image_url',
+}
+# Fields changed on existing products in upsert mode (only when the file has a value)
+IMPORT_UPDATE_FIELDS = (
+    'pieces_per_package', 'cost_price', 'wholesale_price', 'retail_price', 'regular_price',
+    'packages_in_stock', 'pieces_in_stock',
+)
+# Values of fields missing from a row, used for new products only
+IMPORT_INSERT_DEFAULTS = {
+    'pieces_per_package': 1,
+    'cost_price': 0.0,
+    'wholesale_price': 0.0,
+    'retail_price': 0.0,
+    'regular_price': 0.0,
+    'packages_in_stock': 0,
+    'pieces_in_stock': 0,
+}
+# Number columns of the export layout: field -> (cast, title in error messages)
+IMPORT_NUMBER_FIELDS = {
+    'pieces_per_package': (int, "1 qop = dona"),
+    'cost_price': (float, "Kelgan narx"),
+    'wholesale_price': (float, "Ulgurji narx"),
+    'retail_price': (float, "Dona narx"),
+    'regular_price': (float, "Oddiy narx"),
+    'packages_in_stock': (int, "Ombordagi qop"),
+    'pieces_in_stock': (int, "Ombordagi dona"),
+}
 
 
 class ExcelService:
@@ -25,43 +90,63 @@ class ExcelService:
         return exports_dir
     
     @staticmethod
-    def export_products(db: Session) -> str:
-        """Export all products to Excel file"""
-        products = db.query(Product).all()
-        
-        exports_dir = ExcelService._get_exports_dir()
-        filename = f"products_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx"
-        filepath = os.path.join(exports_dir, filename)
-        
-        wb = Workbook()
-        ws = wb.active
-        ws.title = "Mahsulotlar"
+    def _cell_length(value) -> int:
+        """Display length of a cell value (plain value or WriteOnlyCell)"""
+        if isinstance(value, Cell):
+            value = value.value
+        return len(str(value)) if value is not None else 0
+    
+    @staticmethod
+    def _create_sheet(wb: Workbook, title: str, headers: list, sample: list, header_color: str):
+        """
+        Add a write-only sheet with sized columns and a styled header row.
+        Widths come from the headers and sample rows, because write-only
+        sheets cannot be revisited after rows are written.
+        """
+        ws = wb.create_sheet(title)
         
-        # Headers
-        headers = [
-            'ID', 'Nomi', 'Mahsulot kodi (Item Number)', 'Barcode', 'Brend', 'Yetkazib beruvchi', 'Joylashuv', '1 qop = dona',
-            'Kelgan narx (dona)', 'Ulgurji narx (dona)', 'Dona narx (dona)', 'Oddiy narx (dona)',
-            'Ulgurji qop narxi', 'Dona qop narxi', 'Oddiy qop narxi',
-            'Ombordagi qop', 'Ombordagi dona', 'Jami dona', 'Rasm URL'
-        ]
-        ws.append(headers)
+        for index, header in enumerate(headers, 1):
+            max_length = max([len(str(header))] + [
+                ExcelService._cell_length(row[index - 1]) for row in sample if len(row) >= index
+            ])
+            ws.column_dimensions[get_column_letter(index)].width = min(max_length + 2, 50)
         
         # Style headers
-        header_fill = PatternFill(start_color="4f46e5", end_color="4f46e5", fill_type="solid")
+        header_fill = PatternFill(start_color=header_color, end_color=header_color, fill_type="solid")
         header_font = Font(bold=True, color="FFFFFF")
-        for cell in ws[1]:
+        header_cells = []
+        for header in headers:
+            cell = WriteOnlyCell(ws, value=header)
             cell.fill = header_fill
             cell.font = header_font
             cell.alignment = Alignment(horizontal='center', vertical='center')
-        
-        # Data
-        for product in products:
+            header_cells.append(cell)
+        ws.append(header_cells)
+        return ws
+    
+    @staticmethod
+    def _write_sheet(wb: Workbook, title: str, headers: list, rows: Iterable, header_color: str):
+        """Add a write-only sheet, streaming rows from an iterator (columns sized from the first rows)"""
+        rows = iter(rows)
+        sample = list(islice(rows, EXPORT_WIDTH_SAMPLE))
+        ws = ExcelService._create_sheet(wb, title, headers, sample, header_color)
+        for row in sample:
+            ws.append(row)
+        for row in rows:
+            ws.append(row)
+        return ws
+    
+    @staticmethod
+    def _product_rows(db: Session):
+        """Product rows read from the database in chunks"""
+        query = db.query(Product).order_by(Product.id).yield_per(EXPORT_CHUNK_SIZE)
+        for product in query:
             # Calculate package prices (dona narxi * pieces_per_package)
             wholesale_package_price = (product.wholesale_price or 0.0) * (product.pieces_per_package or 1)
             retail_package_price = (product.retail_price or 0.0) * (product.pieces_per_package or 1)
             regular_package_price = (product.regular_price or 0.0) * (product.pieces_per_package or 1)
             
-            ws.append([
+            yield [
                 product.id,
                 product.name,
                 product.item_number or '',
@@ -81,185 +166,333 @@ class ExcelService:
                 product.pieces_in_stock if product.pieces_in_stock is not None else 0,
                 product.total_pieces if product.total_pieces is not None else 0,
                 product.image_url or ''
-            ])
+            ]
+    
+    @staticmethod
+    def export_products(db: Session, filename: Optional[str] = None) -> str:
+        """Export all products to Excel file (filename: name inside exports/, default is timestamped)"""
+        exports_dir = ExcelService._get_exports_dir()
+        filename = filename or f"products_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx"
+        filepath = os.path.join(exports_dir, filename)
         
-        # Auto-adjust column widths
-        for column in ws.columns:
-            max_length = 0
-            column_letter = column[0].column_letter
-            for cell in column:
-                try:
-                    if len(str(cell.value)) > max_length:
-                        max_length = len(str(cell.value))
-                except:
-                    pass
-            adjusted_width = min(max_length + 2, 50)
-            ws.column_dimensions[column_letter].width = adjusted_width
+        wb = Workbook(write_only=True)
+        
+        # Headers
+        headers = [
+            'ID', 'Nomi', 'Mahsulot kodi (Item Number)', 'Barcode', 'Brend', 'Yetkazib beruvchi', 'Joylashuv', '1 qop = dona',
+            'Kelgan narx (dona)', 'Ulgurji narx (dona)', 'Dona narx (dona)', 'Oddiy narx (dona)',
+            'Ulgurji qop narxi', 'Dona qop narxi', 'Oddiy qop narxi',
+            'Ombordagi qop', 'Ombordagi dona', 'Jami dona', 'Rasm URL'
+        ]
+        ExcelService._write_sheet(wb, "Mahsulotlar", headers, ExcelService._product_rows(db), "4f46e5")
         
         wb.save(filepath)
         return filepath
     
     @staticmethod
-    def import_products(db: Session, file_path: str) -> dict:
-        """Import products from Excel file"""
-        wb = load_workbook(file_path, data_only=True)
-        ws = wb.active
+    def _clean_text(value) -> Optional[str]:
+        """Stripped cell text, None for empty cells and the literal 'None'"""
+        if value is None:
+            return None
+        text = str(value).strip()
+        if not text or text.lower() == 'none':
+            return None
+        return text
+    
+    @staticmethod
+    def _parse_number(value, cast, field: str, default):
+        """Convert a numeric cell, rejecting negative values"""
+        if value is None or value == '':
+            return default
+        try:
+            number = cast(value)
+        except (TypeError, ValueError):
+            raise ValueError(f"'{field}' raqam bo'lishi kerak: {value}")
+        if number < 0:
+            raise ValueError(f"'{field}' manfiy bo'lishi mumkin emas: {value}")
+        return number
+    
+    @staticmethod
+    def _present(data: dict) -> dict:
+        """Drop fields without a value (empty cell or missing column)"""
+        return {field: value for field, value in data.items() if value is not None}
+    
+    @staticmethod
+    def _parse_export_row(row: tuple, columns: Dict[str, int]) -> dict:
+        """
+        Parse a row of a file in the export layout (columns found by header).
+        Empty cells and missing columns are left out, so an upsert only changes
+        the values the file actually has.
+        """
+        def cell(field):
+            index = columns.get(field)
+            return row[index] if index is not None and index < len(row) else None
+        
+        data = {
+            field: ExcelService._clean_text(cell(field))
+            for field in ("name", "item_number", "barcode", "brand", "supplier", "location", "image_url")
+        }
+        for field, (cast, title) in IMPORT_NUMBER_FIELDS.items():
+            data[field] = ExcelService._parse_number(cell(field), cast, title, None)
+        if data["pieces_per_package"] == 0:
+            data["pieces_per_package"] = 1
+        return ExcelService._present(data)
+    
+    @staticmethod
+    def _parse_legacy_row(row: tuple) -> dict:
+        """Parse a row of the original positional import layout (empty cells are left out)"""
+        def cell(index):
+            return row[index] if len(row) > index else None
+        
+        parse = ExcelService._parse_number
+        pieces_per_package = parse(cell(6), int, "1 qop = dona", None)
+        if pieces_per_package == 0:
+            pieces_per_package = 1
+        data = {
+            "name": ExcelService._clean_text(cell(1)),
+            "barcode": ExcelService._clean_text(cell(2)),
+            "brand": ExcelService._clean_text(cell(3)),
+            "supplier": ExcelService._clean_text(cell(4)),
+            "location": ExcelService._clean_text(cell(5)),
+            "pieces_per_package": pieces_per_package,
+            "cost_price": parse(cell(7), float, "Kelgan narx", None),
+            # New format: wholesale_price, retail_price, regular_price (all per piece)
+            "wholesale_price": parse(cell(8), float, "Ulgurji narx", None),
+            "retail_price": parse(cell(9), float, "Dona narx", None),
+            "regular_price": parse(cell(10), float, "Oddiy narx", None),
+        }
+        
+        # Old format support: if package prices are provided, convert to piece prices
+        package_wholesale = parse(cell(11), float, "Ulgurji qop narxi", None)
+        if package_wholesale:
+            divisor = pieces_per_package or 1
+            package_retail = parse(cell(12), float, "Dona qop narxi", None)
+            package_regular = parse(cell(13), float, "Oddiy qop narxi", None)
+            data["wholesale_price"] = package_wholesale / divisor
+            data["retail_price"] = package_retail / divisor if package_retail is not None else None
+            data["regular_price"] = package_regular / divisor if package_regular is not None else None
+            data["packages_in_stock"] = parse(cell(14), int, "Ombordagi qop", None)
+            data["pieces_in_stock"] = parse(cell(15), int, "Ombordagi dona", None)
+            data["image_url"] = ExcelService._clean_text(cell(16))
+        else:
+            # New format - piece prices already provided
+            data["packages_in_stock"] = parse(cell(11), int, "Ombordagi qop", None)
+            data["pieces_in_stock"] = parse(cell(12), int, "Ombordagi dona", None)
+            data["image_url"] = ExcelService._clean_text(cell(13))
+        return ExcelService._present(data)
+    
+    @staticmethod
+    def _build_product_index(db: Session) -> Dict[str, Dict[str, int]]:
+        """name/barcode/item_number -> product ID lookup built with a single query"""
+        index = {"name": {}, "barcode": {}, "item_number": {}}
+        rows = db.query(Product.id, Product.name, Product.barcode, Product.item_number).yield_per(EXPORT_CHUNK_SIZE)
+        for row in rows:
+            for field in ("name", "barcode", "item_number"):
+                value = getattr(row, field)
+                if value:
+                    index[field].setdefault(value, row.id)
+        return index
+    
+    @staticmethod
+    def bulk_import_products(
+        db: Session,
+        records: Iterable,
+        mode: str = "insert",
+        progress: Optional[Callable[[int, Optional[int]], None]] = None,
+        total_rows: Optional[int] = None
+    ) -> dict:
+        """
+        Shared bulk path for product imports (Excel, CSV, NDJSON).
+        records yields (row number, product dict or ValueError).
+        mode='insert' skips rows whose name or barcode already exists;
+        mode='upsert' updates prices and stock of existing products (matched by
+        barcode, then item number, then name) and inserts the rest. Only fields
+        present in a record are updated; IMPORT_INSERT_DEFAULTS fill new products.
+        Rows are written in IMPORT_BATCH_SIZE batches, so memory does not grow with the file.
+        """
+        if mode not in IMPORT_MODES:
+            raise ValueError(f"Unknown import mode: {mode}")
         
-        imported_count = 0
+        index = ExcelService._build_product_index(db)
+        pending = []
+        updates = {}
         errors = []
+        imported = 0
+        updated = set()
         
-        # Skip header row
-        for row_num, row in enumerate(ws.iter_rows(min_row=2, values_only=True), start=2):
-            if not row or not row[1]:  # Skip empty rows (check name)
-                continue
-            
-            try:
-                # Parse row data (flexible column order)
-                name = str(row[1]).strip() if row[1] else None
-                if not name:
-                    continue
+        def flush_inserts():
+            # return_defaults fills in the new IDs so later rows can update them
+            db.bulk_insert_mappings(Product, pending, return_defaults=True)
+            for data in pending:
+                for field in ("name", "barcode", "item_number"):
+                    if data.get(field) and index[field].get(data[field]) is data:
+                        index[field][data[field]] = data["id"]
+            pending.clear()
+        
+        def flush_updates():
+            db.bulk_update_mappings(Product, list(updates.values()))
+            updates.clear()
+        
+        try:
+            rows_done = 0
+            for row_num, data in records:
+                rows_done += 1
+                if progress is not None and rows_done % IMPORT_PROGRESS_EVERY == 0:
+                    progress(rows_done, total_rows)
                 
-                barcode = str(row[2]).strip() if len(row) > 2 and row[2] else None
-                brand = str(row[3]).strip() if len(row) > 3 and row[3] else None
-                supplier = str(row[4]).strip() if len(row) > 4 and row[4] else None
-                location = str(row[5]).strip() if len(row) > 5 and row[5] else None
-                pieces_per_package = int(row[6]) if len(row) > 6 and row[6] else 1
-                cost_price = float(row[7]) if len(row) > 7 and row[7] else 0.0
+                if isinstance(data, Exception):
+                    errors.append(f"Qator {row_num}: {str(data)}")
+                    continue
                 
-                # New format: wholesale_price, retail_price, regular_price (all per piece)
-                # Old format support: if package prices are provided, calculate piece prices
-                wholesale_price = float(row[8]) if len(row) > 8 and row[8] else 0.0
-                retail_price = float(row[9]) if len(row) > 9 and row[9] else 0.0
-                regular_price = float(row[10]) if len(row) > 10 and row[10] else 0.0
+                name = data.get("name")
+                if not name:
+                    continue
                 
-                # If package prices are provided instead (old format), convert to piece prices
-                if len(row) > 11 and row[11] and float(row[11]) > 0:
-                    # Old format detected - package prices provided
-                    wholesale_package_price = float(row[11]) if len(row) > 11 and row[11] else 0.0
-                    retail_package_price = float(row[12]) if len(row) > 12 and row[12] else 0.0
-                    regular_package_price = float(row[13]) if len(row) > 13 and row[13] else 0.0
-                    packages_in_stock = int(row[14]) if len(row) > 14 and row[14] else 0
-                    pieces_in_stock = int(row[15]) if len(row) > 15 and row[15] else 0
-                    image_url = str(row[16]).strip() if len(row) > 16 and row[16] else None
-                    
-                    # Convert package prices to piece prices
-                    if pieces_per_package > 0:
-                        wholesale_price = wholesale_package_price / pieces_per_package
-                        retail_price = retail_package_price / pieces_per_package
-                        regular_price = regular_package_price / pieces_per_package
+                if mode == "upsert":
+                    match_fields = ("barcode", "item_number", "name")
                 else:
-                    # New format - piece prices already provided
-                    packages_in_stock = int(row[11]) if len(row) > 11 and row[11] else 0
-                    pieces_in_stock = int(row[12]) if len(row) > 12 and row[12] else 0
-                    image_url = str(row[13]).strip() if len(row) > 13 and row[13] else None
+                    match_fields = ("name", "barcode")
+                existing = next(
+                    (index[field][data[field]] for field in match_fields
+                     if data.get(field) and data[field] in index[field]),
+                    None
+                )
                 
-                # Check if product with same name or barcode exists
-                existing = db.query(Product).filter(
-                    (Product.name == name) | 
-                    ((Product.barcode == barcode) if barcode else False)
-                ).first()
+                if existing is not None and mode == "insert":
+                    errors.append(f"Qator {row_num}: '{name}' allaqachon mavjud (ID: {existing if isinstance(existing, int) else 'fayl ichida'})")
+                    continue
                 
-                if existing:
-                    errors.append(f"Qator {row_num}: '{name}' allaqachon mavjud (ID: {existing.id})")
+                if existing is not None:
+                    changes = {field: data[field] for field in IMPORT_UPDATE_FIELDS if field in data}
+                    if isinstance(existing, int):
+                        updates[existing] = dict(updates.get(existing, {}), **changes, id=existing)
+                        updated.add(existing)
+                        if len(updates) >= IMPORT_BATCH_SIZE:
+                            flush_updates()
+                    else:
+                        # Same product appears twice in the file - last row wins
+                        existing.update(changes)
                     continue
                 
-                product = Product(
-                    name=name,
-                    barcode=barcode if barcode and barcode.lower() != 'none' else None,
-                    brand=brand if brand and brand.lower() != 'none' else None,
-                    supplier=supplier if supplier and supplier.lower() != 'none' else None,
-                    location=location if location and location.lower() != 'none' else None,
-                    pieces_per_package=pieces_per_package,
-                    cost_price=cost_price,
-                    wholesale_price=wholesale_price,
-                    retail_price=retail_price,
-                    regular_price=regular_price,
-                    packages_in_stock=packages_in_stock,
-                    pieces_in_stock=pieces_in_stock,
-                    image_url=image_url if image_url and image_url.lower() != 'none' else None
-                )
-                db.add(product)
-                imported_count += 1
-            except Exception as e:
-                errors.append(f"Qator {row_num}: {str(e)}")
-                continue
+                # Missing values get their defaults only when the product is created
+                data = dict(IMPORT_INSERT_DEFAULTS, **data)
+                pending.append(data)
+                imported += 1
+                for field in ("name", "barcode", "item_number"):
+                    if data.get(field):
+                        index[field].setdefault(data[field], data)
+                if len(pending) >= IMPORT_BATCH_SIZE:
+                    flush_inserts()
+            
+            if pending:
+                flush_inserts()
+            if updates:
+                flush_updates()
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            # Batches may have been committed by then; the autocomplete and scan indexes are rebuilt on next use
+            ProductSuggestService.invalidate()
+            ProductCodeService.invalidate()
         
-        db.commit()
+        if progress is not None:
+            progress(rows_done, total_rows or rows_done)
         return {
-            "imported": imported_count,
+            "imported": imported,
+            "updated": len(updated),
             "errors": errors
         }
     
+    @staticmethod
+    def import_products(
+        db: Session,
+        file_path: str,
+        mode: str = "insert",
+        progress: Optional[Callable[[int, Optional[int]], None]] = None
+    ) -> dict:
+        """Import products from Excel file (see bulk_import_products for modes)"""
+        if mode not in IMPORT_MODES:
+            raise ValueError(f"Unknown import mode: {mode}")
+        
+        wb = load_workbook(file_path, read_only=True, data_only=True)
+        try:
+            ws = wb.active
+            total_rows = ws.max_row - 1 if ws.max_row else None
+            rows = ws.iter_rows(values_only=True)
+            header = next(rows, None) or ()
+            
+            # Files produced by export_products are read by column title
+            titles = {str(title).strip(): i for i, title in enumerate(header) if title is not None}
+            export_layout = "Nomi" in titles and "Mahsulot kodi (Item Number)" in titles
+            columns = {field: titles[title] for title, field in IMPORT_COLUMNS.items() if title in titles}
+            
+            def records():
+                for row_num, row in enumerate(rows, start=2):
+                    if not row or not any(value is not None and str(value).strip() for value in row):
+                        continue  # Skip empty rows
+                    try:
+                        if export_layout:
+                            yield row_num, ExcelService._parse_export_row(row, columns)
+                        else:
+                            yield row_num, ExcelService._parse_legacy_row(row)
+                    except ValueError as e:
+                        yield row_num, e
+            
+            return ExcelService.bulk_import_products(db, records(), mode, progress, total_rows)
+        finally:
+            wb.close()
+    
+    @staticmethod
+    def _sale_rows(db: Session, start_date: Optional[str], end_date: Optional[str]):
+        """Sale rows (newest first) read from the database in chunks"""
+        from datetime import datetime as dt, timedelta
+        
+        query = db.query(
+            Sale.id,
+            Sale.created_at,
+            Seller.name.label("seller_name"),
+            Customer.name.label("customer_name"),
+            Sale.total_amount
+        ).outerjoin(Seller, Seller.id == Sale.seller_id).outerjoin(Customer, Customer.id == Sale.customer_id)
+        
+        # Filter by date (inclusive, by calendar date)
+        if start_date:
+            query = query.filter(Sale.created_at >= dt.fromisoformat(start_date).replace(hour=0, minute=0, second=0, microsecond=0))
+        if end_date:
+            end = dt.fromisoformat(end_date).replace(hour=0, minute=0, second=0, microsecond=0) + timedelta(days=1)
+            query = query.filter(Sale.created_at < end)
+        
+        for row in query.order_by(Sale.created_at.desc()).yield_per(EXPORT_CHUNK_SIZE):
+            yield [
+                row.id,
+                row.created_at.strftime('%Y-%m-%d %H:%M'),
+                row.seller_name,
+                row.customer_name if row.customer_name is not None else "O'chirilgan mijoz",
+                row.total_amount
+            ]
+    
     @staticmethod
     def export_sales(
         db: Session,
         start_date: Optional[str] = None,
-        end_date: Optional[str] = None
+        end_date: Optional[str] = None,
+        filename: Optional[str] = None
     ) -> str:
-        """Export sales to Excel file"""
-        sales = SaleService.get_sales(db)
-        
-        # Filter by date if provided
-        if start_date or end_date:
-            from datetime import datetime as dt
-            filtered_sales = []
-            for sale in sales:
-                sale_date = sale.created_at.date()
-                if start_date:
-                    start = dt.fromisoformat(start_date).date()
-                    if sale_date < start:
-                        continue
-                if end_date:
-                    end = dt.fromisoformat(end_date).date()
-                    if sale_date > end:
-                        continue
-                filtered_sales.append(sale)
-            sales = filtered_sales
-        
+        """Export sales to Excel file (filename: name inside exports/, default is timestamped)"""
         exports_dir = ExcelService._get_exports_dir()
-        filename = f"sales_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx"
+        filename = filename or f"sales_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx"
         filepath = os.path.join(exports_dir, filename)
         
-        wb = Workbook()
-        ws = wb.active
-        ws.title = "Sotuvlar"
+        wb = Workbook(write_only=True)
         
         # Headers
         headers = [
             'ID', 'Sana', 'Sotuvchi', 'Mijoz', 'Summa'
         ]
-        ws.append(headers)
-        
-        # Style headers
-        header_fill = PatternFill(start_color="10b981", end_color="10b981", fill_type="solid")
-        header_font = Font(bold=True, color="FFFFFF")
-        for cell in ws[1]:
-            cell.fill = header_fill
-            cell.font = header_font
-            cell.alignment = Alignment(horizontal='center', vertical='center')
-        
-        # Data
-        for sale in sales:
-            ws.append([
-                sale.id,
-                sale.created_at.strftime('%Y-%m-%d %H:%M'),
-                sale.seller.name,
-                sale.customer.name if sale.customer else "O'chirilgan mijoz",
-                sale.total_amount
-            ])
-        
-        # Auto-adjust column widths
-        for column in ws.columns:
-            max_length = 0
-            column_letter = column[0].column_letter
-            for cell in column:
-                try:
-                    if len(str(cell.value)) > max_length:
-                        max_length = len(str(cell.value))
-                except:
-                    pass
-            adjusted_width = min(max_length + 2, 50)
-            ws.column_dimensions[column_letter].width = adjusted_width
+        rows = ExcelService._sale_rows(db, start_date, end_date)
+        ExcelService._write_sheet(wb, "Sotuvlar", headers, rows, "10b981")
         
         wb.save(filepath)
         return filepath
@@ -268,97 +501,75 @@ class ExcelService:
     def export_statistics(
         db: Session,
         start_date: Optional[str] = None,
-        end_date: Optional[str] = None
+        end_date: Optional[str] = None,
+        filename: Optional[str] = None
     ) -> str:
-        """Export statistics to Excel file"""
-        stats = SaleService.get_statistics(db, start_date, end_date)
+        """
+        Export statistics to Excel file (filename: name inside exports/, default is timestamped).
+        Built from grouped SQL queries (all sales, like SaleService.get_statistics),
+        so memory does not grow with the number of sales.
+        """
+        start = SaleService.parse_statistics_date(start_date, "start_date")
+        end = SaleService.parse_statistics_date(end_date, "end_date")
+        totals = AnalyticsService.get_range_totals(db, start, end, with_profit=True, approved_only=False)
+        payment_methods = AnalyticsService.get_payment_method_totals(db, start, end, approved_only=False)
         
         exports_dir = ExcelService._get_exports_dir()
-        filename = f"statistics_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx"
+        filename = filename or f"statistics_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx"
         filepath = os.path.join(exports_dir, filename)
         
-        wb = Workbook()
+        wb = Workbook(write_only=True)
+        header_color = "6366f1"
         
         # Sheet 1: General Statistics
-        ws1 = wb.active
-        ws1.title = "Umumiy Statistika"
-        
-        # Headers
-        header_fill = PatternFill(start_color="6366f1", end_color="6366f1", fill_type="solid")
-        header_font = Font(bold=True, color="FFFFFF")
+        general_rows = [
+            ["Jami sotuvlar", f"{totals['amount']:,.0f} so'm"],
+            ["Sotuvlar soni", f"{totals['count']} ta"],
+            ["O'rtacha sotuv", f"{totals['average']:,.0f} so'm"],
+            ["Daromad", f"{totals['profit']:,.0f} so'm"],
+            ["Jami qarz", f"{DebtService.get_total_debt(db):,.0f} so'm"],
+        ]
         
-        ws1.append(["Ko'rsatkich", "Qiymat"])
-        for cell in ws1[1]:
-            cell.fill = header_fill
-            cell.font = header_font
-            cell.alignment = Alignment(horizontal='center', vertical='center')
+        # Payment methods
+        general_rows.append([])
+        general_rows.append(["TO'LOV TURLARI", ""])
         
-        # General stats
-        ws1.append(["Jami sotuvlar", f"{stats.get('total_amount', 0):,.0f} so'm"])
-        ws1.append(["Sotuvlar soni", f"{stats.get('total_sales', 0)} ta"])
-        ws1.append(["O'rtacha sotuv", f"{stats.get('average_sale', 0):,.0f} so'm"])
-        ws1.append(["Daromad", f"{stats.get('total_profit', 0):,.0f} so'm"])
-        ws1.append(["Jami qarz", f"{stats.get('total_debt', 0):,.0f} so'm"])
+        for method, data in payment_methods.items():
+            method_name = {
+                'cash': '💵 Naqd',
+                'card': '💳 Karta',
+                'credit': '📝 Nasiya',
+                'bank_transfer': '🏦 O\'tkazma'
+            }.get(method, method.upper())
+            general_rows.append([method_name, f"{data['amount']:,.0f} so'm ({data['count']} ta)"])
         
-        # Payment methods
-        if 'payment_methods' in stats:
-            ws1.append([])
-            ws1.append(["TO'LOV TURLARI", ""])
-            for cell in ws1[ws1.max_row]:
-                cell.font = Font(bold=True)
-            
-            for method, data in stats['payment_methods'].items():
-                method_name = {
-                    'cash': '💵 Naqd',
-                    'card': '💳 Karta',
-                    'credit': '📝 Nasiya',
-                    'bank_transfer': '🏦 O\'tkazma'
-                }.get(method, method.upper())
-                ws1.append([method_name, f"{data['amount']:,.0f} so'm ({data['count']} ta)"])
+        ws1 = ExcelService._create_sheet(wb, "Umumiy Statistika", ["Ko'rsatkich", "Qiymat"], general_rows, header_color)
+        for row in general_rows:
+            if row and row[0] == "TO'LOV TURLARI":
+                section = WriteOnlyCell(ws1, value=row[0])
+                section.font = Font(bold=True)
+                row = [section, row[1]]
+            ws1.append(row)
         
         # Sheet 2: Top Products
-        if 'top_products' in stats:
-            ws2 = wb.create_sheet("Top Mahsulotlar")
-            ws2.append(["Mahsulot", "Mahsulot kodi (Item Number)", "Sotildi", "Summa"])
-            for cell in ws2[1]:
-                cell.fill = header_fill
-                cell.font = header_font
-                cell.alignment = Alignment(horizontal='center', vertical='center')
-            
-            for product in stats['top_products']:
-                ws2.append([
-                    product['name'],
-                    product.get('item_number', '') or '',
-                    product['quantity'],
-                    f"{product['amount']:,.0f}"
-                ])
+        rows = (
+            [
+                product['name'],
+                product.get('item_number', '') or '',
+                product['quantity'],
+                f"{product['amount']:,.0f}"
+            ]
+            for product in AnalyticsService.get_top_products(db, start, end, approved_only=False)
+        )
+        headers = ["Mahsulot", "Mahsulot kodi (Item Number)", "Sotildi", "Summa"]
+        ExcelService._write_sheet(wb, "Top Mahsulotlar", headers, rows, header_color)
         
         # Sheet 3: Top Customers
-        if 'top_customers' in stats:
-            ws3 = wb.create_sheet("Top Mijozlar")
-            ws3.append(["Mijoz", "Xaridlar", "Summa"])
-            for cell in ws3[1]:
-                cell.fill = header_fill
-                cell.font = header_font
-                cell.alignment = Alignment(horizontal='center', vertical='center')
-            
-            for customer in stats['top_customers']:
-                ws3.append([customer['name'], customer['count'], f"{customer['amount']:,.0f}"])
-        
-        # Auto-adjust column widths for all sheets
-        for sheet in wb.worksheets:
-            for column in sheet.columns:
-                max_length = 0
-                column_letter = column[0].column_letter
-                for cell in column:
-                    try:
-                        if len(str(cell.value)) > max_length:
-                            max_length = len(str(cell.value))
-                    except:
-                        pass
-                adjusted_width = min(max_length + 2, 50)
-                sheet.column_dimensions[column_letter].width = adjusted_width
+        rows = (
+            [customer['name'], customer['count'], f"{customer['amount']:,.0f}"]
+            for customer in AnalyticsService.get_top_customers(db, start, end, approved_only=False)
+        )
+        ExcelService._write_sheet(wb, "Top Mijozlar", ["Mijoz", "Xaridlar", "Summa"], rows, header_color)
         
         wb.save(filepath)
         return filepath
-
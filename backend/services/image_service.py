@@ -0,0 +1,250 @@
+"""
+Image Service - uploaded images stored by content hash, with resized WebP/JPEG
+variants (thumb, list, detail) rendered in a background process pool
+"""
+from typing import Dict, Optional
+import os
+import re
+import hashlib
+import shutil
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from sqlalchemy.orm import Session
+from starlette.staticfiles import StaticFiles
+from models import Banner, Product, ProductImage, Seller, Settings
+
+
+# Project root /uploads (same directory main.py mounts at /uploads)
+UPLOADS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "uploads")
+VARIANTS_DIR = os.path.join(UPLOADS_DIR, "variants")
+VARIANTS_URL = "/uploads/variants"
+
+# Variant name -> longest side in px (never upscaled)
+IMAGE_VARIANTS = {"thumb": 160, "list": 480, "detail": 1080}
+# Output format -> (file extension, Pillow save options)
+IMAGE_FORMATS = {
+    "webp": (".webp", {"format": "WEBP", "quality": 80, "method": 4}),
+    "jpeg": (".jpg", {"format": "JPEG", "quality": 82, "optimize": True, "progressive": True}),
+}
+# Extensions Pillow can resize (svg logos are kept as uploaded)
+RESIZABLE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".gif", ".webp"}
+
+IMAGE_WORKERS = int(os.getenv("IMAGE_WORKERS", "2"))
+# Variant files never change (the name is the content hash)
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+# Responses that embed variant URLs (their ETags change when variants become ready)
+VARIANT_RESOURCES = ["products", "banners"]
+
+# Stored originals: /uploads/{folder}/{digest}{ext}
+_HASHED_URL = re.compile(r"^/uploads/[\w-]+/([0-9a-f]{32})(\.\w+)$")
+
+_executor = None
+_pending = set()
+_pending_lock = threading.Lock()
+
+
+def _render_variants(source_path: str, target_dir: str) -> int:
+    """
+    Worker process entry point: write every variant of one image into
+    target_dir (VARIANTS_DIR/{digest}). Rendered into a temp directory that is
+    renamed at the end, so a variant directory is either complete or missing.
+    """
+    from PIL import Image, ImageOps
+
+    if os.path.isdir(target_dir):
+        return 0
+    temp_dir = f"{target_dir}.tmp{os.getpid()}"
+    os.makedirs(temp_dir, exist_ok=True)
+    try:
+        with Image.open(source_path) as image:
+            largest = max(IMAGE_VARIANTS.values())
+            # JPEG: decode at reduced scale straight away (phone photos are 12+ MP)
+            image.draft("RGB", (largest * 2, largest * 2))
+            image = ImageOps.exif_transpose(image)
+            if image.mode in ("RGBA", "LA", "P"):
+                # Transparent PNG/GIF: flatten on white (JPEG has no alpha)
+                image = image.convert("RGBA")
+                background = Image.new("RGB", image.size, (255, 255, 255))
+                background.paste(image, mask=image.getchannel("A"))
+                image = background
+            elif image.mode != "RGB":
+                image = image.convert("RGB")
+
+            # Largest first, each smaller variant is resized from the previous one
+            written = 0
+            for name, size in sorted(IMAGE_VARIANTS.items(), key=lambda item: -item[1]):
+                image.thumbnail((size, size), Image.LANCZOS)
+                for extension, options in IMAGE_FORMATS.values():
+                    image.save(os.path.join(temp_dir, f"{name}{extension}"), **options)
+                    written += 1
+        os.replace(temp_dir, target_dir)
+        return written
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+
+class ImmutableStaticFiles(StaticFiles):
+    """StaticFiles with far-future cache headers (for content-hashed files)"""
+
+    def file_response(self, *args, **kwargs):
+        response = super().file_response(*args, **kwargs)
+        response.headers["Cache-Control"] = IMMUTABLE_CACHE_CONTROL
+        return response
+
+
+class ImageService:
+    """Service for storing uploaded images and their resized variants"""
+
+    @staticmethod
+    def get_executor() -> ProcessPoolExecutor:
+        """Shared process pool for image resizing"""
+        global _executor
+        if _executor is None:
+            # spawn: worker processes must not inherit DB connections or threads
+            _executor = ProcessPoolExecutor(
+                max_workers=IMAGE_WORKERS,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        return _executor
+
+    @staticmethod
+    def shutdown_executor(wait: bool = True):
+        """Stop the process pool (on application shutdown)"""
+        global _executor
+        if _executor is not None:
+            _executor.shutdown(wait=wait)
+            _executor = None
+
+    @staticmethod
+    def _variant_paths(digest: str) -> Dict[str, Dict[str, str]]:
+        return {
+            name: {
+                image_format: f"{VARIANTS_URL}/{digest}/{name}{extension}"
+                for image_format, (extension, _) in IMAGE_FORMATS.items()
+            }
+            for name in IMAGE_VARIANTS
+        }
+
+    @staticmethod
+    def variant_urls(image_url: Optional[str], ready_only: bool = True) -> Optional[Dict[str, Dict[str, str]]]:
+        """
+        {"thumb": {"webp": url, "jpeg": url}, "list": ..., "detail": ...} for an
+        image stored by save_upload; None for other URLs (external links, older
+        uploads) or, with ready_only, while the variants are still being rendered.
+        """
+        if not image_url:
+            return None
+        match = _HASHED_URL.match(image_url)
+        if not match or match.group(2).lower() not in RESIZABLE_EXTENSIONS:
+            return None
+        digest = match.group(1)
+        if ready_only and not os.path.isdir(os.path.join(VARIANTS_DIR, digest)):
+            return None
+        return ImageService._variant_paths(digest)
+
+    @staticmethod
+    def _variants_ready():
+        """Invalidate cached catalog responses so clients pick up the variant URLs"""
+        from database import SessionLocal
+        try:
+            from .resource_version_service import ResourceVersionService
+        except ImportError:
+            from resource_version_service import ResourceVersionService
+
+        db = SessionLocal()
+        try:
+            ResourceVersionService.bump(db, VARIANT_RESOURCES)
+        except Exception as e:
+            print(f"[Images] Could not bump catalog versions: {e}")
+        finally:
+            db.close()
+
+    @staticmethod
+    def schedule_variants(file_path: str, digest: str):
+        """Render variants in the process pool; returns immediately"""
+        target_dir = os.path.join(VARIANTS_DIR, digest)
+        if os.path.isdir(target_dir):
+            return
+        with _pending_lock:
+            if digest in _pending:
+                return
+            _pending.add(digest)
+
+        def done(future):
+            with _pending_lock:
+                _pending.discard(digest)
+            error = future.exception()
+            if error is not None:
+                print(f"[Images] Variants failed for {file_path}: {error}")
+            elif future.result():
+                ImageService._variants_ready()
+
+        os.makedirs(VARIANTS_DIR, exist_ok=True)
+        try:
+            ImageService.get_executor().submit(_render_variants, file_path, target_dir).add_done_callback(done)
+        except RuntimeError as e:
+            # Pool shut down or broken - the original image is still served
+            with _pending_lock:
+                _pending.discard(digest)
+            print(f"[Images] Could not schedule variants for {file_path}: {e}")
+
+    @staticmethod
+    def save_upload(content: bytes, folder: str, extension: str) -> dict:
+        """
+        Store an uploaded image as /uploads/{folder}/{content hash}{extension}
+        (the same image uploaded twice is stored once) and queue its variants.
+        """
+        extension = extension.lower()
+        digest = hashlib.sha256(content).hexdigest()[:32]
+        filename = f"{digest}{extension}"
+        folder_dir = os.path.join(UPLOADS_DIR, folder)
+        os.makedirs(folder_dir, exist_ok=True)
+        file_path = os.path.join(folder_dir, filename)
+
+        if not os.path.exists(file_path):
+            temp_path = f"{file_path}.tmp{os.getpid()}.{threading.get_ident()}"
+            with open(temp_path, "wb") as buffer:
+                buffer.write(content)
+            os.replace(temp_path, file_path)
+
+        url = f"/uploads/{folder}/{filename}"
+        variants = None
+        if extension in RESIZABLE_EXTENSIONS:
+            ImageService.schedule_variants(file_path, digest)
+            variants = ImageService._variant_paths(digest)
+        return {"url": url, "filename": filename, "variants": variants}
+
+    @staticmethod
+    def is_referenced(db: Session, image_url: str, digest_only: bool = False) -> bool:
+        """
+        Whether any record still uses this image (identical uploads share one file).
+        digest_only: any folder with the same content (they share the variants).
+        """
+        columns = [Product.image_url, ProductImage.image_url, Seller.image_url, Banner.image_url, Settings.logo_url]
+        match = _HASHED_URL.match(image_url)
+        if digest_only and match:
+            conditions = [column.like(f"/uploads/%/{match.group(1)}.%") for column in columns]
+        else:
+            conditions = [column == image_url for column in columns]
+        return any(
+            db.query(column).filter(condition).first() is not None
+            for column, condition in zip(columns, conditions)
+        )
+
+    @staticmethod
+    def delete_if_unused(db: Session, image_url: Optional[str]) -> bool:
+        """Delete an uploaded file (and its variants) once no record references it"""
+        if not image_url or not image_url.startswith("/uploads/"):
+            return False
+        if ImageService.is_referenced(db, image_url):
+            return False
+        file_path = os.path.abspath(os.path.join(UPLOADS_DIR, image_url[len("/uploads/"):]))
+        if not file_path.startswith(os.path.abspath(UPLOADS_DIR) + os.sep) or not os.path.isfile(file_path):
+            return False
+        os.remove(file_path)
+        match = _HASHED_URL.match(image_url)
+        if match and not ImageService.is_referenced(db, image_url, digest_only=True):
+            shutil.rmtree(os.path.join(VARIANTS_DIR, match.group(1)), ignore_errors=True)
+        return True
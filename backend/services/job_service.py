@@ -0,0 +1,276 @@
+"""
+Job Service - long exports, reports and imports run in a background worker pool
+"""
+from sqlalchemy.orm import Session
+from typing import Callable, Dict, List, Optional
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime, timedelta
+import os
+import glob
+import uuid
+import asyncio
+import threading
+from database import SessionLocal
+try:
+    from .excel_service import ExcelService
+    from .pdf_service import PDFService
+    from .sale_service import SaleService
+except ImportError:
+    from excel_service import ExcelService
+    from pdf_service import PDFService
+    from sale_service import SaleService
+
+
+# Jobs running at the same time (exports are DB and CPU heavy, SQLite has one writer)
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+# Finished jobs and their files are removed after this many hours
+JOB_RETENTION_HOURS = float(os.getenv("JOB_RETENTION_HOURS", "24"))
+# How often the retention cleanup runs (seconds)
+JOB_CLEANUP_INTERVAL = int(os.getenv("JOB_CLEANUP_INTERVAL", "900"))
+
+JOB_STATUSES = ("queued", "running", "done", "failed")
+
+XLSX_MEDIA_TYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+_executor = None
+_jobs: Dict[str, dict] = {}
+_futures: Dict[str, Future] = {}
+_listeners: List[Callable[[dict], None]] = []
+_lock = threading.Lock()
+
+
+def _artifact_name(params: dict, name: str, extension: str) -> str:
+    """Per-job file name, so jobs of the same kind finishing in the same second don't collide"""
+    return f"job_{params['job_id']}_{name}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{extension}"
+
+
+def _export_products(db: Session, params: dict, progress) -> dict:
+    file_path = ExcelService.export_products(db, filename=_artifact_name(params, "products", "xlsx"))
+    return {"file_path": file_path, "media_type": XLSX_MEDIA_TYPE}
+
+
+def _export_sales(db: Session, params: dict, progress) -> dict:
+    file_path = ExcelService.export_sales(
+        db, params.get("start_date"), params.get("end_date"), filename=_artifact_name(params, "sales", "xlsx")
+    )
+    return {"file_path": file_path, "media_type": XLSX_MEDIA_TYPE}
+
+
+def _export_statistics(db: Session, params: dict, progress) -> dict:
+    start_date, end_date = params.get("start_date"), params.get("end_date")
+    if params.get("format") == "pdf":
+        stats = SaleService.get_statistics(db, start_date, end_date)
+        # period_start/period_end: dates printed on the report, if they differ from the filter
+        file_path = PDFService.export_statistics(
+            stats, params.get("period_start", start_date), params.get("period_end", end_date),
+            filename=_artifact_name(params, "statistics", "pdf")
+        )
+        return {"file_path": file_path, "media_type": "application/pdf"}
+    file_path = ExcelService.export_statistics(
+        db, start_date, end_date, filename=_artifact_name(params, "statistics", "xlsx")
+    )
+    return {"file_path": file_path, "media_type": XLSX_MEDIA_TYPE}
+
+
+def _import_products(db: Session, params: dict, progress) -> dict:
+    file_path = params["file_path"]
+    try:
+        return ExcelService.import_products(db, file_path, params.get("mode", "insert"), progress)
+    finally:
+        # Uploaded file is not needed after the import
+        if os.path.exists(file_path):
+            os.remove(file_path)
+
+
+# Job type -> handler(db, params, progress) returning a result dict; params include
+# the job_id. "file_path" and "media_type" in the result make the job downloadable
+JOB_TYPES = {
+    "products_export": _export_products,
+    "sales_export": _export_sales,
+    "statistics_export": _export_statistics,
+    "products_import": _import_products,
+}
+
+
+class JobService:
+    """Service for running heavy work outside the request and tracking its progress"""
+
+    @staticmethod
+    def get_executor() -> ThreadPoolExecutor:
+        """Shared worker pool for jobs"""
+        global _executor
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=JOB_WORKERS, thread_name_prefix="job")
+        return _executor
+
+    @staticmethod
+    def shutdown_executor(wait: bool = True):
+        """Stop the worker pool (on application shutdown)"""
+        global _executor
+        if _executor is not None:
+            _executor.shutdown(wait=wait)
+            _executor = None
+
+    @staticmethod
+    def artifacts_dir() -> str:
+        """Job files are kept in exports/ next to the synchronous exports"""
+        return ExcelService._get_exports_dir()
+
+    @staticmethod
+    def add_listener(listener: Callable[[dict], None]):
+        """listener(job) is called from worker threads on every status or progress change"""
+        _listeners.append(listener)
+
+    @staticmethod
+    def to_response(job: dict) -> dict:
+        """Job fields returned to clients (server paths are left out)"""
+        response = {key: value for key, value in job.items() if key not in ("params", "file_path")}
+        for key in ("created_at", "started_at", "finished_at"):
+            if response.get(key):
+                response[key] = response[key].isoformat()
+        response["download_ready"] = job["status"] == "done" and bool(job.get("file_path"))
+        return response
+
+    @staticmethod
+    def _update(job_id: str, **changes):
+        with _lock:
+            job = _jobs.get(job_id)
+            if job is None:
+                return
+            job.update(changes)
+            snapshot = JobService.to_response(job)
+        for listener in list(_listeners):
+            try:
+                listener(snapshot)
+            except Exception as e:
+                print(f"[Jobs] Listener error: {e}")
+
+    @staticmethod
+    def _run(job_id: str):
+        job = _jobs[job_id]
+        JobService._update(job_id, status="running", started_at=datetime.now())
+
+        def progress(done: int, total: Optional[int] = None):
+            JobService._update(job_id, progress={"done": done, "total": total})
+
+        db = SessionLocal()
+        try:
+            params = dict(job["params"], job_id=job_id)
+            result = JOB_TYPES[job["type"]](db, params, progress) or {}
+            file_path = result.pop("file_path", None)
+            media_type = result.pop("media_type", None)
+            filename = None
+            if file_path:
+                # Artifacts live in exports/ under the job ID so retention can find them;
+                # the download name is shown without the prefix
+                prefix = f"job_{job_id}_"
+                filename = os.path.basename(file_path)
+                if filename.startswith(prefix):
+                    filename = filename[len(prefix):]
+                target = os.path.join(JobService.artifacts_dir(), prefix + filename)
+                if os.path.abspath(file_path) != os.path.abspath(target):
+                    os.replace(file_path, target)
+                file_path = target
+            JobService._update(
+                job_id,
+                status="done",
+                finished_at=datetime.now(),
+                result=result,
+                file_path=file_path,
+                filename=filename,
+                media_type=media_type
+            )
+        except Exception as e:
+            JobService._update(job_id, status="failed", finished_at=datetime.now(), error=str(e))
+        finally:
+            db.close()
+
+    @staticmethod
+    def submit(job_type: str, params: Optional[dict] = None, owner_id: Optional[int] = None) -> dict:
+        """Queue a job and return it immediately (status 'queued')"""
+        if job_type not in JOB_TYPES:
+            raise ValueError(f"Unknown job type: {job_type}")
+
+        job_id = uuid.uuid4().hex
+        job = {
+            "id": job_id,
+            "type": job_type,
+            "status": "queued",
+            "owner_id": owner_id,
+            "params": dict(params or {}),
+            "progress": {"done": 0, "total": None},
+            "result": None,
+            "error": None,
+            "file_path": None,
+            "filename": None,
+            "media_type": None,
+            "created_at": datetime.now(),
+            "started_at": None,
+            "finished_at": None,
+        }
+        with _lock:
+            _jobs[job_id] = job
+            response = JobService.to_response(job)
+            # Registered under the lock so cleanup_expired never misses the future
+            _futures[job_id] = JobService.get_executor().submit(JobService._run, job_id)
+        return response
+
+    @staticmethod
+    def get_job(job_id: str) -> Optional[dict]:
+        """Internal job record (with file_path) or None"""
+        with _lock:
+            job = _jobs.get(job_id)
+            return dict(job) if job else None
+
+    @staticmethod
+    async def wait(job_id: str) -> Optional[dict]:
+        """Await a job from async code (e.g. the bot) without blocking the event loop"""
+        with _lock:
+            future = _futures.get(job_id)
+        if future is not None:
+            await asyncio.wrap_future(future)
+        return JobService.get_job(job_id)
+
+    @staticmethod
+    def cleanup_expired(now: Optional[datetime] = None) -> int:
+        """
+        Drop finished jobs older than JOB_RETENTION_HOURS and delete old files
+        in exports/ (including leftovers of synchronous exports).
+        Returns the number of deleted files.
+        """
+        now = now or datetime.now()
+        cutoff = now - timedelta(hours=JOB_RETENTION_HOURS)
+
+        with _lock:
+            expired = [
+                job_id for job_id, job in _jobs.items()
+                if job["finished_at"] is not None and job["finished_at"] < cutoff
+            ]
+            for job_id in expired:
+                _jobs.pop(job_id, None)
+                _futures.pop(job_id, None)
+            active_files = {job["file_path"] for job in _jobs.values() if job.get("file_path")}
+
+        removed = 0
+        for path in glob.glob(os.path.join(JobService.artifacts_dir(), "*")):
+            if path in active_files or not os.path.isfile(path):
+                continue
+            try:
+                if datetime.fromtimestamp(os.path.getmtime(path)) < cutoff:
+                    os.remove(path)
+                    removed += 1
+            except FileNotFoundError:
+                pass
+        return removed
+
+    @staticmethod
+    async def cleanup_loop():
+        """Run the retention cleanup every JOB_CLEANUP_INTERVAL seconds"""
+        while True:
+            try:
+                removed = await asyncio.get_running_loop().run_in_executor(None, JobService.cleanup_expired)
+                if removed:
+                    print(f"[Jobs] Retention: {removed} ta eski fayl o'chirildi")
+            except Exception as e:
+                print(f"[Jobs] Retention cleanup error: {e}")
+            await asyncio.sleep(JOB_CLEANUP_INTERVAL)
@@ -5,11 +5,13 @@ from sqlalchemy.orm import Session
 from reportlab.lib import colors
 from reportlab.lib.pagesizes import A4
 from reportlab.lib.units import mm
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
+from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer, PageBreak
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.lib.enums import TA_CENTER, TA_LEFT, TA_RIGHT
 from reportlab.pdfgen import canvas
+from reportlab.lib.utils import ImageReader
 import os
+import io
 from datetime import datetime
 from utils import get_uzbekistan_now, format_datetime_uz
 try:
@@ -26,6 +28,21 @@ class PDFService:
     
     RECEIPTS_DIR = "receipts"
     
+    PAYMENT_METHOD_NAMES = {
+        'cash': 'Naqd',
+        'card': 'Bank kartasi',
+        'bank_transfer': 'Bank hisob raqami'
+    }
+    
+    # Logo size in the receipt header and the resolution it is pre-scaled to
+    LOGO_WIDTH = 35*mm
+    LOGO_HEIGHT = 18*mm
+    LOGO_DPI = 300
+    
+    # Receipt template cache (styles and scaled logo), cleared by invalidate_template_cache()
+    _receipt_styles = None
+    _logo_cache = {}
+    
     @staticmethod
     def _ensure_receipts_dir():
         """Ensure receipts directory exists"""
@@ -33,18 +50,152 @@ class PDFService:
             os.makedirs(PDFService.RECEIPTS_DIR)
     
     @staticmethod
-    def _header_footer(canvas_obj, doc, settings=None):
-        """Add header and footer to each page with modern design"""
-        canvas_obj.saveState()
+    def invalidate_template_cache():
+        """Drop cached receipt styles and logo (called when settings change)"""
+        PDFService._receipt_styles = None
+        PDFService._logo_cache.clear()
+    
+    @staticmethod
+    def _get_receipt_styles() -> dict:
+        """Paragraph styles used by receipts, built once"""
+        if PDFService._receipt_styles is not None:
+            return PDFService._receipt_styles
+        
+        styles = getSampleStyleSheet()
+        receipt_styles = {
+            'receipt_num': ParagraphStyle(
+                'ReceiptNum',
+                parent=styles['Normal'],
+                fontSize=16,
+                textColor=colors.HexColor("#0b0909"),
+                spaceAfter=6*mm,
+                alignment=TA_CENTER,
+                fontName='Helvetica-Bold',
+                leading=20
+            ),
+            'info_label': ParagraphStyle(
+                'InfoLabel',
+                parent=styles['Normal'],
+                fontSize=9,
+                textColor=colors.HexColor('#64748b'),
+                fontName='Helvetica-Bold',
+                leading=12
+            ),
+            'info_value': ParagraphStyle(
+                'InfoValue',
+                parent=styles['Normal'],
+                fontSize=10,
+                textColor=colors.HexColor('#1e293b'),
+                fontName='Helvetica-Bold',
+                leading=12
+            ),
+            # Table cell styles
+            'table_cell': ParagraphStyle(
+                'TableCell',
+                parent=styles['Normal'],
+                fontSize=9,
+                textColor=colors.HexColor('#1e293b'),
+                fontName='Helvetica',
+                leading=11
+            ),
+            'table_total': ParagraphStyle(
+                'TableTotal',
+                parent=styles['Normal'],
+                fontSize=10,
+                textColor=colors.HexColor('#1e293b'),
+                fontName='Helvetica-Bold',
+                leading=12
+            ),
+            # Items table header style - dark text instead of white
+            'header_num': ParagraphStyle(
+                'HeaderNum',
+                parent=styles['Normal'],
+                fontSize=10,
+                textColor=colors.HexColor('#1e293b'),
+                fontName='Helvetica-Bold',
+                alignment=TA_CENTER
+            ),
+            'header_left': ParagraphStyle(
+                'HeaderLeft',
+                parent=styles['Normal'],
+                fontSize=10,
+                textColor=colors.HexColor('#1e293b'),
+                fontName='Helvetica-Bold',
+                alignment=TA_LEFT
+            ),
+            'header_right': ParagraphStyle(
+                'HeaderRight',
+                parent=styles['Normal'],
+                fontSize=10,
+                textColor=colors.HexColor('#1e293b'),
+                fontName='Helvetica-Bold',
+                alignment=TA_RIGHT
+            ),
+            'thank': ParagraphStyle(
+                'ThankYou',
+                parent=styles['Normal'],
+                fontSize=13,
+                textColor=colors.HexColor("#050506"),
+                alignment=TA_CENTER,
+                fontName='Helvetica-Bold',
+                leading=18,
+                spaceBefore=3*mm,
+                spaceAfter=5*mm
+            ),
+        }
+        PDFService._receipt_styles = receipt_styles
+        return receipt_styles
+    
+    @staticmethod
+    def _resolve_logo_path(logo_url: str) -> str:
+        """Convert logo URL path to file system path"""
+        logo_path = logo_url
+        if logo_path.startswith('/uploads/'):
+            backend_dir = os.path.dirname(os.path.dirname(__file__))
+            project_root = os.path.dirname(backend_dir)
+            logo_path = os.path.join(project_root, logo_path.lstrip('/'))
+        elif logo_path.startswith('/'):
+            logo_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), logo_path.lstrip('/'))
+        
+        return os.path.normpath(logo_path)
+    
+    @staticmethod
+    def _get_logo(logo_url: str):
+        """Logo pre-scaled to header size as ImageReader, cached by URL (None if missing)"""
+        if logo_url in PDFService._logo_cache:
+            return PDFService._logo_cache[logo_url]
+        
+        logo = None
+        try:
+            logo_path = PDFService._resolve_logo_path(logo_url)
+            if os.path.exists(logo_path):
+                from PIL import Image as PILImage
+                
+                image = PILImage.open(logo_path)
+                image.load()
+                max_size = (
+                    int(PDFService.LOGO_WIDTH / 72 * PDFService.LOGO_DPI),
+                    int(PDFService.LOGO_HEIGHT / 72 * PDFService.LOGO_DPI)
+                )
+                image.thumbnail(max_size)
+                logo = ImageReader(image)
+            else:
+                print(f"Logo file not found at: {logo_path}")
+        except Exception as e:
+            print(f"Error loading logo: {e}")
+            import traceback
+            traceback.print_exc()
         
-        # Get settings if not provided
-        if settings is None:
-            from database import SessionLocal
-            db = SessionLocal()
-            try:
-                settings = SettingsService.get_settings(db)
-            finally:
-                db.close()
+        PDFService._logo_cache[logo_url] = logo
+        return logo
+    
+    @staticmethod
+    def _header_footer(canvas_obj, doc, settings=None, show_generated_at=True):
+        """
+        Add header and footer to each page with modern design.
+        show_generated_at=False omits the "Yaratilgan" time (cached receipts).
+        """
+        canvas_obj.saveState()
         
         # Modern header design - vertical layout: logo on top, store name below
         has_logo = settings and settings.logo_url and settings.receipt_show_logo
@@ -59,39 +210,22 @@ class PDFService:
         # Draw logo if available and enabled (centered, on top)
         logo_y_offset = 0
         if has_logo:
-            try:
-                logo_path = settings.logo_url
-                # Convert URL path to file system path
-                if logo_path.startswith('/uploads/'):
-                    backend_dir = os.path.dirname(os.path.dirname(__file__))
-                    project_root = os.path.dirname(backend_dir)
-                    logo_path = os.path.join(project_root, logo_path.lstrip('/'))
-                elif logo_path.startswith('/'):
-                    logo_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), logo_path.lstrip('/'))
-                
-                logo_path = os.path.normpath(logo_path)
+            logo = PDFService._get_logo(settings.logo_url)
+            if logo is not None:
+                # Draw logo centered at top of header (smaller size)
+                logo_width = PDFService.LOGO_WIDTH
+                logo_height = PDFService.LOGO_HEIGHT
+                logo_x = page_center_x - (logo_width / 2)
+                logo_y = doc.height + doc.topMargin - 8*mm - logo_height
                 
-                if os.path.exists(logo_path):
-                    # Draw logo centered at top of header (smaller size)
-                    logo_width = 35*mm
-                    logo_height = 18*mm
-                    logo_x = page_center_x - (logo_width / 2)
-                    logo_y = doc.height + doc.topMargin - 8*mm - logo_height
-                    
-                    canvas_obj.drawImage(logo_path, 
-                                        logo_x, 
-                                        logo_y,
-                                        width=logo_width, 
-                                        height=logo_height, 
-                                        preserveAspectRatio=True,
-                                        mask='auto')
-                    logo_y_offset = logo_height + 5*mm  # Space for logo
-                else:
-                    print(f"Logo file not found at: {logo_path}")
-            except Exception as e:
-                print(f"Error loading logo: {e}")
-                import traceback
-                traceback.print_exc()
+                canvas_obj.drawImage(logo, 
+                                    logo_x, 
+                                    logo_y,
+                                    width=logo_width, 
+                                    height=logo_height, 
+                                    preserveAspectRatio=True,
+                                    mask='auto')
+                logo_y_offset = logo_height + 5*mm  # Space for logo
         
         # Draw store name centered below logo (or centered if no logo) - dark text on white
         store_name = settings.store_name.upper() if settings and settings.store_name else "SOTUV CHEKI"
@@ -123,16 +257,34 @@ class PDFService:
                 canvas_obj.drawCentredString(page_center_x, info_y, info_text)
         
         # Modern footer with subtle design
-        canvas_obj.setFillColor(colors.HexColor('#64748b'))
-        canvas_obj.setFont('Helvetica', 7)
-        footer_text = f"Yaratilgan: {format_datetime_uz(get_uzbekistan_now())}"
-        canvas_obj.drawCentredString(page_center_x, 10*mm, footer_text)
+        if show_generated_at:
+            canvas_obj.setFillColor(colors.HexColor('#64748b'))
+            canvas_obj.setFont('Helvetica', 7)
+            footer_text = f"Yaratilgan: {format_datetime_uz(get_uzbekistan_now())}"
+            canvas_obj.drawCentredString(page_center_x, 10*mm, footer_text)
         
         canvas_obj.restoreState()
     
     @staticmethod
     def generate_receipt(db: Session, sale_id: int) -> str:
-        """Generate PDF receipt for a sale with clean design"""
+        """Generate PDF receipt for a sale and save it to the receipts directory"""
+        content = PDFService.generate_receipt_bytes(db, sale_id)
+        
+        PDFService._ensure_receipts_dir()
+        filename = f"receipt_{sale_id}_{get_uzbekistan_now().strftime('%Y%m%d_%H%M%S')}.pdf"
+        filepath = os.path.join(PDFService.RECEIPTS_DIR, filename)
+        with open(filepath, 'wb') as f:
+            f.write(content)
+        
+        return filepath
+    
+    @staticmethod
+    def generate_receipt_bytes(db: Session, sale_id: int, show_generated_at: bool = True) -> bytes:
+        """
+        Generate PDF receipt for a sale with clean design, rendered in memory.
+        show_generated_at=False leaves out the render time, so the bytes depend
+        only on the sale and settings (safe to cache).
+        """
         sale = SaleService.get_sale(db, sale_id)
         if not sale:
             raise ValueError(f"Sale {sale_id} not found")
@@ -140,9 +292,15 @@ class PDFService:
         # Get settings
         settings = SettingsService.get_settings(db)
         
-        PDFService._ensure_receipts_dir()
-        filename = f"receipt_{sale_id}_{get_uzbekistan_now().strftime('%Y%m%d_%H%M%S')}.pdf"
-        filepath = os.path.join(PDFService.RECEIPTS_DIR, filename)
+        return PDFService.render_receipts([sale], settings, show_generated_at)
+    
+    @staticmethod
+    def render_receipts(sales: list, settings, show_generated_at: bool = True) -> bytes:
+        """
+        Render receipts into one PDF, each receipt starting on a new page.
+        Works with ORM objects or plain objects with the same attributes.
+        """
+        buffer = io.BytesIO()
         
         # Adjust top margin for modern header design
         has_logo = settings and settings.logo_url and settings.receipt_show_logo
@@ -150,7 +308,7 @@ class PDFService:
         
         # Create PDF
         doc = SimpleDocTemplate(
-            filepath, 
+            buffer, 
             pagesize=A4,
             rightMargin=10*mm,
             leftMargin=10*mm,
@@ -158,73 +316,49 @@ class PDFService:
             bottomMargin=15*mm
         )
         elements = []
+        for index, sale in enumerate(sales):
+            if index > 0:
+                elements.append(PageBreak())
+            elements.extend(PDFService._receipt_elements(sale, settings))
         
-        # Define styles
-        styles = getSampleStyleSheet()
-        
-        # Store info is now in header, so we skip it here to avoid duplication
-        # Add spacing instead
-        elements.append(Spacer(1, 2*mm))
+        # Build PDF with settings
+        def on_first_page(canvas_obj, doc):
+            PDFService._header_footer(canvas_obj, doc, settings, show_generated_at)
         
-        receipt_num_style = ParagraphStyle(
-            'ReceiptNum',
-            parent=styles['Normal'],
-            fontSize=16,
-            textColor=colors.HexColor("#0b0909"),
-            spaceAfter=6*mm,
-            alignment=TA_CENTER,
-            fontName='Helvetica-Bold',
-            leading=20
-        )
+        def on_later_pages(canvas_obj, doc):
+            PDFService._header_footer(canvas_obj, doc, settings, show_generated_at)
         
-        info_label_style = ParagraphStyle(
-            'InfoLabel',
-            parent=styles['Normal'],
-            fontSize=9,
-            textColor=colors.HexColor('#64748b'),
-            fontName='Helvetica-Bold',
-            leading=12
-        )
+        doc.build(elements, onFirstPage=on_first_page, onLaterPages=on_later_pages)
         
-        info_value_style = ParagraphStyle(
-            'InfoValue',
-            parent=styles['Normal'],
-            fontSize=10,
-            textColor=colors.HexColor('#1e293b'),
-            fontName='Helvetica-Bold',
-            leading=12
-        )
+        return buffer.getvalue()
+    
+    @staticmethod
+    def _receipt_elements(sale, settings) -> list:
+        """Flowables of a single receipt body"""
+        elements = []
         
-        # Table cell styles
-        table_cell_style = ParagraphStyle(
-            'TableCell',
-            parent=styles['Normal'],
-            fontSize=9,
-            textColor=colors.HexColor('#1e293b'),
-            fontName='Helvetica',
-            leading=11
-        )
+        # Styles are built once and shared between receipts
+        receipt_styles = PDFService._get_receipt_styles()
+        receipt_num_style = receipt_styles['receipt_num']
+        info_label_style = receipt_styles['info_label']
+        info_value_style = receipt_styles['info_value']
+        table_cell_style = receipt_styles['table_cell']
+        table_total_style = receipt_styles['table_total']
+        header_num_style = receipt_styles['header_num']
+        header_left_style = receipt_styles['header_left']
+        header_right_style = receipt_styles['header_right']
+        thank_style = receipt_styles['thank']
         
-        table_total_style = ParagraphStyle(
-            'TableTotal',
-            parent=styles['Normal'],
-            fontSize=10,
-            textColor=colors.HexColor('#1e293b'),
-            fontName='Helvetica-Bold',
-            leading=12
-        )
+        # Store info is now in header, so we skip it here to avoid duplication
+        # Add spacing instead
+        elements.append(Spacer(1, 2*mm))
         
         # Receipt number
         elements.append(Paragraph(f"Chek № {sale.id}", receipt_num_style))
         elements.append(Spacer(1, 3*mm))
         
         # Sale information
-        payment_method_map = {
-            'cash': 'Naqd',
-            'card': 'Bank kartasi',
-            'bank_transfer': 'Bank hisob raqami'
-        }
-        payment_method = payment_method_map.get(sale.payment_method.value, sale.payment_method.value)
+        payment_method = PDFService.PAYMENT_METHOD_NAMES.get(sale.payment_method.value, sale.payment_method.value)
         sale_date = format_datetime_uz(sale.created_at, '%d.%m.%Y, %H:%M')
         
         payment_amount = sale.payment_amount or sale.total_amount
@@ -256,34 +390,6 @@ class PDFService:
         elements.append(info_table)
         elements.append(Spacer(1, 10*mm))
         
-        # Items table header style - dark text instead of white
-        header_num_style = ParagraphStyle(
-            'HeaderNum',
-            parent=styles['Normal'],
-            fontSize=10,
-            textColor=colors.HexColor('#1e293b'),
-            fontName='Helvetica-Bold',
-            alignment=TA_CENTER
-        )
-        
-        header_left_style = ParagraphStyle(
-            'HeaderLeft',
-            parent=styles['Normal'],
-            fontSize=10,
-            textColor=colors.HexColor('#1e293b'),
-            fontName='Helvetica-Bold',
-            alignment=TA_LEFT
-        )
-        
-        header_right_style = ParagraphStyle(
-            'HeaderRight',
-            parent=styles['Normal'],
-            fontSize=10,
-            textColor=colors.HexColor('#1e293b'),
-            fontName='Helvetica-Bold',
-            alignment=TA_RIGHT
-        )
-        
         table_data = [[
             Paragraph('№', header_num_style),
             Paragraph('Mahsulot', header_left_style),
@@ -455,37 +561,17 @@ class PDFService:
         # Add decorative spacing before thank you message
         elements.append(Spacer(1, 5*mm))
         
-        thank_style = ParagraphStyle(
-            'ThankYou',
-            parent=styles['Normal'],
-            fontSize=13,
-            textColor=colors.HexColor("#050506"),
-            alignment=TA_CENTER,
-            fontName='Helvetica-Bold',
-            leading=18,
-            spaceBefore=3*mm,
-            spaceAfter=5*mm
-        )
         footer_text = settings.receipt_footer_text if settings and settings.receipt_footer_text else "Xaridingiz uchun rahmat!"
         elements.append(Paragraph(footer_text, thank_style))
         
-        # Build PDF with settings
-        def on_first_page(canvas_obj, doc):
-            PDFService._header_footer(canvas_obj, doc, settings)
-        
-        def on_later_pages(canvas_obj, doc):
-            PDFService._header_footer(canvas_obj, doc, settings)
-        
-        doc.build(elements, onFirstPage=on_first_page, onLaterPages=on_later_pages)
-        
-        return filepath
+        return elements
     
     @staticmethod
-    def export_statistics(stats: dict, start_date: str = None, end_date: str = None) -> str:
-        """Export statistics to PDF file"""
+    def export_statistics(stats: dict, start_date: str = None, end_date: str = None, filename: str = None) -> str:
+        """Export statistics to PDF file (filename: default is timestamped)"""
         PDFService._ensure_receipts_dir()
         
-        filename = f"statistics_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf"
+        filename = filename or f"statistics_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf"
         filepath = os.path.join(PDFService.RECEIPTS_DIR, filename)
         
         doc = SimpleDocTemplate(
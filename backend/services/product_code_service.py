@@ -0,0 +1,249 @@
+"""
+Product Code Service - in-memory index of scannable product codes
+(barcode, item number, QR payload, product id) for the scan endpoints
+"""
+from sqlalchemy.orm import Session
+from sqlalchemy import or_
+from typing import Container, Dict, List, Mapping, Optional, Tuple
+from datetime import datetime
+import re
+import asyncio
+import threading
+from database import SessionLocal
+from models import Product
+
+
+# QR code payload: PRODUCT_{id}_{name}
+QR_PREFIX = "PRODUCT_"
+# Deep link: product/{id} or /product/{id}
+_DEEP_LINK = re.compile(r'product[/_](\d+)', re.IGNORECASE)
+
+
+def _candidate_ids(code: str) -> List[Tuple[int, str]]:
+    """Product ids the code may encode, in lookup order, with their match type"""
+    candidates = []
+    if code.startswith(QR_PREFIX):
+        parts = code.split("_", 2)
+        if len(parts) >= 2 and parts[1].isdigit():
+            candidates.append((int(parts[1]), "qr_code"))
+    deep_link = _DEEP_LINK.search(code)
+    if deep_link:
+        candidates.append((int(deep_link.group(1)), "deep_link"))
+    if code.isdigit():
+        candidates.append((int(code), "product_id"))
+    return candidates
+
+
+def _resolve(
+    code: str,
+    barcodes: Mapping[str, int],
+    item_numbers: Mapping[str, int],
+    product_ids: Container[int]
+) -> Optional[Tuple[int, str]]:
+    """
+    (product_id, match_type) for a code: barcode first, then item number,
+    then QR code, deep link and plain id. Same order for the index and the DB.
+    """
+    if code in barcodes:
+        return barcodes[code], "barcode"
+    if code in item_numbers:
+        return item_numbers[code], "item_number"
+    for product_id, match_type in _candidate_ids(code):
+        if product_id in product_ids:
+            return product_id, match_type
+    return None
+
+
+class _CodeIndex:
+    """Code -> product id maps; several products may share an item number, the lowest id wins"""
+
+    def __init__(self):
+        self.barcodes: Dict[str, int] = {}
+        self.item_numbers: Dict[str, int] = {}
+        # product_id -> (barcode, item_number), to drop old codes on update/delete
+        self.products: Dict[int, Tuple[Optional[str], Optional[str]]] = {}
+        self.built_at = datetime.now()
+
+    def add(self, product_id: int, barcode: Optional[str], item_number: Optional[str]):
+        self.products[product_id] = (barcode, item_number)
+        for codes, code in ((self.barcodes, barcode), (self.item_numbers, item_number)):
+            if code and (code not in codes or product_id < codes[code]):
+                codes[code] = product_id
+
+    def remove(self, product_id: int):
+        barcode, item_number = self.products.pop(product_id, (None, None))
+        # Another product with the same item number is picked up again by the DB fallback
+        for codes, code in ((self.barcodes, barcode), (self.item_numbers, item_number)):
+            if code and codes.get(code) == product_id:
+                del codes[code]
+
+
+_index: Optional[_CodeIndex] = None
+_stale = False
+_lock = threading.RLock()
+_stats_lock = threading.Lock()
+_stats = {
+    "lookups": 0,
+    "index_hits": 0,      # resolved from memory
+    "index_misses": 0,    # not in the index (or index not built yet), looked up in the DB
+    "fallback_hits": 0,   # found in the DB after an index miss - index was out of date
+    "not_found": 0,
+}
+
+
+def _count(**increments):
+    with _stats_lock:
+        for key, value in increments.items():
+            _stats[key] += value
+
+
+class ProductCodeService:
+    """Service for resolving scanned codes to products"""
+
+    @staticmethod
+    def rebuild(db: Session) -> int:
+        """Build the whole index from the database (startup, after imports)"""
+        global _index, _stale
+        index = _CodeIndex()
+        rows = db.query(Product.id, Product.barcode, Product.item_number).yield_per(5000)
+        for product_id, barcode, item_number in rows:
+            index.add(product_id, barcode, item_number)
+        with _lock:
+            _index = index
+            _stale = False
+        return len(index.products)
+
+    @staticmethod
+    def upsert_product(product: Product):
+        """Index a created or updated product (no-op until the index is built)"""
+        with _lock:
+            if _index is None:
+                return
+            _index.remove(product.id)
+            _index.add(product.id, product.barcode, product.item_number)
+
+    @staticmethod
+    def remove_product(product_id: int):
+        """Drop a deleted product"""
+        with _lock:
+            if _index is not None:
+                _index.remove(product_id)
+
+    @staticmethod
+    def invalidate():
+        """Rebuild on next scan (bulk imports)"""
+        global _stale
+        _stale = True
+
+    @staticmethod
+    def get_stats() -> dict:
+        """Lookup counters and index size"""
+        with _stats_lock:
+            stats = dict(_stats)
+        index = _index
+        stats["hit_rate"] = stats["index_hits"] / stats["lookups"] * 100 if stats["lookups"] else 0.0
+        stats["indexed_products"] = len(index.products) if index is not None else 0
+        stats["built_at"] = index.built_at if index is not None else None
+        stats["stale"] = _stale
+        return stats
+
+    @staticmethod
+    def _find_in_db(db: Session, codes: List[str]) -> Dict[str, Tuple[Product, str]]:
+        """Resolve codes with a single query (index miss or index not built)"""
+        ids = {product_id for code in codes for product_id, _ in _candidate_ids(code)}
+        conditions = [Product.barcode.in_(codes), Product.item_number.in_(codes)]
+        if ids:
+            conditions.append(Product.id.in_(ids))
+        products = db.query(Product).filter(or_(*conditions)).order_by(Product.id).all()
+
+        by_id = {product.id: product for product in products}
+        barcodes = {product.barcode: product.id for product in products if product.barcode}
+        item_numbers = {}
+        for product in products:
+            if product.item_number:
+                item_numbers.setdefault(product.item_number, product.id)
+
+        found = {}
+        for code in codes:
+            match = _resolve(code, barcodes, item_numbers, by_id)
+            if match:
+                found[code] = (by_id[match[0]], match[1])
+        return found
+
+    @staticmethod
+    def find_products(db: Session, codes: List[str]) -> Dict[str, Tuple[Product, str]]:
+        """
+        Resolve scanned codes to (product, match_type); codes that match
+        nothing are left out. Index hits cost one primary key query in total.
+        """
+        codes = list(dict.fromkeys(code for code in codes if code))
+        if not codes:
+            return {}
+        if _stale:
+            with _lock:
+                if _stale:
+                    ProductCodeService.rebuild(db)
+
+        index = _index
+        resolved = {}
+        if index is not None:
+            for code in codes:
+                match = _resolve(code, index.barcodes, index.item_numbers, index.products)
+                if match:
+                    resolved[code] = match
+
+        found = {}
+        if resolved:
+            product_ids = {product_id for product_id, _ in resolved.values()}
+            products = {
+                product.id: product
+                for product in db.query(Product).filter(Product.id.in_(product_ids)).all()
+            }
+            for code, (product_id, match_type) in resolved.items():
+                product = products.get(product_id)
+                if product is None:
+                    # Deleted outside ProductService
+                    ProductCodeService.remove_product(product_id)
+                elif (match_type == "barcode" and product.barcode != code) or (
+                    match_type == "item_number" and product.item_number != code
+                ):
+                    # Code changed outside ProductService - reindex and treat as a miss
+                    ProductCodeService.upsert_product(product)
+                else:
+                    found[code] = (product, match_type)
+
+        missing = [code for code in codes if code not in found]
+        fallback = ProductCodeService._find_in_db(db, missing) if missing else {}
+        for product, _ in fallback.values():
+            ProductCodeService.upsert_product(product)
+        found.update(fallback)
+
+        _count(
+            lookups=len(codes),
+            index_hits=len(codes) - len(missing),
+            index_misses=len(missing),
+            fallback_hits=len(fallback),
+            not_found=len(missing) - len(fallback),
+        )
+        return found
+
+    @staticmethod
+    def find_product(db: Session, code: str) -> Optional[Tuple[Product, str]]:
+        """(product, match_type) for a single scanned code, or None"""
+        return ProductCodeService.find_products(db, [code]).get(code)
+
+    @staticmethod
+    async def build_on_startup():
+        """Build the index in a worker thread; scans use the DB until it is ready"""
+        def run():
+            db = SessionLocal()
+            try:
+                return ProductCodeService.rebuild(db)
+            finally:
+                db.close()
+
+        try:
+            count = await asyncio.get_running_loop().run_in_executor(None, run)
+            print(f"[Scan] Code index built: {count} ta mahsulot")
+        except Exception as e:
+            print(f"[Scan] Code index build error: {e}")
@@ -0,0 +1,219 @@
+"""
+Product Search Service - SQLite FTS5 (trigram) index over products with
+Uzbek Latin/Cyrillic normalization
+"""
+from sqlalchemy.orm import Session
+from sqlalchemy import text, bindparam, Integer, Float
+from sqlalchemy.exc import OperationalError
+from typing import Dict, List
+import threading
+from models import Product
+from search_text import normalize_search_text, word_start_keys, WORD_START_MARK
+
+
+SEARCH_TABLE = "products_fts"
+# Trigram tokenizer only matches terms of 3+ characters; shorter terms
+# are matched against word starts ("word_starts" column, see search_text.py)
+MIN_TERM_LENGTH = 3
+# bm25 weights, in index column order: name, item_number, brand, category, barcode, word_starts
+RANK_WEIGHTS = (10.0, 6.0, 3.0, 2.0, 6.0, 4.0)
+SEARCH_COLUMNS = ("name", "item_number", "brand", "category", "barcode", "word_starts")
+
+# Products whose index row must be rewritten; filled by the triggers, drained by sync_pending
+PENDING_TABLE = "products_fts_pending"
+# Products per normalize/insert round
+SYNC_BATCH_SIZE = 500
+
+_INDEX_COLUMNS = "rowid, " + ", ".join(SEARCH_COLUMNS)
+
+# Triggers are plain SQL: normalization happens in Python (sync_pending), so
+# writes from any connection (sqlite3 CLI, migrate_*.py scripts) keep working
+# and are indexed on the next search
+INDEX_DDL = [
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_TABLE} USING fts5("
+    f"{', '.join(SEARCH_COLUMNS)}, tokenize='trigram')",
+    f"CREATE TABLE IF NOT EXISTS {PENDING_TABLE} ("
+    f"seq INTEGER PRIMARY KEY AUTOINCREMENT, product_id INTEGER NOT NULL)",
+    # Older versions of these triggers called uz_normalize()
+    f"DROP TRIGGER IF EXISTS {SEARCH_TABLE}_ai",
+    f"DROP TRIGGER IF EXISTS {SEARCH_TABLE}_ad",
+    f"DROP TRIGGER IF EXISTS {SEARCH_TABLE}_au",
+    f"DROP TRIGGER IF EXISTS {SEARCH_TABLE}_category_au",
+    f"""CREATE TRIGGER {SEARCH_TABLE}_ai AFTER INSERT ON products BEGIN
+        INSERT INTO {PENDING_TABLE}(product_id) VALUES (new.id);
+    END""",
+    f"""CREATE TRIGGER {SEARCH_TABLE}_ad AFTER DELETE ON products BEGIN
+        DELETE FROM {SEARCH_TABLE} WHERE rowid = old.id;
+    END""",
+    # Price/stock updates don't touch the index
+    f"""CREATE TRIGGER {SEARCH_TABLE}_au
+    AFTER UPDATE OF name, item_number, brand, category, category_id, barcode ON products BEGIN
+        INSERT INTO {PENDING_TABLE}(product_id) VALUES (new.id);
+    END""",
+    f"""CREATE TRIGGER {SEARCH_TABLE}_category_au AFTER UPDATE OF name ON categories BEGIN
+        INSERT INTO {PENDING_TABLE}(product_id) SELECT id FROM products WHERE category_id = new.id;
+    END""",
+]
+
+# Bind URL -> whether the index is usable (FTS5 trigram needs SQLite 3.34+)
+_index_state: Dict[str, bool] = {}
+_lock = threading.Lock()
+_sync_lock = threading.Lock()
+
+
+def _index_rows(conn, product_ids: List[int]) -> List[dict]:
+    """Normalized index values of the given products (legacy category text plus the linked category name)"""
+    rows = conn.execute(
+        text(
+            "SELECT p.id, p.name, p.item_number, p.brand, p.category, c.name, p.barcode "
+            "FROM products p LEFT JOIN categories c ON c.id = p.category_id WHERE p.id IN :ids"
+        ).bindparams(bindparam("ids", expanding=True)),
+        {"ids": product_ids}
+    )
+    return [
+        {
+            "rowid": product_id,
+            "name": normalize_search_text(name),
+            "item_number": normalize_search_text(item_number),
+            "brand": normalize_search_text(brand),
+            "category": normalize_search_text(f"{category or ''} {category_name or ''}"),
+            "barcode": normalize_search_text(barcode),
+            "word_starts": word_start_keys(" ".join(value or "" for value in (name, item_number, brand, barcode))),
+        }
+        for product_id, name, item_number, brand, category, category_name, barcode in rows
+    ]
+
+
+def _sync_pending(conn) -> int:
+    """Rewrite index rows of queued products; returns the number of products processed"""
+    last_seq = conn.execute(text(f"SELECT max(seq) FROM {PENDING_TABLE}")).scalar()
+    if last_seq is None:
+        return 0
+    product_ids = [
+        row[0] for row in conn.execute(
+            text(f"SELECT DISTINCT product_id FROM {PENDING_TABLE} WHERE seq <= :last_seq"),
+            {"last_seq": last_seq}
+        )
+    ]
+    insert = text(
+        f"INSERT INTO {SEARCH_TABLE}({_INDEX_COLUMNS}) "
+        f"VALUES (:rowid, {', '.join(':' + column for column in SEARCH_COLUMNS)})"
+    )
+    for i in range(0, len(product_ids), SYNC_BATCH_SIZE):
+        batch = product_ids[i:i + SYNC_BATCH_SIZE]
+        conn.execute(
+            text(f"DELETE FROM {SEARCH_TABLE} WHERE rowid IN :ids").bindparams(bindparam("ids", expanding=True)),
+            {"ids": batch}
+        )
+        rows = _index_rows(conn, batch)
+        if rows:
+            conn.execute(insert, rows)
+    # Rows queued meanwhile (higher seq) are picked up by the next sync
+    conn.execute(text(f"DELETE FROM {PENDING_TABLE} WHERE seq <= :last_seq"), {"last_seq": last_seq})
+    return len(product_ids)
+
+
+class ProductSearchService:
+    """Service for ranked product search"""
+
+    @staticmethod
+    def ensure_index(bind) -> bool:
+        """
+        Create the FTS table and its triggers if missing, filling it once from
+        existing products. Checked once per database; returns False if this
+        SQLite build has no FTS5 trigram tokenizer (search then falls back to LIKE).
+        """
+        key = str(bind.url)
+        if key in _index_state:
+            return _index_state[key]
+
+        with _lock:
+            if key in _index_state:
+                return _index_state[key]
+            try:
+                with bind.begin() as conn:
+                    exists = conn.execute(
+                        text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"),
+                        {"name": SEARCH_TABLE}
+                    ).first()
+                    for statement in INDEX_DDL:
+                        conn.execute(text(statement))
+                    if not exists:
+                        conn.execute(text(f"INSERT INTO {PENDING_TABLE}(product_id) SELECT id FROM products"))
+                        _sync_pending(conn)
+                        print(f"✓ Product search index built ({SEARCH_TABLE})")
+                _index_state[key] = True
+            except OperationalError as e:
+                print(f"Warning: Product search index unavailable, using LIKE search: {e}")
+                _index_state[key] = False
+        return _index_state[key]
+
+    @staticmethod
+    def rebuild_index(bind):
+        """Refill the whole index from products (e.g. after the products table was recreated)"""
+        with bind.begin() as conn:
+            conn.execute(text(f"DELETE FROM {SEARCH_TABLE}"))
+            conn.execute(text(f"INSERT INTO {PENDING_TABLE}(product_id) SELECT id FROM products"))
+            _sync_pending(conn)
+
+    @staticmethod
+    def sync_pending(db: Session):
+        """
+        Index products changed since the last search. Runs on its own connection
+        and only when the triggers queued something; on failure (e.g. the
+        database is locked) search uses the index as it is and retries next time.
+        """
+        if db.execute(text(f"SELECT 1 FROM {PENDING_TABLE} LIMIT 1")).first() is None:
+            return
+        with _sync_lock:
+            try:
+                with db.get_bind().begin() as conn:
+                    _sync_pending(conn)
+            except OperationalError as e:
+                print(f"Warning: Product search index sync failed: {e}")
+
+    @staticmethod
+    def ranked_subquery(db: Session, query: str):
+        """
+        Subquery of (product_id, rank) matching the search text, lower rank is better.
+        None if the index is unavailable, so callers can fall back to ilike.
+        """
+        if not ProductSearchService.ensure_index(db.get_bind()):
+            return None
+        ProductSearchService.sync_pending(db)
+
+        # Every term must occur (implicit AND); quoting keeps punctuation literal.
+        # 1-2 character terms (first keystrokes) match the start of a word.
+        phrases = []
+        for term in normalize_search_text(query).split():
+            if len(term) < MIN_TERM_LENGTH:
+                phrases.append('word_starts : "' + WORD_START_MARK + term.replace('"', '""') + '"')
+            else:
+                phrases.append('"' + term.replace('"', '""') + '"')
+
+        if not phrases:
+            # Nothing searchable left (e.g. only apostrophes): every product matches
+            return text(
+                f"SELECT rowid AS product_id, 0 AS rank FROM {SEARCH_TABLE}"
+            ).columns(product_id=Integer, rank=Float).subquery("product_search")
+
+        rank = f"bm25({SEARCH_TABLE}, {', '.join(str(weight) for weight in RANK_WEIGHTS)})"
+        return text(
+            f"SELECT rowid AS product_id, {rank} AS rank FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH :match"
+        ).bindparams(match=" AND ".join(phrases)).columns(product_id=Integer, rank=Float).subquery("product_search")
+
+    @staticmethod
+    def search(db: Session, query: str, limit: int = 20) -> List[Product]:
+        """Best matching products by name, item number, brand, category or barcode"""
+        ranked = ProductSearchService.ranked_subquery(db, query)
+        if ranked is None:
+            search_term = f"%{query}%"
+            return db.query(Product).filter(
+                (Product.name.ilike(search_term)) |
+                (Product.barcode.ilike(search_term)) |
+                (Product.brand.ilike(search_term))
+            ).limit(limit).all()
+        return db.query(Product).join(
+            ranked, ranked.c.product_id == Product.id
+        ).order_by(ranked.c.rank, Product.id).limit(limit).all()
+
@@ -3,9 +3,35 @@ Product Service
 """
 from sqlalchemy.orm import Session
 from typing import List, Optional, Dict, Any
+from datetime import datetime, timezone
 from sqlalchemy import func
-from models import Product
+from sqlalchemy.engine import Row
+from models import Product, Sale, SaleItem
 from schemas import ProductCreate, ProductUpdate, ProductResponse
+try:
+    from .product_search_service import ProductSearchService
+    from .product_suggest_service import ProductSuggestService
+    from .product_code_service import ProductCodeService
+    from .image_service import ImageService
+except ImportError:
+    from product_search_service import ProductSearchService
+    from product_suggest_service import ProductSuggestService
+    from product_code_service import ProductCodeService
+    from image_service import ImageService
+
+
+# Plain column rows for list endpoints (no ORM objects or sale_items loading)
+PRODUCT_COLUMNS = tuple(Product.__table__.columns)
+PRODUCT_COLUMN_KEYS = tuple(column.key for column in PRODUCT_COLUMNS)
+
+
+def _days_since(value: Optional[datetime]) -> int:
+    """Whole days since value (naive datetimes are UTC), 999 if unknown - as Product.days_since_last_sale"""
+    if value is None:
+        return 999
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return (datetime.now(timezone.utc) - value).days
 
 
 def _sort_products(products: List[Product], sort_by: str, sort_order: str = 'desc') -> List[Product]:
@@ -177,6 +203,8 @@ class ProductService:
                     db.refresh(db_product)
                     print(f"[ProductService.create_product] Category fixed and re-committed: '{db_product.category}'")
             
+            ProductSuggestService.upsert_product(db_product)
+            ProductCodeService.upsert_product(db_product)
             return db_product
         except Exception as e:
             db.rollback()
@@ -201,20 +229,34 @@ class ProductService:
         min_price: Optional[float] = None,
         max_price: Optional[float] = None,
         sort_by: Optional[str] = None,
-        sort_order: Optional[str] = 'desc'  # 'asc' or 'desc'
+        sort_order: Optional[str] = 'desc',  # 'asc' or 'desc'
+        as_rows: bool = False
     ) -> List[Product]:
-        """Get all products with optional search and filtering"""
+        """
+        Get all products with optional search and filtering.
+        as_rows=True returns rows of PRODUCT_COLUMNS instead of Product objects
+        (for response_dict; sale items are not loaded).
+        """
         from sqlalchemy.orm import joinedload
         
-        query = db.query(Product).options(joinedload(Product.sale_items))
+        if as_rows:
+            query = db.query(*PRODUCT_COLUMNS)
+        else:
+            query = db.query(Product).options(joinedload(Product.sale_items))
         
-        # Search by name or barcode
+        # Search by name, item number, brand, category or barcode (ranked, FTS index)
+        search_rank = None
         if search:
-            search_term = f"%{search}%"
-            query = query.filter(
-                (Product.name.ilike(search_term)) | 
-                (Product.barcode.ilike(search_term))
-            )
+            ranked = ProductSearchService.ranked_subquery(db, search)
+            if ranked is not None:
+                query = query.join(ranked, ranked.c.product_id == Product.id)
+                search_rank = ranked.c.rank
+            else:
+                search_term = f"%{search}%"
+                query = query.filter(
+                    (Product.name.ilike(search_term)) | 
+                    (Product.barcode.ilike(search_term))
+                )
         
         # Filter by brand
         if brand:
@@ -250,6 +292,9 @@ class ProductService:
                 query = query.order_by(order_col.asc())
             else:
                 query = query.order_by(order_col.desc())
+        elif not sort_by and search_rank is not None:
+            # Search results: best matches first
+            query = query.order_by(search_rank.asc(), Product.id.asc())
         elif not sort_by:
             # Default: omborda borlar birinchi (stock desc), keyin yo'qlari
             # We'll sort by stock in Python after loading
@@ -299,7 +344,8 @@ class ProductService:
         # For normal queries, load products first
         # If default sorting (no sort_by), we need to load more to sort by stock
         # Also load more if price filters are applied
-        load_limit = limit * 2 if (sort_by in ['stock', 'price_low', 'price_high'] or not sort_by or min_price is not None or max_price is not None) else limit
+        default_stock_sort = not sort_by and search_rank is None
+        load_limit = limit * 2 if (sort_by in ['stock', 'price_low', 'price_high'] or default_stock_sort or min_price is not None or max_price is not None) else limit
         products = query.offset(skip).limit(load_limit).all()
         
         # Apply price filters in Python
@@ -320,10 +366,13 @@ class ProductService:
             return products[:limit]
         
         # Default sorting: omborda borlar birinchi (stock desc), keyin yo'qlari
-        if not sort_by:
+        if default_stock_sort:
             products = _sort_products(products, 'stock', 'desc')
             return products[:limit]
         
+        if search_rank is not None:
+            return products[:limit]
+        
         return products
     
     @staticmethod
@@ -344,11 +393,15 @@ class ProductService:
         
         # Apply same filters as get_products
         if search:
-            search_term = f"%{search}%"
-            query = query.filter(
-                (Product.name.ilike(search_term)) | 
-                (Product.barcode.ilike(search_term))
-            )
+            ranked = ProductSearchService.ranked_subquery(db, search)
+            if ranked is not None:
+                query = query.join(ranked, ranked.c.product_id == Product.id)
+            else:
+                search_term = f"%{search}%"
+                query = query.filter(
+                    (Product.name.ilike(search_term)) | 
+                    (Product.barcode.ilike(search_term))
+                )
         
         if brand:
             query = query.filter(Product.brand.ilike(f"%{brand}%"))
@@ -381,6 +434,98 @@ class ProductService:
         
         return query.count()
     
+    @staticmethod
+    def get_last_sold_dates(db: Session, product_ids: List[int]) -> Dict[int, datetime]:
+        """Last sale date per product in one aggregate query (instead of loading sale items)"""
+        if not product_ids:
+            return {}
+        rows = db.query(SaleItem.product_id, func.max(Sale.created_at)).join(
+            Sale, Sale.id == SaleItem.sale_id
+        ).filter(SaleItem.product_id.in_(product_ids)).group_by(SaleItem.product_id).all()
+        return {product_id: last_sold for product_id, last_sold in rows}
+
+    @staticmethod
+    def response_dict(product, last_sold: Optional[datetime] = None, include_sales_stats: bool = True) -> dict:
+        """
+        ProductResponse fields as a plain dict, from a Product or a row of
+        PRODUCT_COLUMNS. Computed properties are calculated here, so the result
+        can be serialized directly without validating it again.
+        """
+        if isinstance(product, Row):
+            values = dict(zip(PRODUCT_COLUMN_KEYS, product))
+        else:
+            values = {key: getattr(product, key) for key in PRODUCT_COLUMN_KEYS}
+        product_id = values["id"]
+        pieces_per_package = values["pieces_per_package"]
+        packages_in_stock = values["packages_in_stock"] or 0
+        pieces_in_stock = values["pieces_in_stock"] or 0
+        total_pieces = packages_in_stock * (pieces_per_package if pieces_per_package and pieces_per_package > 0 else 1) + pieces_in_stock
+        cost_price = max(0.0, values["cost_price"] or 0.0)
+        wholesale_price = max(0.0, values["wholesale_price"] or 0.0)
+        retail_price = max(0.0, values["retail_price"] or 0.0)
+        regular_price = max(0.0, values["regular_price"] or 0.0)
+        created_at = values["created_at"]
+        updated_at = values["updated_at"]
+
+        days_since = None
+        is_slow = None
+        if include_sales_stats:
+            days_since = _days_since(last_sold or created_at)
+            is_slow = days_since >= 30
+        else:
+            last_sold = None
+
+        return {
+            "id": product_id,
+            "name": values["name"],
+            "item_number": values["item_number"],
+            "barcode": values["barcode"],
+            "category": (values["category"] or "").strip() or None,
+            "category_id": values["category_id"],
+            "brand": values["brand"],
+            "supplier": values["supplier"],
+            "received_date": values["received_date"],
+            "image_url": values["image_url"],
+            "location": values["location"],
+            "pieces_per_package": pieces_per_package,
+            "cost_price": cost_price,
+            "wholesale_price": wholesale_price,
+            "retail_price": retail_price,
+            "regular_price": regular_price,
+            "packages_in_stock": max(0, packages_in_stock),
+            "pieces_in_stock": max(0, pieces_in_stock),
+            "total_pieces": total_pieces,
+            "total_value": total_pieces * ((wholesale_price + retail_price + regular_price) / 3) if total_pieces else 0.0,
+            "total_value_cost": total_pieces * cost_price,
+            "total_value_wholesale": total_pieces * wholesale_price,
+            "images": [],
+            "last_sold_date": last_sold,
+            "days_since_last_sale": days_since,
+            "is_slow_moving": is_slow,
+            "product_url": f"/product/{product_id}",  # Customer app uchun URL
+            "image_variants": ImageService.variant_urls(values["image_url"]),
+            "created_at": created_at if created_at is not None else datetime.now(),
+            "updated_at": updated_at if updated_at is not None else datetime.now(),
+        }
+
+    @staticmethod
+    def products_to_response_dicts(db: Session, products) -> List[dict]:
+        """Response dicts for a page of products/rows with one extra query for last sale dates"""
+        last_sold = ProductService.get_last_sold_dates(db, [product.id for product in products])
+        return [ProductService.response_dict(product, last_sold.get(product.id)) for product in products]
+
+    @staticmethod
+    def product_to_response(product: Product, include_sales_stats: bool = True) -> ProductResponse:
+        """
+        Product with computed properties as ProductResponse.
+        include_sales_stats=False skips last sale/slow moving fields, which load
+        all sale items of the product (not needed at the till).
+        """
+        last_sold = product.last_sold_date if include_sales_stats else None
+        return ProductResponse.model_validate(
+            ProductService.response_dict(product, last_sold, include_sales_stats)
+        )
+
     @staticmethod
     def get_product(db: Session, product_id: int) -> Optional[Product]:
         """Get a specific product by ID"""
@@ -431,6 +576,8 @@ class ProductService:
         
         db.commit()
         db.refresh(db_product)
+        ProductSuggestService.upsert_product(db_product)
+        ProductCodeService.upsert_product(db_product)
         return db_product
     
     @staticmethod
@@ -442,6 +589,8 @@ class ProductService:
         
         db.delete(db_product)
         db.commit()
+        ProductSuggestService.remove_product(product_id)
+        ProductCodeService.remove_product(product_id)
         return True
     
     @staticmethod
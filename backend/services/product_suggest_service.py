@@ -0,0 +1,410 @@
+"""
+Product Suggest Service - in-memory autocomplete index over product names,
+brands and categories (prefix + typo tolerant, boosted by sales and searches)
+"""
+from sqlalchemy.orm import Session
+from sqlalchemy import func
+from typing import Dict, List, Optional, Set, Tuple
+from datetime import datetime, timedelta
+import os
+import math
+import heapq
+import bisect
+import asyncio
+import threading
+from collections import Counter
+from database import SessionLocal
+from models import Category, Product, Sale, SaleItem, SearchHistory
+from search_text import normalize_search_text
+
+
+# Sales and searches of the last N days count as "recent"
+SUGGEST_POPULARITY_DAYS = int(os.getenv("SUGGEST_POPULARITY_DAYS", "30"))
+# How often popularity is recomputed (seconds)
+SUGGEST_REFRESH_INTERVAL = int(os.getenv("SUGGEST_REFRESH_INTERVAL", "600"))
+
+# Where the matched word comes from
+FIELD_WEIGHTS = {"name": 3.0, "brand": 2.0, "category": 1.0}
+# Whole word typed (not just a prefix)
+EXACT_WORD_BONUS = 1.0
+# Per edit of a typo match
+TYPO_PENALTY = 1.5
+SALES_WEIGHT = 1.0
+SEARCH_WEIGHT = 0.5
+# Terms whose prefix covers more words than this (e.g. a single letter) only filter
+# results of the other terms instead of being expanded word by word
+MAX_PREFIX_EXPANSION = int(os.getenv("SUGGEST_MAX_PREFIX_EXPANSION", "1000"))
+
+
+def max_typos(term: str) -> int:
+    """Allowed edits grow with the term: none below 4 letters, 2 from 8"""
+    if len(term) < 4:
+        return 0
+    return 1 if len(term) < 8 else 2
+
+
+def _grams(word: str) -> Set[str]:
+    padded = "^" + word
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def _prefix_distance(term: str, word: str, limit: int) -> int:
+    """
+    Smallest edit distance (with adjacent transpositions) between term and
+    any prefix of word; returns limit + 1 as soon as it can't be within limit.
+    """
+    width = min(len(word), len(term) + limit)
+    previous_previous = None
+    previous = list(range(width + 1))
+    for i in range(1, len(term) + 1):
+        current = [i] + [0] * width
+        row_min = i
+        for j in range(1, width + 1):
+            cost = 0 if term[i - 1] == word[j - 1] else 1
+            value = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if (previous_previous is not None and i > 1 and j > 1
+                    and term[i - 1] == word[j - 2] and term[i - 2] == word[j - 1]):
+                value = min(value, previous_previous[j - 2] + 1)
+            current[j] = value
+            row_min = min(row_min, value)
+        if row_min > limit:
+            return limit + 1
+        previous_previous, previous = previous, current
+    # Prefixes shorter than term - limit can't be close enough
+    tail = previous[max(0, len(term) - limit):]
+    return min(tail) if tail else limit + 1
+
+
+class _SuggestIndex:
+    """Words -> products postings, kept sorted by static score for early-stopping merges"""
+
+    def __init__(self):
+        self.products: Dict[int, dict] = {}
+        # word -> [(-score, product id)] ascending, i.e. best first
+        self.postings: Dict[str, List[Tuple[float, int]]] = {}
+        self.vocabulary: List[str] = []
+        self.gram_words: Dict[str, Set[str]] = {}
+        self.product_popularity: Dict[int, float] = {}
+        self.word_popularity: Dict[str, float] = {}
+        # Results of queries made only of broad terms (first keystrokes), until the index changes
+        self.broad_results: Dict[Tuple[Tuple[str, ...], int], List[dict]] = {}
+
+    def _entry_words(self, entry: dict) -> Dict[str, float]:
+        words = {}
+        for field, weight in FIELD_WEIGHTS.items():
+            for word in normalize_search_text(entry[field]).split():
+                words[word] = max(words.get(word, 0.0), weight)
+        return words
+
+    def _posting_key(self, product_id: int, weight: float) -> Tuple[float, int]:
+        return (-(weight + self.product_popularity.get(product_id, 0.0)), product_id)
+
+    def _index_word(self, word: str):
+        # Numbers (sizes, codes) are only prefix matched, never typo corrected
+        if not word.isdigit():
+            for gram in _grams(word):
+                self.gram_words.setdefault(gram, set()).add(word)
+
+    def load(self, entries):
+        """Bulk build: postings are sorted once instead of inserted one by one"""
+        for entry in entries:
+            entry["words"] = self._entry_words(entry)
+            self.products[entry["id"]] = entry
+            for word, weight in entry["words"].items():
+                self.postings.setdefault(word, []).append(self._posting_key(entry["id"], weight))
+        for word, posting in self.postings.items():
+            posting.sort()
+            self._index_word(word)
+        self.vocabulary = sorted(self.postings)
+
+    def add(self, entry: dict):
+        self.broad_results.clear()
+        product_id = entry["id"]
+        entry["words"] = self._entry_words(entry)
+        self.products[product_id] = entry
+        for word, weight in entry["words"].items():
+            posting = self.postings.get(word)
+            if posting is None:
+                posting = self.postings[word] = []
+                bisect.insort(self.vocabulary, word)
+                self._index_word(word)
+            bisect.insort(posting, self._posting_key(product_id, weight))
+
+    def remove(self, product_id: int):
+        self.broad_results.clear()
+        entry = self.products.pop(product_id, None)
+        if entry is None:
+            return
+        for word, weight in entry["words"].items():
+            posting = self.postings.get(word)
+            if not posting:
+                continue
+            key = self._posting_key(product_id, weight)
+            position = bisect.bisect_left(posting, key)
+            if position < len(posting) and posting[position] == key:
+                posting.pop(position)
+            else:
+                posting[:] = [item for item in posting if item[1] != product_id]
+            if not posting:
+                del self.postings[word]
+                del self.vocabulary[bisect.bisect_left(self.vocabulary, word)]
+                for gram in _grams(word):
+                    words = self.gram_words.get(gram)
+                    if words is not None:
+                        words.discard(word)
+                        if not words:
+                            del self.gram_words[gram]
+
+    def resort(self):
+        """Re-rank postings after popularity changed"""
+        self.broad_results.clear()
+        for word, posting in self.postings.items():
+            posting[:] = sorted(
+                self._posting_key(product_id, self.products[product_id]["words"][word])
+                for _, product_id in posting
+            )
+
+    def prefix_count(self, term: str) -> int:
+        """Number of vocabulary words starting with term"""
+        return bisect.bisect_left(self.vocabulary, term + "\uffff") - bisect.bisect_left(self.vocabulary, term)
+
+    def prefix_bonus(self, term: str, word: str) -> Optional[float]:
+        """Bonus of a word for a term matched by prefix only, None if it doesn't match"""
+        if not word.startswith(term):
+            return None
+        return (EXACT_WORD_BONUS if word == term else 0.0) + self.word_popularity.get(word, 0.0)
+
+    def match_words(self, term: str, complete: bool) -> Dict[str, float]:
+        """Vocabulary words matching a query term -> bonus (exact, prefix or typo)"""
+        matches = {}
+        start = bisect.bisect_left(self.vocabulary, term)
+        for position in range(start, len(self.vocabulary)):
+            word = self.vocabulary[position]
+            if not word.startswith(term):
+                break
+            matches[word] = EXACT_WORD_BONUS if word == term else 0.0
+
+        limit = max_typos(term)
+        if limit and (complete or len(matches) < 3):
+            # Typo candidates share enough trigrams with the term, then the edit distance decides
+            term_grams = _grams(term)
+            counts = Counter()
+            for gram in term_grams:
+                counts.update(self.gram_words.get(gram, ()))
+            # One edit breaks up to 3 trigrams, a transposition up to 4
+            needed = max(1, len(term_grams) - 4 * limit)
+            for word, shared in counts.items():
+                if shared < needed or word in matches:
+                    continue
+                distance = _prefix_distance(term, word, limit)
+                if distance <= limit:
+                    matches[word] = -TYPO_PENALTY * distance
+        for word in matches:
+            matches[word] += self.word_popularity.get(word, 0.0)
+        return matches
+
+
+_index: Optional[_SuggestIndex] = None
+_stale = False
+_lock = threading.RLock()
+
+
+class ProductSuggestService:
+    """Service for search-box autocomplete served from memory"""
+
+    @staticmethod
+    def _entry(product: Product) -> dict:
+        category = product.category_obj.name if product.category_obj else product.category
+        return {
+            "id": product.id,
+            "name": product.name,
+            "brand": product.brand,
+            "category": category,
+            "image_url": product.image_url,
+        }
+
+    @staticmethod
+    def _load_popularity(db: Session, index: _SuggestIndex):
+        since = datetime.now() - timedelta(days=SUGGEST_POPULARITY_DAYS)
+        sold = db.query(SaleItem.product_id, func.sum(SaleItem.requested_quantity)).join(
+            Sale, Sale.id == SaleItem.sale_id
+        ).filter(Sale.created_at >= since).group_by(SaleItem.product_id).all()
+        index.product_popularity = {
+            product_id: SALES_WEIGHT * math.log1p(quantity or 0) for product_id, quantity in sold
+        }
+
+        searched = db.query(SearchHistory.search_query, func.count(SearchHistory.id)).filter(
+            SearchHistory.created_at >= since
+        ).group_by(SearchHistory.search_query).all()
+        word_counts = Counter()
+        for search_query, count in searched:
+            for word in set(normalize_search_text(search_query).split()):
+                word_counts[word] += count
+        index.word_popularity = {
+            word: SEARCH_WEIGHT * math.log1p(count) for word, count in word_counts.items()
+        }
+
+    @staticmethod
+    def rebuild(db: Session):
+        """Build the whole index from the database (startup, after imports)"""
+        global _index, _stale
+        index = _SuggestIndex()
+        ProductSuggestService._load_popularity(db, index)
+        rows = db.query(
+            Product.id, Product.name, Product.brand, Product.category, Category.name, Product.image_url
+        ).outerjoin(Category, Category.id == Product.category_id).yield_per(5000)
+        index.load(
+            {
+                "id": product_id,
+                "name": name,
+                "brand": brand,
+                "category": category_name or category,
+                "image_url": image_url,
+            }
+            for product_id, name, brand, category, category_name, image_url in rows
+        )
+        with _lock:
+            _index = index
+            _stale = False
+        return len(index.products)
+
+    @staticmethod
+    def refresh_popularity(db: Session):
+        """Recompute sales/search boosts and re-rank postings"""
+        with _lock:
+            index = _index
+        if index is None:
+            return
+        popularity = _SuggestIndex()
+        ProductSuggestService._load_popularity(db, popularity)
+        with _lock:
+            index.product_popularity = popularity.product_popularity
+            index.word_popularity = popularity.word_popularity
+            index.resort()
+
+    @staticmethod
+    def upsert_product(product: Product):
+        """Index a created or updated product (no-op until the index is built)"""
+        with _lock:
+            if _index is None:
+                return
+            _index.remove(product.id)
+            _index.add(ProductSuggestService._entry(product))
+
+    @staticmethod
+    def remove_product(product_id: int):
+        """Drop a deleted product"""
+        with _lock:
+            if _index is not None:
+                _index.remove(product_id)
+
+    @staticmethod
+    def invalidate():
+        """Rebuild on next use (bulk imports, category renames)"""
+        global _stale
+        _stale = True
+
+    @staticmethod
+    def suggest(db: Session, query: str, limit: int = 10) -> List[dict]:
+        """Best products for what has been typed so far"""
+        terms = normalize_search_text(query).split()
+        if not terms:
+            return []
+        if _index is None or _stale:
+            with _lock:
+                if _index is None or _stale:
+                    ProductSuggestService.rebuild(db)
+
+        with _lock:
+            index = _index
+            # Broad terms are only checked against candidates, unless every term is broad
+            prefix_counts = [index.prefix_count(term) for term in terms]
+            broad = [count > MAX_PREFIX_EXPANSION for count in prefix_counts]
+            cache_key = None
+            if all(broad):
+                cache_key = (tuple(terms), limit)
+                if cache_key in index.broad_results:
+                    return [dict(item) for item in index.broad_results[cache_key]]
+                broad[prefix_counts.index(min(prefix_counts))] = False
+            # The last term may still be typed, earlier ones are complete words
+            term_matches = [
+                None if broad[position] else index.match_words(term, complete=position < len(terms) - 1)
+                for position, term in enumerate(terms)
+            ]
+            if any(matches is not None and not matches for matches in term_matches):
+                return []
+
+            # Merge postings of the most selective term best-first; other terms filter
+            driver = min(
+                (position for position in range(len(terms)) if not broad[position]),
+                key=lambda position: sum(len(index.postings[word]) for word in term_matches[position])
+            )
+            others = [
+                (terms[position], matches) for position, matches in enumerate(term_matches)
+                if position != driver
+            ]
+            heap = [
+                (index.postings[word][0][0] - bonus, word, 0, bonus)
+                for word, bonus in term_matches[driver].items()
+            ]
+            heapq.heapify(heap)
+
+            results = []
+            seen = set()
+            while heap and len(results) < limit:
+                key, word, position, bonus = heapq.heappop(heap)
+                posting = index.postings[word]
+                product_id = posting[position][1]
+                if position + 1 < len(posting):
+                    heapq.heappush(heap, (posting[position + 1][0] - bonus, word, position + 1, bonus))
+                if product_id in seen:
+                    continue
+                seen.add(product_id)
+                entry = index.products[product_id]
+                score = -key
+                for term, matches in others:
+                    if matches is None:
+                        bonuses = (index.prefix_bonus(term, w) for w in entry["words"])
+                        best = max((bonus for bonus in bonuses if bonus is not None), default=None)
+                    else:
+                        best = max((matches[w] for w in entry["words"] if w in matches), default=None)
+                    if best is None:
+                        break
+                    score += best
+                else:
+                    results.append({
+                        "id": product_id,
+                        "name": entry["name"],
+                        "brand": entry["brand"],
+                        "category": entry["category"],
+                        "image_url": entry["image_url"],
+                        "score": round(score, 3),
+                    })
+            results.sort(key=lambda item: -item["score"])
+            if cache_key is not None:
+                index.broad_results[cache_key] = [dict(item) for item in results]
+            return results
+
+    @staticmethod
+    async def refresh_loop():
+        """Build the index at startup, then refresh popularity every SUGGEST_REFRESH_INTERVAL seconds"""
+        loop = asyncio.get_running_loop()
+
+        def run(action):
+            db = SessionLocal()
+            try:
+                return action(db)
+            finally:
+                db.close()
+
+        try:
+            count = await loop.run_in_executor(None, run, ProductSuggestService.rebuild)
+            print(f"[Suggest] Index built: {count} ta mahsulot")
+        except Exception as e:
+            print(f"[Suggest] Index build error: {e}")
+        while True:
+            await asyncio.sleep(SUGGEST_REFRESH_INTERVAL)
+            try:
+                await loop.run_in_executor(None, run, ProductSuggestService.refresh_popularity)
+            except Exception as e:
+                print(f"[Suggest] Popularity refresh error: {e}")
@@ -0,0 +1,235 @@
+"""
+Receipt Batch Service - many receipts rendered in parallel into one PDF or a ZIP
+"""
+from sqlalchemy.orm import Session, joinedload
+from typing import Any, Awaitable, Callable, List, Optional, Tuple
+from types import SimpleNamespace
+import os
+import io
+import asyncio
+import zipfile
+import importlib.util
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from models import Sale, SaleItem
+try:
+    from .pdf_service import PDFService
+    from .sale_service import SaleService
+    from .settings_service import SettingsService
+except ImportError:
+    from pdf_service import PDFService
+    from sale_service import SaleService
+    from settings_service import SettingsService
+
+
+BATCH_FORMATS = ("pdf", "zip")
+
+# One reportlab render per CPU core
+RECEIPT_BATCH_WORKERS = int(os.getenv("RECEIPT_BATCH_WORKERS", str(os.cpu_count() or 1)))
+# Upper bound of receipts in one batch
+RECEIPT_BATCH_MAX_SALES = int(os.getenv("RECEIPT_BATCH_MAX_SALES", "1000"))
+
+_executor = None
+
+
+class ReceiptBatchTooLarge(ValueError):
+    """More matching sales than RECEIPT_BATCH_MAX_SALES"""
+
+    def __init__(self, limit: int):
+        super().__init__(
+            f"Cheklar soni {limit} tadan ko'p - sana oralig'ini yoki sotuvchini toraytiring"
+        )
+        self.limit = limit
+
+
+def _render_receipts(sales: list, settings) -> bytes:
+    """Worker process entry point (must be a module-level function to be picklable)"""
+    return PDFService.render_receipts(sales, settings)
+
+
+def _can_merge_pdfs() -> bool:
+    """pypdf (requirements.txt) lets a combined PDF be rendered in parallel"""
+    return importlib.util.find_spec("pypdf") is not None
+
+
+def _merge_pdfs(parts: List[bytes]) -> bytes:
+    """Concatenate rendered PDFs page by page"""
+    from pypdf import PdfWriter, PdfReader
+
+    writer = PdfWriter()
+    for part in parts:
+        for page in PdfReader(io.BytesIO(part)).pages:
+            writer.add_page(page)
+    buffer = io.BytesIO()
+    writer.write(buffer)
+    return buffer.getvalue()
+
+
+def _zip_receipts(entries: List[Tuple[str, bytes]]) -> bytes:
+    """ZIP archive of (file name, PDF) pairs"""
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as archive:
+        for name, content in entries:
+            archive.writestr(name, content)
+    return buffer.getvalue()
+
+
+class ReceiptBatchService:
+    """Service for rendering receipts of many sales at once"""
+
+    @staticmethod
+    def get_executor() -> ProcessPoolExecutor:
+        """Shared process pool for receipt rendering"""
+        global _executor
+        if _executor is None:
+            # spawn: worker processes must not inherit DB connections or threads
+            _executor = ProcessPoolExecutor(
+                max_workers=RECEIPT_BATCH_WORKERS,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        return _executor
+
+    @staticmethod
+    def shutdown_executor(wait: bool = True):
+        """Stop the process pool (on application shutdown)"""
+        global _executor
+        if _executor is not None:
+            _executor.shutdown(wait=wait)
+            _executor = None
+
+    @staticmethod
+    def _snapshot_sale(sale: Sale) -> SimpleNamespace:
+        """Plain picklable copy of the sale fields printed on the receipt"""
+        customer = None
+        if sale.customer:
+            customer = SimpleNamespace(
+                id=sale.customer.id,
+                name=sale.customer.name,
+                debt_balance=sale.customer.debt_balance
+            )
+        items = [
+            SimpleNamespace(
+                requested_quantity=item.requested_quantity,
+                piece_price=item.piece_price,
+                subtotal=item.subtotal,
+                product=SimpleNamespace(
+                    name=item.product.name if item.product else "O'chirilgan mahsulot",
+                    item_number=item.product.item_number if item.product else None
+                )
+            )
+            for item in sale.items
+        ]
+        return SimpleNamespace(
+            id=sale.id,
+            payment_method=SimpleNamespace(value=sale.payment_method.value),
+            created_at=sale.created_at,
+            payment_amount=sale.payment_amount,
+            total_amount=sale.total_amount,
+            excess_action=sale.excess_action,
+            customer=customer,
+            seller=SimpleNamespace(name=sale.seller.name if sale.seller else None),
+            items=items
+        )
+
+    @staticmethod
+    def _snapshot_settings(settings) -> Optional[SimpleNamespace]:
+        """Plain picklable copy of the receipt header settings"""
+        if not settings:
+            return None
+        return SimpleNamespace(
+            store_name=settings.store_name,
+            store_address=settings.store_address,
+            store_phone=settings.store_phone,
+            logo_url=settings.logo_url,
+            receipt_show_logo=settings.receipt_show_logo,
+            receipt_footer_text=settings.receipt_footer_text
+        )
+
+    @staticmethod
+    def load_sales(
+        db: Session,
+        start_date: Optional[str] = None,
+        end_date: Optional[str] = None,
+        seller_id: Optional[int] = None,
+        status: Optional[str] = None
+    ) -> Tuple[List[SimpleNamespace], Optional[SimpleNamespace]]:
+        """
+        Load sales (oldest first) and settings as picklable snapshots.
+        Raises ReceiptBatchTooLarge instead of silently dropping older sales.
+        """
+        sales = SaleService.get_sales(
+            db,
+            seller_id=seller_id,
+            start_date=start_date,
+            end_date=end_date,
+            status=status,
+            limit=RECEIPT_BATCH_MAX_SALES + 1
+        )
+        if len(sales) > RECEIPT_BATCH_MAX_SALES:
+            raise ReceiptBatchTooLarge(RECEIPT_BATCH_MAX_SALES)
+        sale_ids = [sale.id for sale in sales]
+        if sale_ids:
+            # Load relationships of all sales in one query instead of one per sale
+            db.query(Sale).options(
+                joinedload(Sale.items).joinedload(SaleItem.product),
+                joinedload(Sale.customer),
+                joinedload(Sale.seller)
+            ).filter(Sale.id.in_(sale_ids)).all()
+
+        snapshots = [ReceiptBatchService._snapshot_sale(sale) for sale in reversed(sales)]
+        settings = ReceiptBatchService._snapshot_settings(SettingsService.get_settings(db))
+        return snapshots, settings
+
+    @staticmethod
+    async def render(
+        sales: List[SimpleNamespace],
+        settings: Optional[SimpleNamespace],
+        fmt: str = "pdf",
+        progress: Optional[Callable[[int, int], Awaitable[Any]]] = None
+    ) -> bytes:
+        """
+        Render receipts in the process pool, one receipt per task; merging the
+        PDFs or building the ZIP runs there too, off the event loop.
+        If pypdf is missing a combined PDF falls back to a single task.
+        Returns one combined PDF or a ZIP with a PDF per sale.
+        progress(done, total) is awaited after every finished receipt.
+        """
+        if fmt not in BATCH_FORMATS:
+            raise ValueError(f"Unknown format: {fmt}")
+        if not sales:
+            raise ValueError("No sales to render")
+
+        loop = asyncio.get_running_loop()
+        executor = ReceiptBatchService.get_executor()
+        total = len(sales)
+
+        try:
+            if fmt == "pdf" and not _can_merge_pdfs():
+                # Fallback only: pypdf is in requirements.txt, without it the parts cannot be merged
+                print("[Receipts] pypdf is not installed - rendering the combined PDF in a single task")
+                content = await loop.run_in_executor(executor, _render_receipts, sales, settings)
+                if progress is not None:
+                    await progress(total, total)
+                return content
+
+            async def render_one(index, sale):
+                return index, await loop.run_in_executor(executor, _render_receipts, [sale], settings)
+
+            parts: List[Optional[bytes]] = [None] * total
+            done = 0
+            for task in asyncio.as_completed([render_one(i, sale) for i, sale in enumerate(sales)]):
+                index, content = await task
+                parts[index] = content
+                done += 1
+                if progress is not None:
+                    await progress(done, total)
+
+            if fmt == "zip":
+                entries = [(f"receipt_{sale.id}.pdf", content) for sale, content in zip(sales, parts)]
+                return await loop.run_in_executor(executor, _zip_receipts, entries)
+            return await loop.run_in_executor(executor, _merge_pdfs, parts)
+        except BrokenProcessPool:
+            # A new pool is created on the next request
+            ReceiptBatchService.shutdown_executor(wait=False)
+            raise
@@ -0,0 +1,155 @@
+"""
+Receipt Cache Service - rendered receipt PDFs cached on disk by content version
+"""
+from sqlalchemy.orm import Session
+from typing import Tuple
+import os
+import glob
+import hashlib
+import threading
+import uuid
+from models import Sale
+try:
+    from .pdf_service import PDFService
+    from .settings_service import SettingsService
+except ImportError:
+    from pdf_service import PDFService
+    from settings_service import SettingsService
+
+
+class ReceiptCacheService:
+    """Service for caching rendered receipts keyed by (sale id, sale version, settings version)"""
+
+    CACHE_DIR = os.path.join(PDFService.RECEIPTS_DIR, "cache")
+    # Total size of cached receipts before the least recently used ones are removed
+    MAX_CACHE_BYTES = int(float(os.getenv("RECEIPT_CACHE_MAX_MB", "100")) * 1024 * 1024)
+
+    _lock = threading.Lock()
+
+    @staticmethod
+    def _digest(parts) -> str:
+        return hashlib.sha1(repr(parts).encode("utf-8")).hexdigest()[:16]
+
+    @staticmethod
+    def sale_version(sale: Sale) -> str:
+        """Hash of everything from the sale that is printed on the receipt"""
+        customer = sale.customer
+        parts = (
+            sale.customer_id,
+            sale.seller_id,
+            sale.total_amount,
+            sale.payment_method.value if sale.payment_method else None,
+            sale.payment_amount,
+            sale.excess_action,
+            sale.admin_approved,
+            customer.name if customer else None,
+            getattr(customer, "debt_balance", None) if customer else None,
+            sale.seller.name if sale.seller else None,
+            sorted(
+                (item.id, item.product_id, item.requested_quantity, item.piece_price, item.subtotal,
+                 item.product.name if item.product else None,
+                 item.product.item_number if item.product else None)
+                for item in sale.items
+            ),
+        )
+        return ReceiptCacheService._digest(parts)
+
+    @staticmethod
+    def settings_version(db: Session) -> str:
+        """Hash of the settings used in the receipt header and footer"""
+        settings = SettingsService.get_settings(db)
+        if not settings:
+            return ReceiptCacheService._digest(None)
+        parts = (
+            settings.store_name,
+            settings.store_address,
+            settings.store_phone,
+            settings.logo_url,
+            settings.receipt_show_logo,
+            settings.receipt_footer_text,
+        )
+        return ReceiptCacheService._digest(parts)
+
+    @staticmethod
+    def get_etag(db: Session, sale: Sale) -> str:
+        """Strong ETag for the current receipt of a sale"""
+        sale_version = ReceiptCacheService.sale_version(sale)
+        settings_version = ReceiptCacheService.settings_version(db)
+        return f'"{sale.id}-{sale_version}-{settings_version}"'
+
+    @staticmethod
+    def _cache_path(etag: str) -> str:
+        sale_id, sale_version, settings_version = etag.strip('"').split("-")
+        filename = f"receipt_{sale_id}_{sale_version}_{settings_version}.pdf"
+        return os.path.join(ReceiptCacheService.CACHE_DIR, filename)
+
+    @staticmethod
+    def get_receipt(db: Session, sale: Sale) -> Tuple[bytes, str]:
+        """
+        Return (PDF bytes, ETag), rendering the receipt only on a cache miss.
+        Cached receipts have no "Yaratilgan" render time in the footer (it would be
+        frozen at the first render); the sale date is printed in the body.
+        """
+        etag = ReceiptCacheService.get_etag(db, sale)
+        path = ReceiptCacheService._cache_path(etag)
+
+        try:
+            with open(path, "rb") as f:
+                content = f.read()
+            # Mark as recently used for LRU eviction
+            os.utime(path)
+            return content, etag
+        except FileNotFoundError:
+            pass
+
+        content = PDFService.generate_receipt_bytes(db, sale.id, show_generated_at=False)
+
+        os.makedirs(ReceiptCacheService.CACHE_DIR, exist_ok=True)
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(content)
+        os.replace(tmp_path, path)
+
+        ReceiptCacheService._enforce_size_limit()
+        return content, etag
+
+    @staticmethod
+    def _enforce_size_limit():
+        """Remove least recently used receipts until the cache fits MAX_CACHE_BYTES"""
+        with ReceiptCacheService._lock:
+            entries = []
+            for path in glob.glob(os.path.join(ReceiptCacheService.CACHE_DIR, "receipt_*.pdf")):
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+
+            total = sum(size for _, size, _ in entries)
+            for _, size, path in sorted(entries):
+                if total <= ReceiptCacheService.MAX_CACHE_BYTES:
+                    break
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                total -= size
+
+    @staticmethod
+    def invalidate_sale(sale_id: int):
+        """Remove cached receipts of a sale (after update/approve/delete)"""
+        pattern = os.path.join(ReceiptCacheService.CACHE_DIR, f"receipt_{sale_id}_*.pdf")
+        for path in glob.glob(pattern):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    @staticmethod
+    def clear():
+        """Remove all cached receipts (after settings change)"""
+        for path in glob.glob(os.path.join(ReceiptCacheService.CACHE_DIR, "receipt_*.pdf")):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
@@ -0,0 +1,151 @@
+"""
+Resource Version Service - per-resource version counters for conditional GETs
+(ETag / Last-Modified) on catalog endpoints
+"""
+from sqlalchemy.orm import Session
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+from typing import Dict, List, Optional, Tuple
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+import threading
+from fastapi import Request
+from models import ResourceVersion
+
+
+# Resource -> (table, write operations) that change its responses
+RESOURCE_TABLES = {
+    # sale_items: last_sold_date in product responses
+    "products": [("products", ("INSERT", "UPDATE", "DELETE")), ("sale_items", ("INSERT", "DELETE"))],
+    "categories": [("categories", ("INSERT", "UPDATE", "DELETE"))],
+    "banners": [("banners", ("INSERT", "UPDATE", "DELETE"))],
+    "settings": [("settings", ("INSERT", "UPDATE", "DELETE"))],
+}
+# Responses with day counters (days_since_last_sale) also change from one day to the next
+DAILY_RESOURCES = {"products"}
+
+CACHE_CONTROL = "private, no-cache"
+
+
+def _trigger_ddl() -> List[str]:
+    statements = []
+    for resource, tables in RESOURCE_TABLES.items():
+        for table, operations in tables:
+            for operation in operations:
+                # Triggers bump the counter for every writer: API, bot, imports, raw SQL
+                statements.append(
+                    f"CREATE TRIGGER IF NOT EXISTS resource_version_{table}_{operation.lower()} "
+                    f"AFTER {operation} ON {table} BEGIN "
+                    f"UPDATE resource_versions SET version = version + 1, updated_at = CURRENT_TIMESTAMP "
+                    f"WHERE name = '{resource}'; END"
+                )
+    return statements
+
+
+# Bind URL -> whether the triggers are installed
+_trigger_state: Dict[str, bool] = {}
+_lock = threading.Lock()
+
+
+class ResourceVersionService:
+    """Service for catalog ETags"""
+
+    @staticmethod
+    def ensure_triggers(bind) -> bool:
+        """Create the version rows and triggers if missing (once per database)"""
+        key = str(bind.url)
+        if key in _trigger_state:
+            return _trigger_state[key]
+
+        with _lock:
+            if key in _trigger_state:
+                return _trigger_state[key]
+            try:
+                ResourceVersion.__table__.create(bind=bind, checkfirst=True)
+                with bind.begin() as conn:
+                    for resource in RESOURCE_TABLES:
+                        conn.execute(text(
+                            "INSERT OR IGNORE INTO resource_versions (name, version, updated_at) "
+                            "VALUES (:name, 1, CURRENT_TIMESTAMP)"
+                        ), {"name": resource})
+                    for statement in _trigger_ddl():
+                        conn.execute(text(statement))
+                _trigger_state[key] = True
+            except OperationalError as e:
+                print(f"Warning: Resource version triggers unavailable, conditional GET disabled: {e}")
+                _trigger_state[key] = False
+        return _trigger_state[key]
+
+    @staticmethod
+    def get_version(db: Session, resource: str) -> Optional[Tuple[int, datetime]]:
+        """(version, last change in UTC) of a resource, None if not tracked"""
+        if not ResourceVersionService.ensure_triggers(db.get_bind()):
+            return None
+        row = db.query(ResourceVersion.version, ResourceVersion.updated_at).filter(
+            ResourceVersion.name == resource
+        ).first()
+        if row is None:
+            return None
+        version, updated_at = row
+        updated_at = (updated_at or datetime.now(timezone.utc)).replace(tzinfo=timezone.utc, microsecond=0)
+        return version, updated_at
+
+    @staticmethod
+    def bump(db: Session, resources: List[str]):
+        """
+        Mark resources as changed without a row write (e.g. derived files such as
+        image variants became available)
+        """
+        if not ResourceVersionService.ensure_triggers(db.get_bind()):
+            return
+        db.query(ResourceVersion).filter(ResourceVersion.name.in_(resources)).update(
+            {
+                ResourceVersion.version: ResourceVersion.version + 1,
+                ResourceVersion.updated_at: datetime.now(timezone.utc).replace(tzinfo=None),
+            },
+            synchronize_session=False
+        )
+        db.commit()
+
+    @staticmethod
+    def cache_headers(db: Session, resource: str) -> Dict[str, str]:
+        """
+        ETag, Last-Modified and Cache-Control for the current version of a resource
+        ({} if it is not tracked). Read it before querying the data, so a write in
+        between yields an older tag and the client simply downloads again next time.
+        """
+        current = ResourceVersionService.get_version(db, resource)
+        if current is None:
+            return {}
+        version, last_modified = current
+        etag = f"{resource}-{version}-{int(last_modified.timestamp())}"
+        if resource in DAILY_RESOURCES:
+            today = datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
+            etag += f"-{today:%Y%m%d}"
+            last_modified = max(last_modified, today)
+        return {
+            "ETag": f'"{etag}"',
+            "Last-Modified": format_datetime(last_modified, usegmt=True),
+            "Cache-Control": CACHE_CONTROL,
+        }
+
+    @staticmethod
+    def is_not_modified(request: Request, cache_headers: Dict[str, str]) -> bool:
+        """Whether the client's copy is current (If-None-Match, else If-Modified-Since)"""
+        if not cache_headers:
+            return False
+        if_none_match = request.headers.get("if-none-match")
+        if if_none_match is not None:
+            tags = [tag.strip() for tag in if_none_match.split(",")]
+            return "*" in tags or cache_headers["ETag"] in [tag[2:] if tag.startswith("W/") else tag for tag in tags]
+        if_modified_since = request.headers.get("if-modified-since")
+        if if_modified_since:
+            try:
+                since = parsedate_to_datetime(if_modified_since)
+                last_modified = parsedate_to_datetime(cache_headers["Last-Modified"])
+            except (TypeError, ValueError):
+                return False
+            if since.tzinfo is None:
+                since = since.replace(tzinfo=timezone.utc)
+            return last_modified <= since
+        return False
@@ -5,6 +5,7 @@ from sqlalchemy.orm import Session, joinedload
 from typing import List, Optional
 from models import Role, Permission, Seller
 from schemas import RoleCreate, RoleUpdate, RoleResponse, PermissionResponse
+from auth import invalidate_role_permissions
 
 
 class RoleService:
@@ -74,6 +75,7 @@ class RoleService:
                 db_role.permissions = permissions
         
         db.commit()
+        invalidate_role_permissions(role_id)
         db.refresh(db_role)
         # Reload with permissions
         return db.query(Role).options(joinedload(Role.permissions)).filter(Role.id == db_role.id).first()
@@ -95,6 +97,7 @@ class RoleService:
         
         db.delete(db_role)
         db.commit()
+        invalidate_role_permissions(role_id)
         return True
     
     @staticmethod
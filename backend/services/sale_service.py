@@ -433,6 +433,15 @@ class SaleService:
             joinedload(Sale.approver)
         ).filter(Sale.id == sale_id).first()
     
+    @staticmethod
+    def _invalidate_receipt(sale_id: int):
+        """Drop cached receipt PDFs of a changed sale"""
+        try:
+            from .receipt_cache_service import ReceiptCacheService
+        except ImportError:
+            from receipt_cache_service import ReceiptCacheService
+        ReceiptCacheService.invalidate_sale(sale_id)
+    
     @staticmethod
     def update_sale(
         db: Session,
@@ -532,6 +541,8 @@ class SaleService:
         
         db.commit()
         db.refresh(sale)
+        
+        SaleService._invalidate_receipt(sale.id)
         return sale
     
     @staticmethod
@@ -708,8 +719,28 @@ class SaleService:
         
         db.commit()
         db.refresh(sale)
+        
+        SaleService._invalidate_receipt(sale.id)
         return sale
     
+    @staticmethod
+    def parse_statistics_date(value: Optional[str], field: str = "date") -> Optional[datetime]:
+        """ISO date/datetime filter value; naive values are Uzbekistan time. None if empty or invalid."""
+        if not value:
+            return None
+        try:
+            # Handle different date formats
+            value_str = value.replace('Z', '+00:00') if 'Z' in value else value
+            parsed = datetime.fromisoformat(value_str)
+            if parsed.tzinfo is None:
+                from utils import UZBEKISTAN_TZ
+                # Assume input is in Uzbekistan timezone
+                parsed = parsed.replace(tzinfo=UZBEKISTAN_TZ)
+            return parsed
+        except (ValueError, AttributeError) as e:
+            print(f"Warning: Invalid {field} format '{value}' in get_statistics: {e}")
+            return None
+    
     @staticmethod
     def get_statistics(
         db: Session,
@@ -720,41 +751,13 @@ class SaleService:
         """Get sales statistics"""
         query = db.query(Sale)
         
-        if start_date:
-            try:
-                # Handle different date formats
-                start_str = start_date.replace('Z', '+00:00') if 'Z' in start_date else start_date
-                # If no timezone info, assume UTC and convert
-                if '+' not in start_str and 'Z' not in start_str and start_str[-1] != 'Z':
-                    # Naive datetime, assume it's UTC
-                    start = datetime.fromisoformat(start_str)
-                    if start.tzinfo is None:
-                        from utils import UZBEKISTAN_TZ
-                        # Assume input is in Uzbekistan timezone
-                        start = start.replace(tzinfo=UZBEKISTAN_TZ)
-                else:
-                    start = datetime.fromisoformat(start_str)
-                query = query.filter(Sale.created_at >= start)
-            except (ValueError, AttributeError) as e:
-                print(f"Warning: Invalid start_date format '{start_date}' in get_statistics: {e}")
+        start = SaleService.parse_statistics_date(start_date, "start_date")
+        if start is not None:
+            query = query.filter(Sale.created_at >= start)
         
-        if end_date:
-            try:
-                # Handle different date formats
-                end_str = end_date.replace('Z', '+00:00') if 'Z' in end_date else end_date
-                # If no timezone info, assume UTC and convert
-                if '+' not in end_str and 'Z' not in end_str and end_str[-1] != 'Z':
-                    # Naive datetime, assume it's UTC
-                    end = datetime.fromisoformat(end_str)
-                    if end.tzinfo is None:
-                        from utils import UZBEKISTAN_TZ
-                        # Assume input is in Uzbekistan timezone
-                        end = end.replace(tzinfo=UZBEKISTAN_TZ)
-                else:
-                    end = datetime.fromisoformat(end_str)
-                query = query.filter(Sale.created_at <= end)
-            except (ValueError, AttributeError) as e:
-                print(f"Warning: Invalid end_date format '{end_date}' in get_statistics: {e}")
+        end = SaleService.parse_statistics_date(end_date, "end_date")
+        if end is not None:
+            query = query.filter(Sale.created_at <= end)
         
         if seller_id:
             query = query.filter(Sale.seller_id == seller_id)
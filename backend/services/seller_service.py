@@ -6,6 +6,7 @@ from typing import List, Optional, Dict, Any
 from datetime import datetime
 from models import Seller, Role
 from schemas import SellerCreate, SellerUpdate, SellerResponse
+from auth import invalidate_seller, revoke_subject
 
 
 class SellerService:
@@ -62,6 +63,7 @@ class SellerService:
         if seller.password:
             update_data['password_hash'] = AuthService.hash_password(seller.password)
         
+        old_role_id = db_seller.role_id
         for field, value in update_data.items():
             # Handle None/empty values for role_id
             if field == 'role_id' and (value == '' or value is None):
@@ -70,6 +72,10 @@ class SellerService:
             setattr(db_seller, field, value)
         
         db.commit()
+        invalidate_seller(seller_id)
+        # Tokens carry role and active state - issue new ones after such changes
+        if db_seller.role_id != old_role_id or update_data.get('is_active') is False or 'password_hash' in update_data:
+            revoke_subject("seller", seller_id)
         db.refresh(db_seller)
         # Reload with role relationship
         return db.query(Seller).options(selectinload(Seller.role)).filter(Seller.id == seller_id).first()
@@ -223,6 +229,8 @@ class SellerService:
             # 7. Finally delete the seller
             db.delete(db_seller)
             db.commit()
+            invalidate_seller(seller_id)
+            revoke_subject("seller", seller_id)
             return True
         except Exception as e:
             db.rollback()
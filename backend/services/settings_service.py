@@ -98,6 +98,16 @@ class SettingsService:
         db.commit()
         db.refresh(settings)
         
+        # Receipt header (store name, logo) depends on settings
+        try:
+            from .pdf_service import PDFService
+            from .receipt_cache_service import ReceiptCacheService
+        except ImportError:
+            from pdf_service import PDFService
+            from receipt_cache_service import ReceiptCacheService
+        PDFService.invalidate_template_cache()
+        ReceiptCacheService.clear()
+        
         return settings
     
     @staticmethod
@@ -0,0 +1,159 @@
+"""
+Telegram rasmlaridan shtrix kodni o'qish.
+
+Rasm diskka yozilmaydi: xotiradagi bytes alohida process'da PIL + pyzbar
+bilan o'qiladi. Birinchi urinish chiqmasa, bir nechta oldindan ishlov
+berish bosqichlari (kulrang, kichraytirish, kontrast, burish) navbat bilan
+sinab ko'riladi. Natija Telegram file_unique_id bo'yicha keshlanadi,
+o'qish vaqti va muvaffaqiyat foizi statistikada yig'iladi.
+"""
+import os
+import io
+import time
+import asyncio
+import logging
+import threading
+import multiprocessing
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+# Shtrix kod o'qiydigan process'lar soni
+BOT_BARCODE_WORKERS = int(os.getenv('BOT_BARCODE_WORKERS', '2'))
+# Nechta rasm natijasi xotirada saqlanadi
+BARCODE_CACHE_SIZE = int(os.getenv('BOT_BARCODE_CACHE_SIZE', '256'))
+# Kichraytirishda eng katta tomon (px)
+DOWNSCALE_MAX_SIDE = 1024
+
+_executor = None
+_results = OrderedDict()
+_stats_lock = threading.Lock()
+_stats = {
+    'requests': 0,
+    'cache_hits': 0,
+    'decoded': 0,
+    'failed': 0,
+    'decode_seconds': 0.0,
+    'steps': {},
+}
+
+
+def get_executor() -> ProcessPoolExecutor:
+    """Shtrix kod o'qish uchun umumiy ProcessPoolExecutor"""
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(
+            max_workers=BOT_BARCODE_WORKERS,
+            mp_context=multiprocessing.get_context('spawn')
+        )
+    return _executor
+
+
+def shutdown_executor(wait: bool = True):
+    """Executor'ni to'xtatish (bot to'xtaganda)"""
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=wait)
+        _executor = None
+
+
+def _preprocessing_steps(image):
+    """(bosqich nomi, rasm) juftlarini arzonidan qimmatiga qarab qaytaradi"""
+    from PIL import ImageOps, ImageFilter
+
+    gray = image.convert('L')
+    yield 'gray', gray
+
+    small = gray
+    if max(gray.size) > DOWNSCALE_MAX_SIDE:
+        small = gray.copy()
+        small.thumbnail((DOWNSCALE_MAX_SIDE, DOWNSCALE_MAX_SIDE))
+        yield 'downscale', small
+
+    contrast = ImageOps.autocontrast(small, cutoff=2)
+    yield 'contrast', contrast
+
+    sharp = contrast.filter(ImageFilter.SHARPEN)
+    yield 'sharpen', sharp
+
+    yield 'threshold', sharp.point(lambda p: 255 if p > 128 else 0)
+
+    # Qiyshiq olingan rasmlar uchun
+    for angle in (90, 45, -45):
+        yield f'rotate{angle}', contrast.rotate(angle, expand=True, fillcolor=255)
+
+
+def decode_barcode_bytes(data: bytes):
+    """
+    Rasm bytes'idan shtrix kodni o'qish (worker process ichida).
+    (qiymat yoki None, muvaffaqiyatli bosqich nomi yoki None) qaytaradi.
+    """
+    from PIL import Image
+    from pyzbar.pyzbar import decode
+
+    image = Image.open(io.BytesIO(data))
+    image.load()
+    for step, candidate in _preprocessing_steps(image):
+        barcodes = decode(candidate)
+        if barcodes:
+            return barcodes[0].data.decode('utf-8'), step
+    return None, None
+
+
+def _record(decoded, step, seconds):
+    with _stats_lock:
+        _stats['decode_seconds'] += seconds
+        if decoded:
+            _stats['decoded'] += 1
+            _stats['steps'][step] = _stats['steps'].get(step, 0) + 1
+        else:
+            _stats['failed'] += 1
+
+
+def get_decode_stats() -> dict:
+    """O'qish statistikasi: so'rovlar, kesh, muvaffaqiyat foizi, o'rtacha vaqt"""
+    with _stats_lock:
+        stats = dict(_stats, steps=dict(_stats['steps']))
+    attempts = stats['decoded'] + stats['failed']
+    stats['success_rate'] = stats['decoded'] / attempts * 100 if attempts else 0.0
+    stats['avg_decode_ms'] = stats['decode_seconds'] / attempts * 1000 if attempts else 0.0
+    return stats
+
+
+def _remember(file_unique_id, value):
+    _results[file_unique_id] = value
+    _results.move_to_end(file_unique_id)
+    while len(_results) > BARCODE_CACHE_SIZE:
+        _results.popitem(last=False)
+
+
+async def decode_photo(photo):
+    """
+    Telegram PhotoSize'dan shtrix kodni o'qish. Bir xil rasm (file_unique_id)
+    qayta yuborilsa, yuklab olinmaydi va qayta o'qilmaydi.
+    """
+    with _stats_lock:
+        _stats['requests'] += 1
+    if photo.file_unique_id in _results:
+        _results.move_to_end(photo.file_unique_id)
+        with _stats_lock:
+            _stats['cache_hits'] += 1
+        return _results[photo.file_unique_id]
+
+    file = await photo.get_file()
+    data = bytes(await file.download_as_bytearray())
+
+    loop = asyncio.get_running_loop()
+    started = time.perf_counter()
+    try:
+        value, step = await loop.run_in_executor(get_executor(), decode_barcode_bytes, data)
+    except BrokenProcessPool:
+        # Keyingi so'rovda yangi pool yaratiladi
+        shutdown_executor(wait=False)
+        raise
+    elapsed = time.perf_counter() - started
+
+    _record(value is not None, step, elapsed)
+    logging.info(f"Shtrix kod: {value or 'topilmadi'} (bosqich: {step}, {elapsed * 1000:.0f} ms)")
+    _remember(photo.file_unique_id, value)
+    return value
@@ -38,7 +38,7 @@ def run_telegram_bot():
         from telegram.ext import ApplicationBuilder, CommandHandler, CallbackQueryHandler, MessageHandler, filters
         
         # Create application
-        app = ApplicationBuilder().token(TELEGRAM_TOKEN).build()
+        app = ApplicationBuilder().token(TELEGRAM_TOKEN).concurrent_updates(True).build()
         print("✅ Application yaratildi")
         
         # Add handlers
@@ -0,0 +1,150 @@
+"""
+Telegram hisobotlari uchun PNG grafiklar.
+
+Grafik alohida process'da (headless) chiziladi: matplotlib (Agg) bo'lsa u
+ishlatiladi, bo'lmasa PIL bilan oddiy ustunli grafik chiziladi. Tayyor
+rasm Telegram'ga bir marta yuklanadi, keyin (grafik turi, davr, ma'lumot
+versiyasi) bo'yicha saqlangan file_id qayta ishlatiladi.
+"""
+import os
+import io
+import asyncio
+import hashlib
+import multiprocessing
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+# Grafik chizadigan process'lar soni
+BOT_CHART_WORKERS = int(os.getenv('BOT_CHART_WORKERS', '1'))
+# Nechta file_id xotirada saqlanadi
+CHART_CACHE_SIZE = int(os.getenv('BOT_CHART_CACHE_SIZE', '64'))
+
+CHART_WIDTH = 800
+CHART_HEIGHT = 450
+BAR_COLOR = (33, 150, 243)
+
+_executor = None
+_file_ids = OrderedDict()
+
+
+def get_executor() -> ProcessPoolExecutor:
+    """Grafik chizish uchun umumiy ProcessPoolExecutor"""
+    global _executor
+    if _executor is None:
+        # fork o'rniga spawn: bot DB threadlari bolalar process'ga o'tmasligi uchun
+        _executor = ProcessPoolExecutor(
+            max_workers=BOT_CHART_WORKERS,
+            mp_context=multiprocessing.get_context('spawn')
+        )
+    return _executor
+
+
+def shutdown_executor(wait: bool = True):
+    """Executor'ni to'xtatish (bot to'xtaganda)"""
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=wait)
+        _executor = None
+
+
+def _render_matplotlib(title, labels, values, ylabel):
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+    # pyplot ishlatilmaydi - global holat va GUI backend kerak emas
+    fig = Figure(figsize=(CHART_WIDTH / 100, CHART_HEIGHT / 100), dpi=100)
+    FigureCanvasAgg(fig)
+    ax = fig.add_subplot(1, 1, 1)
+    bars = ax.bar(labels, values, color=[c / 255 for c in BAR_COLOR])
+    ax.bar_label(bars, labels=[f"{v:.1f}" for v in values], fontsize=9)
+    ax.set_title(title)
+    ax.set_ylabel(ylabel)
+    ax.spines['top'].set_visible(False)
+    ax.spines['right'].set_visible(False)
+    fig.tight_layout()
+
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format='png')
+    return buffer.getvalue()
+
+
+def _render_pil(title, labels, values, ylabel):
+    from PIL import Image, ImageDraw, ImageFont
+
+    image = Image.new('RGB', (CHART_WIDTH, CHART_HEIGHT), 'white')
+    draw = ImageDraw.Draw(image)
+    font = ImageFont.load_default()
+
+    left, right, top, bottom = 60, CHART_WIDTH - 20, 50, CHART_HEIGHT - 40
+    draw.text((left, 15), title, fill='black', font=font)
+    draw.text((5, top - 20), ylabel, fill='gray', font=font)
+    draw.line((left, top, left, bottom), fill='gray')
+    draw.line((left, bottom, right, bottom), fill='gray')
+
+    max_value = max(values) if values and max(values) > 0 else 1
+    slot = (right - left) / max(len(values), 1)
+    bar_width = slot * 0.6
+    for i, (label, value) in enumerate(zip(labels, values)):
+        x0 = left + slot * i + (slot - bar_width) / 2
+        y0 = bottom - (bottom - top) * (value / max_value)
+        draw.rectangle((x0, y0, x0 + bar_width, bottom), fill=BAR_COLOR)
+        draw.text((x0, y0 - 14), f"{value:.1f}", fill='black', font=font)
+        draw.text((x0, bottom + 8), str(label), fill='black', font=font)
+
+    buffer = io.BytesIO()
+    image.save(buffer, format='PNG', optimize=True)
+    return buffer.getvalue()
+
+
+def render_bar_chart(title, labels, values, ylabel=''):
+    """Ustunli grafikni PNG bytes ko'rinishida chizish (worker process ichida)"""
+    try:
+        return _render_matplotlib(title, labels, values, ylabel)
+    except ImportError:
+        return _render_pil(title, labels, values, ylabel)
+
+
+def chart_cache_key(chart_type, period, labels, values):
+    """(grafik turi, davr, ma'lumot versiyasi) kaliti"""
+    data = repr([(str(label), round(float(value), 6)) for label, value in zip(labels, values)])
+    version = hashlib.sha1(data.encode('utf-8')).hexdigest()[:16]
+    return (chart_type, str(period), version)
+
+
+def get_cached_file_id(key):
+    file_id = _file_ids.get(key)
+    if file_id is not None:
+        _file_ids.move_to_end(key)
+    return file_id
+
+
+def remember_file_id(key, file_id):
+    _file_ids[key] = file_id
+    _file_ids.move_to_end(key)
+    while len(_file_ids) > CHART_CACHE_SIZE:
+        _file_ids.popitem(last=False)
+
+
+async def send_bar_chart(message, chart_type, period, title, labels, values, ylabel='', caption=None, reply_markup=None):
+    """
+    Grafikni chatga yuborish. Keshda file_id bo'lsa rasm qayta chizilmaydi
+    va qayta yuklanmaydi.
+    """
+    key = chart_cache_key(chart_type, period, labels, values)
+    photo = get_cached_file_id(key)
+    if photo is None:
+        loop = asyncio.get_running_loop()
+        try:
+            photo = await loop.run_in_executor(
+                get_executor(), render_bar_chart, title, list(labels), list(values), ylabel
+            )
+        except BrokenProcessPool:
+            # Keyingi so'rovda yangi pool yaratiladi
+            shutdown_executor(wait=False)
+            raise
+
+    sent = await message.reply_photo(photo=photo, caption=caption, reply_markup=reply_markup)
+    if sent is not None and getattr(sent, 'photo', None):
+        remember_file_id(key, sent.photo[-1].file_id)
+    return sent
@@ -0,0 +1,59 @@
+"""
+Telegram bot uchun ma'lumotlar bazasi ishlarini alohida thread pool'da bajarish.
+
+SQLAlchemy so'rovlari sinxron, shuning uchun ular bot event loop'ini
+bloklamasligi kerak. Barcha handlerlar DB ishini run_db() orqali bajaradi.
+"""
+import os
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    from database import SessionLocal
+except ImportError:
+    import sys
+    sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from database import SessionLocal
+
+# Bir vaqtda ishlaydigan DB threadlar soni (SQLite uchun ko'p bo'lishi shart emas)
+BOT_DB_WORKERS = int(os.getenv('BOT_DB_WORKERS', '4'))
+
+_executor = None
+
+
+def get_executor() -> ThreadPoolExecutor:
+    """Bot DB ishlari uchun umumiy ThreadPoolExecutor"""
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=BOT_DB_WORKERS, thread_name_prefix="bot-db")
+    return _executor
+
+
+def _call_with_session(fn, args, kwargs):
+    """Thread ichida yangi session ochib, fn(db, ...) ni chaqirish"""
+    db = SessionLocal()
+    try:
+        return fn(db, *args, **kwargs)
+    finally:
+        db.close()
+
+
+async def run_db(fn, *args, **kwargs):
+    """
+    fn(db, *args, **kwargs) ni bot thread pool'ida bajarish.
+    Session thread ichida ochiladi va yopiladi, natija qaytariladi.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        get_executor(),
+        functools.partial(_call_with_session, fn, args, kwargs)
+    )
+
+
+def shutdown_executor(wait: bool = True):
+    """Executor'ni to'xtatish (bot to'xtaganda)"""
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=wait)
+        _executor = None
@@ -0,0 +1,138 @@
+"""
+Bot ro'yxatlari (top mahsulotlar, qarzdorlar, kam qolganlar ...) uchun kesh.
+
+Har bir chat uchun tartiblangan ID ro'yxati TTL bilan saqlanadi. Birinchi
+sahifa so'ralganda ma'lumot versiyasi tekshiriladi va o'zgargan bo'lsa
+ro'yxat qayta tuziladi. Keyingi sahifalar faqat shu sahifadagi yozuvlarni
+bazadan oladi.
+"""
+import os
+import time
+import threading
+
+from sqlalchemy import func, case
+
+try:
+    from models import Product, Customer, Sale
+except ImportError:
+    import sys
+    sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from models import Product, Customer, Sale
+try:
+    from .analytics_service import AnalyticsService
+except ImportError:
+    from analytics_service import AnalyticsService
+
+# Ro'yxat necha soniya saqlanadi
+BOT_LIST_CACHE_TTL = int(os.getenv('BOT_LIST_CACHE_TTL', '300'))
+
+_entries = {}
+_lock = threading.Lock()
+
+
+def sales_version(db):
+    """Sotuvlar o'zgarganini bildiruvchi arzon agregat (tasdiqlanganlar soni ham kiradi)"""
+    return tuple(db.query(
+        func.count(Sale.id), func.max(Sale.id), func.sum(Sale.total_amount),
+        func.sum(case((AnalyticsService.approved_sales_filter(), 1), else_=0))
+    ).one())
+
+
+def customers_version(db):
+    """Mijozlar (qarz balanslari) o'zgarganini bildiruvchi agregat"""
+    return tuple(db.query(
+        func.count(Customer.id), func.max(Customer.updated_at), func.sum(Customer.debt_balance)
+    ).one())
+
+
+def products_version(db):
+    """Mahsulotlar (qoldiqlar) o'zgarganini bildiruvchi agregat"""
+    return tuple(db.query(
+        func.count(Product.id),
+        func.max(Product.updated_at),
+        func.sum(Product.packages_in_stock * Product.pieces_per_package + Product.pieces_in_stock)
+    ).one())
+
+
+def products_sales_version(db):
+    """Sotilmagan mahsulotlar ro'yxati uchun: mahsulotlar va sotuvlar versiyasi"""
+    return products_version(db) + sales_version(db)
+
+
+def rank_debtors(db):
+    """Qarzdorlar qarz bo'yicha kamayish tartibida, qo'shimcha: jami qarz"""
+    ids = [row.id for row in db.query(Customer.id).filter(Customer.debt_balance > 0).order_by(Customer.debt_balance.desc()).all()]
+    grand_total = db.query(func.sum(Customer.debt_balance)).filter(Customer.debt_balance > 0).scalar() or 0
+    return ids, grand_total
+
+
+def rank_low_stock(db, include_limit=False):
+    """
+    Kam qolgan mahsulotlar (10 donadan kam), qoldiq bo'yicha o'sish tartibida.
+    include_limit=True: 10 dona ham kiradi (ovozli buyruqdagi avvalgi chegara).
+    """
+    stock = Product.packages_in_stock * Product.pieces_per_package + Product.pieces_in_stock
+    condition = stock <= 10 if include_limit else stock < 10
+    ids = [row.id for row in db.query(Product.id).filter(condition).order_by(stock).all()]
+    return ids, None
+
+
+def rank_voice_low_stock(db):
+    """Ovozli buyruq uchun kam qolgan mahsulotlar (10 dona va undan kam)"""
+    return rank_low_stock(db, include_limit=True)
+
+
+def _prune(now):
+    expired = [key for key, entry in _entries.items() if now - entry['created_at'] > BOT_LIST_CACHE_TTL]
+    for key in expired:
+        del _entries[key]
+
+
+def get_ranked_list(db, chat_id, list_name, page, version_fn, rank_fn):
+    """
+    Chat uchun tartiblangan ro'yxatni olish.
+
+    rank_fn(db) -> (items, extra): to'liq tartiblangan ro'yxat (ID yoki kichik tuple'lar)
+    va ixtiyoriy qo'shimcha ma'lumot (masalan, jami qarz).
+    version_fn(db) faqat birinchi sahifada yoki kesh bo'lmaganda chaqiriladi.
+    """
+    key = (chat_id, list_name)
+    now = time.monotonic()
+    with _lock:
+        entry = _entries.get(key)
+    if entry is not None and now - entry['created_at'] > BOT_LIST_CACHE_TTL:
+        entry = None
+
+    version = None
+    if entry is not None and page == 0:
+        version = version_fn(db)
+        if version != entry['version']:
+            entry = None
+
+    if entry is None:
+        if version is None:
+            version = version_fn(db)
+        items, extra = rank_fn(db)
+        entry = {'items': items, 'extra': extra, 'version': version, 'created_at': now}
+        with _lock:
+            _prune(now)
+            _entries[key] = entry
+    return entry
+
+
+def get_page(entry, page, per_page):
+    """Keshlangan ro'yxatdan bitta sahifa: (sahifa elementlari, jami soni, sahifalar soni)"""
+    items = entry['items']
+    total = len(items)
+    total_pages = max(1, (total + per_page - 1) // per_page)
+    start = page * per_page
+    return items[start:start + per_page], total, total_pages
+
+
+def fetch_by_ids(db, model, ids):
+    """ID lar bo'yicha yozuvlarni berilgan tartibda olish"""
+    if not ids:
+        return []
+    rows = {row.id: row for row in db.query(model).filter(model.id.in_(ids)).all()}
+    return [rows[i] for i in ids if i in rows]
+
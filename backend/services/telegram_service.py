@@ -8,6 +8,25 @@ from dotenv import load_dotenv
 # Backend direktoryasini sys.path ga qo'shish
 sys.path.append(os.path.dirname(os.path.dirname(__file__)))
 
+try:
+    from services.telegram_db import run_db, shutdown_executor
+    from services.telegram_charts import send_bar_chart, shutdown_executor as shutdown_chart_executor
+    from services import telegram_list_cache as list_cache
+    from services.telegram_barcode import decode_photo, get_decode_stats, shutdown_executor as shutdown_barcode_executor
+    from services.telegram_voice import recognize_voice, VoiceQueueFull, shutdown_executor as shutdown_voice_executor
+    from services.receipt_batch_service import ReceiptBatchService
+    from services.job_service import JobService
+    from services.product_search_service import ProductSearchService
+except ImportError:
+    from telegram_db import run_db, shutdown_executor
+    from telegram_charts import send_bar_chart, shutdown_executor as shutdown_chart_executor
+    import telegram_list_cache as list_cache
+    from telegram_barcode import decode_photo, get_decode_stats, shutdown_executor as shutdown_barcode_executor
+    from telegram_voice import recognize_voice, VoiceQueueFull, shutdown_executor as shutdown_voice_executor
+    from receipt_batch_service import ReceiptBatchService
+    from job_service import JobService
+    from product_search_service import ProductSearchService
+
 load_dotenv(os.path.join(os.path.dirname(__file__), '..', '.env'))
 TELEGRAM_TOKEN = os.getenv('TELEGRAM_TOKEN') or 'TOKENNI_BU_YERGA_QO`YING'
 ADMIN_CHAT_IDS = [int(x) for x in (os.getenv('ADMIN_CHAT_IDS') or '').split(',') if x.strip().isdigit()]
@@ -353,112 +372,102 @@ async def handle_search_input(update: Update, context: ContextTypes.DEFAULT_TYPE
         return
     
     try:
-        from sqlalchemy.orm import Session
-        from database import SessionLocal
-        from models import Product, Customer
+        from models import Customer
         
-        db: Session = SessionLocal()
-        try:
-            if search_type == 'product_search':
-                # Mahsulot qidirish
-                products = db.query(Product).filter(
-                    (Product.name.ilike(f'%{search_query}%')) | 
-                    (Product.barcode.ilike(f'%{search_query}%')) |
-                    (Product.brand.ilike(f'%{search_query}%'))
-                ).limit(20).all()  # Ko'proq natija ko'rsatish - 20 tagacha
-                
-                if not products:
-                    text = f"❌ '{search_query}' bo'yicha mahsulot topilmadi"
-                    keyboard = [[InlineKeyboardButton("🔄 Qayta qidirish", callback_data='search_product')],
-                               [InlineKeyboardButton("⬅️ Orqaga", callback_data='search_menu')]]
-                    context.user_data.pop('waiting_for', None)
-                    await update.message.reply_text(text, reply_markup=InlineKeyboardMarkup(keyboard))
-                else:
-                    context.user_data.pop('waiting_for', None)
-                    
-                    # Har bir mahsulot uchun rasm va ma'lumot yuborish
-                    for i, p in enumerate(products, 1):
-                        caption = f"🏷 {p.name}\n"
-                        if p.brand:
-                            caption += f"Brend: {p.brand}\n"
-                        if p.barcode:
-                            caption += f"Barcode: {p.barcode}\n"
-                        caption += f"Qoldiq: {p.packages_in_stock} qop, {p.pieces_in_stock} dona\n"
-                        caption += f"Jami: {p.packages_in_stock * p.pieces_per_package + p.pieces_in_stock} dona\n"
-                        caption += f"Narxi: {p.wholesale_price:,.0f} so'm"
-                        
-                        # Sotuv tugmasi
-                        keyboard = [[InlineKeyboardButton("🛒 Sotuv qilish", callback_data=f'sell_product_{p.id}')]]
-                        
-                        # Rasm bilan yuborish
-                        import os
-                        if p.image_url and os.path.exists(os.path.join(os.path.dirname(__file__), '..', '..', p.image_url.lstrip('/'))):
-                            photo_path = os.path.join(os.path.dirname(__file__), '..', '..', p.image_url.lstrip('/'))
-                            try:
-                                with open(photo_path, 'rb') as photo:
-                                    await update.message.reply_photo(
-                                        photo=photo,
-                                        caption=caption,
-                                        reply_markup=InlineKeyboardMarkup(keyboard)
-                                    )
-                            except Exception as e:
-                                logging.error(f"Photo send error: {e}")
-                                await update.message.reply_text(caption, reply_markup=InlineKeyboardMarkup(keyboard))
-                        else:
-                            await update.message.reply_text(caption, reply_markup=InlineKeyboardMarkup(keyboard))
-                    
-                    # Oxirgi xabar - qayta qidirish
-                    final_keyboard = [[InlineKeyboardButton("🔄 Qayta qidirish", callback_data='search_product')],
-                                     [InlineKeyboardButton("⬅️ Orqaga", callback_data='search_menu')]]
-                    await update.message.reply_text(
-                        f"📦 Topildi: {len(products)} ta mahsulot",
-                        reply_markup=InlineKeyboardMarkup(final_keyboard)
-                    )
+        if search_type == 'product_search':
+            # Mahsulot qidirish (FTS indeks, lotin/kirill va o'/oʻ farqlarisiz)
+            products = await run_db(lambda db: ProductSearchService.search(db, search_query, limit=20))  # 20 tagacha
             
-            elif search_type == 'customer_search':
-                # Mijoz qidirish
-                customers = db.query(Customer).filter(
-                    (Customer.name.ilike(f'%{search_query}%')) | 
-                    (Customer.phone.ilike(f'%{search_query}%'))
-                ).limit(10).all()
+            if not products:
+                text = f"❌ '{search_query}' bo'yicha mahsulot topilmadi"
+                keyboard = [[InlineKeyboardButton("🔄 Qayta qidirish", callback_data='search_product')],
+                           [InlineKeyboardButton("⬅️ Orqaga", callback_data='search_menu')]]
+                context.user_data.pop('waiting_for', None)
+                await update.message.reply_text(text, reply_markup=InlineKeyboardMarkup(keyboard))
+            else:
+                context.user_data.pop('waiting_for', None)
                 
-                if not customers:
-                    text = f"❌ '{search_query}' bo'yicha mijoz topilmadi"
-                    keyboard = [[InlineKeyboardButton("🔄 Qayta qidirish", callback_data='search_customer')],
-                               [InlineKeyboardButton("⬅️ Orqaga", callback_data='search_menu')]]
-                else:
-                    text = f"👥 TOPILGAN MIJOZLAR ({len(customers)}):\n\n"
-                    for c in customers:
-                        text += f"👤 {c.name}\n"
-                        text += f"   📞 {c.phone}\n"
-                        text += f"   Turi: {c.customer_type.value}\n"
-                        if c.debt_balance > 0:
-                            text += f"   💰 Qarzi: {c.debt_balance:,.0f} so'm\n"
-                        text += "\n"
+                # Har bir mahsulot uchun rasm va ma'lumot yuborish
+                for i, p in enumerate(products, 1):
+                    caption = f"🏷 {p.name}\n"
+                    if p.brand:
+                        caption += f"Brend: {p.brand}\n"
+                    if p.barcode:
+                        caption += f"Barcode: {p.barcode}\n"
+                    caption += f"Qoldiq: {p.packages_in_stock} qop, {p.pieces_in_stock} dona\n"
+                    caption += f"Jami: {p.packages_in_stock * p.pieces_per_package + p.pieces_in_stock} dona\n"
+                    caption += f"Narxi: {p.wholesale_price:,.0f} so'm"
                     
-                    keyboard = [[InlineKeyboardButton("🔄 Qayta qidirish", callback_data='search_customer')],
-                               [InlineKeyboardButton("⬅️ Orqaga", callback_data='search_menu')]]
+                    # Sotuv tugmasi
+                    keyboard = [[InlineKeyboardButton("🛒 Sotuv qilish", callback_data=f'sell_product_{p.id}')]]
+                    
+                    # Rasm bilan yuborish
+                    import os
+                    if p.image_url and os.path.exists(os.path.join(os.path.dirname(__file__), '..', '..', p.image_url.lstrip('/'))):
+                        photo_path = os.path.join(os.path.dirname(__file__), '..', '..', p.image_url.lstrip('/'))
+                        try:
+                            with open(photo_path, 'rb') as photo:
+                                await update.message.reply_photo(
+                                    photo=photo,
+                                    caption=caption,
+                                    reply_markup=InlineKeyboardMarkup(keyboard)
+                                )
+                        except Exception as e:
+                            logging.error(f"Photo send error: {e}")
+                            await update.message.reply_text(caption, reply_markup=InlineKeyboardMarkup(keyboard))
+                    else:
+                        await update.message.reply_text(caption, reply_markup=InlineKeyboardMarkup(keyboard))
                 
-                context.user_data.pop('waiting_for', None)
-                await update.message.reply_text(text, reply_markup=InlineKeyboardMarkup(keyboard))
-            
-            elif search_type == 'inline_sale_quantity':
-                # Inline sotuv miqdori
-                await handle_inline_sale_quantity(update, context, search_query)
-            
-            elif search_type == 'inline_sale_customer':
-                # Inline sotuv mijoz tanlov
-                await handle_inline_sale_customer_selection(update, context, search_query)
+                # Oxirgi xabar - qayta qidirish
+                final_keyboard = [[InlineKeyboardButton("🔄 Qayta qidirish", callback_data='search_product')],
+                                 [InlineKeyboardButton("⬅️ Orqaga", callback_data='search_menu')]]
+                await update.message.reply_text(
+                    f"📦 Topildi: {len(products)} ta mahsulot",
+                    reply_markup=InlineKeyboardMarkup(final_keyboard)
+                )
+        
+        elif search_type == 'customer_search':
+            # Mijoz qidirish
+            customers = await run_db(lambda db: db.query(Customer).filter(
+                (Customer.name.ilike(f'%{search_query}%')) | 
+                (Customer.phone.ilike(f'%{search_query}%'))
+            ).limit(10).all())
             
-            elif search_type == 'inline_sale_payment':
-                # Inline sotuv to'lov miqdori
-                await handle_inline_sale_payment(update, context, search_query)
+            if not customers:
+                text = f"❌ '{search_query}' bo'yicha mijoz topilmadi"
+                keyboard = [[InlineKeyboardButton("🔄 Qayta qidirish", callback_data='search_customer')],
+                           [InlineKeyboardButton("⬅️ Orqaga", callback_data='search_menu')]]
+            else:
+                text = f"👥 TOPILGAN MIJOZLAR ({len(customers)}):\n\n"
+                for c in customers:
+                    text += f"👤 {c.name}\n"
+                    text += f"   📞 {c.phone}\n"
+                    text += f"   Turi: {c.customer_type.value}\n"
+                    if c.debt_balance > 0:
+                        text += f"   💰 Qarzi: {c.debt_balance:,.0f} so'm\n"
+                    text += "\n"
+                
+                keyboard = [[InlineKeyboardButton("🔄 Qayta qidirish", callback_data='search_customer')],
+                           [InlineKeyboardButton("⬅️ Orqaga", callback_data='search_menu')]]
             
-            elif search_type == 'payment_amount':
-                # To'lov qabul qilish
-                await handle_payment_amount_input(update, context, search_query)
-        finally:
-            db.close()
+            context.user_data.pop('waiting_for', None)
+            await update.message.reply_text(text, reply_markup=InlineKeyboardMarkup(keyboard))
+        
+        elif search_type == 'inline_sale_quantity':
+            # Inline sotuv miqdori
+            await handle_inline_sale_quantity(update, context, search_query)
+        
+        elif search_type == 'inline_sale_customer':
+            # Inline sotuv mijoz tanlov
+            await handle_inline_sale_customer_selection(update, context, search_query)
+        
+        elif search_type == 'inline_sale_payment':
+            # Inline sotuv to'lov miqdori
+            await handle_inline_sale_payment(update, context, search_query)
+        
+        elif search_type == 'payment_amount':
+            # To'lov qabul qilish
+            await handle_payment_amount_input(update, context, search_query)
     except Exception as e:
         logging.error(f"Search error: {str(e)}")
         context.user_data.pop('waiting_for', None)
@@ -480,46 +489,40 @@ async def handle_inline_sale_quantity(update: Update, context: ContextTypes.DEFA
             )
             return
         
-        from sqlalchemy.orm import Session
-        from database import SessionLocal
         from models import Product, Customer
         
-        db: Session = SessionLocal()
-        try:
-            product_id = context.user_data.get('inline_sale_product_id')
-            if not product_id:
-                await update.message.reply_text("❌ Mahsulot ma'lumoti topilmadi.")
-                return
-            
-            product = db.query(Product).filter(Product.id == product_id).first()
-            if not product:
-                await update.message.reply_text("❌ Mahsulot topilmadi.")
-                return
-            
-            # Mavjudlikni tekshirish
-            total_pieces = product.packages_in_stock * product.pieces_per_package + product.pieces_in_stock
-            if quantity > total_pieces:
-                await update.message.reply_text(
-                    f"❌ Omborда {total_pieces} dona bor, {quantity} ta so'ralgan.",
-                    reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("❌ Bekor qilish", callback_data='search_product')]])
-                )
-                return
-            
-            # Miqdor va narxni saqlash
-            context.user_data['inline_sale_quantity'] = quantity
-            
-            # Mijoz tanlashni so'rash
-            text = f"✅ MAHSULOT TANLANDI:\n\n"
-            text += f"📦 Mahsulot: {product.name}\n"
-            text += f"🔢 Miqdor: {quantity} dona\n\n"
-            text += "Mijoz ismini yozing:"
-            
-            context.user_data['waiting_for'] = 'inline_sale_customer'
-            
-            keyboard = [[InlineKeyboardButton("❌ Bekor qilish", callback_data='search_product')]]
-            await update.message.reply_text(text, reply_markup=InlineKeyboardMarkup(keyboard))
-        finally:
-            db.close()
+        product_id = context.user_data.get('inline_sale_product_id')
+        if not product_id:
+            await update.message.reply_text("❌ Mahsulot ma'lumoti topilmadi.")
+            return
+        
+        product = await run_db(lambda db: db.query(Product).filter(Product.id == product_id).first())
+        if not product:
+            await update.message.reply_text("❌ Mahsulot topilmadi.")
+            return
+        
+        # Mavjudlikni tekshirish
+        total_pieces = product.packages_in_stock * product.pieces_per_package + product.pieces_in_stock
+        if quantity > total_pieces:
+            await update.message.reply_text(
+                f"❌ Omborда {total_pieces} dona bor, {quantity} ta so'ralgan.",
+                reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("❌ Bekor qilish", callback_data='search_product')]])
+            )
+            return
+        
+        # Miqdor va narxni saqlash
+        context.user_data['inline_sale_quantity'] = quantity
+        
+        # Mijoz tanlashni so'rash
+        text = f"✅ MAHSULOT TANLANDI:\n\n"
+        text += f"📦 Mahsulot: {product.name}\n"
+        text += f"🔢 Miqdor: {quantity} dona\n\n"
+        text += "Mijoz ismini yozing:"
+        
+        context.user_data['waiting_for'] = 'inline_sale_customer'
+        
+        keyboard = [[InlineKeyboardButton("❌ Bekor qilish", callback_data='search_product')]]
+        await update.message.reply_text(text, reply_markup=InlineKeyboardMarkup(keyboard))
     except Exception as e:
         await update.message.reply_text(f"❌ Xatolik: {str(e)}")
 
@@ -533,22 +536,19 @@ async def handle_inline_sale_customer_selection(update: Update, context: Context
         
         from sqlalchemy.orm import Session
         try:
-            from database import SessionLocal
             from models import Product, Customer, Seller
             from services.sale_service import SaleService
             from schemas import SaleCreate, SaleItemCreate
             from services.customer_service import CustomerService
             from schemas import CustomerCreate
         except ImportError:
-            from database import SessionLocal
             from models import Product, Customer, Seller
             from sale_service import SaleService
             from schemas import SaleCreate, SaleItemCreate
             from customer_service import CustomerService
             from schemas import CustomerCreate
         
-        db: Session = SessionLocal()
-        try:
+        def _prepare_payment(db: Session):
             # Mijozni topish yoki yaratish
             customer = db.query(Customer).filter(Customer.name.ilike(f'%{customer_name}%')).first()
             if not customer:
@@ -562,21 +562,18 @@ async def handle_inline_sale_customer_selection(update: Update, context: Context
             # Admin (bot orqali sotuv uchun birinchi faol sotuvchini topamiz)
             admin_seller = db.query(Seller).filter(Seller.is_active == True).first()
             if not admin_seller:
-                await update.message.reply_text("❌ Faol sotuvchi topilmadi.")
-                return
+                return "❌ Faol sotuvchi topilmadi.", None
             
             # Sotuv ma'lumotlarini olish
             product_id = context.user_data.get('inline_sale_product_id')
             quantity = context.user_data.get('inline_sale_quantity')
             
             if not all([product_id, quantity]):
-                await update.message.reply_text("❌ Sotuv ma'lumotlari noto'liq.")
-                return
+                return "❌ Sotuv ma'lumotlari noto'liq.", None
             
             product = db.query(Product).filter(Product.id == product_id).first()
             if not product:
-                await update.message.reply_text("❌ Mahsulot topilmadi.")
-                return
+                return "❌ Mahsulot topilmadi.", None
             
             # Narx hisoblaash (mijoz turiga qarab)
             if customer.customer_type.value == 'wholesale':
@@ -606,9 +603,10 @@ async def handle_inline_sale_customer_selection(update: Update, context: Context
             context.user_data['waiting_for'] = 'inline_sale_payment'
             
             keyboard = [[InlineKeyboardButton("❌ Bekor qilish", callback_data='search_product')]]
-            await update.message.reply_text(payment_text, reply_markup=InlineKeyboardMarkup(keyboard))
-        finally:
-            db.close()
+            return payment_text, InlineKeyboardMarkup(keyboard)
+
+        text, reply_markup = await run_db(_prepare_payment)
+        await update.message.reply_text(text, reply_markup=reply_markup)
     except Exception as e:
         # Ma'lumotlarni tozalash
         context.user_data.pop('inline_sale_product_id', None)
@@ -641,13 +639,14 @@ async def handle_inline_sale_payment(update: Update, context: ContextTypes.DEFAU
         sys.path.append(os.path.dirname(os.path.dirname(__file__)))
         
         from sqlalchemy.orm import Session
-        from database import SessionLocal
         from models import Product, Customer, Seller
         from sale_service import SaleService
         from schemas import SaleCreate, SaleItemCreate
         
-        db: Session = SessionLocal()
-        try:
+        # Sotuv jarayonidagi qo'shimcha ogohlantirishlar (qarz limiti va h.k.)
+        notices = []
+        
+        def _create_sale(db: Session):
             # Ma'lumotlarni olish
             product_id = context.user_data.get('inline_sale_product_id')
             quantity = context.user_data.get('inline_sale_quantity')
@@ -656,14 +655,12 @@ async def handle_inline_sale_payment(update: Update, context: ContextTypes.DEFAU
             total_price = context.user_data.get('inline_sale_total_price')
             
             if not all([product_id, quantity, customer, unit_price, total_price]):
-                await update.message.reply_text("❌ Sotuv ma'lumotlari noto'liq.")
-                return
+                return "❌ Sotuv ma'lumotlari noto'liq.", None
             
             # Admin seller
             admin_seller = db.query(Seller).filter(Seller.is_active == True).first()
             if not admin_seller:
-                await update.message.reply_text("❌ Faol sotuvchi topilmadi.")
-                return
+                return "❌ Faol sotuvchi topilmadi.", None
             
             # To'lov validatsiyasi va admin tasdiq logikasi (sales panel kabi)
             requires_approval = False
@@ -679,7 +676,7 @@ async def handle_inline_sale_payment(update: Update, context: ContextTypes.DEFAU
                 if customer.debt_limit and customer.debt_limit > 0:
                     new_debt = (customer.debt_balance or 0) + debt_amount
                     if new_debt > customer.debt_limit:
-                        await update.message.reply_text(
+                        notices.append(
                             f"❌ QARZ LIMITI OSHIB KETADI!\n\n"
                             f"👤 Mijoz: {customer.name}\n"
                             f"💰 Joriy qarz: {customer.debt_balance:,.0f} so'm\n"
@@ -753,9 +750,12 @@ async def handle_inline_sale_payment(update: Update, context: ContextTypes.DEFAU
             
             keyboard = [[InlineKeyboardButton("🔍 Boshqa mahsulot qidirish", callback_data='search_product')],
                        [InlineKeyboardButton("🏠 Bosh menyu", callback_data='back_main')]]
-            await update.message.reply_text(text, reply_markup=InlineKeyboardMarkup(keyboard))
-        finally:
-            db.close()
+            return text, InlineKeyboardMarkup(keyboard)
+
+        text, reply_markup = await run_db(_create_sale)
+        for notice in notices:
+            await update.message.reply_text(notice)
+        await update.message.reply_text(text, reply_markup=reply_markup)
     except Exception as e:
         # Ma'lumotlarni tozalash
         context.user_data.pop('inline_sale_product_id', None)
@@ -808,42 +808,40 @@ async def stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
     try:
         from sqlalchemy.orm import Session
         try:
-            from database import SessionLocal
-            from services.sale_service import SaleService
+            from services.analytics_service import AnalyticsService
             from services.product_service import ProductService
             from services.debt_service import DebtService
         except ImportError:
-            from database import SessionLocal
-            from sale_service import SaleService
+            from analytics_service import AnalyticsService
             from product_service import ProductService
             from debt_service import DebtService
         
-        db: Session = SessionLocal()
-        try:
-            stats_data = SaleService.get_statistics(db)
+        def _build(db: Session):
+            stats_data = AnalyticsService.get_range_totals(db, with_profit=True)
             inventory = ProductService.get_inventory_total_value(db)
             total_debt = DebtService.get_total_debt(db)
             
             text = (
                 f"📊 UMUMIY STATISTIKA (barcha vaqt):\n\n"
-                f"💰 Sotuvlar soni: {stats_data['total_sales']}\n"
-                f"💵 Umumiy summa: {stats_data['total_amount']:,} so'm\n"
-                f"📊 Foyda: {stats_data['total_profit']:,} so'm\n"
-                f"📈 O'rtacha sotuv: {stats_data['average_sale']:,} so'm\n"
+                f"💰 Sotuvlar soni: {stats_data['count']}\n"
+                f"💵 Umumiy summa: {stats_data['amount']:,.0f} so'm\n"
+                f"📊 Foyda: {stats_data['profit']:,.0f} so'm\n"
+                f"📈 O'rtacha sotuv: {stats_data['average']:,.0f} so'm\n"
                 f"\n"
                 f"🗃 Ombor (kelgan narx): {inventory['total_value_by_cost']:,} so'm\n"
                 f"🗃 Ombor (ulgurji): {inventory['total_value_by_wholesale']:,} so'm\n"
                 f"\n"
                 f"💸 Jami qarzdorlik: {total_debt:,} so'm\n"
             )
-            
-            # Agar callback query bo'lsa
-            if update.callback_query:
-                await update.callback_query.edit_message_text(text, reply_markup=get_main_keyboard())
-            else:
-                await update.message.reply_text(text, reply_markup=get_main_keyboard())
-        finally:
-            db.close()
+            return text
+
+        text = await run_db(_build)
+
+        # Agar callback query bo'lsa
+        if update.callback_query:
+            await update.callback_query.edit_message_text(text, reply_markup=get_main_keyboard())
+        else:
+            await update.message.reply_text(text, reply_markup=get_main_keyboard())
     except Exception as e:
         error_msg = f"❌ Xatolik: {str(e)}"
         if update.callback_query:
@@ -858,33 +856,30 @@ async def today(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Bugungi sotuvlar statistikasi"""
     try:
         from sqlalchemy.orm import Session
-        from database import SessionLocal
-        from sale_service import SaleService
-        from datetime import datetime, timedelta
+        from analytics_service import AnalyticsService
         from utils import get_uzbekistan_now
         
-        db: Session = SessionLocal()
-        try:
+        def _build(db: Session):
             now = get_uzbekistan_now()
-            start = now.replace(hour=0, minute=0, second=0, microsecond=0).isoformat()
-            end = now.isoformat()
+            start = AnalyticsService.period_start(now, 'day')
             
-            stats = SaleService.get_statistics(db, start_date=start, end_date=end)
+            stats = AnalyticsService.get_range_totals(db, start, now, with_profit=True)
             
             text = (
                 f"📅 BUGUNGI STATISTIKA ({now.strftime('%d.%m.%Y')})\n\n"
-                f"💰 Sotuvlar soni: {stats['total_sales']}\n"
-                f"💵 Umumiy summa: {stats['total_amount']:,.0f} so'm\n"
-                f"📊 Foyda: {stats['total_profit']:,.0f} so'm\n"
-                f"📈 O'rtacha sotuv: {stats['average_sale']:,.0f} so'm\n"
+                f"💰 Sotuvlar soni: {stats['count']}\n"
+                f"💵 Umumiy summa: {stats['amount']:,.0f} so'm\n"
+                f"📊 Foyda: {stats['profit']:,.0f} so'm\n"
+                f"📈 O'rtacha sotuv: {stats['average']:,.0f} so'm\n"
             )
-            
-            if update.callback_query:
-                await update.callback_query.edit_message_text(text, reply_markup=get_main_keyboard())
-            else:
-                await update.message.reply_text(text, reply_markup=get_main_keyboard())
-        finally:
-            db.close()
+            return text
+
+        text = await run_db(_build)
+
+        if update.callback_query:
+            await update.callback_query.edit_message_text(text, reply_markup=get_main_keyboard())
+        else:
+            await update.message.reply_text(text, reply_markup=get_main_keyboard())
     except Exception as e:
         error_msg = f"❌ Xatolik: {str(e)}"
         if update.callback_query:
@@ -896,34 +891,32 @@ async def weekly(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Haftalik statistika"""
     try:
         from sqlalchemy.orm import Session
-        from database import SessionLocal
-        from sale_service import SaleService
-        from datetime import datetime, timedelta
+        from analytics_service import AnalyticsService
         from utils import get_uzbekistan_now
         
-        db: Session = SessionLocal()
-        try:
+        def _build(db: Session):
             now = get_uzbekistan_now()
-            start = (now - timedelta(days=7)).replace(hour=0, minute=0, second=0, microsecond=0).isoformat()
-            end = now.isoformat()
+            # Bugun bilan birga oxirgi 7 kun
+            start = AnalyticsService.shift_period(AnalyticsService.period_start(now, 'day'), 'day', -6)
             
-            stats = SaleService.get_statistics(db, start_date=start, end_date=end)
+            stats = AnalyticsService.get_range_totals(db, start, now, with_profit=True)
             
             text = (
                 f"📆 HAFTALIK STATISTIKA (7 kun)\n\n"
-                f"💰 Sotuvlar soni: {stats['total_sales']}\n"
-                f"💵 Umumiy summa: {stats['total_amount']:,.0f} so'm\n"
-                f"📊 Foyda: {stats['total_profit']:,.0f} so'm\n"
-                f"📈 O'rtacha sotuv: {stats['average_sale']:,.0f} so'm\n"
-                f"📉 Kunlik o'rtacha: {stats['total_amount']/7:,.0f} so'm\n"
+                f"💰 Sotuvlar soni: {stats['count']}\n"
+                f"💵 Umumiy summa: {stats['amount']:,.0f} so'm\n"
+                f"📊 Foyda: {stats['profit']:,.0f} so'm\n"
+                f"📈 O'rtacha sotuv: {stats['average']:,.0f} so'm\n"
+                f"📉 Kunlik o'rtacha: {stats['amount']/7:,.0f} so'm\n"
             )
-            
-            if update.callback_query:
-                await update.callback_query.edit_message_text(text, reply_markup=get_main_keyboard())
-            else:
-                await update.message.reply_text(text, reply_markup=get_main_keyboard())
-        finally:
-            db.close()
+            return text
+
+        text = await run_db(_build)
+
+        if update.callback_query:
+            await update.callback_query.edit_message_text(text, reply_markup=get_main_keyboard())
+        else:
+            await update.message.reply_text(text, reply_markup=get_main_keyboard())
     except Exception as e:
         error_msg = f"❌ Xatolik: {str(e)}"
         if update.callback_query:
@@ -935,34 +928,32 @@ async def monthly(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Oylik statistika"""
     try:
         from sqlalchemy.orm import Session
-        from database import SessionLocal
-        from sale_service import SaleService
-        from datetime import datetime, timedelta
+        from analytics_service import AnalyticsService
         from utils import get_uzbekistan_now
         
-        db: Session = SessionLocal()
-        try:
+        def _build(db: Session):
             now = get_uzbekistan_now()
-            start = (now - timedelta(days=30)).replace(hour=0, minute=0, second=0, microsecond=0).isoformat()
-            end = now.isoformat()
+            # Bugun bilan birga oxirgi 30 kun
+            start = AnalyticsService.shift_period(AnalyticsService.period_start(now, 'day'), 'day', -29)
             
-            stats = SaleService.get_statistics(db, start_date=start, end_date=end)
+            stats = AnalyticsService.get_range_totals(db, start, now, with_profit=True)
             
             text = (
                 f"📈 OYLIK STATISTIKA (30 kun)\n\n"
-                f"💰 Sotuvlar soni: {stats['total_sales']}\n"
-                f"💵 Umumiy summa: {stats['total_amount']:,.0f} so'm\n"
-                f"📊 Foyda: {stats['total_profit']:,.0f} so'm\n"
-                f"📈 O'rtacha sotuv: {stats['average_sale']:,.0f} so'm\n"
-                f"📉 Kunlik o'rtacha: {stats['total_amount']/30:,.0f} so'm\n"
+                f"💰 Sotuvlar soni: {stats['count']}\n"
+                f"💵 Umumiy summa: {stats['amount']:,.0f} so'm\n"
+                f"📊 Foyda: {stats['profit']:,.0f} so'm\n"
+                f"📈 O'rtacha sotuv: {stats['average']:,.0f} so'm\n"
+                f"📉 Kunlik o'rtacha: {stats['amount']/30:,.0f} so'm\n"
             )
-            
-            if update.callback_query:
-                await update.callback_query.edit_message_text(text, reply_markup=get_main_keyboard())
-            else:
-                await update.message.reply_text(text, reply_markup=get_main_keyboard())
-        finally:
-            db.close()
+            return text
+
+        text = await run_db(_build)
+
+        if update.callback_query:
+            await update.callback_query.edit_message_text(text, reply_markup=get_main_keyboard())
+        else:
+            await update.message.reply_text(text, reply_markup=get_main_keyboard())
     except Exception as e:
         error_msg = f"❌ Xatolik: {str(e)}"
         if update.callback_query:
@@ -974,31 +965,32 @@ async def top_products(update: Update, context: ContextTypes.DEFAULT_TYPE, page:
     """Eng ko'p sotiladigan mahsulotlar"""
     try:
         from sqlalchemy.orm import Session
-        from database import SessionLocal
-        from sale_service import SaleService
+        from models import Product
+        from analytics_service import AnalyticsService
         
         ITEMS_PER_PAGE = 10
+        chat_id = update.effective_chat.id
         
-        db: Session = SessionLocal()
-        try:
-            stats = SaleService.get_statistics(db)
-            all_top = stats.get('top_products', [])
-            
-            total = len(all_top)
-            total_pages = max(1, (total + ITEMS_PER_PAGE - 1) // ITEMS_PER_PAGE)
-            
+        def _rank(db: Session):
+            # Faqat tasdiqlangan sotuvlar (boshqa bot hisobotlari kabi)
+            rows = AnalyticsService.get_top_products(db, limit=None)
+            return [(r['product_id'], r['quantity'], r['amount']) for r in rows], None
+        
+        def _build(db: Session):
+            entry = list_cache.get_ranked_list(db, chat_id, 'top_products', page, list_cache.sales_version, _rank)
+            top, total, total_pages = list_cache.get_page(entry, page, ITEMS_PER_PAGE)
             start_idx = page * ITEMS_PER_PAGE
-            end_idx = start_idx + ITEMS_PER_PAGE
-            top = all_top[start_idx:end_idx]
+            names = dict(db.query(Product.id, Product.name).filter(Product.id.in_([r[0] for r in top])).all()) if top else {}
             
-            if not all_top:
+            if total == 0:
                 text = "Hozircha sotuvlar yo'q."
             else:
                 text = f"🏆 TOP MAHSULOTLAR ({page + 1}/{total_pages}):\n\n"
-                for i, product in enumerate(top, 1 + start_idx):
-                    text += f"{i}. {product['name']}\n"
-                    text += f"   Soni: {product['quantity']} dona\n"
-                    text += f"   Summa: {product['amount']:,.0f} so'm\n\n"
+                for i, (product_id, quantity, amount) in enumerate(top, 1 + start_idx):
+                    name = names.get(product_id, "O'chirilgan mahsulot")
+                    text += f"{i}. {name}\n"
+                    text += f"   Soni: {quantity} dona\n"
+                    text += f"   Summa: {amount:,.0f} so'm\n\n"
             
             # Pagination tugmalari
             buttons = []
@@ -1014,13 +1006,14 @@ async def top_products(update: Update, context: ContextTypes.DEFAULT_TYPE, page:
             
             buttons.append([InlineKeyboardButton("⬅️ Orqaga", callback_data='products_menu')])
             keyboard = InlineKeyboardMarkup(buttons)
-            
-            if update.callback_query:
-                await update.callback_query.edit_message_text(text, reply_markup=keyboard)
-            else:
-                await update.message.reply_text(text, reply_markup=keyboard)
-        finally:
-            db.close()
+            return text, keyboard
+
+        text, keyboard = await run_db(_build)
+
+        if update.callback_query:
+            await update.callback_query.edit_message_text(text, reply_markup=keyboard)
+        else:
+            await update.message.reply_text(text, reply_markup=keyboard)
     except Exception as e:
         error_msg = f"❌ Xatolik: {str(e)}"
         if update.callback_query:
@@ -1032,23 +1025,17 @@ async def debtors(update: Update, context: ContextTypes.DEFAULT_TYPE, page: int
     """Qarzdorlar ro'yxati"""
     try:
         from sqlalchemy.orm import Session
-        from database import SessionLocal
         from models import Customer
         
         ITEMS_PER_PAGE = 10
+        chat_id = update.effective_chat.id
         
-        db: Session = SessionLocal()
-        try:
-            query = db.query(Customer).filter(Customer.debt_balance > 0).order_by(Customer.debt_balance.desc())
-            
-            total = query.count()
-            total_pages = max(1, (total + ITEMS_PER_PAGE - 1) // ITEMS_PER_PAGE)
-            
-            customers = query.offset(page * ITEMS_PER_PAGE).limit(ITEMS_PER_PAGE).all()
-            
-            # Jami qarzni hisoblash
-            all_debtors = db.query(Customer).filter(Customer.debt_balance > 0).all()
-            grand_total = sum(c.debt_balance for c in all_debtors)
+        def _build(db: Session):
+            # Ro'yxat bilan birga jami qarz ham keshlanadi
+            entry = list_cache.get_ranked_list(db, chat_id, 'debtors', page, list_cache.customers_version, list_cache.rank_debtors)
+            page_ids, total, total_pages = list_cache.get_page(entry, page, ITEMS_PER_PAGE)
+            customers = list_cache.fetch_by_ids(db, Customer, page_ids)
+            grand_total = entry['extra']
             
             if not customers:
                 text = "Qarzdor mijozlar yo'q."
@@ -1076,13 +1063,14 @@ async def debtors(update: Update, context: ContextTypes.DEFAULT_TYPE, page: int
             
             buttons.append([InlineKeyboardButton("⬅️ Orqaga", callback_data='customers_menu')])
             keyboard = InlineKeyboardMarkup(buttons)
-            
-            if update.callback_query:
-                await update.callback_query.edit_message_text(text, reply_markup=keyboard)
-            else:
-                await update.message.reply_text(text, reply_markup=keyboard)
-        finally:
-            db.close()
+            return text, keyboard
+
+        text, keyboard = await run_db(_build)
+
+        if update.callback_query:
+            await update.callback_query.edit_message_text(text, reply_markup=keyboard)
+        else:
+            await update.message.reply_text(text, reply_markup=keyboard)
     except Exception as e:
         error_msg = f"❌ Xatolik: {str(e)}"
         if update.callback_query:
@@ -1094,11 +1082,9 @@ async def stock(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Ombor ma'lumotlari"""
     try:
         from sqlalchemy.orm import Session
-        from database import SessionLocal
         from product_service import ProductService
         
-        db: Session = SessionLocal()
-        try:
+        def _build(db: Session):
             inventory = ProductService.get_inventory_total_value(db)
             low_stock = ProductService.get_products(db, low_stock_only=True, min_stock=10, limit=10)
             
@@ -1114,13 +1100,14 @@ async def stock(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 text += f"\n⚠️ KAM QOLGAN MAHSULOTLAR:\n"
                 for product in low_stock[:5]:
                     text += f"• {product.name}: {product.total_pieces} dona\n"
-            
-            if update.callback_query:
-                await update.callback_query.edit_message_text(text, reply_markup=get_main_keyboard())
-            else:
-                await update.message.reply_text(text, reply_markup=get_main_keyboard())
-        finally:
-            db.close()
+            return text
+
+        text = await run_db(_build)
+
+        if update.callback_query:
+            await update.callback_query.edit_message_text(text, reply_markup=get_main_keyboard())
+        else:
+            await update.message.reply_text(text, reply_markup=get_main_keyboard())
     except Exception as e:
         error_msg = f"❌ Xatolik: {str(e)}"
         if update.callback_query:
@@ -1132,11 +1119,9 @@ async def recent_sales(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """So'nggi sotuvlar"""
     try:
         from sqlalchemy.orm import Session
-        from database import SessionLocal
         from models import Sale
         
-        db: Session = SessionLocal()
-        try:
+        def _build(db: Session):
             sales = db.query(Sale).order_by(Sale.created_at.desc()).limit(10).all()
             
             if not sales:
@@ -1150,13 +1135,14 @@ async def recent_sales(update: Update, context: ContextTypes.DEFAULT_TYPE):
                     text += f"{i}. {time} - {customer_name}\n"
                     text += f"   Sotuvchi: {seller_name}\n"
                     text += f"   Summa: {sale.total_amount:,.0f} so'm\n\n"
-            
-            if update.callback_query:
-                await update.callback_query.edit_message_text(text, reply_markup=get_main_keyboard())
-            else:
-                await update.message.reply_text(text, reply_markup=get_main_keyboard())
-        finally:
-            db.close()
+            return text
+
+        text = await run_db(_build)
+
+        if update.callback_query:
+            await update.callback_query.edit_message_text(text, reply_markup=get_main_keyboard())
+        else:
+            await update.message.reply_text(text, reply_markup=get_main_keyboard())
     except Exception as e:
         error_msg = f"❌ Xatolik: {str(e)}"
         if update.callback_query:
@@ -1168,37 +1154,32 @@ async def top_customers(update: Update, context: ContextTypes.DEFAULT_TYPE, page
     """Top mijozlar"""
     try:
         from sqlalchemy.orm import Session
-        try:
-            from database import SessionLocal
-            from sale_service import SaleService
-        except ImportError:
-            import sys, os
-            sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
-            from database import SessionLocal
-            from services.sale_service import SaleService
+        from models import Customer
+        from analytics_service import AnalyticsService
         
         ITEMS_PER_PAGE = 10
+        chat_id = update.effective_chat.id
         
-        db: Session = SessionLocal()
-        try:
-            stats = SaleService.get_statistics(db)
-            all_top = stats.get('top_customers', [])
-            
-            total = len(all_top)
-            total_pages = max(1, (total + ITEMS_PER_PAGE - 1) // ITEMS_PER_PAGE)
-            
+        def _rank(db: Session):
+            # Faqat tasdiqlangan sotuvlar; mijozsiz sotuvlar hisobga olinmaydi
+            rows = AnalyticsService.get_top_customers(db, limit=None)
+            return [(r['customer_id'], r['count'], r['amount']) for r in rows], None
+        
+        def _build(db: Session):
+            entry = list_cache.get_ranked_list(db, chat_id, 'top_customers', page, list_cache.sales_version, _rank)
+            top, total, total_pages = list_cache.get_page(entry, page, ITEMS_PER_PAGE)
             start_idx = page * ITEMS_PER_PAGE
-            end_idx = start_idx + ITEMS_PER_PAGE
-            top = all_top[start_idx:end_idx]
+            names = dict(db.query(Customer.id, Customer.name).filter(Customer.id.in_([r[0] for r in top])).all()) if top else {}
             
-            if not all_top:
+            if total == 0:
                 text = "Hozircha mijozlar yo'q."
             else:
                 text = f"👥 TOP MIJOZLAR ({page + 1}/{total_pages}):\n\n"
-                for i, customer in enumerate(top, 1 + start_idx):
-                    text += f"{i}. {customer['name']}\n"
-                    text += f"   Sotuvlar: {customer['count']} ta\n"
-                    text += f"   Summa: {customer['amount']:,.0f} so'm\n\n"
+                for i, (customer_id, count, amount) in enumerate(top, 1 + start_idx):
+                    name = names.get(customer_id, "O'chirilgan mijoz")
+                    text += f"{i}. {name}\n"
+                    text += f"   Sotuvlar: {count} ta\n"
+                    text += f"   Summa: {amount:,.0f} so'm\n\n"
             
             # Pagination tugmalari
             buttons = []
@@ -1214,13 +1195,14 @@ async def top_customers(update: Update, context: ContextTypes.DEFAULT_TYPE, page
             
             buttons.append([InlineKeyboardButton("⬅️ Orqaga", callback_data='customers_menu')])
             keyboard = InlineKeyboardMarkup(buttons)
-            
-            if update.callback_query:
-                await update.callback_query.edit_message_text(text, reply_markup=keyboard)
-            else:
-                await update.message.reply_text(text, reply_markup=keyboard)
-        finally:
-            db.close()
+            return text, keyboard
+
+        text, keyboard = await run_db(_build)
+
+        if update.callback_query:
+            await update.callback_query.edit_message_text(text, reply_markup=keyboard)
+        else:
+            await update.message.reply_text(text, reply_markup=keyboard)
     except Exception as e:
         error_msg = f"❌ Xatolik: {str(e)}"
         if update.callback_query:
@@ -1232,37 +1214,36 @@ async def sellers_stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Sotuvchilar statistikasi"""
     try:
         from sqlalchemy.orm import Session
-        from database import SessionLocal
-        from models import Seller, Sale
-        from sqlalchemy import func
+        from models import Seller
+        from analytics_service import AnalyticsService
         
-        db: Session = SessionLocal()
-        try:
-            # Har bir sotuvchi bo'yicha statistika
-            sellers = db.query(
-                Seller.id,
-                Seller.name,
-                func.count(Sale.id).label('sales_count'),
-                func.sum(Sale.total_amount).label('total_amount')
-            ).outerjoin(Sale, Seller.id == Sale.seller_id).group_by(Seller.id, Seller.name).order_by(func.sum(Sale.total_amount).desc()).limit(10).all()
+        def _build(db: Session):
+            # Har bir sotuvchi bo'yicha statistika (faqat tasdiqlangan sotuvlar, bitta so'rov)
+            seller_totals = AnalyticsService.get_seller_totals(db)
+            sellers = sorted(
+                db.query(Seller.id, Seller.name).all(),
+                key=lambda seller: (-seller_totals.get(seller.id, {}).get('amount', 0), seller.id)
+            )[:10]
             
             if not sellers:
                 text = "Sotuvchilar yo'q."
             else:
                 text = "👨‍💼 SOTUVCHILAR REYTINGI:\n\n"
                 for i, seller in enumerate(sellers, 1):
-                    sales_count = seller.sales_count or 0
-                    total_amount = seller.total_amount or 0
+                    totals = seller_totals.get(seller.id, {})
+                    sales_count = totals.get('count', 0)
+                    total_amount = totals.get('amount', 0)
                     text += f"{i}. {seller.name}\n"
                     text += f"   Sotuvlar: {sales_count} ta\n"
                     text += f"   Summa: {total_amount:,.0f} so'm\n\n"
-            
-            if update.callback_query:
-                await update.callback_query.edit_message_text(text, reply_markup=get_main_keyboard())
-            else:
-                await update.message.reply_text(text, reply_markup=get_main_keyboard())
-        finally:
-            db.close()
+            return text
+
+        text = await run_db(_build)
+
+        if update.callback_query:
+            await update.callback_query.edit_message_text(text, reply_markup=get_main_keyboard())
+        else:
+            await update.message.reply_text(text, reply_markup=get_main_keyboard())
     except Exception as e:
         error_msg = f"❌ Xatolik: {str(e)}"
         if update.callback_query:
@@ -1274,31 +1255,32 @@ async def slow_moving(update: Update, context: ContextTypes.DEFAULT_TYPE, page:
     """Kam sotilgan mahsulotlar"""
     try:
         from sqlalchemy.orm import Session
-        from database import SessionLocal
+        from models import Product
         from product_service import ProductService
         
         ITEMS_PER_PAGE = 10
+        chat_id = update.effective_chat.id
         
-        db: Session = SessionLocal()
-        try:
+        def _rank(db: Session):
             products = ProductService.get_products(db, limit=500)
             # 30 kundan ko'proq vaqt sotilmagan yoki hech sotilmagan mahsulotlar
-            all_slow = [p for p in products if p.days_since_last_sale is None or p.days_since_last_sale > 30]
-            all_slow = sorted(all_slow, key=lambda x: x.days_since_last_sale or 999, reverse=True)
-            
-            total = len(all_slow)
-            total_pages = max(1, (total + ITEMS_PER_PAGE - 1) // ITEMS_PER_PAGE)
-            
+            all_slow = [(p.id, p.days_since_last_sale) for p in products if p.days_since_last_sale is None or p.days_since_last_sale > 30]
+            all_slow = sorted(all_slow, key=lambda x: x[1] or 999, reverse=True)
+            return all_slow, None
+        
+        def _build(db: Session):
+            entry = list_cache.get_ranked_list(db, chat_id, 'slow_moving', page, list_cache.products_sales_version, _rank)
+            slow, total, total_pages = list_cache.get_page(entry, page, ITEMS_PER_PAGE)
             start_idx = page * ITEMS_PER_PAGE
-            end_idx = start_idx + ITEMS_PER_PAGE
-            slow = all_slow[start_idx:end_idx]
+            products = list_cache.fetch_by_ids(db, Product, [product_id for product_id, _ in slow])
+            days_by_id = dict(slow)
             
-            if not all_slow:
+            if total == 0:
                 text = "Barcha mahsulotlar yaxshi sotilmoqda! 🎉"
             else:
                 text = f"📉 KAM SOTILGAN MAHSULOTLAR ({page + 1}/{total_pages}):\n\n"
-                for i, product in enumerate(slow, 1 + start_idx):
-                    days = product.days_since_last_sale or 0
+                for i, product in enumerate(products, 1 + start_idx):
+                    days = days_by_id.get(product.id) or 0
                     text += f"{i}. {product.name}\n"
                     text += f"   📊 Omborda: {product.total_pieces} dona\n"
                     if days > 0:
@@ -1320,13 +1302,14 @@ async def slow_moving(update: Update, context: ContextTypes.DEFAULT_TYPE, page:
             
             buttons.append([InlineKeyboardButton("⬅️ Orqaga", callback_data='products_menu')])
             keyboard = InlineKeyboardMarkup(buttons)
-            
-            if update.callback_query:
-                await update.callback_query.edit_message_text(text, reply_markup=keyboard)
-            else:
-                await update.message.reply_text(text, reply_markup=keyboard)
-        finally:
-            db.close()
+            return text, keyboard
+
+        text, keyboard = await run_db(_build)
+
+        if update.callback_query:
+            await update.callback_query.edit_message_text(text, reply_markup=keyboard)
+        else:
+            await update.message.reply_text(text, reply_markup=keyboard)
     except Exception as e:
         error_msg = f"❌ Xatolik: {str(e)}"
         if update.callback_query:
@@ -1334,133 +1317,83 @@ async def slow_moving(update: Update, context: ContextTypes.DEFAULT_TYPE, page:
         else:
             await update.message.reply_text(error_msg, reply_markup=get_main_keyboard())
 
-async def export_excel(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Excel hisobot yuborish"""
+async def _send_job_document(context: ContextTypes.DEFAULT_TYPE, chat_id: int, job_id: str, caption: str, error_prefix: str):
+    """Job tugashini kutib, tayyor faylni chatga yuborish (handler'dan alohida task)"""
+    job = await JobService.wait(job_id)
+    if not job or job["status"] != "done":
+        error = job["error"] if job else "job topilmadi"
+        await context.bot.send_message(chat_id=chat_id, text=f"❌ {error_prefix}: {error}", reply_markup=get_main_keyboard())
+        return
     try:
-        import os
-        import sys
-        sys.path.append(os.path.dirname(os.path.dirname(__file__)))
-        
-        from sqlalchemy.orm import Session
-        from database import SessionLocal
-        from excel_service import ExcelService
-        
-        db: Session = SessionLocal()
-        try:
-            # Excel fayl yaratish
-            file_path = ExcelService.export_sales(db)
-            
-            # Faylni yuborish
-            if update.callback_query:
-                await update.callback_query.answer("Excel hisobot tayyorlanmoqda...")
-                await context.bot.send_document(
-                    chat_id=update.effective_chat.id,
-                    document=open(file_path, 'rb'),
-                    filename=f"savdo_hisobot_{os.path.basename(file_path)}",
-                    caption="📊 Sotuvlar hisoboti (Excel)"
-                )
-            else:
-                await update.message.reply_text("Excel hisobot tayyorlanmoqda...")
-                await update.message.reply_document(
-                    document=open(file_path, 'rb'),
-                    filename=f"savdo_hisobot_{os.path.basename(file_path)}",
-                    caption="📊 Sotuvlar hisoboti (Excel)"
-                )
-            
-            # Faylni o'chirish
-            if os.path.exists(file_path):
-                os.remove(file_path)
-        finally:
-            db.close()
+        with open(job["file_path"], 'rb') as document:
+            await context.bot.send_document(
+                chat_id=chat_id,
+                document=document,
+                filename=f"savdo_hisobot_{job['filename']}",
+                caption=caption
+            )
+    finally:
+        # Fayl botga yuborilgandan keyin kerak emas
+        if os.path.exists(job["file_path"]):
+            os.remove(job["file_path"])
+
+
+async def _submit_report_job(update: Update, context: ContextTypes.DEFAULT_TYPE, job_type: str, params: dict,
+                             waiting_text: str, caption: str, error_prefix: str):
+    """Hisobotni job sifatida navbatga qo'yish; fayl tayyor bo'lganda alohida yuboriladi"""
+    try:
+        job = JobService.submit(job_type, params, owner_id=update.effective_user.id if update.effective_user else None)
+        if update.callback_query:
+            await update.callback_query.answer(waiting_text)
+        else:
+            await update.message.reply_text(waiting_text)
+        context.application.create_task(
+            _send_job_document(context, update.effective_chat.id, job["id"], caption, error_prefix)
+        )
     except Exception as e:
-        error_msg = f"❌ Excel yaratishda xatolik: {str(e)}"
+        error_msg = f"❌ {error_prefix}: {str(e)}"
         if update.callback_query:
             await update.callback_query.answer(error_msg, show_alert=True)
         else:
             await update.message.reply_text(error_msg, reply_markup=get_main_keyboard())
 
+async def export_excel(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Excel hisobot yuborish"""
+    await _submit_report_job(
+        update, context, "sales_export", {},
+        "Excel hisobot tayyorlanmoqda...", "📊 Sotuvlar hisoboti (Excel)", "Excel yaratishda xatolik"
+    )
+
 async def export_pdf(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """PDF hisobot yuborish"""
+    from datetime import datetime, timedelta
+    end_date = datetime.now()
+    start_date = end_date - timedelta(days=30)  # So'nggi 30 kun
+    params = {
+        "format": "pdf",
+        "start_date": start_date.isoformat(),
+        "end_date": end_date.isoformat(),
+        "period_start": start_date.strftime('%Y-%m-%d'),
+        "period_end": end_date.strftime('%Y-%m-%d'),
+    }
+    await _submit_report_job(
+        update, context, "statistics_export", params,
+        "PDF hisobot tayyorlanmoqda...", "📊 Sotuvlar hisoboti (PDF)", "PDF yaratishda xatolik"
+    )
+
+async def low_stock(update: Update, context: ContextTypes.DEFAULT_TYPE, page: int = 0):
+    """Kam qolgan mahsulotlar"""
     try:
-        import os
-        import sys
-        sys.path.append(os.path.dirname(os.path.dirname(__file__)))
-        
         from sqlalchemy.orm import Session
-        from database import SessionLocal
-        from pdf_service import PDFService
-        from sale_service import SaleService
-        import os
-        
-        db: Session = SessionLocal()
-        try:
-            # PDF fayl yaratish - statistikani olish va PDF yaratish
-            from datetime import datetime, timedelta
-            end_date = datetime.now()
-            start_date = end_date - timedelta(days=30)  # So'nggi 30 kun
-            
-            # Statistikani olish
-            stats = SaleService.get_statistics(
-                db,
-                start_date=start_date.isoformat(),
-                end_date=end_date.isoformat()
-            )
-            
-            file_path = PDFService.export_statistics(
-                stats,
-                start_date.strftime('%Y-%m-%d'),
-                end_date.strftime('%Y-%m-%d')
-            )
-            
-            # Faylni yuborish
-            if update.callback_query:
-                await update.callback_query.answer("PDF hisobot tayyorlanmoqda...")
-                await context.bot.send_document(
-                    chat_id=update.effective_chat.id,
-                    document=open(file_path, 'rb'),
-                    filename=f"savdo_hisobot_{os.path.basename(file_path)}",
-                    caption="📊 Sotuvlar hisoboti (PDF)"
-                )
-            else:
-                await update.message.reply_text("PDF hisobot tayyorlanmoqda...")
-                await update.message.reply_document(
-                    document=open(file_path, 'rb'),
-                    filename=f"savdo_hisobot_{os.path.basename(file_path)}",
-                    caption="📊 Sotuvlar hisoboti (PDF)"
-                )
-            
-            # Faylni o'chirish
-            if os.path.exists(file_path):
-                os.remove(file_path)
-        finally:
-            db.close()
-    except Exception as e:
-        error_msg = f"❌ PDF yaratishda xatolik: {str(e)}"
-        if update.callback_query:
-            await update.callback_query.answer(error_msg, show_alert=True)
-        else:
-            await update.message.reply_text(error_msg, reply_markup=get_main_keyboard())
-
-async def low_stock(update: Update, context: ContextTypes.DEFAULT_TYPE, page: int = 0):
-    """Kam qolgan mahsulotlar"""
-    try:
-        from sqlalchemy.orm import Session
-        from database import SessionLocal
-        from models import Product
+        from models import Product
         
         ITEMS_PER_PAGE = 10
+        chat_id = update.effective_chat.id
         
-        db: Session = SessionLocal()
-        try:
-            # Kam qolgan mahsulotlar (10 donadan kam)
-            query = db.query(Product).filter(
-                Product.packages_in_stock * Product.pieces_per_package + Product.pieces_in_stock < 10
-            ).order_by(Product.packages_in_stock * Product.pieces_per_package + Product.pieces_in_stock)
-            
-            total = query.count()
-            total_pages = max(1, (total + ITEMS_PER_PAGE - 1) // ITEMS_PER_PAGE)
-            
-            products = query.offset(page * ITEMS_PER_PAGE).limit(ITEMS_PER_PAGE).all()
+        def _build(db: Session):
+            entry = list_cache.get_ranked_list(db, chat_id, 'low_stock', page, list_cache.products_version, list_cache.rank_low_stock)
+            page_ids, total, total_pages = list_cache.get_page(entry, page, ITEMS_PER_PAGE)
+            products = list_cache.fetch_by_ids(db, Product, page_ids)
             
             if total == 0:
                 text = "✅ Barcha mahsulotlar yetarli miqdorda!"
@@ -1489,13 +1422,14 @@ async def low_stock(update: Update, context: ContextTypes.DEFAULT_TYPE, page: in
             
             buttons.append([InlineKeyboardButton("⬅️ Orqaga", callback_data='products_menu')])
             keyboard = InlineKeyboardMarkup(buttons)
-            
-            if update.callback_query:
-                await update.callback_query.edit_message_text(text, reply_markup=keyboard)
-            else:
-                await update.message.reply_text(text, reply_markup=keyboard)
-        finally:
-            db.close()
+            return text, keyboard
+
+        text, keyboard = await run_db(_build)
+
+        if update.callback_query:
+            await update.callback_query.edit_message_text(text, reply_markup=keyboard)
+        else:
+            await update.message.reply_text(text, reply_markup=keyboard)
     except Exception as e:
         error_msg = f"❌ Xatolik: {str(e)}"
         keyboard = get_products_menu()
@@ -1508,11 +1442,9 @@ async def debt_limit_exceeded(update: Update, context: ContextTypes.DEFAULT_TYPE
     """Qarz limiti oshgan mijozlar"""
     try:
         from sqlalchemy.orm import Session
-        from database import SessionLocal
         from models import Customer
         
-        db: Session = SessionLocal()
-        try:
+        def _build(db: Session):
             # Qarz limiti oshgan mijozlar
             all_customers = db.query(Customer).filter(
                 Customer.debt_limit.isnot(None),
@@ -1548,12 +1480,14 @@ async def debt_limit_exceeded(update: Update, context: ContextTypes.DEFAULT_TYPE
                 text += f"Jami: {len(customers)} ta mijoz"
             
             keyboard = get_customers_menu()
-            if update.callback_query:
-                await update.callback_query.edit_message_text(text, reply_markup=keyboard)
-            else:
-                await update.message.reply_text(text, reply_markup=keyboard)
-        finally:
-            db.close()
+            return text, keyboard
+
+        text, keyboard = await run_db(_build)
+
+        if update.callback_query:
+            await update.callback_query.edit_message_text(text, reply_markup=keyboard)
+        else:
+            await update.message.reply_text(text, reply_markup=keyboard)
     except Exception as e:
         error_msg = f"❌ Xatolik: {str(e)}"
         keyboard = get_customers_menu()
@@ -1566,11 +1500,9 @@ async def pending_sales(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Tasdiqlanishi kerak sotuvlar"""
     try:
         from sqlalchemy.orm import Session
-        from database import SessionLocal
         from models import Sale
         
-        db: Session = SessionLocal()
-        try:
+        def _build(db: Session):
             # Tasdiqlanmagan sotuvlar
             sales = db.query(Sale).filter(
                 Sale.requires_admin_approval == True,
@@ -1611,13 +1543,14 @@ async def pending_sales(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 # Tugmalarni qo'shamiz
                 buttons.append([InlineKeyboardButton("⬅️ Orqaga", callback_data='approvals_menu')])
                 keyboard = InlineKeyboardMarkup(buttons)
-            
-            if update.callback_query:
-                await update.callback_query.edit_message_text(text, reply_markup=keyboard)
-            else:
-                await update.message.reply_text(text, reply_markup=keyboard)
-        finally:
-            db.close()
+            return text, keyboard
+
+        text, keyboard = await run_db(_build)
+
+        if update.callback_query:
+            await update.callback_query.edit_message_text(text, reply_markup=keyboard)
+        else:
+            await update.message.reply_text(text, reply_markup=keyboard)
     except Exception as e:
         error_msg = f"❌ Xatolik: {str(e)}"
         keyboard = get_approvals_menu()
@@ -1630,11 +1563,9 @@ async def approved_sales(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Tasdiqlangan sotuvlar"""
     try:
         from sqlalchemy.orm import Session
-        from database import SessionLocal
         from models import Sale
         
-        db: Session = SessionLocal()
-        try:
+        def _build(db: Session):
             sales = db.query(Sale).filter(
                 Sale.admin_approved == True
             ).order_by(Sale.approved_at.desc()).limit(10).all()
@@ -1652,9 +1583,11 @@ async def approved_sales(update: Update, context: ContextTypes.DEFAULT_TYPE):
                     text += f"   Summa: {sale.total_amount:,.0f} so'm\n\n"
             
             keyboard = get_approvals_menu()
-            await update.callback_query.edit_message_text(text, reply_markup=keyboard)
-        finally:
-            db.close()
+            return text, keyboard
+
+        text, keyboard = await run_db(_build)
+
+        await update.callback_query.edit_message_text(text, reply_markup=keyboard)
     except Exception as e:
         keyboard = get_approvals_menu()
         await update.callback_query.edit_message_text(f"❌ Xatolik: {str(e)}", reply_markup=keyboard)
@@ -1663,11 +1596,9 @@ async def rejected_sales(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Rad etilgan sotuvlar"""
     try:
         from sqlalchemy.orm import Session
-        from database import SessionLocal
         from models import Sale
         
-        db: Session = SessionLocal()
-        try:
+        def _build(db: Session):
             sales = db.query(Sale).filter(
                 Sale.admin_approved == False
             ).order_by(Sale.created_at.desc()).limit(10).all()
@@ -1685,9 +1616,11 @@ async def rejected_sales(update: Update, context: ContextTypes.DEFAULT_TYPE):
                     text += f"   Summa: {sale.total_amount:,.0f} so'm\n\n"
             
             keyboard = get_approvals_menu()
-            await update.callback_query.edit_message_text(text, reply_markup=keyboard)
-        finally:
-            db.close()
+            return text, keyboard
+
+        text, keyboard = await run_db(_build)
+
+        await update.callback_query.edit_message_text(text, reply_markup=keyboard)
     except Exception as e:
         keyboard = get_approvals_menu()
         await update.callback_query.edit_message_text(f"❌ Xatolik: {str(e)}", reply_markup=keyboard)
@@ -1696,16 +1629,13 @@ async def view_sale_inline(update: Update, context: ContextTypes.DEFAULT_TYPE, s
     """Sotuvni inline tugma orqali ko'rish"""
     try:
         from sqlalchemy.orm import Session
-        from database import SessionLocal
         from models import Sale
         
-        db: Session = SessionLocal()
-        try:
+        def _build(db: Session):
             sale = db.query(Sale).filter(Sale.id == sale_id).first()
             
             if not sale:
-                await update.callback_query.edit_message_text(f"❌ ID {sale_id} raqamli sotuv topilmadi.")
-                return
+                return f"❌ ID {sale_id} raqamli sotuv topilmadi.", None
             
             time = sale.created_at.strftime('%d.%m.%Y %H:%M')
             customer_name = sale.customer.name if sale.customer else "O'chirilgan mijoz"
@@ -1744,9 +1674,10 @@ async def view_sale_inline(update: Update, context: ContextTypes.DEFAULT_TYPE, s
                 text += "❌ Holat: Rad etilgan"
                 keyboard = [[InlineKeyboardButton("⬅️ Orqaga", callback_data='rejected_sales')]]
             
-            await update.callback_query.edit_message_text(text, reply_markup=InlineKeyboardMarkup(keyboard))
-        finally:
-            db.close()
+            return text, InlineKeyboardMarkup(keyboard)
+
+        text, reply_markup = await run_db(_build)
+        await update.callback_query.edit_message_text(text, reply_markup=reply_markup)
     except Exception as e:
         await update.callback_query.edit_message_text(f"❌ Xatolik: {str(e)}")
 
@@ -1760,16 +1691,13 @@ async def view_sale_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         sale_id = int(context.args[0])
         
         from sqlalchemy.orm import Session
-        from database import SessionLocal
         from models import Sale
         
-        db: Session = SessionLocal()
-        try:
+        def _build(db: Session):
             sale = db.query(Sale).filter(Sale.id == sale_id).first()
             
             if not sale:
-                await update.message.reply_text(f"❌ ID {sale_id} raqamli sotuv topilmadi.")
-                return
+                return f"❌ ID {sale_id} raqamli sotuv topilmadi.", None
             
             time = sale.created_at.strftime('%d.%m.%Y %H:%M')
             customer_name = sale.customer.name if sale.customer else "O'chirilgan mijoz"
@@ -1808,9 +1736,10 @@ async def view_sale_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 text += "❌ Holat: Rad etilgan"
                 keyboard = [[InlineKeyboardButton("⬅️ Orqaga", callback_data='rejected_sales')]]
             
-            await update.message.reply_text(text, reply_markup=InlineKeyboardMarkup(keyboard))
-        finally:
-            db.close()
+            return text, InlineKeyboardMarkup(keyboard)
+
+        text, reply_markup = await run_db(_build)
+        await update.message.reply_text(text, reply_markup=reply_markup)
     except Exception as e:
         await update.message.reply_text(f"❌ Xatolik: {str(e)}")
 
@@ -1821,48 +1750,16 @@ async def approve_sale(update: Update, context: ContextTypes.DEFAULT_TYPE):
         sale_id = int(query.data.split('_')[1])
         
         from sqlalchemy.orm import Session
-        from database import SessionLocal
         from sale_service import SaleService
         
-        db: Session = SessionLocal()
-        try:
-            # Admin ID ni olamiz (ADMIN_CHAT_IDS dan)
-            admin_id = query.from_user.id
-            
+        # Admin ID ni olamiz (ADMIN_CHAT_IDS dan)
+        admin_id = query.from_user.id
+        
+        def _build(db: Session):
             # Sotuvni tasdiqlash
             sale = SaleService.approve_sale(db, sale_id, approved_by=admin_id)
-            
             if not sale:
-                await query.answer("❌ Sotuv topilmadi!", show_alert=True)
-                return
-            
-            await query.answer("✅ Sotuv tasdiqlandi!", show_alert=True)
-            
-            # WebSocket orqali barcha clientlarga xabar yuborish
-            try:
-                import asyncio
-                import httpx
-                
-                async def notify_clients():
-                    try:
-                        # Backend API ga POST so'rov yuborish
-                        async with httpx.AsyncClient() as client:
-                            await client.post(
-                                'http://localhost:8000/api/websocket/broadcast',
-                                json={
-                                    'type': 'sale_approved',
-                                    'sale_id': sale_id,
-                                    'message': f'Sotuv #{sale_id} tasdiqlandi'
-                                },
-                                timeout=2.0
-                            )
-                    except Exception as e:
-                        print(f"WebSocket notification error: {e}")
-                
-                # Background taskda yuborish
-                asyncio.create_task(notify_clients())
-            except Exception as e:
-                print(f"Error creating notification task: {e}")
+                return None
             
             # Yangilangan ma'lumotni ko'rsatish
             customer_name = sale.customer.name if sale.customer else "O'chirilgan mijoz"
@@ -1870,14 +1767,46 @@ async def approve_sale(update: Update, context: ContextTypes.DEFAULT_TYPE):
             text += f"Mijoz: {customer_name}\n"
             text += f"Summa: {sale.total_amount:,.0f} so'm\n"
             text += f"Tasdiqlandi: {sale.approved_at.strftime('%d.%m.%Y %H:%M') if sale.approved_at else 'hozir'}"
+            return text
+
+        text = await run_db(_build)
+        if not text:
+            await query.answer("❌ Sotuv topilmadi!", show_alert=True)
+            return
+        
+        await query.answer("✅ Sotuv tasdiqlandi!", show_alert=True)
+        
+        # WebSocket orqali barcha clientlarga xabar yuborish
+        try:
+            import asyncio
+            import httpx
+            
+            async def notify_clients():
+                try:
+                    # Backend API ga POST so'rov yuborish
+                    async with httpx.AsyncClient() as client:
+                        await client.post(
+                            'http://localhost:8000/api/websocket/broadcast',
+                            json={
+                                'type': 'sale_approved',
+                                'sale_id': sale_id,
+                                'message': f'Sotuv #{sale_id} tasdiqlandi'
+                            },
+                            timeout=2.0
+                        )
+                except Exception as e:
+                    print(f"WebSocket notification error: {e}")
             
-            keyboard = [[InlineKeyboardButton("⬅️ Tasdiqlar", callback_data='approvals_menu')]]
-            await query.edit_message_text(text, reply_markup=InlineKeyboardMarkup(keyboard))
-            
-            # Sotuvchiga xabar yuborish (agar Telegram ID si bo'lsa)
-            # Bu keyingi bosqichda qo'shiladi
-        finally:
-            db.close()
+            # Background taskda yuborish
+            asyncio.create_task(notify_clients())
+        except Exception as e:
+            print(f"Error creating notification task: {e}")
+        
+        keyboard = [[InlineKeyboardButton("⬅️ Tasdiqlar", callback_data='approvals_menu')]]
+        await query.edit_message_text(text, reply_markup=InlineKeyboardMarkup(keyboard))
+        
+        # Sotuvchiga xabar yuborish (agar Telegram ID si bo'lsa)
+        # Bu keyingi bosqichda qo'shiladi
     except Exception as e:
         print(f"DEBUG: Approve error: {e}")
         import traceback
@@ -1891,55 +1820,55 @@ async def reject_sale(update: Update, context: ContextTypes.DEFAULT_TYPE):
         sale_id = int(query.data.split('_')[1])
         
         from sqlalchemy.orm import Session
-        from database import SessionLocal
         from sale_service import SaleService
         
-        db: Session = SessionLocal()
-        try:
-            admin_id = query.from_user.id
-            
+        admin_id = query.from_user.id
+        
+        def _build(db: Session):
             # Sotuvni rad etish
             sale = SaleService.approve_sale(db, sale_id, approved_by=admin_id, approved=False)
-            
             if not sale:
-                await query.answer("❌ Sotuv topilmadi!", show_alert=True)
-                return
-            
-            await query.answer("❌ Sotuv rad etildi!", show_alert=True)
-            
-            # WebSocket orqali barcha clientlarga xabar yuborish
-            try:
-                import asyncio
-                import httpx
-                
-                async def notify_clients():
-                    try:
-                        async with httpx.AsyncClient() as client:
-                            await client.post(
-                                'http://localhost:8000/api/websocket/broadcast',
-                                json={
-                                    'type': 'sale_rejected',
-                                    'sale_id': sale_id,
-                                    'message': f'Sotuv #{sale_id} rad etildi'
-                                },
-                                timeout=2.0
-                            )
-                    except Exception as e:
-                        print(f"WebSocket notification error: {e}")
-                
-                asyncio.create_task(notify_clients())
-            except Exception as e:
-                print(f"Error creating notification task: {e}")
+                return None
             
             customer_name = sale.customer.name if sale.customer else "O'chirilgan mijoz"
             text = f"❌ SOTUV #{sale_id} RAD ETILDI\n\n"
             text += f"Mijoz: {customer_name}\n"
             text += f"Summa: {sale.total_amount:,.0f} so'm\n"
+            return text
+
+        text = await run_db(_build)
+        if not text:
+            await query.answer("❌ Sotuv topilmadi!", show_alert=True)
+            return
+        
+        await query.answer("❌ Sotuv rad etildi!", show_alert=True)
+        
+        # WebSocket orqali barcha clientlarga xabar yuborish
+        try:
+            import asyncio
+            import httpx
+            
+            async def notify_clients():
+                try:
+                    async with httpx.AsyncClient() as client:
+                        await client.post(
+                            'http://localhost:8000/api/websocket/broadcast',
+                            json={
+                                'type': 'sale_rejected',
+                                'sale_id': sale_id,
+                                'message': f'Sotuv #{sale_id} rad etildi'
+                            },
+                            timeout=2.0
+                        )
+                except Exception as e:
+                    print(f"WebSocket notification error: {e}")
             
-            keyboard = [[InlineKeyboardButton("⬅️ Tasdiqlar", callback_data='approvals_menu')]]
-            await query.edit_message_text(text, reply_markup=InlineKeyboardMarkup(keyboard))
-        finally:
-            db.close()
+            asyncio.create_task(notify_clients())
+        except Exception as e:
+            print(f"Error creating notification task: {e}")
+        
+        keyboard = [[InlineKeyboardButton("⬅️ Tasdiqlar", callback_data='approvals_menu')]]
+        await query.edit_message_text(text, reply_markup=InlineKeyboardMarkup(keyboard))
     except Exception as e:
         print(f"DEBUG: Reject error: {e}")
         import traceback
@@ -1951,44 +1880,23 @@ async def sales_trends(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Sotuvlar tendensiyasi (oxirgi 7 kun)"""
     try:
         from sqlalchemy.orm import Session
-        from database import SessionLocal
-        from models import Sale
-        from utils import get_uzbekistan_now
-        from datetime import timedelta
+        from analytics_service import AnalyticsService
         
-        db: Session = SessionLocal()
-        try:
-            now = get_uzbekistan_now()
-            trends = []
-            
-            for i in range(6, -1, -1):
-                day_start = (now - timedelta(days=i)).replace(hour=0, minute=0, second=0, microsecond=0)
-                day_end = day_start.replace(hour=23, minute=59, second=59, microsecond=999999)
-                
-                sales = db.query(Sale).filter(
-                    Sale.created_at >= day_start,
-                    Sale.created_at <= day_end
-                ).all()
-                
-                total = sum(s.total_amount for s in sales)
-                count = len(sales)
-                
-                trends.append({
-                    'date': day_start.strftime('%d.%m'),
-                    'count': count,
-                    'amount': total
-                })
+        def _build(db: Session):
+            days = AnalyticsService.get_last_periods(db, 'day', 7)
             
             text = "📈 SOTUVLAR TENDENSIYASI (7 kun):\n\n"
-            for trend in trends:
-                bar = '▓' * (trend['count'] if trend['count'] <= 10 else 10)
-                text += f"{trend['date']}: {bar}\n"
-                text += f"   Soni: {trend['count']} | {trend['amount']:,.0f} so'm\n\n"
+            for day in days:
+                bar = '▓' * (day['count'] if day['count'] <= 10 else 10)
+                text += f"{day['start'].strftime('%d.%m')}: {bar}\n"
+                text += f"   Soni: {day['count']} | {day['amount']:,.0f} so'm\n\n"
             
             keyboard = get_analytics_menu()
-            await update.callback_query.edit_message_text(text, reply_markup=keyboard)
-        finally:
-            db.close()
+            return text, keyboard
+
+        text, keyboard = await run_db(_build)
+
+        await update.callback_query.edit_message_text(text, reply_markup=keyboard)
     except Exception as e:
         keyboard = get_analytics_menu()
         await update.callback_query.edit_message_text(f"❌ Xatolik: {str(e)}", reply_markup=keyboard)
@@ -1997,12 +1905,10 @@ async def abc_analysis(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """ABC tahlil - mahsulotlarni toifaga ajratish"""
     try:
         from sqlalchemy.orm import Session
-        from database import SessionLocal
         from models import SaleItem
         from sqlalchemy import func
         
-        db: Session = SessionLocal()
-        try:
+        def _build(db: Session):
             # Mahsulotlar bo'yicha jami sotuvlar
             products = db.query(
                 SaleItem.product_id,
@@ -2045,9 +1951,11 @@ async def abc_analysis(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 text += "C - Kamroq muhim"
             
             keyboard = get_analytics_menu()
-            await update.callback_query.edit_message_text(text, reply_markup=keyboard)
-        finally:
-            db.close()
+            return text, keyboard
+
+        text, keyboard = await run_db(_build)
+
+        await update.callback_query.edit_message_text(text, reply_markup=keyboard)
     except Exception as e:
         keyboard = get_analytics_menu()
         await update.callback_query.edit_message_text(f"❌ Xatolik: {str(e)}", reply_markup=keyboard)
@@ -2056,11 +1964,9 @@ async def recommendations(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Tizim tavsifalari"""
     try:
         from sqlalchemy.orm import Session
-        from database import SessionLocal
         from models import Product, Customer, Sale, SaleItem
         
-        db: Session = SessionLocal()
-        try:
+        def _build(db: Session):
             # Kam qolgan mahsulotlar (10 donadan kam)
             low_stock = db.query(Product).filter(
                 Product.packages_in_stock * Product.pieces_per_package + Product.pieces_in_stock < 10
@@ -2121,10 +2027,11 @@ async def recommendations(update: Update, context: ContextTypes.DEFAULT_TYPE):
             
             buttons.append([InlineKeyboardButton("⬅️ Orqaga", callback_data='analytics_menu')])
             keyboard = InlineKeyboardMarkup(buttons)
-            
-            await update.callback_query.edit_message_text(text, reply_markup=keyboard)
-        finally:
-            db.close()
+            return text, keyboard
+
+        text, keyboard = await run_db(_build)
+
+        await update.callback_query.edit_message_text(text, reply_markup=keyboard)
     except Exception as e:
         keyboard = get_analytics_menu()
         await update.callback_query.edit_message_text(f"❌ Xatolik: {str(e)}", reply_markup=keyboard)
@@ -2134,22 +2041,16 @@ async def show_low_stock_products(update: Update, context: ContextTypes.DEFAULT_
     """Kam qolgan mahsulotlarni ko'rsatish (pagination bilan)"""
     try:
         from sqlalchemy.orm import Session
-        from database import SessionLocal
         from models import Product
         
         ITEMS_PER_PAGE = 10
+        chat_id = update.effective_chat.id
         
-        db: Session = SessionLocal()
-        try:
-            # Kam qolgan mahsulotlar
-            query = db.query(Product).filter(
-                Product.packages_in_stock * Product.pieces_per_package + Product.pieces_in_stock < 10
-            ).order_by(Product.packages_in_stock * Product.pieces_per_package + Product.pieces_in_stock)
-            
-            total = query.count()
-            products = query.offset(page * ITEMS_PER_PAGE).limit(ITEMS_PER_PAGE).all()
-            
-            total_pages = (total + ITEMS_PER_PAGE - 1) // ITEMS_PER_PAGE
+        def _build(db: Session):
+            # low_stock bilan bir xil ro'yxat - kesh umumiy
+            entry = list_cache.get_ranked_list(db, chat_id, 'low_stock', page, list_cache.products_version, list_cache.rank_low_stock)
+            page_ids, total, total_pages = list_cache.get_page(entry, page, ITEMS_PER_PAGE)
+            products = list_cache.fetch_by_ids(db, Product, page_ids)
             
             text = f"📦 KAM QOLGAN MAHSULOTLAR ({page + 1}/{total_pages}):\n\n"
             
@@ -2173,10 +2074,11 @@ async def show_low_stock_products(update: Update, context: ContextTypes.DEFAULT_
             
             buttons.append([InlineKeyboardButton("⬅️ Tavsiyalarga", callback_data='recommendations')])
             keyboard = InlineKeyboardMarkup(buttons)
-            
-            await update.callback_query.edit_message_text(text, reply_markup=keyboard)
-        finally:
-            db.close()
+            return text, keyboard
+
+        text, keyboard = await run_db(_build)
+
+        await update.callback_query.edit_message_text(text, reply_markup=keyboard)
     except Exception as e:
         await update.callback_query.edit_message_text(f"❌ Xatolik: {str(e)}", reply_markup=get_analytics_menu())
 
@@ -2185,34 +2087,26 @@ async def show_debt_exceeded_customers(update: Update, context: ContextTypes.DEF
     """Qarz limiti oshgan mijozlarni ko'rsatish (pagination bilan)"""
     try:
         from sqlalchemy.orm import Session
-        from database import SessionLocal
         from models import Customer
         
         ITEMS_PER_PAGE = 10
+        chat_id = update.effective_chat.id
         
-        db: Session = SessionLocal()
-        try:
-            # Qarz limiti oshgan mijozlar
-            all_customers = db.query(Customer).filter(
+        def _rank(db: Session):
+            # Qarz limiti oshgan mijozlar, oshiq summa bo'yicha
+            overdue = Customer.debt_balance - Customer.debt_limit
+            ids = [row.id for row in db.query(Customer.id).filter(
                 Customer.debt_limit.isnot(None),
-                Customer.debt_limit > 0
-            ).all()
-            
-            # Manual filtering
-            exceeded_customers = []
-            for customer in all_customers:
-                if hasattr(customer, 'debt_balance') and customer.debt_balance > (customer.debt_limit or 0):
-                    exceeded_customers.append(customer)
-            
-            # Sorting by overdue amount
-            exceeded_customers.sort(key=lambda x: (x.debt_balance - (x.debt_limit or 0)), reverse=True)
-            
-            total = len(exceeded_customers)
-            total_pages = max(1, (total + ITEMS_PER_PAGE - 1) // ITEMS_PER_PAGE)
-            
+                Customer.debt_limit > 0,
+                Customer.debt_balance > Customer.debt_limit
+            ).order_by(overdue.desc()).all()]
+            return ids, None
+        
+        def _build(db: Session):
+            entry = list_cache.get_ranked_list(db, chat_id, 'debt_exceeded', page, list_cache.customers_version, _rank)
+            page_ids, total, total_pages = list_cache.get_page(entry, page, ITEMS_PER_PAGE)
             start_idx = page * ITEMS_PER_PAGE
-            end_idx = start_idx + ITEMS_PER_PAGE
-            customers = exceeded_customers[start_idx:end_idx]
+            customers = list_cache.fetch_by_ids(db, Customer, page_ids)
             
             text = f"💸 QARZ LIMITI OSHGANLAR ({page + 1}/{total_pages}):\n\n"
             
@@ -2243,10 +2137,11 @@ async def show_debt_exceeded_customers(update: Update, context: ContextTypes.DEF
             
             buttons.append([InlineKeyboardButton("⬅️ Tavsiyalarga", callback_data='recommendations')])
             keyboard = InlineKeyboardMarkup(buttons)
-            
-            await update.callback_query.edit_message_text(text, reply_markup=keyboard)
-        finally:
-            db.close()
+            return text, keyboard
+
+        text, keyboard = await run_db(_build)
+
+        await update.callback_query.edit_message_text(text, reply_markup=keyboard)
     except Exception as e:
         await update.callback_query.edit_message_text(f"❌ Xatolik: {str(e)}", reply_markup=get_analytics_menu())
 
@@ -2255,15 +2150,14 @@ async def show_slow_moving_products(update: Update, context: ContextTypes.DEFAUL
     """30 kun sotilmagan mahsulotlarni ko'rsatish (pagination bilan)"""
     try:
         from sqlalchemy.orm import Session
-        from database import SessionLocal
         from models import Product, Sale, SaleItem
         from utils import get_uzbekistan_now
         from datetime import timedelta
         
         ITEMS_PER_PAGE = 10
+        chat_id = update.effective_chat.id
         
-        db: Session = SessionLocal()
-        try:
+        def _rank(db: Session):
             now = get_uzbekistan_now()
             month_ago = now - timedelta(days=30)
             
@@ -2274,15 +2168,16 @@ async def show_slow_moving_products(update: Update, context: ContextTypes.DEFAUL
             sold_ids = [p[0] for p in sold_product_ids]
             
             # Sotilmagan mahsulotlar
-            query = db.query(Product).filter(
+            ids = [row.id for row in db.query(Product.id).filter(
                 ~Product.id.in_(sold_ids) if sold_ids else True,
                 (Product.packages_in_stock * Product.pieces_per_package + Product.pieces_in_stock) > 0
-            ).order_by(Product.name)
-            
-            total = query.count()
-            products = query.offset(page * ITEMS_PER_PAGE).limit(ITEMS_PER_PAGE).all()
-            
-            total_pages = max(1, (total + ITEMS_PER_PAGE - 1) // ITEMS_PER_PAGE)
+            ).order_by(Product.name).all()]
+            return ids, None
+        
+        def _build(db: Session):
+            entry = list_cache.get_ranked_list(db, chat_id, 'rec_slow_moving', page, list_cache.products_sales_version, _rank)
+            page_ids, total, total_pages = list_cache.get_page(entry, page, ITEMS_PER_PAGE)
+            products = list_cache.fetch_by_ids(db, Product, page_ids)
             
             text = f"🐢 30 KUN SOTILMAGAN MAHSULOTLAR ({page + 1}/{total_pages}):\n\n"
             
@@ -2312,10 +2207,11 @@ async def show_slow_moving_products(update: Update, context: ContextTypes.DEFAUL
             
             buttons.append([InlineKeyboardButton("⬅️ Tavsiyalarga", callback_data='recommendations')])
             keyboard = InlineKeyboardMarkup(buttons)
-            
-            await update.callback_query.edit_message_text(text, reply_markup=keyboard)
-        finally:
-            db.close()
+            return text, keyboard
+
+        text, keyboard = await run_db(_build)
+
+        await update.callback_query.edit_message_text(text, reply_markup=keyboard)
     except Exception as e:
         await update.callback_query.edit_message_text(f"❌ Xatolik: {str(e)}", reply_markup=get_analytics_menu())
 
@@ -2324,32 +2220,15 @@ async def growth_rate(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """O'sish sur'ati"""
     try:
         from sqlalchemy.orm import Session
-        from database import SessionLocal
-        from models import Sale
-        from utils import get_uzbekistan_now
-        from datetime import timedelta
+        from analytics_service import AnalyticsService
         
-        db: Session = SessionLocal()
-        try:
-            now = get_uzbekistan_now()
-            
-            # Bu oy
-            this_month_start = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-            this_month_sales = db.query(Sale).filter(
-                Sale.created_at >= this_month_start
-            ).all()
-            this_month_total = sum(s.total_amount for s in this_month_sales)
-            this_month_count = len(this_month_sales)
-            
-            # O'tgan oy
-            last_month_end = this_month_start - timedelta(days=1)
-            last_month_start = last_month_end.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-            last_month_sales = db.query(Sale).filter(
-                Sale.created_at >= last_month_start,
-                Sale.created_at < this_month_start
-            ).all()
-            last_month_total = sum(s.total_amount for s in last_month_sales)
-            last_month_count = len(last_month_sales)
+        def _build(db: Session):
+            # O'tgan oy va bu oy bitta so'rovda
+            last_month, this_month = AnalyticsService.get_last_periods(db, 'month', 2)
+            this_month_total = this_month['amount']
+            this_month_count = this_month['count']
+            last_month_total = last_month['amount']
+            last_month_count = last_month['count']
             
             # O'sish foizi
             if last_month_total > 0:
@@ -2381,9 +2260,11 @@ async def growth_rate(update: Update, context: ContextTypes.DEFAULT_TYPE):
             text += f"{count_icon} Sotuvlar soni: {count_growth:+.1f}%"
             
             keyboard = get_analytics_menu()
-            await update.callback_query.edit_message_text(text, reply_markup=keyboard)
-        finally:
-            db.close()
+            return text, keyboard
+
+        text, keyboard = await run_db(_build)
+
+        await update.callback_query.edit_message_text(text, reply_markup=keyboard)
     except Exception as e:
         keyboard = get_analytics_menu()
         await update.callback_query.edit_message_text(f"❌ Xatolik: {str(e)}", reply_markup=keyboard)
@@ -2392,35 +2273,18 @@ async def compare_months(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Oylarni taqqoslash"""
     try:
         from sqlalchemy.orm import Session
-        from database import SessionLocal
-        from models import Sale
-        from utils import get_uzbekistan_now
-        from datetime import timedelta
-        
-        db: Session = SessionLocal()
-        try:
-            now = get_uzbekistan_now()
-            months = []
-            
-            for i in range(3):
-                # Har bir oy boshini hisoblaymiz
-                month_start = (now.replace(day=1) - timedelta(days=30*i)).replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-                if i == 0:
-                    month_end = now
-                else:
-                    next_month = month_start.replace(day=28) + timedelta(days=4)
-                    month_end = (next_month - timedelta(days=next_month.day)).replace(hour=23, minute=59, second=59)
-                
-                sales = db.query(Sale).filter(
-                    Sale.created_at >= month_start,
-                    Sale.created_at <= month_end
-                ).all()
-                
-                months.append({
-                    'name': month_start.strftime('%B'),
-                    'count': len(sales),
-                    'amount': sum(s.total_amount for s in sales)
-                })
+        from analytics_service import AnalyticsService
+        
+        def _build(db: Session):
+            # Oxirgi 3 oy, eng yangisi birinchi
+            months = [
+                {
+                    'name': month['start'].strftime('%B'),
+                    'count': month['count'],
+                    'amount': month['amount']
+                }
+                for month in reversed(AnalyticsService.get_last_periods(db, 'month', 3))
+            ]
             
             text = "📊 OYLAR TAQQOSLASH:\n\n"
             for month in months:
@@ -2431,9 +2295,11 @@ async def compare_months(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 text += "\n"
             
             keyboard = get_comparison_menu()
-            await update.callback_query.edit_message_text(text, reply_markup=keyboard)
-        finally:
-            db.close()
+            return text, keyboard
+
+        text, keyboard = await run_db(_build)
+
+        await update.callback_query.edit_message_text(text, reply_markup=keyboard)
     except Exception as e:
         keyboard = get_comparison_menu()
         await update.callback_query.edit_message_text(f"❌ Xatolik: {str(e)}", reply_markup=keyboard)
@@ -2442,17 +2308,21 @@ async def compare_sellers(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Sotuvchilarni taqqoslash"""
     try:
         from sqlalchemy.orm import Session
-        from database import SessionLocal
-        from models import Sale, Seller
-        from sqlalchemy import func
-        
-        db: Session = SessionLocal()
-        try:
-            sellers_stats = db.query(
-                Seller.name,
-                func.count(Sale.id).label('count'),
-                func.sum(Sale.total_amount).label('total')
-            ).join(Sale, Seller.id == Sale.seller_id).group_by(Seller.name).order_by(func.sum(Sale.total_amount).desc()).limit(10).all()
+        from models import Seller
+        from analytics_service import AnalyticsService
+        
+        def _build(db: Session):
+            # Faqat tasdiqlangan sotuvlar; o'chirilgan sotuvchilar ko'rsatilmaydi
+            seller_totals = AnalyticsService.get_seller_totals(db)
+            names = dict(db.query(Seller.id, Seller.name).filter(Seller.id.in_(list(seller_totals))).all()) if seller_totals else {}
+            ranked = sorted(
+                (seller_id for seller_id in seller_totals if seller_id in names),
+                key=lambda seller_id: (-seller_totals[seller_id]['amount'], seller_id)
+            )[:10]
+            sellers_stats = [
+                (names[seller_id], seller_totals[seller_id]['count'], seller_totals[seller_id]['amount'])
+                for seller_id in ranked
+            ]
             
             if not sellers_stats:
                 text = "Hozircha sotuvlar yo'q."
@@ -2466,9 +2336,11 @@ async def compare_sellers(update: Update, context: ContextTypes.DEFAULT_TYPE):
                     text += f"   O'rtacha: {(total/count):,.0f} so'm\n\n"
             
             keyboard = get_comparison_menu()
-            await update.callback_query.edit_message_text(text, reply_markup=keyboard)
-        finally:
-            db.close()
+            return text, keyboard
+
+        text, keyboard = await run_db(_build)
+
+        await update.callback_query.edit_message_text(text, reply_markup=keyboard)
     except Exception as e:
         keyboard = get_comparison_menu()
         await update.callback_query.edit_message_text(f"❌ Xatolik: {str(e)}", reply_markup=keyboard)
@@ -2510,11 +2382,9 @@ async def system_status(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Tizim holati"""
     try:
         from sqlalchemy.orm import Session
-        from database import SessionLocal
         from models import Product, Customer, Seller, Sale
         
-        db: Session = SessionLocal()
-        try:
+        def _build(db: Session):
             products_count = db.query(Product).count()
             customers_count = db.query(Customer).count()
             sellers_count = db.query(Seller).count()
@@ -2529,9 +2399,11 @@ async def system_status(update: Update, context: ContextTypes.DEFAULT_TYPE):
             text += "✅ Tizim normal ishlayapti"
             
             keyboard = get_settings_menu()
-            await update.callback_query.edit_message_text(text, reply_markup=keyboard)
-        finally:
-            db.close()
+            return text, keyboard
+
+        text, keyboard = await run_db(_build)
+
+        await update.callback_query.edit_message_text(text, reply_markup=keyboard)
     except Exception as e:
         keyboard = get_settings_menu()
         await update.callback_query.edit_message_text(f"❌ Xatolik: {str(e)}", reply_markup=keyboard)
@@ -2540,13 +2412,10 @@ async def payment_stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """To'lov turlari statistikasi"""
     try:
         from sqlalchemy.orm import Session
-        from database import SessionLocal
-        from sale_service import SaleService
+        from analytics_service import AnalyticsService
         
-        db: Session = SessionLocal()
-        try:
-            stats = SaleService.get_statistics(db)
-            payment_methods = stats.get('payment_methods', {})
+        def _build(db: Session):
+            payment_methods = AnalyticsService.get_payment_method_totals(db)
             
             if not payment_methods:
                 text = "Hozircha to'lovlar yo'q."
@@ -2572,12 +2441,14 @@ async def payment_stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 text += f"💰 Jami: {total_amount:,.0f} so'm"
             
             keyboard = get_payments_menu()
-            if update.callback_query:
-                await update.callback_query.edit_message_text(text, reply_markup=keyboard)
-            else:
-                await update.message.reply_text(text, reply_markup=keyboard)
-        finally:
-            db.close()
+            return text, keyboard
+
+        text, keyboard = await run_db(_build)
+
+        if update.callback_query:
+            await update.callback_query.edit_message_text(text, reply_markup=keyboard)
+        else:
+            await update.message.reply_text(text, reply_markup=keyboard)
     except Exception as e:
         error_msg = f"❌ Xatolik: {str(e)}"
         keyboard = get_payments_menu()
@@ -2622,47 +2493,41 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 async def handle_inline_sale(update: Update, context: ContextTypes.DEFAULT_TYPE, product_id: int):
     """Inline sotuv - mahsulot sotish"""
     try:
-        from sqlalchemy.orm import Session
-        from database import SessionLocal
         from models import Product, Customer, Seller
         
-        db: Session = SessionLocal()
-        try:
-            # Mahsulot ma'lumotlarini olish
-            product = db.query(Product).filter(Product.id == product_id).first()
-            if not product:
-                await update.callback_query.edit_message_text(
-                    "❌ Mahsulot topilmadi.",
-                    reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("⬅️ Orqaga", callback_data='search_product')]])
-                )
-                return
-            
-            # Omborda mavjudligini tekshirish
-            total_pieces = product.packages_in_stock * product.pieces_per_package + product.pieces_in_stock
-            if total_pieces <= 0:
-                await update.callback_query.edit_message_text(
-                    f"❌ {product.name} ombordan tugagan.",
-                    reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("⬅️ Orqaga", callback_data='search_product')]])
-                )
-                return
-            
-            # Sotuvni boshlash
-            text = f"🛒 SOTUV: {product.name}\n\n"
-            text += f"📦 Mavjud: {product.packages_in_stock} qop, {product.pieces_in_stock} dona\n"
-            text += f"📊 Jami: {total_pieces} dona\n\n"
-            text += f"💰 Narx: {product.wholesale_price:,.0f} so'm/dona\n\n"
-            text += "Nechta sotmoqchisiz? (miqdorni yozing)"
-            
-            # Holatni saqlash
-            context.user_data['inline_sale_product_id'] = product_id
-            context.user_data['waiting_for'] = 'inline_sale_quantity'
-            
-            keyboard = [[InlineKeyboardButton("❌ Bekor qilish", callback_data='search_product')]]
-            # Photo message bo'lgani uchun yangi text message yuborish
-            await update.callback_query.message.reply_text(text, reply_markup=InlineKeyboardMarkup(keyboard))
-            await update.callback_query.answer()
-        finally:
-            db.close()
+        # Mahsulot ma'lumotlarini olish
+        product = await run_db(lambda db: db.query(Product).filter(Product.id == product_id).first())
+        if not product:
+            await update.callback_query.edit_message_text(
+                "❌ Mahsulot topilmadi.",
+                reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("⬅️ Orqaga", callback_data='search_product')]])
+            )
+            return
+        
+        # Omborda mavjudligini tekshirish
+        total_pieces = product.packages_in_stock * product.pieces_per_package + product.pieces_in_stock
+        if total_pieces <= 0:
+            await update.callback_query.edit_message_text(
+                f"❌ {product.name} ombordan tugagan.",
+                reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("⬅️ Orqaga", callback_data='search_product')]])
+            )
+            return
+        
+        # Sotuvni boshlash
+        text = f"🛒 SOTUV: {product.name}\n\n"
+        text += f"📦 Mavjud: {product.packages_in_stock} qop, {product.pieces_in_stock} dona\n"
+        text += f"📊 Jami: {total_pieces} dona\n\n"
+        text += f"💰 Narx: {product.wholesale_price:,.0f} so'm/dona\n\n"
+        text += "Nechta sotmoqchisiz? (miqdorni yozing)"
+        
+        # Holatni saqlash
+        context.user_data['inline_sale_product_id'] = product_id
+        context.user_data['waiting_for'] = 'inline_sale_quantity'
+        
+        keyboard = [[InlineKeyboardButton("❌ Bekor qilish", callback_data='search_product')]]
+        # Photo message bo'lgani uchun yangi text message yuborish
+        await update.callback_query.message.reply_text(text, reply_markup=InlineKeyboardMarkup(keyboard))
+        await update.callback_query.answer()
     except Exception as e:
         keyboard = [[InlineKeyboardButton("⬅️ Orqaga", callback_data='search_product')]]
         # Photo message bo'lgani uchun yangi text message yuborish
@@ -2847,6 +2712,10 @@ async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await send_receipt_menu(update, context)
     elif query.data.startswith('receipt_sale_'):
         await send_sale_receipt(update, context)
+    elif query.data.startswith('escpos_sale_'):
+        await send_escpos_receipt(update, context)
+    elif query.data in ('batch_receipts_pdf', 'batch_receipts_zip'):
+        await send_batch_receipts(update, context)
     elif query.data == 'birthdays':
         await birthdays_today(update, context)
     elif query.data == 'loyalty_program':
@@ -2905,35 +2774,28 @@ async def send_scheduled_daily_report():
     """Kunlik avtomatik hisobot yuborish"""
     try:
         from sqlalchemy.orm import Session
-        from database import SessionLocal
-        from models import Sale
+        from analytics_service import AnalyticsService
         from utils import get_uzbekistan_now
-        from datetime import timedelta
         
-        db: Session = SessionLocal()
-        try:
+        def _build(db: Session):
             now = get_uzbekistan_now()
-            today_start = now.replace(hour=0, minute=0, second=0, microsecond=0)
+            today_start = AnalyticsService.period_start(now, 'day')
             
             # Bugungi sotuvlar
-            sales = db.query(Sale).filter(
-                Sale.created_at >= today_start,
-                (Sale.admin_approved == True) | (Sale.requires_admin_approval == False)
-            ).all()
-            
-            total_amount = sum(s.total_amount for s in sales)
+            totals = AnalyticsService.get_range_totals(db, today_start, now)
             
             text = f"📊 KUNLIK HISOBOT - {now.strftime('%d.%m.%Y')}\n\n"
-            text += f"🛒 Sotuvlar soni: {len(sales)} ta\n"
-            text += f"💰 Jami summa: {total_amount:,.0f} so'm\n"
-            
-            # Adminlarga yuborish
-            from telegram import Bot
-            bot = Bot(token=TELEGRAM_TOKEN)
-            for admin_id in ADMIN_CHAT_IDS:
-                await bot.send_message(chat_id=admin_id, text=text)
-        finally:
-            db.close()
+            text += f"🛒 Sotuvlar soni: {totals['count']} ta\n"
+            text += f"💰 Jami summa: {totals['amount']:,.0f} so'm\n"
+            return text
+
+        text = await run_db(_build)
+
+        # Adminlarga yuborish
+        from telegram import Bot
+        bot = Bot(token=TELEGRAM_TOKEN)
+        for admin_id in ADMIN_CHAT_IDS:
+            await bot.send_message(chat_id=admin_id, text=text)
     except Exception as e:
         print(f"Kunlik hisobot xatosi: {e}")
 
@@ -2942,35 +2804,30 @@ async def send_scheduled_weekly_report():
     """Haftalik avtomatik hisobot yuborish"""
     try:
         from sqlalchemy.orm import Session
-        from database import SessionLocal
-        from models import Sale
+        from analytics_service import AnalyticsService
         from utils import get_uzbekistan_now
-        from datetime import timedelta
         
-        db: Session = SessionLocal()
-        try:
+        def _build(db: Session):
             now = get_uzbekistan_now()
-            week_start = now - timedelta(days=7)
-            
-            sales = db.query(Sale).filter(
-                Sale.created_at >= week_start,
-                (Sale.admin_approved == True) | (Sale.requires_admin_approval == False)
-            ).all()
-            
-            total_amount = sum(s.total_amount for s in sales)
+            # Bugun bilan birga oxirgi 7 kun
+            days = AnalyticsService.get_last_periods(db, 'day', 7, now=now)
+            week_start = days[0]['start']
+            total_amount = sum(day['amount'] for day in days)
+            total_count = sum(day['count'] for day in days)
             
             text = f"📊 HAFTALIK HISOBOT\n"
             text += f"📅 {week_start.strftime('%d.%m')} - {now.strftime('%d.%m.%Y')}\n\n"
-            text += f"🛒 Sotuvlar soni: {len(sales)} ta\n"
+            text += f"🛒 Sotuvlar soni: {total_count} ta\n"
             text += f"💰 Jami summa: {total_amount:,.0f} so'm\n"
             text += f"📊 O'rtacha kunlik: {total_amount/7:,.0f} so'm\n"
-            
-            from telegram import Bot
-            bot = Bot(token=TELEGRAM_TOKEN)
-            for admin_id in ADMIN_CHAT_IDS:
-                await bot.send_message(chat_id=admin_id, text=text)
-        finally:
-            db.close()
+            return text
+
+        text = await run_db(_build)
+
+        from telegram import Bot
+        bot = Bot(token=TELEGRAM_TOKEN)
+        for admin_id in ADMIN_CHAT_IDS:
+            await bot.send_message(chat_id=admin_id, text=text)
     except Exception as e:
         print(f"Haftalik hisobot xatosi: {e}")
 
@@ -3007,18 +2864,15 @@ async def payment_reminders(update: Update, context: ContextTypes.DEFAULT_TYPE):
         from sqlalchemy.orm import Session
         from datetime import timedelta
         try:
-            from database import SessionLocal
             from models import Customer
             from utils import get_uzbekistan_now
         except ImportError:
             import sys, os
             sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
-            from database import SessionLocal
             from models import Customer
             from utils import get_uzbekistan_now
         
-        db: Session = SessionLocal()
-        try:
+        def _build(db: Session):
             now = get_uzbekistan_now()
             week_later = now + timedelta(days=7)
             
@@ -3046,10 +2900,11 @@ async def payment_reminders(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 [InlineKeyboardButton("📨 Barchasiga eslatma yuborish", callback_data='send_reminder_all')],
                 [InlineKeyboardButton("⬅️ Orqaga", callback_data='payments_menu')]
             ]
-            
-            await update.callback_query.edit_message_text(text, reply_markup=InlineKeyboardMarkup(keyboard))
-        finally:
-            db.close()
+            return text, keyboard
+
+        text, keyboard = await run_db(_build)
+
+        await update.callback_query.edit_message_text(text, reply_markup=InlineKeyboardMarkup(keyboard))
     except Exception as e:
         await update.callback_query.edit_message_text(f"❌ Xatolik: {e}", reply_markup=get_main_keyboard())
 
@@ -3071,16 +2926,13 @@ async def receive_payment_menu(update: Update, context: ContextTypes.DEFAULT_TYP
     try:
         from sqlalchemy.orm import Session
         try:
-            from database import SessionLocal
             from models import Customer
         except ImportError:
             import sys, os
             sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
-            from database import SessionLocal
             from models import Customer
         
-        db: Session = SessionLocal()
-        try:
+        def _build(db: Session):
             customers = db.query(Customer).filter(
                 Customer.debt_balance > 0
             ).order_by(Customer.debt_balance.desc()).limit(10).all()
@@ -3097,10 +2949,11 @@ async def receive_payment_menu(update: Update, context: ContextTypes.DEFAULT_TYP
                         callback_data=f'pay_customer_{c.id}'
                     )])
                 keyboard.append([InlineKeyboardButton("⬅️ Orqaga", callback_data='payments_menu')])
-            
-            await update.callback_query.edit_message_text(text, reply_markup=InlineKeyboardMarkup(keyboard))
-        finally:
-            db.close()
+            return text, keyboard
+
+        text, keyboard = await run_db(_build)
+
+        await update.callback_query.edit_message_text(text, reply_markup=InlineKeyboardMarkup(keyboard))
     except Exception as e:
         await update.callback_query.edit_message_text(f"❌ Xatolik: {e}", reply_markup=get_main_keyboard())
 
@@ -3128,28 +2981,27 @@ async def handle_payment_amount_input(update: Update, context: ContextTypes.DEFA
             return
         
         from sqlalchemy.orm import Session
-        from database import SessionLocal
         from models import Customer
         
-        db: Session = SessionLocal()
-        try:
+        def _pay(db: Session):
             customer = db.query(Customer).filter(Customer.id == customer_id).first()
-            if customer:
-                old_debt = customer.debt_balance
-                customer.debt_balance = max(0, old_debt - amount)
-                db.commit()
-                
-                text = f"✅ TO'LOV QABUL QILINDI!\n\n"
-                text += f"👤 Mijoz: {customer.name}\n"
-                text += f"💵 To'lov: {amount:,.0f} so'm\n"
-                text += f"📝 Oldingi qarz: {old_debt:,.0f} so'm\n"
-                text += f"📝 Yangi qarz: {customer.debt_balance:,.0f} so'm\n"
-                
-                await update.message.reply_text(text, reply_markup=get_main_keyboard())
-            else:
-                await update.message.reply_text("❌ Mijoz topilmadi!", reply_markup=get_main_keyboard())
+            if not customer:
+                return "❌ Mijoz topilmadi!"
+            old_debt = customer.debt_balance
+            customer.debt_balance = max(0, old_debt - amount)
+            db.commit()
+
+            text = f"✅ TO'LOV QABUL QILINDI!\n\n"
+            text += f"👤 Mijoz: {customer.name}\n"
+            text += f"💵 To'lov: {amount:,.0f} so'm\n"
+            text += f"📝 Oldingi qarz: {old_debt:,.0f} so'm\n"
+            text += f"📝 Yangi qarz: {customer.debt_balance:,.0f} so'm\n"
+            return text
+
+        try:
+            text = await run_db(_pay)
+            await update.message.reply_text(text, reply_markup=get_main_keyboard())
         finally:
-            db.close()
             context.user_data.pop('waiting_for', None)
             context.user_data.pop('payment_customer_id', None)
     except ValueError:
@@ -3161,32 +3013,25 @@ async def cash_report(update: Update, context: ContextTypes.DEFAULT_TYPE):
     try:
         from sqlalchemy.orm import Session
         try:
-            from database import SessionLocal
-            from models import Sale, PaymentMethod
             from utils import get_uzbekistan_now
+            from services.analytics_service import AnalyticsService
         except ImportError:
             import sys, os
             sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
-            from database import SessionLocal
-            from models import Sale, PaymentMethod
             from utils import get_uzbekistan_now
+            from analytics_service import AnalyticsService
         
-        db: Session = SessionLocal()
-        try:
+        def _build(db: Session):
             now = get_uzbekistan_now()
-            today_start = now.replace(hour=0, minute=0, second=0, microsecond=0)
+            today_start = AnalyticsService.period_start(now, 'day')
             
-            # Bugungi sotuvlar (tasdiqlangan yoki tasdiq kutmaydigan)
-            sales = db.query(Sale).filter(
-                Sale.created_at >= today_start
-            ).filter(
-                (Sale.admin_approved == True) | (Sale.requires_admin_approval == False)
-            ).all()
-            
-            cash_total = sum((s.payment_amount or 0) for s in sales if s.payment_method == PaymentMethod.CASH)
-            card_total = sum((s.payment_amount or 0) for s in sales if s.payment_method == PaymentMethod.CARD)
-            transfer_total = sum((s.payment_amount or 0) for s in sales if s.payment_method == PaymentMethod.BANK_TRANSFER)
-            debt_total = sum(s.total_amount - (s.payment_amount or 0) for s in sales)
+            # Bugungi sotuvlar (tasdiqlangan yoki tasdiq kutmaydigan), to'lov turi bo'yicha
+            payments = AnalyticsService.get_payment_method_totals(db, today_start, now)
+            empty = {'amount': 0, 'paid': 0}
+            cash_total = payments.get('cash', empty)['paid']
+            card_total = payments.get('card', empty)['paid']
+            transfer_total = payments.get('bank_transfer', empty)['paid']
+            debt_total = sum(totals['amount'] - totals['paid'] for totals in payments.values())
             
             text = f"💵 KASSA HISOBOTI - {now.strftime('%d.%m.%Y')}\n\n"
             text += f"💰 Naqd pul: {cash_total:,.0f} so'm\n"
@@ -3197,9 +3042,11 @@ async def cash_report(update: Update, context: ContextTypes.DEFAULT_TYPE):
             text += f"📊 JAMI: {cash_total + card_total + transfer_total:,.0f} so'm\n"
             
             keyboard = [[InlineKeyboardButton("⬅️ Orqaga", callback_data='payments_menu')]]
-            await update.callback_query.edit_message_text(text, reply_markup=InlineKeyboardMarkup(keyboard))
-        finally:
-            db.close()
+            return text, keyboard
+
+        text, keyboard = await run_db(_build)
+
+        await update.callback_query.edit_message_text(text, reply_markup=InlineKeyboardMarkup(keyboard))
     except Exception as e:
         await update.callback_query.edit_message_text(f"❌ Xatolik: {e}", reply_markup=get_main_keyboard())
 
@@ -3210,18 +3057,15 @@ async def send_receipt_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
         from sqlalchemy.orm import Session
         from datetime import timedelta
         try:
-            from database import SessionLocal
             from models import Sale
             from utils import get_uzbekistan_now
         except ImportError:
             import sys, os
             sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
-            from database import SessionLocal
             from models import Sale
             from utils import get_uzbekistan_now
         
-        db: Session = SessionLocal()
-        try:
+        def _build(db: Session):
             now = get_uzbekistan_now()
             today_start = now.replace(hour=0, minute=0, second=0, microsecond=0)
             
@@ -3242,11 +3086,16 @@ async def send_receipt_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
                         f"{time} - {customer_name} - {s.total_amount:,.0f}",
                         callback_data=f'receipt_sale_{s.id}'
                     )])
+                keyboard.append([
+                    InlineKeyboardButton("📦 Bugungi cheklar (PDF)", callback_data='batch_receipts_pdf'),
+                    InlineKeyboardButton("🗜 ZIP", callback_data='batch_receipts_zip')
+                ])
                 keyboard.append([InlineKeyboardButton("⬅️ Orqaga", callback_data='main_menu')])
-            
-            await update.callback_query.edit_message_text(text, reply_markup=InlineKeyboardMarkup(keyboard))
-        finally:
-            db.close()
+            return text, keyboard
+
+        text, keyboard = await run_db(_build)
+
+        await update.callback_query.edit_message_text(text, reply_markup=InlineKeyboardMarkup(keyboard))
     except Exception as e:
         await update.callback_query.edit_message_text(f"❌ Xatolik: {e}", reply_markup=get_main_keyboard())
 
@@ -3258,64 +3107,130 @@ async def send_sale_receipt(update: Update, context: ContextTypes.DEFAULT_TYPE):
     try:
         from sqlalchemy.orm import Session
         try:
-            from database import SessionLocal
             from models import Sale
         except ImportError:
             import sys, os
             sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
-            from database import SessionLocal
             from models import Sale
         
-        db: Session = SessionLocal()
-        try:
+        def _build(db: Session):
             sale = db.query(Sale).filter(Sale.id == sale_id).first()
-            if sale:
-                customer_name = sale.customer.name if sale.customer else "O'chirilgan mijoz"
-                seller_name = sale.seller.name if sale.seller else "Noma'lum"
-                text = f"🧾 CHEK #{sale.id}\n"
-                text += f"━━━━━━━━━━━━━━━━\n"
-                text += f"📅 Sana: {sale.created_at.strftime('%d.%m.%Y %H:%M')}\n"
-                text += f"👤 Mijoz: {customer_name}\n"
-                text += f"👨‍💼 Sotuvchi: {seller_name}\n\n"
-                text += "📦 MAHSULOTLAR:\n"
-                
-                for item in sale.items:
-                    text += f"• {item.product.name}\n"
-                    text += f"  {item.requested_quantity} x {item.piece_price:,.0f} = {item.subtotal:,.0f}\n"
-                
-                text += f"\n━━━━━━━━━━━━━━━━\n"
-                text += f"💰 JAMI: {sale.total_amount:,.0f} so'm\n"
-                text += f"✅ To'langan: {(sale.payment_amount or 0):,.0f} so'm\n"
-                if sale.total_amount > (sale.payment_amount or 0):
-                    text += f"📝 Qarz: {sale.total_amount - (sale.payment_amount or 0):,.0f} so'm\n"
-                
-                await update.callback_query.answer("✅ Chek tayyor!")
-                await update.callback_query.edit_message_text(text, reply_markup=InlineKeyboardMarkup([
-                    [InlineKeyboardButton("⬅️ Orqaga", callback_data='send_receipt')]
-                ]))
-        finally:
-            db.close()
+            if not sale:
+                return None
+            customer_name = sale.customer.name if sale.customer else "O'chirilgan mijoz"
+            seller_name = sale.seller.name if sale.seller else "Noma'lum"
+            text = f"🧾 CHEK #{sale.id}\n"
+            text += f"━━━━━━━━━━━━━━━━\n"
+            text += f"📅 Sana: {sale.created_at.strftime('%d.%m.%Y %H:%M')}\n"
+            text += f"👤 Mijoz: {customer_name}\n"
+            text += f"👨‍💼 Sotuvchi: {seller_name}\n\n"
+            text += "📦 MAHSULOTLAR:\n"
+            
+            for item in sale.items:
+                text += f"• {item.product.name}\n"
+                text += f"  {item.requested_quantity} x {item.piece_price:,.0f} = {item.subtotal:,.0f}\n"
+            
+            text += f"\n━━━━━━━━━━━━━━━━\n"
+            text += f"💰 JAMI: {sale.total_amount:,.0f} so'm\n"
+            text += f"✅ To'langan: {(sale.payment_amount or 0):,.0f} so'm\n"
+            if sale.total_amount > (sale.payment_amount or 0):
+                text += f"📝 Qarz: {sale.total_amount - (sale.payment_amount or 0):,.0f} so'm\n"
+            return text
+
+        text = await run_db(_build)
+        if text:
+            await update.callback_query.answer("✅ Chek tayyor!")
+            await update.callback_query.edit_message_text(text, reply_markup=InlineKeyboardMarkup([
+                [InlineKeyboardButton("🖨 Termal printer (ESC/POS)", callback_data=f'escpos_sale_{sale_id}')],
+                [InlineKeyboardButton("⬅️ Orqaga", callback_data='send_receipt')]
+            ]))
     except Exception as e:
         await update.callback_query.edit_message_text(f"❌ Xatolik: {e}", reply_markup=get_main_keyboard())
 
 
+async def send_escpos_receipt(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Sotuv chekini termal printer uchun ESC/POS fayl qilib yuborish"""
+    query = update.callback_query
+    sale_id = int(query.data.split('_')[-1])
+    
+    try:
+        try:
+            from services.escpos_service import EscPosService
+        except ImportError:
+            from escpos_service import EscPosService
+        
+        content = await run_db(EscPosService.generate_receipt, sale_id)
+        await query.answer("✅ ESC/POS chek tayyor!")
+        await context.bot.send_document(
+            chat_id=update.effective_chat.id,
+            document=content,
+            filename=f"chek_{sale_id}.bin",
+            caption=f"🖨 Chek #{sale_id} (58/80mm termal printer, ESC/POS)"
+        )
+    except Exception as e:
+        await query.answer(f"❌ Xatolik: {e}", show_alert=True)
+
+
+async def send_batch_receipts(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Bugungi barcha cheklarni bitta PDF yoki ZIP qilib yuborish"""
+    query = update.callback_query
+    fmt = query.data.split('_')[-1]
+    back_keyboard = InlineKeyboardMarkup([[InlineKeyboardButton("⬅️ Orqaga", callback_data='send_receipt')]])
+    
+    try:
+        try:
+            from utils import get_uzbekistan_now
+        except ImportError:
+            import sys, os
+            sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+            from utils import get_uzbekistan_now
+        
+        today = get_uzbekistan_now().strftime('%Y-%m-%d')
+        sales, settings = await run_db(ReceiptBatchService.load_sales, start_date=today, end_date=today)
+        if not sales:
+            await query.edit_message_text("Bugun sotuvlar yo'q.", reply_markup=back_keyboard)
+            return
+        
+        await query.answer("⏳ Cheklar tayyorlanmoqda...")
+        last_shown = {'done': 0}
+        
+        async def report_progress(done, total):
+            # Telegram limitlari uchun har 10% da yangilanadi
+            step = max(1, total // 10)
+            if done == total or done - last_shown['done'] >= step:
+                last_shown['done'] = done
+                try:
+                    await query.edit_message_text(f"⏳ Cheklar tayyorlanmoqda: {done}/{total}")
+                except Exception:
+                    pass
+        
+        content = await ReceiptBatchService.render(sales, settings, fmt, progress=report_progress)
+        
+        await context.bot.send_document(
+            chat_id=update.effective_chat.id,
+            document=content,
+            filename=f"cheklar_{today}.{fmt}",
+            caption=f"🧾 Bugungi cheklar: {len(sales)} ta"
+        )
+        await query.edit_message_text(f"✅ {len(sales)} ta chek yuborildi.", reply_markup=back_keyboard)
+    except Exception as e:
+        await query.edit_message_text(f"❌ Xatolik: {e}", reply_markup=back_keyboard)
+
+
 async def birthdays_today(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Bugungi tug'ilgan kunlar"""
     try:
         from sqlalchemy.orm import Session
         try:
-            from database import SessionLocal
             from models import Customer
             from utils import get_uzbekistan_now
         except ImportError:
             import sys, os
             sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
-            from database import SessionLocal
             from models import Customer
             from utils import get_uzbekistan_now
         
-        db: Session = SessionLocal()
-        try:
+        def _build(db: Session):
             now = get_uzbekistan_now()
             today_month = now.month
             today_day = now.day
@@ -3342,10 +3257,11 @@ async def birthdays_today(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 [InlineKeyboardButton("📨 Tabrik yuborish", callback_data='send_birthday_wishes')],
                 [InlineKeyboardButton("⬅️ Orqaga", callback_data='customers_menu')]
             ]
-            
-            await update.callback_query.edit_message_text(text, reply_markup=InlineKeyboardMarkup(keyboard))
-        finally:
-            db.close()
+            return text, keyboard
+
+        text, keyboard = await run_db(_build)
+
+        await update.callback_query.edit_message_text(text, reply_markup=InlineKeyboardMarkup(keyboard))
     except Exception as e:
         await update.callback_query.edit_message_text(f"❌ Xatolik: {e}", reply_markup=get_main_keyboard())
 
@@ -3356,16 +3272,13 @@ async def loyalty_program(update: Update, context: ContextTypes.DEFAULT_TYPE):
         from sqlalchemy.orm import Session
         from sqlalchemy import func
         try:
-            from database import SessionLocal
             from models import Customer, Sale
         except ImportError:
             import sys, os
             sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
-            from database import SessionLocal
             from models import Customer, Sale
         
-        db: Session = SessionLocal()
-        try:
+        def _build(db: Session):
             # Eng ko'p xarid qilgan mijozlar
             top_customers = db.query(
                 Customer.id,
@@ -3393,9 +3306,11 @@ async def loyalty_program(update: Update, context: ContextTypes.DEFAULT_TYPE):
             text += "🎁 100 ball = 5% chegirma"
             
             keyboard = [[InlineKeyboardButton("⬅️ Orqaga", callback_data='customers_menu')]]
-            await update.callback_query.edit_message_text(text, reply_markup=InlineKeyboardMarkup(keyboard))
-        finally:
-            db.close()
+            return text, keyboard
+
+        text, keyboard = await run_db(_build)
+
+        await update.callback_query.edit_message_text(text, reply_markup=InlineKeyboardMarkup(keyboard))
     except Exception as e:
         await update.callback_query.edit_message_text(f"❌ Xatolik: {e}", reply_markup=get_main_keyboard())
 
@@ -3420,16 +3335,13 @@ async def stock_alerts(update: Update, context: ContextTypes.DEFAULT_TYPE):
     try:
         from sqlalchemy.orm import Session
         try:
-            from database import SessionLocal
             from models import Product
         except ImportError:
             import sys, os
             sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
-            from database import SessionLocal
             from models import Product
         
-        db: Session = SessionLocal()
-        try:
+        def _build(db: Session):
             # Juda kam qolganlar (5 dan kam)
             critical = db.query(Product).filter(
                 Product.packages_in_stock * Product.pieces_per_package + Product.pieces_in_stock < 5
@@ -3463,10 +3375,11 @@ async def stock_alerts(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 [InlineKeyboardButton("📋 To'liq ro'yxat", callback_data='low_stock')],
                 [InlineKeyboardButton("⬅️ Orqaga", callback_data='products_menu')]
             ]
-            
-            await update.callback_query.edit_message_text(text, reply_markup=InlineKeyboardMarkup(keyboard))
-        finally:
-            db.close()
+            return text, keyboard
+
+        text, keyboard = await run_db(_build)
+
+        await update.callback_query.edit_message_text(text, reply_markup=InlineKeyboardMarkup(keyboard))
     except Exception as e:
         await update.callback_query.edit_message_text(f"❌ Xatolik: {e}", reply_markup=get_main_keyboard())
 
@@ -3476,16 +3389,13 @@ async def inventory_check(update: Update, context: ContextTypes.DEFAULT_TYPE):
     try:
         from sqlalchemy.orm import Session
         try:
-            from database import SessionLocal
             from models import Product
         except ImportError:
             import sys, os
             sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
-            from database import SessionLocal
             from models import Product
         
-        db: Session = SessionLocal()
-        try:
+        def _build(db: Session):
             products = db.query(Product).filter(
                 (Product.packages_in_stock * Product.pieces_per_package + Product.pieces_in_stock) > 0
             ).order_by(Product.name).limit(10).all()
@@ -3503,10 +3413,11 @@ async def inventory_check(update: Update, context: ContextTypes.DEFAULT_TYPE):
             
             keyboard.append([InlineKeyboardButton("✅ Barchasini tasdiqlash", callback_data='inv_confirm_all')])
             keyboard.append([InlineKeyboardButton("⬅️ Orqaga", callback_data='products_menu')])
-            
-            await update.callback_query.edit_message_text(text, reply_markup=InlineKeyboardMarkup(keyboard))
-        finally:
-            db.close()
+            return text, keyboard
+
+        text, keyboard = await run_db(_build)
+
+        await update.callback_query.edit_message_text(text, reply_markup=InlineKeyboardMarkup(keyboard))
     except Exception as e:
         await update.callback_query.edit_message_text(f"❌ Xatolik: {e}", reply_markup=get_main_keyboard())
 
@@ -3516,54 +3427,55 @@ async def inventory_confirm(update: Update, context: ContextTypes.DEFAULT_TYPE):
     try:
         from sqlalchemy.orm import Session
         try:
-            from database import SessionLocal
             from models import Product
         except ImportError:
             import sys, os
             sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
-            from database import SessionLocal
             from models import Product
         
         callback_data = update.callback_query.data
         
-        db: Session = SessionLocal()
-        try:
-            if callback_data == 'inv_confirm_all':
+        from datetime import datetime
+
+        if callback_data == 'inv_confirm_all':
+            def _confirm_all(db: Session):
                 # Tasdiqlash - hozircha faqat log
                 products = db.query(Product).filter(
                     (Product.packages_in_stock * Product.pieces_per_package + Product.pieces_in_stock) > 0
                 ).all()
-                
+
                 # Inventarizatsiya sanasini yangilash (agar kerak bo'lsa)
-                from datetime import datetime
                 for p in products:
                     p.updated_at = datetime.utcnow()
-                
+
                 db.commit()
-                await update.callback_query.answer(f"✅ {len(products)} ta mahsulot tasdiqlandi!")
-                await products_menu(update, context)
-                return
-            
-            # Bitta mahsulot tasdiqlash
-            product_id = int(callback_data.split('_')[-1])
+                return len(products)
+
+            count = await run_db(_confirm_all)
+            await update.callback_query.answer(f"✅ {count} ta mahsulot tasdiqlandi!")
+            await products_menu(update, context)
+            return
+
+        # Bitta mahsulot tasdiqlash
+        product_id = int(callback_data.split('_')[-1])
+
+        def _confirm_one(db: Session):
             product = db.query(Product).filter(Product.id == product_id).first()
-            
-            if product:
-                # Inventarizatsiya sanasini yangilash
-                from datetime import datetime
-                product.updated_at = datetime.utcnow()
-                db.commit()
-                
-                stock = (product.packages_in_stock * product.pieces_per_package) + product.pieces_in_stock
-                await update.callback_query.answer(
-                    f"✅ {product.name} tasdiqlandi! Qoldiq: {stock} dona",
-                    show_alert=True
-                )
-            else:
-                await update.callback_query.answer("❌ Mahsulot topilmadi", show_alert=True)
-                
-        finally:
-            db.close()
+            if not product:
+                return None
+
+            # Inventarizatsiya sanasini yangilash
+            product.updated_at = datetime.utcnow()
+            db.commit()
+
+            stock = (product.packages_in_stock * product.pieces_per_package) + product.pieces_in_stock
+            return f"✅ {product.name} tasdiqlandi! Qoldiq: {stock} dona"
+
+        text = await run_db(_confirm_one)
+        if text:
+            await update.callback_query.answer(text, show_alert=True)
+        else:
+            await update.callback_query.answer("❌ Mahsulot topilmadi", show_alert=True)
             
     except Exception as e:
         print(f"Inventory confirm error: {e}")
@@ -3577,16 +3489,13 @@ async def delivery_tracking(update: Update, context: ContextTypes.DEFAULT_TYPE):
     try:
         from sqlalchemy.orm import Session
         try:
-            from database import SessionLocal
             from models import Order, OrderStatus
         except ImportError:
             import sys, os
             sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
-            from database import SessionLocal
             from models import Order, OrderStatus
         
-        db: Session = SessionLocal()
-        try:
+        def _build(db: Session):
             # Yetkazib berilmagan buyurtmalar
             orders = db.query(Order).filter(
                 Order.status.in_([OrderStatus.PENDING, OrderStatus.PROCESSING])
@@ -3617,10 +3526,11 @@ async def delivery_tracking(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 [InlineKeyboardButton("📍 Xaritada ko'rish", callback_data='delivery_map')],
                 [InlineKeyboardButton("⬅️ Orqaga", callback_data='main_menu')]
             ]
-            
-            await update.callback_query.edit_message_text(text, reply_markup=InlineKeyboardMarkup(keyboard))
-        finally:
-            db.close()
+            return text, keyboard
+
+        text, keyboard = await run_db(_build)
+
+        await update.callback_query.edit_message_text(text, reply_markup=InlineKeyboardMarkup(keyboard))
     except Exception as e:
         await update.callback_query.edit_message_text(f"❌ Xatolik: {e}", reply_markup=get_main_keyboard())
 
@@ -3635,18 +3545,15 @@ async def seller_locations(update: Update, context: ContextTypes.DEFAULT_TYPE):
     try:
         from sqlalchemy.orm import Session
         try:
-            from database import SessionLocal
             from models import Seller
             from utils import get_uzbekistan_now
         except ImportError:
             import sys, os
             sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
-            from database import SessionLocal
             from models import Seller
             from utils import get_uzbekistan_now
         
-        db: Session = SessionLocal()
-        try:
+        def _build(db: Session):
             sellers = db.query(Seller).filter(
                 Seller.is_active == True,
                 Seller.latitude.isnot(None),
@@ -3677,9 +3584,11 @@ async def seller_locations(update: Update, context: ContextTypes.DEFAULT_TYPE):
                     text += f"   🕐 {time_text}\n\n"
             
             keyboard = [[InlineKeyboardButton("⬅️ Orqaga", callback_data='payments_menu')]]
-            await update.callback_query.edit_message_text(text, reply_markup=InlineKeyboardMarkup(keyboard))
-        finally:
-            db.close()
+            return text, keyboard
+
+        text, keyboard = await run_db(_build)
+
+        await update.callback_query.edit_message_text(text, reply_markup=InlineKeyboardMarkup(keyboard))
     except Exception as e:
         await update.callback_query.edit_message_text(f"❌ Xatolik: {e}", reply_markup=get_main_keyboard())
 
@@ -3690,18 +3599,15 @@ async def work_time_report(update: Update, context: ContextTypes.DEFAULT_TYPE):
         from sqlalchemy.orm import Session
         from sqlalchemy import func
         try:
-            from database import SessionLocal
             from models import Seller, Sale
             from utils import get_uzbekistan_now
         except ImportError:
             import sys, os
             sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
-            from database import SessionLocal
             from models import Seller, Sale
             from utils import get_uzbekistan_now
         
-        db: Session = SessionLocal()
-        try:
+        def _build(db: Session):
             now = get_uzbekistan_now()
             today_start = now.replace(hour=0, minute=0, second=0, microsecond=0)
             
@@ -3737,9 +3643,11 @@ async def work_time_report(update: Update, context: ContextTypes.DEFAULT_TYPE):
                     text += f"   ❌ Bugun sotuv yo'q\n\n"
             
             keyboard = [[InlineKeyboardButton("⬅️ Orqaga", callback_data='payments_menu')]]
-            await update.callback_query.edit_message_text(text, reply_markup=InlineKeyboardMarkup(keyboard))
-        finally:
-            db.close()
+            return text, keyboard
+
+        text, keyboard = await run_db(_build)
+
+        await update.callback_query.edit_message_text(text, reply_markup=InlineKeyboardMarkup(keyboard))
     except Exception as e:
         await update.callback_query.edit_message_text(f"❌ Xatolik: {e}", reply_markup=get_main_keyboard())
 
@@ -3748,22 +3656,20 @@ async def seller_targets(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Sotuvchi rejalari va maqsadlari"""
     try:
         from sqlalchemy.orm import Session
-        from sqlalchemy import func
         try:
-            from database import SessionLocal
-            from models import Seller, Sale
+            from models import Seller
             from utils import get_uzbekistan_now
+            from services.analytics_service import AnalyticsService
         except ImportError:
             import sys, os
             sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
-            from database import SessionLocal
-            from models import Seller, Sale
+            from models import Seller
             from utils import get_uzbekistan_now
+            from analytics_service import AnalyticsService
         
-        db: Session = SessionLocal()
-        try:
+        def _build(db: Session):
             now = get_uzbekistan_now()
-            month_start = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+            month_start = AnalyticsService.period_start(now, 'month')
             
             # Oylik reja (har bir sotuvchi uchun 50 mln default)
             MONTHLY_TARGET = 50000000
@@ -3772,14 +3678,12 @@ async def seller_targets(update: Update, context: ContextTypes.DEFAULT_TYPE):
             text += f"📅 {now.strftime('%B %Y')}\n\n"
             
             sellers = db.query(Seller).filter(Seller.is_active == True).all()
+            # Barcha sotuvchilar uchun bitta so'rov
+            seller_totals = AnalyticsService.get_seller_totals(db, month_start, now)
             
             for s in sellers:
                 # Bu oylik sotuvlar
-                monthly_sales = db.query(func.sum(Sale.total_amount)).filter(
-                    Sale.seller_id == s.id,
-                    Sale.created_at >= month_start,
-                    (Sale.admin_approved == True) | (Sale.requires_admin_approval == False)
-                ).scalar() or 0
+                monthly_sales = seller_totals.get(s.id, {}).get('amount', 0)
                 
                 progress = (monthly_sales / MONTHLY_TARGET) * 100
                 progress_bar = "█" * int(progress / 10) + "░" * (10 - int(progress / 10))
@@ -3791,9 +3695,11 @@ async def seller_targets(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 text += f"   💰 {monthly_sales:,.0f} / {MONTHLY_TARGET:,.0f}\n\n"
             
             keyboard = [[InlineKeyboardButton("⬅️ Orqaga", callback_data='payments_menu')]]
-            await update.callback_query.edit_message_text(text, reply_markup=InlineKeyboardMarkup(keyboard))
-        finally:
-            db.close()
+            return text, keyboard
+
+        text, keyboard = await run_db(_build)
+
+        await update.callback_query.edit_message_text(text, reply_markup=InlineKeyboardMarkup(keyboard))
     except Exception as e:
         await update.callback_query.edit_message_text(f"❌ Xatolik: {e}", reply_markup=get_main_keyboard())
 
@@ -3802,93 +3708,91 @@ async def seller_ranking(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Sotuvchilar reytingi"""
     try:
         from sqlalchemy.orm import Session
-        from sqlalchemy import func
         try:
-            from database import SessionLocal
-            from models import Seller, Sale
+            from models import Seller
             from utils import get_uzbekistan_now
+            from services.analytics_service import AnalyticsService
         except ImportError:
             import sys, os
             sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
-            from database import SessionLocal
-            from models import Seller, Sale
+            from models import Seller
             from utils import get_uzbekistan_now
+            from analytics_service import AnalyticsService
         
-        db: Session = SessionLocal()
-        try:
+        def _build(db: Session):
             now = get_uzbekistan_now()
-            month_start = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-            
-            # Bu oylik eng ko'p sotgan sotuvchilar
-            rankings = db.query(
-                Seller.name,
-                func.count(Sale.id).label('sales_count'),
-                func.sum(Sale.total_amount).label('total_amount')
-            ).join(Sale, Seller.id == Sale.seller_id).filter(
-                Sale.created_at >= month_start,
-                (Sale.admin_approved == True) | (Sale.requires_admin_approval == False)
-            ).group_by(Seller.name).order_by(func.sum(Sale.total_amount).desc()).all()
+            month_start = AnalyticsService.period_start(now, 'month')
+            
+            # Bu oylik eng ko'p sotgan sotuvchilar (bitta guruhlangan so'rov)
+            seller_totals = AnalyticsService.get_seller_totals(db, month_start, now)
+            names = dict(db.query(Seller.id, Seller.name).filter(Seller.id.in_(list(seller_totals))).all()) if seller_totals else {}
+            rankings = sorted(
+                (seller_id for seller_id in seller_totals if seller_id in names),
+                key=lambda seller_id: (-seller_totals[seller_id]['amount'], seller_id)
+            )
             
             text = "🏆 SOTUVCHILAR REYTINGI\n\n"
             text += f"📅 {now.strftime('%B %Y')}\n\n"
             
             medals = ["🥇", "🥈", "🥉"]
             
-            for i, r in enumerate(rankings):
+            for i, seller_id in enumerate(rankings):
                 medal = medals[i] if i < 3 else f"{i+1}."
-                text += f"{medal} {r.name}\n"
-                text += f"   🛒 Sotuvlar: {r.sales_count} ta\n"
-                text += f"   💰 Summa: {r.total_amount:,.0f} so'm\n\n"
+                totals = seller_totals[seller_id]
+                text += f"{medal} {names[seller_id]}\n"
+                text += f"   🛒 Sotuvlar: {totals['count']} ta\n"
+                text += f"   💰 Summa: {totals['amount']:,.0f} so'm\n\n"
             
             if not rankings:
                 text += "Bu oyda sotuvlar yo'q."
             
             keyboard = [[InlineKeyboardButton("⬅️ Orqaga", callback_data='payments_menu')]]
-            await update.callback_query.edit_message_text(text, reply_markup=InlineKeyboardMarkup(keyboard))
-        finally:
-            db.close()
+            return text, keyboard
+
+        text, keyboard = await run_db(_build)
+
+        await update.callback_query.edit_message_text(text, reply_markup=InlineKeyboardMarkup(keyboard))
     except Exception as e:
         await update.callback_query.edit_message_text(f"❌ Xatolik: {e}", reply_markup=get_main_keyboard())
 
 
+async def send_chart_report(update: Update, chart_type, period, title, labels, values, caption, fallback_text, keyboard):
+    """Grafikni PNG rasm qilib yuborish, chizib bo'lmasa matnli grafikni ko'rsatish"""
+    query = update.callback_query
+    try:
+        await send_bar_chart(
+            query.message, chart_type, period, title, labels, values,
+            ylabel="mln so'm", caption=caption
+        )
+    except Exception as e:
+        logging.error(f"Grafik yuborishda xatolik: {e}")
+        await query.edit_message_text(fallback_text, reply_markup=InlineKeyboardMarkup(keyboard))
+        return
+    
+    # Rasm xabarini tahrirlab bo'lmaydi - menyu tugmalari yangi matnli xabarda
+    await query.message.reply_text("⬆️ Grafik", reply_markup=InlineKeyboardMarkup(keyboard))
+    try:
+        await query.message.delete()
+    except Exception:
+        pass
+
+
 async def sales_chart(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Sotuvlar grafigi"""
     try:
         from sqlalchemy.orm import Session
-        from sqlalchemy import func
-        from datetime import timedelta
-        import io
         try:
-            from database import SessionLocal
-            from models import Sale
-            from utils import get_uzbekistan_now
+            from services.analytics_service import AnalyticsService
         except ImportError:
             import sys, os
             sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
-            from database import SessionLocal
-            from models import Sale
-            from utils import get_uzbekistan_now
+            from analytics_service import AnalyticsService
         
-        db: Session = SessionLocal()
-        try:
-            now = get_uzbekistan_now()
-            
+        def _build(db: Session):
             # Oxirgi 7 kunlik ma'lumotlar
-            days_data = []
-            labels = []
-            for i in range(6, -1, -1):
-                day = now - timedelta(days=i)
-                day_start = day.replace(hour=0, minute=0, second=0, microsecond=0)
-                day_end = day_start + timedelta(days=1)
-                
-                daily_total = db.query(func.sum(Sale.total_amount)).filter(
-                    Sale.created_at >= day_start,
-                    Sale.created_at < day_end,
-                    (Sale.admin_approved == True) | (Sale.requires_admin_approval == False)
-                ).scalar() or 0
-                
-                days_data.append(daily_total / 1000000)  # MLN ga o'tkazish
-                labels.append(day.strftime('%d.%m'))
+            days = AnalyticsService.get_last_periods(db, 'day', 7)
+            days_data = [day['amount'] / 1000000 for day in days]  # MLN ga o'tkazish
+            labels = [day['start'].strftime('%d.%m') for day in days]
             
             # Matnli grafik yaratish
             max_val = max(days_data) if days_data else 1
@@ -3903,14 +3807,26 @@ async def sales_chart(update: Update, context: ContextTypes.DEFAULT_TYPE):
             
             text += f"\n📈 Jami: {sum(days_data):.1f} mln so'm"
             
+            best = max(days, key=lambda day: day['amount'])
+            caption = (
+                f"📊 SOTUVLAR GRAFIGI (7 kun)\n\n"
+                f"📈 Jami: {sum(days_data):.1f} mln so'm ({sum(day['count'] for day in days)} ta sotuv)\n"
+                f"📊 O'rtacha: {sum(days_data)/7:.1f} mln/kun\n"
+                f"🏆 Eng yaxshi kun: {best['start'].strftime('%d.%m')} ({best['amount']/1000000:.1f} mln)"
+            )
+            
             keyboard = [
                 [InlineKeyboardButton("📊 Oylik grafik", callback_data='monthly_chart')],
                 [InlineKeyboardButton("⬅️ Orqaga", callback_data='analytics_menu')]
             ]
-            
-            await update.callback_query.edit_message_text(text, reply_markup=InlineKeyboardMarkup(keyboard))
-        finally:
-            db.close()
+            return text, keyboard, labels, days_data, caption, days[-1]['start'].strftime('%Y-%m-%d')
+
+        text, keyboard, labels, values, caption, period = await run_db(_build)
+
+        await send_chart_report(
+            update, 'sales_chart', period, "Sotuvlar (7 kun)", labels, values,
+            caption, text, keyboard
+        )
     except Exception as e:
         await update.callback_query.edit_message_text(f"❌ Xatolik: {e}", reply_markup=get_main_keyboard())
 
@@ -3919,39 +3835,18 @@ async def monthly_chart(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Oylik sotuvlar grafigi"""
     try:
         from sqlalchemy.orm import Session
-        from sqlalchemy import func
-        from datetime import timedelta
         try:
-            from database import SessionLocal
-            from models import Sale
-            from utils import get_uzbekistan_now
+            from services.analytics_service import AnalyticsService
         except ImportError:
             import sys, os
             sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
-            from database import SessionLocal
-            from models import Sale
-            from utils import get_uzbekistan_now
+            from analytics_service import AnalyticsService
         
-        db: Session = SessionLocal()
-        try:
-            now = get_uzbekistan_now()
-            
+        def _build(db: Session):
             # Oxirgi 6 oylik ma'lumotlar
-            months_data = []
-            labels = []
-            for i in range(5, -1, -1):
-                month = now.replace(day=1) - timedelta(days=30*i)
-                month_start = month.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-                next_month = (month_start + timedelta(days=32)).replace(day=1)
-                
-                monthly_total = db.query(func.sum(Sale.total_amount)).filter(
-                    Sale.created_at >= month_start,
-                    Sale.created_at < next_month,
-                    (Sale.admin_approved == True) | (Sale.requires_admin_approval == False)
-                ).scalar() or 0
-                
-                months_data.append(monthly_total / 1000000)
-                labels.append(month_start.strftime('%b'))
+            months = AnalyticsService.get_last_periods(db, 'month', 6)
+            months_data = [month['amount'] / 1000000 for month in months]
+            labels = [month['start'].strftime('%b') for month in months]
             
             max_val = max(months_data) if months_data else 1
             
@@ -3966,14 +3861,26 @@ async def monthly_chart(update: Update, context: ContextTypes.DEFAULT_TYPE):
             text += f"\n📈 Jami: {sum(months_data):.1f} mln so'm"
             text += f"\n📊 O'rtacha: {sum(months_data)/6:.1f} mln/oy"
             
+            best = max(months, key=lambda month: month['amount'])
+            caption = (
+                f"📊 OYLIK SOTUVLAR GRAFIGI (6 oy)\n\n"
+                f"📈 Jami: {sum(months_data):.1f} mln so'm ({sum(month['count'] for month in months)} ta sotuv)\n"
+                f"📊 O'rtacha: {sum(months_data)/6:.1f} mln/oy\n"
+                f"🏆 Eng yaxshi oy: {best['start'].strftime('%b %Y')} ({best['amount']/1000000:.1f} mln)"
+            )
+            
             keyboard = [
                 [InlineKeyboardButton("📊 Haftalik grafik", callback_data='sales_chart')],
                 [InlineKeyboardButton("⬅️ Orqaga", callback_data='analytics_menu')]
             ]
-            
-            await update.callback_query.edit_message_text(text, reply_markup=InlineKeyboardMarkup(keyboard))
-        finally:
-            db.close()
+            return text, keyboard, labels, months_data, caption, months[-1]['start'].strftime('%Y-%m')
+
+        text, keyboard, labels, values, caption, period = await run_db(_build)
+
+        await send_chart_report(
+            update, 'monthly_chart', period, "Oylik sotuvlar (6 oy)", labels, values,
+            caption, text, keyboard
+        )
     except Exception as e:
         await update.callback_query.edit_message_text(f"❌ Xatolik: {e}", reply_markup=get_main_keyboard())
 
@@ -3985,18 +3892,15 @@ async def smart_suggestions(update: Update, context: ContextTypes.DEFAULT_TYPE):
         from sqlalchemy import func
         from datetime import timedelta
         try:
-            from database import SessionLocal
             from models import Product, Sale, SaleItem, Customer
             from utils import get_uzbekistan_now
         except ImportError:
             import sys, os
             sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
-            from database import SessionLocal
             from models import Product, Sale, SaleItem, Customer
             from utils import get_uzbekistan_now
         
-        db: Session = SessionLocal()
-        try:
+        def _build(db: Session):
             now = get_uzbekistan_now()
             month_ago = now - timedelta(days=30)
             
@@ -4052,9 +3956,11 @@ async def smart_suggestions(update: Update, context: ContextTypes.DEFAULT_TYPE):
             text += "   • 16:00 - 18:00 (kechqurun)\n"
             
             keyboard = [[InlineKeyboardButton("⬅️ Orqaga", callback_data='analytics_menu')]]
-            await update.callback_query.edit_message_text(text, reply_markup=InlineKeyboardMarkup(keyboard))
-        finally:
-            db.close()
+            return text, keyboard
+
+        text, keyboard = await run_db(_build)
+
+        await update.callback_query.edit_message_text(text, reply_markup=InlineKeyboardMarkup(keyboard))
     except Exception as e:
         await update.callback_query.edit_message_text(f"❌ Xatolik: {e}", reply_markup=get_main_keyboard())
 
@@ -4063,36 +3969,26 @@ async def sales_forecast(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Sotuvlar bashorati"""
     try:
         from sqlalchemy.orm import Session
-        from sqlalchemy import func
-        from datetime import timedelta
         try:
-            from database import SessionLocal
-            from models import Sale
             from utils import get_uzbekistan_now
+            from services.analytics_service import AnalyticsService
         except ImportError:
             import sys, os
             sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
-            from database import SessionLocal
-            from models import Sale
             from utils import get_uzbekistan_now
+            from analytics_service import AnalyticsService
         
-        db: Session = SessionLocal()
-        try:
+        def _build(db: Session):
             now = get_uzbekistan_now()
             
-            # O'tgan 3 oylik ma'lumotlar
-            months_data = []
-            for i in range(3, 0, -1):
-                month_start = (now - timedelta(days=30*i)).replace(day=1)
-                month_end = (month_start + timedelta(days=32)).replace(day=1)
-                
-                monthly_total = db.query(func.sum(Sale.total_amount)).filter(
-                    Sale.created_at >= month_start,
-                    Sale.created_at < month_end,
-                    (Sale.admin_approved == True) | (Sale.requires_admin_approval == False)
-                ).scalar() or 0
-                
-                months_data.append(monthly_total)
+            # O'tgan 3 oylik ma'lumotlar (joriy oysiz)
+            this_month_start = AnalyticsService.period_start(now, 'month')
+            months_data = [
+                month['amount']
+                for month in AnalyticsService.get_period_totals(
+                    db, 'month', AnalyticsService.shift_period(this_month_start, 'month', -3), this_month_start
+                )
+            ]
             
             # Oddiy bashorat (o'rtacha o'sish)
             if len(months_data) >= 2 and months_data[-2] > 0:
@@ -4120,9 +4016,11 @@ async def sales_forecast(update: Update, context: ContextTypes.DEFAULT_TYPE):
                     text += f"   📉 {growth_rate*100:.1f}% pasayish kutilmoqda\n"
             
             keyboard = [[InlineKeyboardButton("⬅️ Orqaga", callback_data='analytics_menu')]]
-            await update.callback_query.edit_message_text(text, reply_markup=InlineKeyboardMarkup(keyboard))
-        finally:
-            db.close()
+            return text, keyboard
+
+        text, keyboard = await run_db(_build)
+
+        await update.callback_query.edit_message_text(text, reply_markup=InlineKeyboardMarkup(keyboard))
     except Exception as e:
         await update.callback_query.edit_message_text(f"❌ Xatolik: {e}", reply_markup=get_main_keyboard())
 
@@ -4131,39 +4029,28 @@ async def year_comparison(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """O'tgan yil bilan solishtirish"""
     try:
         from sqlalchemy.orm import Session
-        from sqlalchemy import func
-        from datetime import timedelta
         try:
-            from database import SessionLocal
-            from models import Sale
             from utils import get_uzbekistan_now
+            from services.analytics_service import AnalyticsService
         except ImportError:
             import sys, os
             sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
-            from database import SessionLocal
-            from models import Sale
             from utils import get_uzbekistan_now
+            from analytics_service import AnalyticsService
         
-        db: Session = SessionLocal()
-        try:
+        def _build(db: Session):
             now = get_uzbekistan_now()
             
+            # O'tgan yil shu oydan bu oygacha - bitta so'rov
+            this_month_start = AnalyticsService.period_start(now, 'month')
+            last_year_month_start = AnalyticsService.shift_period(this_month_start, 'month', -12)
+            months = AnalyticsService.get_period_totals(db, 'month', last_year_month_start, now)
+            
             # Bu oy
-            this_month_start = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-            this_month_total = db.query(func.sum(Sale.total_amount)).filter(
-                Sale.created_at >= this_month_start,
-                (Sale.admin_approved == True) | (Sale.requires_admin_approval == False)
-            ).scalar() or 0
+            this_month_total = months[-1]['amount']
             
             # O'tgan yil shu oy
-            last_year_month_start = this_month_start.replace(year=this_month_start.year - 1)
-            last_year_month_end = (last_year_month_start + timedelta(days=32)).replace(day=1)
-            
-            last_year_total = db.query(func.sum(Sale.total_amount)).filter(
-                Sale.created_at >= last_year_month_start,
-                Sale.created_at < last_year_month_end,
-                (Sale.admin_approved == True) | (Sale.requires_admin_approval == False)
-            ).scalar() or 0
+            last_year_total = months[0]['amount']
             
             text = "📅 YIL BO'YICHA SOLISHTIRISH\n\n"
             text += f"📊 {now.strftime('%B')} oyi:\n\n"
@@ -4187,9 +4074,11 @@ async def year_comparison(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 text += "ℹ️ O'tgan yil ma'lumotlari yo'q"
             
             keyboard = [[InlineKeyboardButton("⬅️ Orqaga", callback_data='analytics_menu')]]
-            await update.callback_query.edit_message_text(text, reply_markup=InlineKeyboardMarkup(keyboard))
-        finally:
-            db.close()
+            return text, keyboard
+
+        text, keyboard = await run_db(_build)
+
+        await update.callback_query.edit_message_text(text, reply_markup=InlineKeyboardMarkup(keyboard))
     except Exception as e:
         await update.callback_query.edit_message_text(f"❌ Xatolik: {e}", reply_markup=get_main_keyboard())
 
@@ -4206,6 +4095,11 @@ async def barcode_scan_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
     text += "• Ma'lumotlarni ko'rsatadi\n\n"
     text += "💡 Yorug'likda aniq rasm oling!"
     
+    stats = get_decode_stats()
+    if stats['decoded'] + stats['failed'] > 0:
+        text += f"\n\n📈 Aniqlangan: {stats['decoded']}/{stats['decoded'] + stats['failed']} ({stats['success_rate']:.0f}%)"
+        text += f", o'rtacha {stats['avg_decode_ms']:.0f} ms"
+    
     keyboard = [[InlineKeyboardButton("⬅️ Orqaga", callback_data='main_menu')]]
     await update.callback_query.edit_message_text(text, reply_markup=InlineKeyboardMarkup(keyboard))
 
@@ -4215,26 +4109,10 @@ async def handle_barcode_photo(update: Update, context: ContextTypes.DEFAULT_TYP
     try:
         # Rasmni olish
         photo = update.message.photo[-1]  # Eng katta rasm
-        file = await photo.get_file()
-        
-        # Vaqtinchalik faylga saqlash
-        import tempfile
-        with tempfile.NamedTemporaryFile(suffix='.jpg', delete=False) as tmp:
-            await file.download_to_drive(tmp.name)
-            tmp_path = tmp.name
         
-        barcode_value = None
-        
-        # pyzbar kutubxonasi bilan shtrix kodni o'qish
+        # pyzbar kutubxonasi bilan shtrix kodni o'qish (alohida process'da, xotirada)
         try:
-            from PIL import Image
-            from pyzbar.pyzbar import decode
-            
-            image = Image.open(tmp_path)
-            barcodes = decode(image)
-            
-            if barcodes:
-                barcode_value = barcodes[0].data.decode('utf-8')
+            barcode_value = await decode_photo(photo)
         except ImportError:
             await update.message.reply_text(
                 "⚠️ Shtrix kod o'qish kutubxonasi o'rnatilmagan!\n\n"
@@ -4247,11 +4125,6 @@ async def handle_barcode_photo(update: Update, context: ContextTypes.DEFAULT_TYP
         except Exception as e:
             await update.message.reply_text(f"❌ Shtrix kodni o'qishda xatolik: {e}")
             return
-        finally:
-            # Vaqtinchalik faylni o'chirish
-            import os
-            if os.path.exists(tmp_path):
-                os.remove(tmp_path)
         
         if not barcode_value:
             await update.message.reply_text(
@@ -4265,40 +4138,34 @@ async def handle_barcode_photo(update: Update, context: ContextTypes.DEFAULT_TYP
         
         # Mahsulotni bazadan qidirish
         try:
-            from database import SessionLocal
             from models import Product
         except ImportError:
             import sys, os
             sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
-            from database import SessionLocal
             from models import Product
         
-        db = SessionLocal()
-        try:
-            product = db.query(Product).filter(Product.barcode == barcode_value).first()
+        product = await run_db(lambda db: db.query(Product).filter(Product.barcode == barcode_value).first())
+        
+        if product:
+            stock = (product.packages_in_stock * product.pieces_per_package) + product.pieces_in_stock
+            text = f"✅ MAHSULOT TOPILDI!\n\n"
+            text += f"📦 Nomi: {product.name}\n"
+            text += f"📊 Shtrix kod: {barcode_value}\n"
+            text += f"💰 Narx: {product.piece_price:,.0f} so'm\n"
+            text += f"📦 Omborda: {stock} dona\n"
             
-            if product:
-                stock = (product.packages_in_stock * product.pieces_per_package) + product.pieces_in_stock
-                text = f"✅ MAHSULOT TOPILDI!\n\n"
-                text += f"📦 Nomi: {product.name}\n"
-                text += f"📊 Shtrix kod: {barcode_value}\n"
-                text += f"💰 Narx: {product.piece_price:,.0f} so'm\n"
-                text += f"📦 Omborda: {stock} dona\n"
-                
-                keyboard = [
-                    [InlineKeyboardButton("🛒 Sotish", callback_data=f'sale_product_{product.id}')],
-                    [InlineKeyboardButton("⬅️ Orqaga", callback_data='main_menu')]
-                ]
-                await update.message.reply_text(text, reply_markup=InlineKeyboardMarkup(keyboard))
-            else:
-                await update.message.reply_text(
-                    f"⚠️ Mahsulot topilmadi!\n\n"
-                    f"Shtrix kod: `{barcode_value}`\n\n"
-                    f"Bu kod bazada ro'yxatdan o'tmagan.",
-                    parse_mode='Markdown'
-                )
-        finally:
-            db.close()
+            keyboard = [
+                [InlineKeyboardButton("🛒 Sotish", callback_data=f'sale_product_{product.id}')],
+                [InlineKeyboardButton("⬅️ Orqaga", callback_data='main_menu')]
+            ]
+            await update.message.reply_text(text, reply_markup=InlineKeyboardMarkup(keyboard))
+        else:
+            await update.message.reply_text(
+                f"⚠️ Mahsulot topilmadi!\n\n"
+                f"Shtrix kod: `{barcode_value}`\n\n"
+                f"Bu kod bazada ro'yxatdan o'tmagan.",
+                parse_mode='Markdown'
+            )
             
     except Exception as e:
         await update.message.reply_text(f"❌ Xatolik: {e}")
@@ -4325,38 +4192,16 @@ async def voice_help(update: Update, context: ContextTypes.DEFAULT_TYPE):
 async def handle_voice_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Ovozli xabarni qayta ishlash"""
     try:
+        import asyncio
         voice = update.message.voice
         file = await voice.get_file()
         
-        # Vaqtinchalik faylga saqlash
-        import tempfile
-        with tempfile.NamedTemporaryFile(suffix='.ogg', delete=False) as tmp:
-            await file.download_to_drive(tmp.name)
-            tmp_path = tmp.name
-        
-        recognized_text = None
+        # Xotiraga yuklab olish (vaqtinchalik fayl kerak emas)
+        data = bytes(await file.download_as_bytearray())
         
         try:
-            # Speech recognition kutubxonasi
-            import speech_recognition as sr
-            from pydub import AudioSegment
-            
-            # OGG ni WAV ga aylantirish
-            audio = AudioSegment.from_ogg(tmp_path)
-            wav_path = tmp_path.replace('.ogg', '.wav')
-            audio.export(wav_path, format='wav')
-            
-            # Ovozni matnga aylantirish
-            recognizer = sr.Recognizer()
-            with sr.AudioFile(wav_path) as source:
-                audio_data = recognizer.record(source)
-                recognized_text = recognizer.recognize_google(audio_data, language='uz-UZ')
-            
-            # WAV faylni o'chirish
-            import os
-            if os.path.exists(wav_path):
-                os.remove(wav_path)
-                
+            # OGG -> PCM va tanib olish alohida thread pool'da
+            recognized_text = await recognize_voice(data)
         except ImportError:
             await update.message.reply_text(
                 "⚠️ Ovozni aniqlash kutubxonasi o'rnatilmagan!\n\n"
@@ -4366,19 +4211,18 @@ async def handle_voice_message(update: Update, context: ContextTypes.DEFAULT_TYP
                 parse_mode='Markdown'
             )
             return
-        except sr.UnknownValueError:
-            await update.message.reply_text("❌ Ovoz tushunarsiz. Iltimos, aniqroq gapiring.")
+        except VoiceQueueFull:
+            await update.message.reply_text("⏳ Hozir ko'p ovozli xabarlar qayta ishlanmoqda. Birozdan keyin qayta yuboring.")
+            return
+        except asyncio.TimeoutError:
+            await update.message.reply_text("⌛ Ovozni aniqlash juda uzoq davom etdi. Qisqaroq xabar yuboring.")
             return
         except Exception as e:
             await update.message.reply_text(f"❌ Ovozni aniqlashda xatolik: {e}")
             return
-        finally:
-            import os
-            if os.path.exists(tmp_path):
-                os.remove(tmp_path)
         
         if not recognized_text:
-            await update.message.reply_text("❌ Ovoz aniqlanmadi.")
+            await update.message.reply_text("❌ Ovoz tushunarsiz. Iltimos, aniqroq gapiring.")
             return
         
         # Aniqlangan matnni ko'rsatish
@@ -4422,107 +4266,99 @@ async def handle_voice_message(update: Update, context: ContextTypes.DEFAULT_TYP
 async def show_voice_stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Ovozli buyruq uchun statistika"""
     try:
-        from database import SessionLocal
-        from models import Sale
         from utils import get_uzbekistan_now
+        from services.analytics_service import AnalyticsService
     except ImportError:
         import sys, os
         sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
-        from database import SessionLocal
-        from models import Sale
         from utils import get_uzbekistan_now
+        from analytics_service import AnalyticsService
     
-    db = SessionLocal()
-    try:
+    def _build(db):
         now = get_uzbekistan_now()
-        today_start = now.replace(hour=0, minute=0, second=0, microsecond=0)
-        
-        sales = db.query(Sale).filter(Sale.created_at >= today_start).all()
-        total = sum(s.total_amount for s in sales)
+        totals = AnalyticsService.get_range_totals(db, AnalyticsService.period_start(now, 'day'), now)
         
         text = f"📊 BUGUNGI STATISTIKA\n\n"
-        text += f"🛒 Sotuvlar: {len(sales)} ta\n"
-        text += f"💰 Jami: {total:,.0f} so'm"
-        
-        await update.message.reply_text(text, reply_markup=get_main_keyboard())
-    finally:
-        db.close()
+        text += f"🛒 Sotuvlar: {totals['count']} ta\n"
+        text += f"💰 Jami: {totals['amount']:,.0f} so'm"
+        return text
+
+    text = await run_db(_build)
+
+    await update.message.reply_text(text, reply_markup=get_main_keyboard())
 
 
 async def show_voice_debtors(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Ovozli buyruq uchun qarzdorlar"""
     try:
-        from database import SessionLocal
         from models import Customer
     except ImportError:
         import sys, os
         sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
-        from database import SessionLocal
         from models import Customer
     
-    db = SessionLocal()
-    try:
-        debtors = db.query(Customer).filter(Customer.debt_balance > 0).order_by(Customer.debt_balance.desc()).limit(5).all()
+    chat_id = update.effective_chat.id
+    
+    def _build(db):
+        # "Qarzdorlar" ro'yxati bilan umumiy kesh
+        entry = list_cache.get_ranked_list(db, chat_id, 'debtors', 0, list_cache.customers_version, list_cache.rank_debtors)
+        top_ids, total_count, _ = list_cache.get_page(entry, 0, 5)
+        debtors = list_cache.fetch_by_ids(db, Customer, top_ids)
         
         if not debtors:
             text = "✅ Qarzdorlar yo'q!"
         else:
-            total = sum(c.debt_balance for c in debtors)
-            text = f"💳 QARZDORLAR ({len(debtors)} ta)\n\n"
+            text = f"💳 QARZDORLAR ({total_count} ta)\n\n"
             for c in debtors:
                 text += f"• {c.name}: {c.debt_balance:,.0f} so'm\n"
-            text += f"\n💰 Jami: {total:,.0f} so'm"
-        
-        await update.message.reply_text(text)
-    finally:
-        db.close()
+            text += f"\n💰 Jami: {entry['extra']:,.0f} so'm"
+        return text
+
+    text = await run_db(_build)
+
+    await update.message.reply_text(text)
 
 
 async def show_voice_low_stock(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Ovozli buyruq uchun kam qolgan mahsulotlar"""
     try:
-        from database import SessionLocal
         from models import Product
     except ImportError:
         import sys, os
         sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
-        from database import SessionLocal
         from models import Product
     
-    db = SessionLocal()
-    try:
-        products = db.query(Product).all()
-        low_stock = []
-        for p in products:
-            stock = (p.packages_in_stock * p.pieces_per_package) + p.pieces_in_stock
-            if stock <= 10:
-                low_stock.append((p.name, stock))
+    chat_id = update.effective_chat.id
+    
+    def _build(db):
+        # Ovozli buyruq 10 donani ham kam qolgan deb hisoblaydi (ro'yxatdagi chegara < 10)
+        entry = list_cache.get_ranked_list(db, chat_id, 'voice_low_stock', 0, list_cache.products_version, list_cache.rank_voice_low_stock)
+        page_ids, total, _ = list_cache.get_page(entry, 0, 10)
         
-        if not low_stock:
+        if total == 0:
             text = "✅ Barcha mahsulotlar yetarli!"
         else:
-            text = f"⚠️ KAM QOLGAN ({len(low_stock)} ta)\n\n"
-            for name, stock in low_stock[:10]:
-                text += f"• {name}: {stock} dona\n"
-        
-        await update.message.reply_text(text)
-    finally:
-        db.close()
+            text = f"⚠️ KAM QOLGAN ({total} ta)\n\n"
+            for p in list_cache.fetch_by_ids(db, Product, page_ids):
+                stock = (p.packages_in_stock * p.pieces_per_package) + p.pieces_in_stock
+                text += f"• {p.name}: {stock} dona\n"
+        return text
+
+    text = await run_db(_build)
+
+    await update.message.reply_text(text)
 
 
 async def show_voice_recent_sales(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Ovozli buyruq uchun so'nggi sotuvlar"""
     try:
-        from database import SessionLocal
         from models import Sale
     except ImportError:
         import sys, os
         sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
-        from database import SessionLocal
         from models import Sale
     
-    db = SessionLocal()
-    try:
+    def _build(db):
         sales = db.query(Sale).order_by(Sale.created_at.desc()).limit(5).all()
         
         if not sales:
@@ -4533,39 +4369,28 @@ async def show_voice_recent_sales(update: Update, context: ContextTypes.DEFAULT_
                 time = s.created_at.strftime('%H:%M')
                 customer = s.customer.name if s.customer else "Noma'lum"
                 text += f"• {time} - {customer}: {s.total_amount:,.0f} so'm\n"
-        
-        await update.message.reply_text(text)
-    finally:
-        db.close()
+        return text
+
+    text = await run_db(_build)
+
+    await update.message.reply_text(text)
 
 
 async def search_product_voice(update: Update, context: ContextTypes.DEFAULT_TYPE, query: str):
     """Ovozli buyruq bilan mahsulot qidirish"""
-    try:
-        from database import SessionLocal
-        from models import Product
-    except ImportError:
-        import sys, os
-        sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
-        from database import SessionLocal
-        from models import Product
+    # Tanib olingan matn kirillda bo'lishi mumkin - indeks ikkala yozuvni ham topadi
+    products = await run_db(lambda db: ProductSearchService.search(db, query, limit=5))
     
-    db = SessionLocal()
-    try:
-        products = db.query(Product).filter(Product.name.ilike(f'%{query}%')).limit(5).all()
+    if not products:
+        await update.message.reply_text(f"❌ \"{query}\" topilmadi.")
+    else:
+        text = f"🔍 \"{query}\" bo'yicha natijalar:\n\n"
+        for p in products:
+            stock = (p.packages_in_stock * p.pieces_per_package) + p.pieces_in_stock
+            text += f"📦 {p.name}\n"
+            text += f"   💰 {p.piece_price:,.0f} so'm | 📊 {stock} dona\n\n"
         
-        if not products:
-            await update.message.reply_text(f"❌ \"{query}\" topilmadi.")
-        else:
-            text = f"🔍 \"{query}\" bo'yicha natijalar:\n\n"
-            for p in products:
-                stock = (p.packages_in_stock * p.pieces_per_package) + p.pieces_in_stock
-                text += f"📦 {p.name}\n"
-                text += f"   💰 {p.piece_price:,.0f} so'm | 📊 {stock} dona\n\n"
-            
-            await update.message.reply_text(text)
-    finally:
-        db.close()
+        await update.message.reply_text(text)
 
 
 # ==================== SHTRIX KOD SOTUVI ====================
@@ -4591,35 +4416,28 @@ async def handle_barcode_sale_quantity(update: Update, context: ContextTypes.DEF
             return
         
         try:
-            from database import SessionLocal
             from models import Product, Sale, SaleItem, Customer
             from utils import get_uzbekistan_now
         except ImportError:
             import sys, os
             sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
-            from database import SessionLocal
             from models import Product, Sale, SaleItem, Customer
             from utils import get_uzbekistan_now
         
-        db = SessionLocal()
-        try:
+        def _sell(db):
             product = db.query(Product).filter(Product.id == product_id).first()
-            
+
             if not product:
-                await update.message.reply_text("❌ Mahsulot topilmadi!")
-                context.user_data.pop('awaiting_barcode_quantity', None)
-                context.user_data.pop('barcode_product_id', None)
-                return
-            
+                return "❌ Mahsulot topilmadi!", None
+
             # Zaxirani tekshirish
             total_stock = (product.packages_in_stock * product.pieces_per_package) + product.pieces_in_stock
             if quantity > total_stock:
-                await update.message.reply_text(
+                return (
                     f"❌ Yetarli zaxira yo'q!\n"
                     f"📦 Omborda: {total_stock} dona\n"
                     f"📝 So'ralgan: {quantity} dona"
-                )
-                return
+                ), None
             
             # Naqd pul bilan sotish (tez sotuv)
             total_amount = quantity * product.piece_price
@@ -4672,11 +4490,12 @@ async def handle_barcode_sale_quantity(update: Update, context: ContextTypes.DEF
             text += f"💵 Jami: {total_amount:,.0f} so'm\n"
             text += f"📝 Sotuv ID: #{sale.id}\n"
             text += f"💳 To'lov: Naqd"
-            
-            await update.message.reply_text(text, reply_markup=get_main_keyboard())
-            
+            return text, get_main_keyboard()
+
+        try:
+            text, reply_markup = await run_db(_sell)
+            await update.message.reply_text(text, reply_markup=reply_markup)
         finally:
-            db.close()
             context.user_data.pop('awaiting_barcode_quantity', None)
             context.user_data.pop('barcode_product_id', None)
             
@@ -4722,6 +4541,7 @@ async def print_receipt_menu(update: Update, context: ContextTypes.DEFAULT_TYPE)
     text += "Telegram orqali to'g'ridan-to'g'ri printerga chop etish mumkin emas.\n\n"
     text += "📋 MAVJUD VARIANTLAR:\n"
     text += "• PDF chek yuborish - siz yuklab olasiz\n"
+    text += "• Termal printer (58/80mm) uchun ESC/POS fayl - chekni tanlab yuklab oling\n"
     text += "• Kompyuterda chop etish uchun admin paneldan foydalaning\n\n"
     text += "💡 Admin panel: http://localhost:8000/admin/"
     
@@ -4742,6 +4562,7 @@ def main():
         .read_timeout(10)
         .get_updates_connect_timeout(10)
         .get_updates_read_timeout(10)
+        .concurrent_updates(True)  # Og'ir hisobotlar boshqa so'rovlarni kutdirmasligi uchun
         .build()
     )
     
@@ -4814,6 +4635,12 @@ def main():
         import traceback
         traceback.print_exc()
     finally:
+        shutdown_executor(wait=False)
+        shutdown_chart_executor(wait=False)
+        shutdown_barcode_executor(wait=False)
+        shutdown_voice_executor(wait=False)
+        ReceiptBatchService.shutdown_executor(wait=False)
+        JobService.shutdown_executor(wait=False)
         try:
             loop = asyncio.get_event_loop()
             if not loop.is_closed():
@@ -4857,43 +4684,36 @@ async def show_customers_for_sale(update: Update, context: ContextTypes.DEFAULT_
         import sys
         sys.path.append(os.path.dirname(os.path.dirname(__file__)))
         
-        from sqlalchemy.orm import Session
         try:
-            from database import SessionLocal
             from services.customer_service import CustomerService
             from models import Customer
         except ImportError:
-            from database import SessionLocal
             from customer_service import CustomerService
             from models import Customer
         
-        db: Session = SessionLocal()
-        try:
-            # Mijozlarni olish
-            customers = CustomerService.get_customers(db, limit=10)
-            
-            if not customers:
-                text = "❌ Mijozlar topilmadi!"
-                keyboard = [[InlineKeyboardButton("⬅️ Orqaga", callback_data='back_main')]]
-                await update.callback_query.edit_message_text(text, reply_markup=InlineKeyboardMarkup(keyboard))
-                return
-            
-            text = "👥 MIJOZNI TANLANG:\n\n"
-            keyboard = []
-            
-            for customer in customers:
-                button_text = f"{customer.name}"
-                if customer.phone:
-                    button_text += f" ({customer.phone})"
-                    
-                keyboard.append([InlineKeyboardButton(button_text, callback_data=f'select_customer_{customer.id}')])
-            
-            # Navigatsiya tugmalari
-            keyboard.append([InlineKeyboardButton("⬅️ Orqaga", callback_data='back_main')])
-            
+        # Mijozlarni olish
+        customers = await run_db(CustomerService.get_customers, limit=10)
+        
+        if not customers:
+            text = "❌ Mijozlar topilmadi!"
+            keyboard = [[InlineKeyboardButton("⬅️ Orqaga", callback_data='back_main')]]
             await update.callback_query.edit_message_text(text, reply_markup=InlineKeyboardMarkup(keyboard))
-        finally:
-            db.close()
+            return
+        
+        text = "👥 MIJOZNI TANLANG:\n\n"
+        keyboard = []
+        
+        for customer in customers:
+            button_text = f"{customer.name}"
+            if customer.phone:
+                button_text += f" ({customer.phone})"
+                
+            keyboard.append([InlineKeyboardButton(button_text, callback_data=f'select_customer_{customer.id}')])
+        
+        # Navigatsiya tugmalari
+        keyboard.append([InlineKeyboardButton("⬅️ Orqaga", callback_data='back_main')])
+        
+        await update.callback_query.edit_message_text(text, reply_markup=InlineKeyboardMarkup(keyboard))
             
     except Exception as e:
         error_msg = f"❌ Mijozlar yuklanmadi: {str(e)}"
@@ -4910,38 +4730,31 @@ async def select_customer_for_sale(update: Update, context: ContextTypes.DEFAULT
         import sys
         sys.path.append(os.path.dirname(os.path.dirname(__file__)))
         
-        from sqlalchemy.orm import Session
         try:
-            from database import SessionLocal
             from services.customer_service import CustomerService
             from models import Customer
         except ImportError:
-            from database import SessionLocal
             from customer_service import CustomerService
             from models import Customer
         
         customer_id = int(update.callback_query.data.split('_')[-1])
         
-        db: Session = SessionLocal()
-        try:
-            customer = CustomerService.get_customer(db, customer_id)
-            if not customer:
-                await update.callback_query.answer("❌ Mijoz topilmadi!", show_alert=True)
-                return
-            
-            # Customer sessionga saqlash
-            context.user_data['sale_session']['customer_id'] = customer.id
-            context.user_data['sale_session']['customer_name'] = customer.name
-            context.user_data['sale_session']['step'] = 'select_products'
-            
-            text = f"✅ Mijoz tanlandi: {customer.name}\n\n"
-            text += "📦 Endi mahsulotlarni tanlang:"
-            
-            await update.callback_query.answer(f"✅ {customer.name} tanlandi")
-            await show_products_for_sale(update, context)
-            
-        finally:
-            db.close()
+        customer = await run_db(CustomerService.get_customer, customer_id)
+        if not customer:
+            await update.callback_query.answer("❌ Mijoz topilmadi!", show_alert=True)
+            return
+        
+        # Customer sessionga saqlash
+        context.user_data['sale_session']['customer_id'] = customer.id
+        context.user_data['sale_session']['customer_name'] = customer.name
+        context.user_data['sale_session']['step'] = 'select_products'
+        
+        text = f"✅ Mijoz tanlandi: {customer.name}\n\n"
+        text += "📦 Endi mahsulotlarni tanlang:"
+        
+        await update.callback_query.answer(f"✅ {customer.name} tanlandi")
+        await show_products_for_sale(update, context)
+        
             
     except Exception as e:
         await update.callback_query.answer(f"❌ Xatolik: {str(e)}", show_alert=True)
@@ -4954,56 +4767,49 @@ async def show_products_for_sale(update: Update, context: ContextTypes.DEFAULT_T
         import sys
         sys.path.append(os.path.dirname(os.path.dirname(__file__)))
         
-        from sqlalchemy.orm import Session
         try:
-            from database import SessionLocal
             from services.product_service import ProductService
             from models import Product
         except ImportError:
-            from database import SessionLocal
             from product_service import ProductService
             from models import Product
         
-        db: Session = SessionLocal()
-        try:
-            # Mahsulotlarni olish
-            products = ProductService.get_products(db, limit=8)
-            
-            if not products:
-                text = "❌ Mahsulotlar topilmadi!"
-                keyboard = [[InlineKeyboardButton("⬅️ Orqaga", callback_data='back_main')]]
-                await update.callback_query.edit_message_text(text, reply_markup=InlineKeyboardMarkup(keyboard))
-                return
-            
-            # Sale session ma'lumotlari
-            session = context.user_data.get('sale_session', {})
-            customer_name = session.get('customer_name', 'Noma\'lum')
-            selected_products = session.get('products', [])
-            
-            text = f"👤 Mijoz: {customer_name}\n"
-            text += f"🛒 Tanlangan: {len(selected_products)} ta mahsulot\n\n"
-            text += "📦 MAHSULOTNI TANLANG:\n\n"
-            
-            keyboard = []
-            
-            for product in products:
-                price_text = f"{product.retail_price:,.0f} so'm"
-                stock_text = f"({product.total_pieces} dona)"
-                button_text = f"{product.name} - {price_text} {stock_text}"
-                
-                keyboard.append([InlineKeyboardButton(button_text, callback_data=f'select_product_{product.id}')])
-            
-            # Navigatsiya tugmalari
-            nav_buttons = []
-            if selected_products:
-                nav_buttons.append(InlineKeyboardButton("✅ Yakunlash", callback_data='finalize_sale'))
-            
-            nav_buttons.append(InlineKeyboardButton("⬅️ Orqaga", callback_data='new_sale'))
-            keyboard.append(nav_buttons)
-            
+        # Mahsulotlarni olish
+        products = await run_db(ProductService.get_products, limit=8)
+        
+        if not products:
+            text = "❌ Mahsulotlar topilmadi!"
+            keyboard = [[InlineKeyboardButton("⬅️ Orqaga", callback_data='back_main')]]
             await update.callback_query.edit_message_text(text, reply_markup=InlineKeyboardMarkup(keyboard))
-        finally:
-            db.close()
+            return
+        
+        # Sale session ma'lumotlari
+        session = context.user_data.get('sale_session', {})
+        customer_name = session.get('customer_name', 'Noma\'lum')
+        selected_products = session.get('products', [])
+        
+        text = f"👤 Mijoz: {customer_name}\n"
+        text += f"🛒 Tanlangan: {len(selected_products)} ta mahsulot\n\n"
+        text += "📦 MAHSULOTNI TANLANG:\n\n"
+        
+        keyboard = []
+        
+        for product in products:
+            price_text = f"{product.retail_price:,.0f} so'm"
+            stock_text = f"({product.total_pieces} dona)"
+            button_text = f"{product.name} - {price_text} {stock_text}"
+            
+            keyboard.append([InlineKeyboardButton(button_text, callback_data=f'select_product_{product.id}')])
+        
+        # Navigatsiya tugmalari
+        nav_buttons = []
+        if selected_products:
+            nav_buttons.append(InlineKeyboardButton("✅ Yakunlash", callback_data='finalize_sale'))
+        
+        nav_buttons.append(InlineKeyboardButton("⬅️ Orqaga", callback_data='new_sale'))
+        keyboard.append(nav_buttons)
+        
+        await update.callback_query.edit_message_text(text, reply_markup=InlineKeyboardMarkup(keyboard))
             
     except Exception as e:
         error_msg = f"❌ Mahsulotlar yuklanmadi: {str(e)}"
@@ -5020,68 +4826,61 @@ async def select_product_for_sale(update: Update, context: ContextTypes.DEFAULT_
         import sys
         sys.path.append(os.path.dirname(os.path.dirname(__file__)))
         
-        from sqlalchemy.orm import Session
         try:
-            from database import SessionLocal
             from services.product_service import ProductService
             from models import Product
         except ImportError:
-            from database import SessionLocal
             from product_service import ProductService
             from models import Product
         
         product_id = int(update.callback_query.data.split('_')[-1])
         
-        db: Session = SessionLocal()
-        try:
-            product = ProductService.get_product(db, product_id)
-            if not product:
-                await update.callback_query.answer("❌ Mahsulot topilmadi!", show_alert=True)
-                return
-            
-            if product.total_pieces <= 0:
-                await update.callback_query.answer("❌ Bu mahsulot omborda yo'q!", show_alert=True)
-                return
-            
-            # Standart miqdor (1 dona)
-            quantity = 1
-            price = product.retail_price
-            total = quantity * price
-            
-            # Sessiyaga qo'shish
-            session = context.user_data.get('sale_session', {})
-            products = session.get('products', [])
-            
-            # Mahsulot allaqachon qo'shilganmi?
-            existing_product = None
-            for p in products:
-                if p['product_id'] == product_id:
-                    existing_product = p
-                    break
-            
-            if existing_product:
-                # Miqdorni oshirish
-                existing_product['quantity'] += 1
-                existing_product['total'] = existing_product['quantity'] * existing_product['price']
-            else:
-                # Yangi mahsulot qo'shish
-                products.append({
-                    'product_id': product_id,
-                    'name': product.name,
-                    'quantity': quantity,
-                    'price': price,
-                    'total': total
-                })
-            
-            session['products'] = products
-            session['total_amount'] = sum(p['total'] for p in products)
-            context.user_data['sale_session'] = session
-            
-            await update.callback_query.answer(f"✅ {product.name} qo'shildi!")
-            await show_products_for_sale(update, context)
-            
-        finally:
-            db.close()
+        product = await run_db(ProductService.get_product, product_id)
+        if not product:
+            await update.callback_query.answer("❌ Mahsulot topilmadi!", show_alert=True)
+            return
+        
+        if product.total_pieces <= 0:
+            await update.callback_query.answer("❌ Bu mahsulot omborda yo'q!", show_alert=True)
+            return
+        
+        # Standart miqdor (1 dona)
+        quantity = 1
+        price = product.retail_price
+        total = quantity * price
+        
+        # Sessiyaga qo'shish
+        session = context.user_data.get('sale_session', {})
+        products = session.get('products', [])
+        
+        # Mahsulot allaqachon qo'shilganmi?
+        existing_product = None
+        for p in products:
+            if p['product_id'] == product_id:
+                existing_product = p
+                break
+        
+        if existing_product:
+            # Miqdorni oshirish
+            existing_product['quantity'] += 1
+            existing_product['total'] = existing_product['quantity'] * existing_product['price']
+        else:
+            # Yangi mahsulot qo'shish
+            products.append({
+                'product_id': product_id,
+                'name': product.name,
+                'quantity': quantity,
+                'price': price,
+                'total': total
+            })
+        
+        session['products'] = products
+        session['total_amount'] = sum(p['total'] for p in products)
+        context.user_data['sale_session'] = session
+        
+        await update.callback_query.answer(f"✅ {product.name} qo'shildi!")
+        await show_products_for_sale(update, context)
+        
             
     except Exception as e:
         await update.callback_query.answer(f"❌ Xatolik: {str(e)}", show_alert=True)
@@ -5132,20 +4931,17 @@ async def confirm_sale(update: Update, context: ContextTypes.DEFAULT_TYPE):
         
         from sqlalchemy.orm import Session
         try:
-            from database import SessionLocal
             from services.sale_service import SaleService
             from schemas import SaleCreate, SaleItemCreate
             from models import Sale, SaleItem, Product, Customer
         except ImportError:
-            from database import SessionLocal
             from sale_service import SaleService
             from schemas import SaleCreate, SaleItemCreate
             from models import Sale, SaleItem, Product, Customer
         
         session = context.user_data.get('sale_session', {})
         
-        db: Session = SessionLocal()
-        try:
+        def _build(db: Session):
             # Sale obyektini yaratish
             sale_items = []
             for product in session['products']:
@@ -5179,11 +4975,12 @@ async def confirm_sale(update: Update, context: ContextTypes.DEFAULT_TYPE):
             # Sessionni tozalash
             if 'sale_session' in context.user_data:
                 del context.user_data['sale_session']
-            
-            await update.callback_query.edit_message_text(text, reply_markup=InlineKeyboardMarkup(keyboard))
+            return text, keyboard
+
+        text, keyboard = await run_db(_build)
+
+        await update.callback_query.edit_message_text(text, reply_markup=InlineKeyboardMarkup(keyboard))
         
-        finally:
-            db.close()
             
     except Exception as e:
         error_msg = f"❌ Sotuv saqlanmadi: {str(e)}"
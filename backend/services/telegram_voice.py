@@ -0,0 +1,104 @@
+"""
+Ovozli xabarlarni matnga aylantirish.
+
+OGG fayl diskka yozilmaydi: xotirada PCM (16 kHz, mono, 16 bit) ga
+o'giriladi va tanib olish cheklangan thread pool'da bajariladi. Navbat
+to'lsa yangi xabar darhol rad etiladi, har bir tanib olish vaqt bilan
+cheklanadi - bir nechta admin ovoz yuborsa ham bot qotib qolmaydi.
+"""
+import os
+import io
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# Bir vaqtda tanib olinadigan ovozlar soni
+BOT_VOICE_WORKERS = int(os.getenv('BOT_VOICE_WORKERS', '2'))
+# Navbatdagi (bajarilayotgan + kutayotgan) ovozlar chegarasi
+BOT_VOICE_QUEUE_LIMIT = int(os.getenv('BOT_VOICE_QUEUE_LIMIT', '6'))
+# Bitta ovozni tanib olish uchun maksimal vaqt (soniya)
+BOT_VOICE_TIMEOUT = float(os.getenv('BOT_VOICE_TIMEOUT', '30'))
+
+SAMPLE_RATE = 16000
+SAMPLE_WIDTH = 2
+
+_executor = None
+_pending = 0
+_pending_lock = threading.Lock()
+
+
+class VoiceQueueFull(Exception):
+    """Ovoz navbati to'lgan"""
+    pass
+
+
+def get_executor() -> ThreadPoolExecutor:
+    """Ovoz tanib olish uchun umumiy ThreadPoolExecutor"""
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=BOT_VOICE_WORKERS, thread_name_prefix="bot-voice")
+    return _executor
+
+
+def shutdown_executor(wait: bool = True):
+    """Executor'ni to'xtatish (bot to'xtaganda)"""
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=wait, cancel_futures=True)
+        _executor = None
+
+
+def ogg_to_pcm(data: bytes) -> bytes:
+    """OGG/Opus bytes -> 16 kHz mono 16-bit PCM bytes (xotirada)"""
+    from pydub import AudioSegment
+
+    audio = AudioSegment.from_file(io.BytesIO(data), format='ogg')
+    audio = audio.set_channels(1).set_frame_rate(SAMPLE_RATE).set_sample_width(SAMPLE_WIDTH)
+    return audio.raw_data
+
+
+def recognize_ogg_bytes(data: bytes, language: str = 'uz-UZ'):
+    """Ovozni matnga aylantirish (worker thread ichida). Tushunilmasa None."""
+    import speech_recognition as sr
+
+    audio_data = sr.AudioData(ogg_to_pcm(data), SAMPLE_RATE, SAMPLE_WIDTH)
+    recognizer = sr.Recognizer()
+    # HTTP so'rov ham cheklanadi - aks holda osilgan so'rov worker va navbat joyini band qilib turadi
+    recognizer.operation_timeout = BOT_VOICE_TIMEOUT
+    try:
+        return recognizer.recognize_google(audio_data, language=language)
+    except sr.UnknownValueError:
+        return None
+
+
+def _release(_future):
+    global _pending
+    with _pending_lock:
+        _pending -= 1
+
+
+async def recognize_voice(data: bytes, language: str = 'uz-UZ'):
+    """
+    Ovozni pool'da tanib olish.
+    Navbat to'lgan bo'lsa VoiceQueueFull, vaqt tugasa asyncio.TimeoutError.
+    """
+    global _pending
+    with _pending_lock:
+        if _pending >= BOT_VOICE_QUEUE_LIMIT:
+            raise VoiceQueueFull()
+        _pending += 1
+
+    try:
+        future = get_executor().submit(recognize_ogg_bytes, data, language)
+    except Exception:
+        _release(None)
+        raise
+    # Hisoblagich vazifa haqiqatda tugaganda kamayadi (timeout'da emas)
+    future.add_done_callback(_release)
+
+    try:
+        return await asyncio.wait_for(asyncio.wrap_future(future), timeout=BOT_VOICE_TIMEOUT)
+    except asyncio.TimeoutError:
+        # Hali boshlanmagan bo'lsa navbatdan olib tashlanadi
+        future.cancel()
+        raise
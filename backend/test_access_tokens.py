@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+"""
+Test: imzolangan access tokenlar - muddat, bekor qilish, boshqa kalit va
+ruxsatlar versiyasi (pv).
+
+Vaqtinchalik SQLite baza ishlatiladi; bekor qilingan tokenlar revoked_tokens
+jadvaliga yoziladi va boshqa jarayon kabi xotira tozalangandan keyin ham
+rad etilishi kerak.
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import tempfile
+
+# Add backend directory to path
+backend_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, backend_dir)
+sys.path.insert(0, os.path.join(backend_dir, 'services'))
+
+from fastapi import HTTPException
+from sqlalchemy import create_engine
+
+import auth
+import database
+from models import Base, Permission, RevokedToken, Role, Seller
+
+
+def expect_error(call, status_code, detail=None):
+    try:
+        call()
+    except HTTPException as e:
+        assert e.status_code == status_code, (e.status_code, e.detail)
+        if detail:
+            assert e.detail == detail, e.detail
+        return
+    raise AssertionError(f"{status_code} kutilgan edi")
+
+
+def forget_revocations():
+    """Boshqa jarayon: xotirada hech narsa yo'q, hammasi bazadan o'qiladi"""
+    auth._revoked_tokens.clear()
+    auth._revoked_subjects.clear()
+    auth._revocations_loaded_at = None
+
+
+def with_database(check):
+    workdir = tempfile.mkdtemp(prefix='access_token_test_')
+    engine = create_engine(
+        f"sqlite:///{os.path.join(workdir, 'test.db')}",
+        connect_args={"check_same_thread": False}
+    )
+    Base.metadata.create_all(bind=engine)
+    original_bind = database.SessionLocal.kw["bind"]
+    database.SessionLocal.configure(bind=engine)
+    auth.invalidate_role_permissions()
+    auth.invalidate_seller()
+    forget_revocations()
+    db = database.SessionLocal()
+    try:
+        permission = Permission(code="products.view", name="Mahsulotlarni ko'rish", category="products")
+        role = Role(name="Sotuvchi", permissions=[permission])
+        db.add_all([permission, role])
+        db.flush()
+        seller = Seller(name="Test sotuvchi", role_id=role.id, is_active=True)
+        db.add(seller)
+        db.commit()
+        check(db, seller, role)
+    finally:
+        db.close()
+        database.SessionLocal.configure(bind=original_bind)
+        auth.invalidate_role_permissions()
+        auth.invalidate_seller()
+        forget_revocations()
+        engine.dispose()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def seller_token(db, seller, role):
+    return auth.create_access_token(
+        "seller", seller.id, role.id, auth.permissions_version(auth.get_role_permission_codes(db, role.id))
+    )
+
+
+def login(db, token, x_seller_id=None):
+    return auth.get_seller_from_header(x_seller_id=x_seller_id, authorization=f"Bearer {token}", db=db)
+
+
+def test_valid_and_expired_tokens():
+    def check(db, seller, role):
+        token = seller_token(db, seller, role)
+        assert login(db, token).id == seller.id
+        assert auth.verify_access_token(token, "seller")["sub"] == seller.id
+        # Boshqa turdagi token sifatida qabul qilinmaydi
+        expect_error(lambda: auth.verify_access_token(token, "customer"), 401, "Token yaroqsiz")
+
+        original_ttl = auth.SELLER_TOKEN_TTL
+        auth.SELLER_TOKEN_TTL = -1
+        try:
+            expired = seller_token(db, seller, role)
+        finally:
+            auth.SELLER_TOKEN_TTL = original_ttl
+        expect_error(lambda: login(db, expired), 401, "Token muddati tugagan")
+    with_database(check)
+
+
+def test_revoked_tokens_are_shared():
+    def check(db, seller, role):
+        token = seller_token(db, seller, role)
+        other = seller_token(db, seller, role)
+        auth.revoke_token(token)
+        auth.revoke_token(token)  # ikkinchi chiqish yangi yozuv qo'shmaydi
+        forget_revocations()
+        expect_error(lambda: login(db, token), 401, "Token bekor qilingan")
+        assert login(db, other).id == seller.id
+
+        # Parol o'zgardi: shu paytgacha berilgan hamma tokenlar
+        time.sleep(0.01)
+        auth.revoke_subject("seller", seller.id)
+        forget_revocations()
+        expect_error(lambda: login(db, other), 401, "Token bekor qilingan")
+        time.sleep(0.01)
+        assert login(db, seller_token(db, seller, role)).id == seller.id
+        assert db.query(RevokedToken).count() == 2
+    with_database(check)
+
+
+def test_forged_tokens_do_not_revoke():
+    def check(db, seller, role):
+        token = seller_token(db, seller, role)
+        body = token.partition(".")[0]
+        auth.revoke_token(body + ".abc")
+        for payload in ({}, [], {"jti": "x"}, "text"):
+            encoded = auth._b64encode(json.dumps(payload).encode("utf-8"))
+            auth.revoke_token(f"{encoded}.abc")
+            auth.revoke_token(f"{encoded}.{auth._sign(encoded)}")
+        assert db.query(RevokedToken).count() == 0
+        assert login(db, token).id == seller.id
+    with_database(check)
+
+
+def test_token_signed_with_another_key():
+    def check(db, seller, role):
+        original_key = auth._TOKEN_KEY
+        auth._TOKEN_KEY = b"boshqa-kalit"
+        try:
+            token = seller_token(db, seller, role)
+        finally:
+            auth._TOKEN_KEY = original_key
+        assert not auth.token_signature_valid(token)
+        expect_error(lambda: login(db, token), 401, "Token yaroqsiz")
+        # Eski mijozlar X-Seller-ID ham yuboradi
+        if auth.ALLOW_ID_HEADERS:
+            assert login(db, token, x_seller_id=seller.id).id == seller.id
+    with_database(check)
+
+
+def test_permissions_version_and_seller_status():
+    def check(db, seller, role):
+        token = seller_token(db, seller, role)
+        role.permissions.append(Permission(code="sales.view", name="Sotuvlarni ko'rish", category="sales"))
+        db.commit()
+        auth.invalidate_role_permissions(role.id)
+        expect_error(lambda: login(db, token), 401, "Ruxsatlar o'zgargan, qaytadan kiring")
+        token = seller_token(db, seller, role)
+        assert login(db, token).id == seller.id
+
+        seller.is_active = False
+        db.commit()
+        auth.invalidate_seller(seller.id)
+        expect_error(lambda: login(db, token), 403)
+
+        seller_id = seller.id
+        db.delete(seller)
+        db.commit()
+        auth.invalidate_seller(seller_id)
+        expect_error(lambda: login(db, token), 403)
+    with_database(check)
+
+
+if __name__ == "__main__":
+    test_valid_and_expired_tokens()
+    test_revoked_tokens_are_shared()
+    test_forged_tokens_do_not_revoke()
+    test_token_signed_with_another_key()
+    test_permissions_version_and_seller_status()
+    print("✅ OK")
@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+"""
+Test: AnalyticsService davr chegaralari (UTC+5 yarim tun) va faqat tasdiqlangan
+sotuvlar hisoblanishi.
+
+Sotuvlar created_at ni UTC da saqlaydi; 18:59:59 UTC hali O'zbekistonda bugun,
+19:00:00 UTC esa ertangi kun (hafta, oy) hisoblanishi kerak.
+"""
+import os
+import sys
+import shutil
+import tempfile
+from datetime import datetime
+
+# Add backend directory to path
+backend_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, backend_dir)
+sys.path.insert(0, os.path.join(backend_dir, 'services'))
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from models import Base, Customer, PaymentMethod, Product, Sale, SaleItem
+from services.analytics_service import AnalyticsService
+from utils import UZBEKISTAN_TZ
+import telegram_list_cache as list_cache
+
+
+def local(*args):
+    return datetime(*args, tzinfo=UZBEKISTAN_TZ)
+
+
+def make_session():
+    workdir = tempfile.mkdtemp(prefix='analytics_test_')
+    engine = create_engine(f"sqlite:///{os.path.join(workdir, 'test.db')}")
+    Base.metadata.create_all(bind=engine)
+    return sessionmaker(bind=engine)(), engine, workdir
+
+
+def add_sale(db, created_at, amount, payment_method=PaymentMethod.CASH,
+             requires_approval=False, approved=True):
+    db.add(Sale(
+        seller_id=1,
+        total_amount=amount,
+        payment_method=payment_method,
+        payment_amount=amount,
+        requires_admin_approval=requires_approval,
+        admin_approved=approved,
+        created_at=created_at,  # naive UTC, bazadagi kabi
+    ))
+
+
+def run(check):
+    db, engine, workdir = make_session()
+    try:
+        check(db)
+    finally:
+        db.close()
+        engine.dispose()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def test_day_bucket_at_local_midnight():
+    def check(db):
+        # 2026-03-09 23:59:59 va 2026-03-10 00:00:00 (UTC+5)
+        add_sale(db, datetime(2026, 3, 9, 18, 59, 59), 100.0)
+        add_sale(db, datetime(2026, 3, 9, 19, 0, 0), 250.0)
+        db.commit()
+
+        buckets = AnalyticsService.get_period_totals(db, "day", local(2026, 3, 9), local(2026, 3, 11))
+        assert [b["start"].day for b in buckets] == [9, 10]
+        assert [(b["count"], b["amount"]) for b in buckets] == [(1, 100.0), (1, 250.0)]
+
+        totals = AnalyticsService.get_range_totals(db, local(2026, 3, 10), local(2026, 3, 11))
+        assert (totals["count"], totals["amount"]) == (1, 250.0)
+    run(check)
+
+
+def test_week_and_month_buckets_at_local_midnight():
+    def check(db):
+        # Yakshanba 2026-03-08 23:59 / dushanba 2026-03-09 00:00 (UTC+5)
+        add_sale(db, datetime(2026, 3, 8, 18, 59, 0), 10.0)
+        add_sale(db, datetime(2026, 3, 8, 19, 0, 0), 20.0)
+        # 2026-02-28 23:59 / 2026-03-01 00:00 (UTC+5)
+        add_sale(db, datetime(2026, 2, 28, 18, 59, 0), 30.0)
+        add_sale(db, datetime(2026, 2, 28, 19, 0, 0), 40.0)
+        db.commit()
+
+        weeks = AnalyticsService.get_period_totals(db, "week", local(2026, 3, 2), local(2026, 3, 16))
+        assert [b["start"].day for b in weeks] == [2, 9]
+        assert [b["amount"] for b in weeks] == [10.0, 20.0]
+
+        months = AnalyticsService.get_period_totals(db, "month", local(2026, 2, 1), local(2026, 4, 1))
+        assert [b["start"].month for b in months] == [2, 3]
+        assert [b["amount"] for b in months] == [30.0, 70.0]
+    run(check)
+
+
+def test_only_approved_sales_counted():
+    def check(db):
+        when = datetime(2026, 3, 9, 6, 0, 0)
+        add_sale(db, when, 1.0, requires_approval=False, approved=True)
+        add_sale(db, when, 2.0, requires_approval=True, approved=True)
+        add_sale(db, when, 4.0, requires_approval=True, approved=None)   # kutilmoqda
+        add_sale(db, when, 8.0, requires_approval=True, approved=False)  # rad etilgan
+        add_sale(db, when, 16.0, PaymentMethod.CARD, requires_approval=True, approved=None)
+        add_sale(db, when, 32.0, PaymentMethod.CARD, requires_approval=False, approved=True)
+        db.commit()
+
+        totals = AnalyticsService.get_range_totals(db)
+        assert (totals["count"], totals["amount"]) == (3, 35.0)
+
+        day = AnalyticsService.get_period_totals(db, "day", local(2026, 3, 9), local(2026, 3, 10))
+        assert (day[0]["count"], day[0]["amount"]) == (3, 35.0)
+
+        payments = AnalyticsService.get_payment_method_totals(db)
+        assert payments == {
+            "cash": {"count": 2, "amount": 3.0, "paid": 3.0},
+            "card": {"count": 1, "amount": 32.0, "paid": 32.0},
+        }
+    run(check)
+
+
+def test_top_rankings_and_cache_version_follow_approval():
+    def check(db):
+        tea = Product(name="Choy", pieces_per_package=1, cost_price=0, wholesale_price=0,
+                      retail_price=0, regular_price=0, packages_in_stock=0, pieces_in_stock=0)
+        customer = Customer(name="Ali")
+        db.add_all([tea, customer])
+        db.flush()
+        when = datetime(2026, 3, 9, 6, 0, 0)
+        sales = []
+        for quantity, product_id, approved in ((2, tea.id, True), (5, 999, True), (7, tea.id, None)):
+            sale = Sale(seller_id=1, customer_id=customer.id, total_amount=quantity * 10.0,
+                        payment_method=PaymentMethod.CASH, payment_amount=quantity * 10.0,
+                        requires_admin_approval=approved is None, admin_approved=approved, created_at=when)
+            db.add(sale)
+            db.flush()
+            db.add(SaleItem(sale_id=sale.id, product_id=product_id, requested_quantity=quantity,
+                            package_price=0, piece_price=10.0, subtotal=quantity * 10.0))
+            sales.append(sale)
+        db.commit()
+
+        # 999: o'chirilgan mahsulot; kutilayotgan sotuv hisobga olinmaydi
+        top = AnalyticsService.get_top_products(db, limit=None)
+        assert [(p["product_id"], p["name"], p["quantity"]) for p in top] == [
+            (999, "O'chirilgan mahsulot", 5), (tea.id, "Choy", 2)
+        ]
+        customers = AnalyticsService.get_top_customers(db, limit=None)
+        assert [(c["name"], c["count"], c["amount"]) for c in customers] == [("Ali", 2, 70.0)]
+
+        # Tasdiqlash sotuvlar sonini, summasini va max id ni o'zgartirmaydi
+        version = list_cache.sales_version(db)
+        sales[2].admin_approved = True
+        db.commit()
+        assert list_cache.sales_version(db) != version
+        assert AnalyticsService.get_top_products(db, limit=1)[0]["quantity"] == 9
+    run(check)
+
+
+def test_profit_per_range():
+    def check(db):
+        tea = Product(name="Choy", pieces_per_package=1, cost_price=6.0, wholesale_price=0,
+                      retail_price=0, regular_price=0, packages_in_stock=0, pieces_in_stock=0)
+        db.add(tea)
+        db.flush()
+        for created_at, quantity in ((datetime(2026, 3, 9, 6, 0, 0), 2), (datetime(2026, 3, 10, 6, 0, 0), 5)):
+            sale = Sale(seller_id=1, total_amount=quantity * 10.0, payment_method=PaymentMethod.CASH,
+                        payment_amount=quantity * 10.0, requires_admin_approval=False, admin_approved=True,
+                        created_at=created_at)
+            db.add(sale)
+            db.flush()
+            db.add(SaleItem(sale_id=sale.id, product_id=tea.id, requested_quantity=quantity,
+                            package_price=0, piece_price=10.0, subtotal=quantity * 10.0))
+        db.commit()
+
+        # Foyda = (10 - 6) * soni
+        totals = AnalyticsService.get_range_totals(db, local(2026, 3, 10), local(2026, 3, 11), with_profit=True)
+        assert (totals["count"], totals["profit"]) == (1, 20.0)
+        days = AnalyticsService.get_period_totals(db, "day", local(2026, 3, 9), local(2026, 3, 11), with_profit=True)
+        assert [day["profit"] for day in days] == [8.0, 20.0]
+        assert AnalyticsService.get_range_totals(db, with_profit=True)["profit"] == 28.0
+    run(check)
+
+
+if __name__ == "__main__":
+    test_day_bucket_at_local_midnight()
+    test_week_and_month_buckets_at_local_midnight()
+    test_only_approved_sales_counted()
+    test_top_rankings_and_cache_version_follow_approval()
+    test_profit_per_range()
+    print("✅ OK")
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Test: sekin hisobot bot event loop'ini bloklamasligini tekshirish.
+
+stats handleri ichidagi DB ishi sun'iy ravishda sekinlashtiriladi va shu
+vaqtda /start yuboriladi. /start darhol javob berishi kerak.
+"""
+import asyncio
+import os
+import sys
+import time
+
+# Add backend directory to path
+backend_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, backend_dir)
+sys.path.insert(0, os.path.join(backend_dir, 'services'))
+
+from services import telegram_service
+from services.analytics_service import AnalyticsService
+from services.product_service import ProductService
+from services.debt_service import DebtService
+
+SLOW_REPORT_SECONDS = 1.0
+
+
+class FakeMessage:
+    """Update.message o'rniga ishlatiladigan oddiy obyekt"""
+
+    def __init__(self, name, log):
+        self.name = name
+        self.log = log
+
+    async def reply_text(self, text, reply_markup=None, **kwargs):
+        self.log.append((self.name, time.perf_counter(), text))
+
+
+class FakeUpdate:
+    def __init__(self, name, log):
+        self.message = FakeMessage(name, log)
+        self.callback_query = None
+
+
+def slow_range_totals(db, *args, **kwargs):
+    # Og'ir SQL so'rovini taqlid qilish (sinxron, event loop'ni bloklaydigan)
+    time.sleep(SLOW_REPORT_SECONDS)
+    return {'count': 0, 'amount': 0.0, 'profit': 0.0, 'average': 0.0}
+
+
+async def run_concurrent_updates():
+    log = []
+    started = time.perf_counter()
+
+    report = asyncio.create_task(telegram_service.stats(FakeUpdate('stats', log), None))
+    await asyncio.sleep(0.05)  # Hisobot DB ishini boshlab olsin
+    await telegram_service.start(FakeUpdate('start', log), None)
+    await report
+
+    replies = {name: at - started for name, at, _ in log}
+    return replies
+
+
+def test_slow_report_does_not_delay_start():
+    original = (
+        AnalyticsService.get_range_totals,
+        ProductService.get_inventory_total_value,
+        DebtService.get_total_debt,
+    )
+    AnalyticsService.get_range_totals = staticmethod(slow_range_totals)
+    ProductService.get_inventory_total_value = staticmethod(
+        lambda db: {'total_value_by_cost': 0, 'total_value_by_wholesale': 0}
+    )
+    DebtService.get_total_debt = staticmethod(lambda db: 0)
+    try:
+        replies = asyncio.run(run_concurrent_updates())
+    finally:
+        (
+            AnalyticsService.get_range_totals,
+            ProductService.get_inventory_total_value,
+            DebtService.get_total_debt,
+        ) = (staticmethod(f) for f in original)
+
+    print(f"⏱ /start javobi: {replies['start']:.3f}s")
+    print(f"⏱ stats javobi: {replies['stats']:.3f}s")
+
+    assert replies['stats'] >= SLOW_REPORT_SECONDS
+    # /start sekin hisobotni kutmasligi kerak
+    assert replies['start'] < SLOW_REPORT_SECONDS / 2
+    assert replies['start'] < replies['stats']
+
+
+if __name__ == "__main__":
+    print("🤖 Bot executor testi")
+    print("=" * 30)
+    test_slow_report_does_not_delay_start()
+    print("✅ Sekin hisobot /start ni kutdirmadi!")
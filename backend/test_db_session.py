@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+Test: bitta so'rov uchun bitta DB session va eng ko'pi bilan bitta ulanish.
+
+Route va auth dependency'lari (get_seller_from_header, require_permission)
+bir xil get_db'dan foydalanadi. Vaqtinchalik SQLite bazada har bir so'rovda
+pool'dan olingan ulanishlar (checkout) sanaladi.
+"""
+import os
+import sys
+import tempfile
+
+# Add backend directory to path
+backend_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, backend_dir)
+sys.path.insert(0, os.path.join(backend_dir, 'services'))
+
+from fastapi import Depends, FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import Session, object_session
+
+import auth
+import database
+from models import Base, Permission, Product, Role, Seller
+
+
+def make_app():
+    app = FastAPI()
+
+    @app.get("/ping")
+    def ping(db: Session = Depends(database.get_db)):
+        # DB'ga murojaat qilmaydi - ulanish olinmasligi kerak
+        return {"ok": True}
+
+    @app.get("/products")
+    def products(
+        db: Session = Depends(database.get_db),
+        seller: Seller = Depends(auth.require_permission("products.view"))
+    ):
+        return {
+            "count": db.query(Product).count(),
+            "seller": seller.name,
+            "same_session": object_session(seller) is db,
+        }
+
+    @app.get("/me")
+    def me(
+        db: Session = Depends(database.get_db),
+        seller: Seller = Depends(auth.get_seller_from_header)
+    ):
+        return {"name": seller.name, "same_session": object_session(seller) is db}
+
+    return app
+
+
+def run_requests():
+    workdir = tempfile.mkdtemp(prefix='db_session_test_')
+    engine = create_engine(
+        f"sqlite:///{os.path.join(workdir, 'test.db')}",
+        connect_args={"check_same_thread": False}
+    )
+    Base.metadata.create_all(bind=engine)
+    original_bind = database.SessionLocal.kw["bind"]
+    database.SessionLocal.configure(bind=engine)
+    auth.invalidate_role_permissions()
+    auth.invalidate_seller()
+
+    try:
+        db = database.SessionLocal()
+        permission = Permission(code="products.view", name="Mahsulotlarni ko'rish", category="products")
+        role = Role(name="Sotuvchi", permissions=[permission])
+        db.add_all([permission, role, Product(name="Test mahsulot")])
+        db.flush()
+        seller = Seller(name="Test sotuvchi", role_id=role.id, is_active=True)
+        db.add(seller)
+        db.commit()
+        headers = {"X-Seller-ID": str(seller.id)}
+        db.close()
+
+        checkouts = []
+        event.listen(engine, "checkout", lambda *args: checkouts.append(1))
+
+        client = TestClient(make_app())
+        results = {}
+        for name, path, request_headers in [
+            ("ping", "/ping", {}),
+            ("products", "/products", headers),
+            ("me", "/me", headers),
+        ]:
+            checkouts.clear()
+            response = client.get(path, headers=request_headers)
+            assert response.status_code == 200, response.text
+            results[name] = (len(checkouts), response.json())
+        return results
+    finally:
+        database.SessionLocal.configure(bind=original_bind)
+        auth.invalidate_role_permissions()
+        auth.invalidate_seller()
+        engine.dispose()
+
+
+def test_one_connection_per_request():
+    results = run_requests()
+    for name, (checkouts, body) in results.items():
+        print(f"{name}: {checkouts} ta ulanish, {body}")
+
+    assert results["ping"][0] == 0, "DB ishlatmaydigan so'rov ulanish olmasligi kerak"
+    assert results["products"][0] == 1, "Route va require_permission bitta ulanishdan foydalanishi kerak"
+    assert results["me"][0] == 1, "Route va get_seller_from_header bitta ulanishdan foydalanishi kerak"
+    assert results["products"][1]["same_session"], "Seller route session'iga tegishli bo'lishi kerak"
+    assert results["me"][1]["same_session"], "Seller route session'iga tegishli bo'lishi kerak"
+
+
+if __name__ == "__main__":
+    print("=" * 60)
+    print("So'rov uchun DB ulanishlari")
+    print("=" * 60)
+    test_one_connection_per_request()
+    print("✅ OK")
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""
+Test: bir xil turdagi eksport job'lari bir vaqtda ishlaganda fayllari to'qnashmaydi.
+
+ExcelService fayl nomlari soniyagacha aniq; job'lar o'z job_{id}_... fayliga
+yozishi va har biri o'z faylini qaytarishi kerak.
+"""
+import os
+import sys
+import shutil
+import asyncio
+import tempfile
+
+# Add backend directory to path
+backend_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, backend_dir)
+sys.path.insert(0, os.path.join(backend_dir, 'services'))
+
+from sqlalchemy import create_engine
+
+import database
+from models import Base, Product
+from services.job_service import JobService
+
+
+def test_same_second_exports_get_own_files():
+    workdir = tempfile.mkdtemp(prefix='job_export_test_')
+    engine = create_engine(
+        f"sqlite:///{os.path.join(workdir, 'test.db')}",
+        connect_args={"check_same_thread": False}
+    )
+    Base.metadata.create_all(bind=engine)
+    original_bind = database.SessionLocal.kw["bind"]
+    database.SessionLocal.configure(bind=engine)
+    jobs = []
+    try:
+        db = database.SessionLocal()
+        db.add(Product(name="Choy", pieces_per_package=1, cost_price=0, wholesale_price=0,
+                       retail_price=0, regular_price=0, packages_in_stock=0, pieces_in_stock=0))
+        db.commit()
+        db.close()
+
+        jobs = [JobService.submit("products_export") for _ in range(4)]
+
+        async def wait_all():
+            return [await JobService.wait(job["id"]) for job in jobs]
+
+        finished = asyncio.run(wait_all())
+        assert [job["status"] for job in finished] == ["done"] * 4, [job["error"] for job in finished]
+        paths = {job["file_path"] for job in finished}
+        assert len(paths) == 4
+        for job in finished:
+            assert os.path.basename(job["file_path"]) == f"job_{job['id']}_{job['filename']}"
+            assert job["filename"].startswith("products_")
+            assert os.path.getsize(job["file_path"]) > 0
+    finally:
+        for job in jobs:
+            record = JobService.get_job(job["id"])
+            if record and record.get("file_path") and os.path.exists(record["file_path"]):
+                os.remove(record["file_path"])
+        database.SessionLocal.configure(bind=original_bind)
+        engine.dispose()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    test_same_second_exports_get_own_files()
+    JobService.shutdown_executor()
+    print("✅ OK")
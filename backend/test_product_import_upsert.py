@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+Test: upsert rejimida faqat fayldagi ustunlar yangilanadi.
+
+Faqat Nomi, Mahsulot kodi, Barcode va Ulgurji narx ustunlari bor fayl mavjud
+mahsulotning qoldig'i, kelgan narxi va boshqa narxlarini 0 ga tushirmasligi,
+yangi mahsulotlar esa standart qiymatlar bilan yaratilishi kerak.
+"""
+import os
+import sys
+import shutil
+import tempfile
+
+# Add backend directory to path
+backend_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, backend_dir)
+sys.path.insert(0, os.path.join(backend_dir, 'services'))
+
+from openpyxl import Workbook
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from models import Base, Product
+from services.excel_service import ExcelService
+
+
+def write_workbook(path, header, rows):
+    wb = Workbook()
+    ws = wb.active
+    ws.append(header)
+    for row in rows:
+        ws.append(row)
+    wb.save(path)
+
+
+def test_partial_column_upsert_keeps_other_fields():
+    workdir = tempfile.mkdtemp(prefix='import_upsert_test_')
+    engine = create_engine(f"sqlite:///{os.path.join(workdir, 'test.db')}")
+    try:
+        Base.metadata.create_all(bind=engine)
+        db = sessionmaker(bind=engine)()
+        db.add(Product(
+            name="Sovun", barcode="4780000000017", pieces_per_package=12,
+            cost_price=5.0, wholesale_price=8.0, retail_price=9.0, regular_price=10.0,
+            packages_in_stock=7, pieces_in_stock=3,
+        ))
+        db.commit()
+
+        file_path = os.path.join(workdir, 'prices.xlsx')
+        write_workbook(
+            file_path,
+            ["Nomi", "Mahsulot kodi (Item Number)", "Barcode", "Ulgurji narx (dona)"],
+            [
+                ["Sovun", None, "4780000000017", 12],
+                ["Shampun", "SH-1", "4780000000024", 20],
+                # Bo'sh katak ham qiymat yo'q deb olinadi
+                ["Sovun", None, "4780000000017", None],
+            ],
+        )
+        result = ExcelService.import_products(db, file_path, mode="upsert")
+        assert result["errors"] == [], result["errors"]
+        assert (result["imported"], result["updated"]) == (1, 1)
+
+        db.expire_all()
+        soap = db.query(Product).filter(Product.barcode == "4780000000017").one()
+        assert soap.wholesale_price == 12.0
+        assert (soap.cost_price, soap.retail_price, soap.regular_price) == (5.0, 9.0, 10.0)
+        assert (soap.packages_in_stock, soap.pieces_in_stock, soap.pieces_per_package) == (7, 3, 12)
+
+        shampoo = db.query(Product).filter(Product.barcode == "4780000000024").one()
+        assert shampoo.wholesale_price == 20.0
+        assert (shampoo.cost_price, shampoo.retail_price, shampoo.packages_in_stock) == (0.0, 0.0, 0)
+        assert shampoo.pieces_per_package == 1
+        db.close()
+    finally:
+        engine.dispose()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def test_legacy_layout_empty_cells_not_written():
+    row = (1, "Sovun", "4780000000017", None, None, None, None, None, 15, "", None)
+    data = ExcelService._parse_legacy_row(row)
+    assert data == {"name": "Sovun", "barcode": "4780000000017", "wholesale_price": 15.0}
+
+
+if __name__ == "__main__":
+    test_partial_column_upsert_keeps_other_fields()
+    test_legacy_layout_empty_cells_not_written()
+    print("✅ OK")
@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+"""
+Benchmark: 1000 ta mahsulotli sahifa - eski yo'l (ORM + sale_items joinedload,
+har bir mahsulot uchun model_validate va response_model orqali qayta tekshirish)
+hamda yangi yo'l (ustun qatorlari -> dict, FastJSONResponse).
+
+Ikkala yo'l vaqtinchalik SQLite bazada TestClient orqali o'lchanadi va
+javoblar bir xil ekani tekshiriladi.
+"""
+import os
+import sys
+import time
+import shutil
+import tempfile
+from datetime import datetime, timedelta
+from typing import List
+
+# Add backend directory to path
+backend_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, backend_dir)
+sys.path.insert(0, os.path.join(backend_dir, 'services'))
+
+from fastapi import Depends, FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session, sessionmaker
+
+from json_response import FastJSONResponse
+from models import Base, PaymentMethod, Product, Sale, SaleItem
+from schemas import ProductResponse
+from services.product_service import ProductService
+
+PAGE_SIZE = 1000
+SALES = 300
+ITEMS_PER_SALE = 20
+ITERATIONS = 5
+
+
+def seed(db: Session):
+    now = datetime.now()
+    db.bulk_insert_mappings(Product, [
+        {
+            "id": i + 1,
+            "name": f"Mahsulot {i + 1}",
+            "item_number": f"A-{i + 1:05d}",
+            "barcode": f"478{i + 1:010d}",
+            "brand": f"Brend {i % 40}",
+            "category": f"Kategoriya {i % 25}",
+            "pieces_per_package": 1 + i % 12,
+            "cost_price": 1000.0 + i,
+            "wholesale_price": 1200.0 + i,
+            "retail_price": 1300.0 + i,
+            "regular_price": 1400.0 + i,
+            "packages_in_stock": i % 7,
+            "pieces_in_stock": i % 5,
+            "created_at": now - timedelta(days=90),
+            "updated_at": now - timedelta(days=1),
+        }
+        for i in range(PAGE_SIZE)
+    ])
+    db.bulk_insert_mappings(Sale, [
+        {
+            "id": sale_id,
+            "seller_id": 1,
+            "total_amount": 0.0,
+            "payment_method": PaymentMethod.CASH,
+            "payment_amount": 0.0,
+            "created_at": now - timedelta(days=sale_id % 60),
+        }
+        for sale_id in range(1, SALES + 1)
+    ])
+    db.bulk_insert_mappings(SaleItem, [
+        {
+            "sale_id": sale_id,
+            "product_id": (sale_id * 7 + item * 13) % PAGE_SIZE + 1,
+            "requested_quantity": 1,
+            "package_price": 1300.0,
+            "piece_price": 1300.0,
+            "subtotal": 1300.0,
+        }
+        for sale_id in range(1, SALES + 1)
+        for item in range(ITEMS_PER_SALE)
+    ])
+    db.commit()
+
+
+def make_app(session_factory):
+    app = FastAPI()
+
+    def get_db():
+        db = session_factory()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    @app.get("/before", response_model=List[ProductResponse])
+    def before(db: Session = Depends(get_db)):
+        # Eski yo'l (main.get_products dagi kabi)
+        products = ProductService.get_products(db, limit=PAGE_SIZE)
+        result = []
+        for p in products:
+            result.append(ProductResponse.model_validate({
+                "id": p.id, "name": p.name, "item_number": p.item_number, "barcode": p.barcode,
+                "category": p.category, "brand": p.brand, "supplier": p.supplier,
+                "received_date": p.received_date, "image_url": p.image_url, "location": p.location,
+                "pieces_per_package": p.pieces_per_package,
+                "cost_price": max(0.0, p.cost_price or 0.0),
+                "wholesale_price": max(0.0, p.wholesale_price or 0.0),
+                "retail_price": max(0.0, p.retail_price or 0.0),
+                "regular_price": max(0.0, p.regular_price or 0.0),
+                "product_url": f"/product/{p.id}",
+                "packages_in_stock": max(0, p.packages_in_stock or 0),
+                "pieces_in_stock": max(0, p.pieces_in_stock or 0),
+                "total_pieces": p.total_pieces, "total_value": p.total_value,
+                "total_value_cost": p.total_value_cost, "total_value_wholesale": p.total_value_wholesale,
+                "last_sold_date": p.last_sold_date, "days_since_last_sale": p.days_since_last_sale,
+                "is_slow_moving": p.is_slow_moving,
+                "created_at": p.created_at, "updated_at": p.updated_at,
+            }))
+        return result
+
+    @app.get("/after", response_model=List[ProductResponse])
+    def after(db: Session = Depends(get_db)):
+        products = ProductService.get_products(db, limit=PAGE_SIZE, as_rows=True)
+        return FastJSONResponse(ProductService.products_to_response_dicts(db, products))
+
+    return app
+
+
+def timed(client, path):
+    started = time.perf_counter()
+    for _ in range(ITERATIONS):
+        response = client.get(path)
+        assert response.status_code == 200, response.text
+    return (time.perf_counter() - started) / ITERATIONS * 1000
+
+
+def run_benchmark():
+    workdir = tempfile.mkdtemp(prefix='product_list_bench_')
+    engine = create_engine(
+        f"sqlite:///{os.path.join(workdir, 'test.db')}",
+        connect_args={"check_same_thread": False}
+    )
+    try:
+        Base.metadata.create_all(bind=engine)
+        session_factory = sessionmaker(bind=engine)
+        db = session_factory()
+        seed(db)
+        db.close()
+
+        client = TestClient(make_app(session_factory))
+        before_body = client.get("/before").json()
+        after_body = client.get("/after").json()
+        assert len(after_body) == PAGE_SIZE
+        # Eski yo'l category_id ni qaytarmas edi
+        for item in after_body:
+            item["category_id"] = None
+        assert after_body == before_body, "Yangi yo'l javobi eski yo'l bilan bir xil bo'lishi kerak"
+
+        return timed(client, "/before"), timed(client, "/after")
+    finally:
+        engine.dispose()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def test_product_list_serialization_faster():
+    before_ms, after_ms = run_benchmark()
+    print(f"Oldin (ORM + model_validate + response_model): {before_ms:.1f} ms/sahifa")
+    print(f"Keyin (ustunlar -> dict + FastJSONResponse):   {after_ms:.1f} ms/sahifa")
+    assert after_ms < before_ms, "Yangi yo'l sekinroq bo'lmasligi kerak"
+
+
+if __name__ == "__main__":
+    print("=" * 60)
+    print(f"Mahsulotlar ro'yxati benchmark ({PAGE_SIZE} ta mahsulot)")
+    print("=" * 60)
+    test_product_list_serialization_faster()
+    print("✅ OK")
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+Test: mahsulot qidiruv indeksi (products_fts) boshqa ulanishlardan yozilganda ham ishlaydi.
+
+Triggerlar oddiy SQL: sqlite3 CLI yoki migrate_*.py skriptlari products jadvaliga
+yozganda xato bermasligi, o'zgarishlar esa keyingi qidiruvda indeksga tushishi kerak.
+"""
+import os
+import sys
+import shutil
+import sqlite3
+import tempfile
+
+# Add backend directory to path
+backend_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, backend_dir)
+sys.path.insert(0, os.path.join(backend_dir, 'services'))
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from models import Base, Category, Product
+from services.product_search_service import ProductSearchService
+
+
+def names(db, query):
+    return [product.name for product in ProductSearchService.search(db, query)]
+
+
+def test_index_follows_writes_from_plain_sqlite3():
+    workdir = tempfile.mkdtemp(prefix='search_index_test_')
+    db_path = os.path.join(workdir, 'test.db')
+    engine = create_engine(f"sqlite:///{db_path}")
+    try:
+        Base.metadata.create_all(bind=engine)
+        db = sessionmaker(bind=engine)()
+        category = Category(name="Ichimliklar")
+        db.add(category)
+        db.flush()
+        db.add(Product(name="Oʻzbekiston choyi", barcode="4780000000017", category_id=category.id))
+        db.commit()
+        if not ProductSearchService.ensure_index(engine):
+            print("FTS5 trigram yo'q - test o'tkazib yuborildi")
+            return
+        assert names(db, "ўзбекистон") == ["Oʻzbekiston choyi"]
+
+        # Funksiyalar ro'yxatdan o'tmagan oddiy ulanish
+        conn = sqlite3.connect(db_path)
+        conn.execute("UPDATE products SET name = 'Qora choy' WHERE barcode = '4780000000017'")
+        conn.execute(
+            "INSERT INTO products (name, barcode, pieces_per_package, cost_price, wholesale_price, retail_price, "
+            "regular_price, packages_in_stock, pieces_in_stock) VALUES ('Кофе Арабика', '4780000000024', 1, 0, 0, 0, 0, 0, 0)"
+        )
+        conn.execute("UPDATE categories SET name = 'Sovuq ichimliklar' WHERE id = ?", (category.id,))
+        conn.commit()
+        conn.close()
+
+        assert names(db, "ozbekiston") == []
+        assert names(db, "qora") == ["Qora choy"]
+        assert names(db, "kofe arabika") == ["Кофе Арабика"]
+        assert names(db, "sovuq") == ["Qora choy"]
+        assert names(db, "ko") == ["Кофе Арабика"]  # so'z boshi (1-2 harf)
+
+        conn = sqlite3.connect(db_path)
+        conn.execute("DELETE FROM products WHERE barcode = '4780000000024'")
+        conn.commit()
+        conn.close()
+        assert names(db, "kofe") == []
+
+        ProductSearchService.rebuild_index(engine)
+        assert names(db, "choy") == ["Qora choy"]
+        db.close()
+    finally:
+        engine.dispose()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    test_index_follows_writes_from_plain_sqlite3()
+    print("✅ OK")
@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+Benchmark: PDF chek yaratish - keshsiz va diskka yozish (eski yo'l) hamda
+keshlangan uslublar/logo bilan xotirada yaratish (yangi yo'l).
+
+Sotuv va sozlamalar bazadan emas, oddiy obyektlardan olinadi - faqat PDF
+yaratish vaqti o'lchanadi.
+"""
+import io
+import os
+import sys
+import shutil
+import tempfile
+import time
+import contextlib
+from datetime import datetime
+from types import SimpleNamespace
+
+# Add backend directory to path
+backend_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, backend_dir)
+sys.path.insert(0, os.path.join(backend_dir, 'services'))
+
+from PIL import Image
+
+from services.pdf_service import PDFService
+from services.sale_service import SaleService
+from services.settings_service import SettingsService
+
+ITERATIONS = 30
+ITEMS_PER_SALE = 25
+
+
+def make_sale(sale_id=1):
+    customer = SimpleNamespace(id=1, name='Test mijoz', debt_balance=0)
+    items = []
+    for i in range(ITEMS_PER_SALE):
+        product = SimpleNamespace(name=f'Mahsulot {i + 1}', item_number=f'A-{i + 1:03d}')
+        items.append(SimpleNamespace(
+            product=product, requested_quantity=2, piece_price=15000.0, subtotal=30000.0
+        ))
+    total = sum(item.subtotal for item in items)
+    return SimpleNamespace(
+        id=sale_id,
+        payment_method=SimpleNamespace(value='cash'),
+        created_at=datetime(2026, 1, 15, 10, 30),
+        payment_amount=total,
+        total_amount=total,
+        excess_action=None,
+        customer=customer,
+        seller=SimpleNamespace(name='Sotuvchi'),
+        items=items,
+    )
+
+
+def make_settings(logo_url):
+    return SimpleNamespace(
+        store_name="Test do'kon",
+        store_address='Toshkent',
+        store_phone='+998 90 000 00 00',
+        logo_url=logo_url,
+        receipt_show_logo=True,
+        receipt_footer_text=None,
+    )
+
+
+def timed(fn, iterations):
+    started = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        for _ in range(iterations):
+            fn()
+    return (time.perf_counter() - started) / iterations * 1000
+
+
+def run_benchmark():
+    workdir = tempfile.mkdtemp(prefix='receipt_bench_')
+    logo_path = os.path.join(workdir, 'logo.png')
+    Image.new('RGB', (2400, 1200), (33, 150, 243)).save(logo_path)
+
+    sale = make_sale()
+    settings = make_settings(os.path.relpath(logo_path))
+    original = (SaleService.get_sale, SettingsService.get_settings, PDFService.RECEIPTS_DIR)
+    SaleService.get_sale = staticmethod(lambda db, sale_id: sale)
+    SettingsService.get_settings = staticmethod(lambda db: settings)
+    PDFService.RECEIPTS_DIR = os.path.join(workdir, 'receipts')
+    try:
+        def before():
+            # Eski yo'l: har safar uslublar va logo qaytadan, natija diskka
+            PDFService.invalidate_template_cache()
+            PDFService.generate_receipt(None, sale.id)
+
+        def after():
+            PDFService.generate_receipt_bytes(None, sale.id)
+
+        content = PDFService.generate_receipt_bytes(None, sale.id)
+        assert content.startswith(b'%PDF')
+
+        before_ms = timed(before, ITERATIONS)
+        after_ms = timed(after, ITERATIONS)
+        return before_ms, after_ms
+    finally:
+        SaleService.get_sale, SettingsService.get_settings = (staticmethod(f) for f in original[:2])
+        PDFService.RECEIPTS_DIR = original[2]
+        PDFService.invalidate_template_cache()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def test_cached_receipt_not_slower():
+    before_ms, after_ms = run_benchmark()
+    print(f"Oldin (keshsiz + disk): {before_ms:.1f} ms/chek")
+    print(f"Keyin (kesh + xotira):  {after_ms:.1f} ms/chek")
+    assert after_ms <= before_ms * 1.1, "Keshlangan chek yaratish sekinroq bo'lmasligi kerak"
+
+
+if __name__ == "__main__":
+    print("=" * 60)
+    print("PDF chek benchmark")
+    print("=" * 60)
+    test_cached_receipt_not_slower()
+    print("✅ OK")
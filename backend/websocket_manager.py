@@ -6,39 +6,57 @@ from typing import List, Dict, Optional
 import json
 
 
+# Topic of admin and seller panel connections (clients connected without customer_id)
+ADMIN_TOPIC = "admins"
+
+
+def customer_topic(customer_id: int) -> str:
+    """Topic of all connections of one customer"""
+    return f"customer:{customer_id}"
+
+
 class ConnectionManager:
     """Manages WebSocket connections for real-time updates"""
     
     def __init__(self):
         self.active_connections: List[WebSocket] = []
-        # Store customer_id -> WebSocket mapping for personal notifications
-        self.customer_connections: Dict[int, List[WebSocket]] = {}
+        # Store topic -> WebSocket mapping for targeted notifications
+        # ("customer:<id>" for a customer's devices, ADMIN_TOPIC for admin/seller panels)
+        self.topic_connections: Dict[str, List[WebSocket]] = {}
     
     async def connect(self, websocket: WebSocket, customer_id: Optional[int] = None):
         """Accept a new WebSocket connection, optionally associated with a customer_id"""
         await websocket.accept()
         self.active_connections.append(websocket)
         
-        # If customer_id is provided, store the connection for this customer
+        # Customers get their personal topic, other clients (panels) the admin topic
         if customer_id is not None:
-            if customer_id not in self.customer_connections:
-                self.customer_connections[customer_id] = []
-            self.customer_connections[customer_id].append(websocket)
-            print(f"[WebSocket] Customer {customer_id} connected. Total connections for this customer: {len(self.customer_connections[customer_id])}")
+            topic = customer_topic(customer_id)
+            self.subscribe(websocket, topic)
+            print(f"[WebSocket] Customer {customer_id} connected. Total connections for this customer: {len(self.topic_connections[topic])}")
+        else:
+            self.subscribe(websocket, ADMIN_TOPIC)
+    
+    def subscribe(self, websocket: WebSocket, topic: str):
+        """Add a connection to a topic"""
+        connections = self.topic_connections.setdefault(topic, [])
+        if websocket not in connections:
+            connections.append(websocket)
     
     def disconnect(self, websocket: WebSocket):
         """Remove a WebSocket connection"""
         if websocket in self.active_connections:
             self.active_connections.remove(websocket)
         
-        # Remove from customer_connections if present
-        for customer_id, connections in list(self.customer_connections.items()):
+        # Remove from topics if present
+        for topic, connections in list(self.topic_connections.items()):
             if websocket in connections:
                 connections.remove(websocket)
                 if not connections:
-                    # Remove customer entry if no connections left
-                    del self.customer_connections[customer_id]
-                print(f"[WebSocket] Customer {customer_id} disconnected. Remaining connections: {len(self.customer_connections.get(customer_id, []))}")
+                    # Remove topic entry if no connections left
+                    del self.topic_connections[topic]
+                if topic.startswith("customer:"):
+                    print(f"[WebSocket] Customer {topic.split(':', 1)[1]} disconnected. Remaining connections: {len(self.topic_connections.get(topic, []))}")
     
     async def send_personal_message(self, message: dict, websocket: WebSocket):
         """Send a message to a specific WebSocket connection"""
@@ -48,24 +66,31 @@ class ConnectionManager:
             print(f"Error sending message: {e}")
             self.disconnect(websocket)
     
-    async def send_to_customer(self, customer_id: int, message: dict):
-        """Send a message to all WebSocket connections for a specific customer"""
-        if customer_id not in self.customer_connections:
-            print(f"[WebSocket] No connections found for customer {customer_id}")
+    async def publish(self, topic: str, message: dict):
+        """Send a message to all WebSocket connections subscribed to a topic"""
+        if topic not in self.topic_connections:
             return
         
+        payload = json.dumps(message)
         disconnected = []
-        for connection in self.customer_connections[customer_id]:
+        for connection in list(self.topic_connections[topic]):
             try:
-                await connection.send_text(json.dumps(message))
+                await connection.send_text(payload)
             except Exception as e:
-                print(f"Error sending message to customer {customer_id}: {e}")
+                print(f"Error sending message to topic {topic}: {e}")
                 disconnected.append(connection)
         
         # Remove disconnected connections
         for connection in disconnected:
             self.disconnect(connection)
     
+    async def send_to_customer(self, customer_id: int, message: dict):
+        """Send a message to all WebSocket connections for a specific customer"""
+        if customer_topic(customer_id) not in self.topic_connections:
+            print(f"[WebSocket] No connections found for customer {customer_id}")
+            return
+        await self.publish(customer_topic(customer_id), message)
+    
     async def broadcast(self, message: dict):
         """Broadcast a message to all connected WebSocket clients"""
         disconnected = []